@@ -1,12 +1,15 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import requests
 import os
 import logging
 from dotenv import load_dotenv
 
 # Importar utilidades HTTP
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
+from utils.erpnext_transport import ERPNextSession
+from utils.session_cache import invalidate_session, get_session_cache_stats
+from utils.logging_utils import set_correlation_id, get_correlation_id
+from routes.auth_utils import get_session_with_auth
 
 # Importar configuración
 from config import ERPNEXT_URL, ERPNEXT_HOST
@@ -83,6 +86,7 @@ from routes.unpaid_movements import unpaid_movements_bp
 from routes.expense_mapping import expense_mapping_bp
 from routes.month_closure import month_closure_bp
 from routes.party_import import party_import_bp
+from routes.jobs import jobs_bp
 
 # Inicializa la aplicación Flask
 app = Flask(__name__)
@@ -95,6 +99,21 @@ app.url_map.strict_slashes = False
 logging.getLogger('werkzeug').setLevel(logging.WARNING)
 app.logger.setLevel(logging.WARNING)
 
+
+# Correlation id por request: se toma de X-Request-ID (proxy/frontend) o se genera,
+# aparece en cada línea de get_logger() y se devuelve en la respuesta
+@app.before_request
+def assign_correlation_id():
+    set_correlation_id(request.headers.get('X-Request-ID'))
+
+
+@app.after_request
+def expose_correlation_id(response):
+    correlation_id = get_correlation_id()
+    if correlation_id:
+        response.headers['X-Request-ID'] = correlation_id
+    return response
+
 # Registrar los blueprints ANTES de configurar CORS
 app.register_blueprint(companies_bp)
 app.register_blueprint(accounting_bp)
@@ -171,6 +190,7 @@ app.register_blueprint(month_closure_bp)  # Módulo de cierre de mes bancario
 # Lee la variable de entorno. Si no existe, usa localhost:5173 para desarrollo.
 # En producción, le pasaremos la IP a través de docker-compose.
 app.register_blueprint(party_import_bp)  # Importaci¢n masiva de clientes/proveedores
+app.register_blueprint(jobs_bp)  # Estado y cancelación de jobs en segundo plano
 
 allowed_origins = os.getenv('FLASK_CORS_ORIGINS', 'http://localhost:5173,http://localhost:5174')
 print(f"CORS - Orígenes permitidos leídos de ENV: {allowed_origins}")
@@ -179,10 +199,10 @@ print(f"CORS - Orígenes permitidos leídos de ENV: {allowed_origins}")
 # Si tiene varias separadas por coma, pasalas como lista.
 if ',' in allowed_origins:
     origins_list = [origin.strip() for origin in allowed_origins.split(',')]
-    CORS(app, origins=origins_list, supports_credentials=True, methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"], allow_headers=["Content-Type", "Authorization", "X-Session-Token", "X-Requested-With", "X-Active-Company", "x-active-company"], expose_headers=["Content-Type", "X-Custom-Header"])
+    CORS(app, origins=origins_list, supports_credentials=True, methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"], allow_headers=["Content-Type", "Authorization", "X-Session-Token", "X-Requested-With", "X-Active-Company", "x-active-company", "X-Request-ID"], expose_headers=["Content-Type", "X-Custom-Header", "X-Request-ID"])
     print(f"CORS configurado para MÚLTIPLES orígenes: {origins_list}")
 else:
-    CORS(app, origins=allowed_origins, supports_credentials=True, methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"], allow_headers=["Content-Type", "Authorization", "X-Session-Token", "X-Requested-With", "X-Active-Company", "x-active-company"], expose_headers=["Content-Type", "X-Custom-Header"])
+    CORS(app, origins=allowed_origins, supports_credentials=True, methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"], allow_headers=["Content-Type", "Authorization", "X-Session-Token", "X-Requested-With", "X-Active-Company", "x-active-company", "X-Request-ID"], expose_headers=["Content-Type", "X-Custom-Header", "X-Request-ID"])
     print(f"CORS configurado para UN origen: {allowed_origins}")
 
 
@@ -204,8 +224,8 @@ def login():
         print("Error: Usuario o contraseña faltante en la petición.")
         return jsonify({"success": False, "message": "Usuario o contraseña faltante"}), 400
 
-    # Usamos una sesión de 'requests' para que maneje las cookies automáticamente
-    session = requests.Session()
+    # Sesión liviana sobre el pool compartido; guarda las cookies que devuelve el login
+    session = ERPNextSession()
 
     # Hacer la petición de login usando la utilidad centralizada
     response, error_response = make_erpnext_request(
@@ -239,6 +259,37 @@ def login():
     # Devolvemos el token al frontend
     return jsonify({"success": True, "token": sid_token})
 
+# Ruta de logout: cierra la sesión en ERPNext y descarta el sid del cache de sesiones
+@app.route('/api/logout', methods=['POST'])
+def logout():
+    sid_token = request.headers.get('X-Session-Token') or request.cookies.get('sid')
+    if not sid_token:
+        return jsonify({"success": True, "message": "Sin sesión activa"})
+
+    invalidate_session(sid_token)
+
+    erp_host = ERPNEXT_HOST if ERPNEXT_HOST else ERPNEXT_URL.split('//')[1].split(':')[0]
+    session = ERPNextSession(sid_token, cookie_domain=erp_host)
+    response, error_response = make_erpnext_request(
+        session=session,
+        method="POST",
+        endpoint="/api/method/logout",
+        operation_name="Logout"
+    )
+    if error_response and error_response.get('status_code') not in (401, 403):
+        print(f"Logout en ERPNext falló: {error_response.get('message')}")
+
+    return jsonify({"success": True})
+
+
+# Estadísticas del cache de sesiones validadas (hit rate y latencia ahorrada)
+@app.route('/api/auth/session-cache/stats', methods=['GET'])
+def session_cache_stats():
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+    return jsonify({"success": True, "data": get_session_cache_stats()})
+
 # Inicia el servidor
 if __name__ == '__main__':
     if not ERPNEXT_URL:
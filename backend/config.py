@@ -25,3 +25,101 @@ if not SITE_BASE_URL and ERPNEXT_URL:
     scheme = parsed.scheme or "http"
     host = parsed.hostname or ""
     SITE_BASE_URL = f"{scheme}://{host}" if host else None
+
+# Transporte HTTP hacia ERPNext (pool de conexiones compartido por proceso)
+ERPNEXT_POOL_CONNECTIONS = int(os.getenv("ERPNEXT_POOL_CONNECTIONS", "10"))
+ERPNEXT_POOL_MAXSIZE = int(os.getenv("ERPNEXT_POOL_MAXSIZE", "32"))
+ERPNEXT_POOL_BLOCK = os.getenv("ERPNEXT_POOL_BLOCK", "false").lower() in ("true", "1", "yes", "on")
+ERPNEXT_KEEP_ALIVE = os.getenv("ERPNEXT_KEEP_ALIVE", "true").lower() in ("true", "1", "yes", "on")
+ERPNEXT_TIMEOUT_GET = float(os.getenv("ERPNEXT_TIMEOUT_GET", "60"))
+ERPNEXT_TIMEOUT_POST = float(os.getenv("ERPNEXT_TIMEOUT_POST", "120"))
+ERPNEXT_TIMEOUT_PUT = float(os.getenv("ERPNEXT_TIMEOUT_PUT", "120"))
+ERPNEXT_TIMEOUT_DELETE = float(os.getenv("ERPNEXT_TIMEOUT_DELETE", "60"))
+
+# Cache de sesiones validadas (sid -> usuario) para evitar get_logged_user en cada request
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "300"))
+SESSION_CACHE_MAXSIZE = int(os.getenv("SESSION_CACHE_MAXSIZE", "2048"))
+
+# Cache de metadatos de compañía (abbr, moneda, cuentas y almacenes por defecto)
+COMPANY_CACHE_TTL = float(os.getenv("COMPANY_CACHE_TTL", "600"))
+COMPANY_CACHE_MAXSIZE = int(os.getenv("COMPANY_CACHE_MAXSIZE", "256"))
+
+# Letter Head embebido para PDFs: nombre resuelto por compañía y logos como data URI
+LETTERHEAD_CACHE_TTL = float(os.getenv("LETTERHEAD_CACHE_TTL", "300"))
+LOGO_CACHE_TTL = float(os.getenv("LOGO_CACHE_TTL", "3600"))
+LOGO_CACHE_MAXSIZE = int(os.getenv("LOGO_CACHE_MAXSIZE", "32"))
+LOGO_CACHE_MAX_BYTES = int(os.getenv("LOGO_CACHE_MAX_BYTES", str(2 * 1024 * 1024)))
+
+# PDFs de documentos confirmados cacheados en disco (LRU acotado por tamaño total)
+PDF_CACHE_DIR = os.getenv(
+    "PDF_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdf_cache")
+)
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+PDF_STREAM_CHUNK_SIZE = int(os.getenv("PDF_STREAM_CHUNK_SIZE", str(64 * 1024)))
+# `modified` de cada Print Format (parte de la clave del cache de PDFs)
+PRINT_FORMAT_CACHE_TTL = float(os.getenv("PRINT_FORMAT_CACHE_TTL", "60"))
+
+# Exportación de PDFs en lote (zip generado por un job, se borra a los JOB_RETENTION_DAYS)
+PDF_EXPORT_DIR = os.getenv(
+    "PDF_EXPORT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdf_exports")
+)
+PDF_EXPORT_MAX_WORKERS = int(os.getenv("PDF_EXPORT_MAX_WORKERS", "4"))
+PDF_EXPORT_MAX_DOCUMENTS = int(os.getenv("PDF_EXPORT_MAX_DOCUMENTS", "1000"))
+
+# Snapshots persistidos de reportes fiscales (Libro IVA, percepciones) por compañía y período
+REPORT_SNAPSHOT_DIR = os.getenv(
+    "REPORT_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_snapshots")
+)
+# Vencimiento forzado: cubre cambios de datos de clientes/proveedores que no tocan el comprobante
+REPORT_SNAPSHOT_MAX_AGE_HOURS = float(os.getenv("REPORT_SNAPSHOT_MAX_AGE_HOURS", "24"))
+
+# Saldos de clientes/proveedores (cache corto + paralelismo acotado para el fallback por parte)
+PARTY_BALANCE_CACHE_TTL = float(os.getenv("PARTY_BALANCE_CACHE_TTL", "60"))
+PARTY_BALANCE_CACHE_MAXSIZE = int(os.getenv("PARTY_BALANCE_CACHE_MAXSIZE", "20000"))
+PARTY_BALANCE_MAX_WORKERS = int(os.getenv("PARTY_BALANCE_MAX_WORKERS", "8"))
+
+# Jobs en segundo plano (estado persistido en SQLite, compartido entre workers de gunicorn)
+JOB_STORE_PATH = os.getenv(
+    "JOB_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_store", "jobs.sqlite3")
+)
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "4"))
+JOB_MAX_PER_COMPANY = int(os.getenv("JOB_MAX_PER_COMPANY", "2"))
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+# Índice de almacenes por compañía (se invalida al crear/editar/eliminar almacenes)
+WAREHOUSE_INDEX_TTL = float(os.getenv("WAREHOUSE_INDEX_TTL", "600"))
+
+# Réplica local del catálogo de items por compañía (sincronización incremental por `modified`)
+ITEM_CATALOG_POLL_INTERVAL = float(os.getenv("ITEM_CATALOG_POLL_INTERVAL", "30"))
+ITEM_CATALOG_FULL_SYNC_INTERVAL = float(os.getenv("ITEM_CATALOG_FULL_SYNC_INTERVAL", "21600"))
+# Opcional: archivo SQLite para arrancar con la réplica ya cargada ("" = solo memoria)
+ITEM_CATALOG_SQLITE_PATH = os.getenv("ITEM_CATALOG_SQLITE_PATH", "")
+
+# Lecturas en lote hacia ERPNext (largo máximo de URL para GET y concurrencia acotada)
+ERPNEXT_MAX_URL_LENGTH = int(os.getenv("ERPNEXT_MAX_URL_LENGTH", "7500"))
+STOCK_FETCH_MAX_WORKERS = int(os.getenv("STOCK_FETCH_MAX_WORKERS", "6"))
+
+# Logging estructurado (utils/logging_utils.get_logger)
+# LOG_LEVEL: DEBUG, INFO, WARNING, ERROR. LOG_FORMAT: "text" o "json" (una línea JSON por evento)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Mensajes por fila (imports CSV): se emite 1 de cada N por clave
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "1000"))
+
+# active_companies.json: cada cuánto se vuelcan los contadores de items acumulados (0 = en cada cambio)
+STATE_COUNTER_FLUSH_INTERVAL = float(os.getenv("STATE_COUNTER_FLUSH_INTERVAL", "2"))
+
+# Totales mensuales de meses cerrados (cierre de mes / balances), persistidos
+ACCOUNT_BALANCE_CACHE_PATH = os.getenv(
+    "ACCOUNT_BALANCE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "balance_cache", "account_balances.json")
+)
+# Sumas del balance de comprobación por compañía y mes, para las cuentas con el mes cerrado
+TRIAL_BALANCE_CACHE_PATH = os.getenv(
+    "TRIAL_BALANCE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "balance_cache", "trial_balance.json")
+)
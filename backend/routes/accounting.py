@@ -4,6 +4,7 @@ import requests
 import json
 from urllib.parse import quote
 from collections import defaultdict
+from datetime import datetime
 
 # Importar configuración
 from config import ERPNEXT_URL, ERPNEXT_HOST
@@ -20,6 +21,9 @@ from routes.general import get_company_abbr, get_active_company, get_company_def
 # Importar utilidades HTTP centralizadas
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
 
+# Balance de sumas y saldos agregado en ERPNext con meses cerrados cacheados
+from services.trial_balance import get_fiscal_year_range, get_trial_balance as build_trial_balance
+
 # Crear el blueprint para las rutas de contabilidad
 accounting_bp = Blueprint('accounting', __name__)
 
@@ -1418,7 +1422,7 @@ def get_fiscal_years():
 
 @accounting_bp.route('/api/trial-balance', methods=['GET'])
 def get_trial_balance():
-    """Obtiene el Trial Balance desde ERPNext para mostrar saldos de cuentas"""
+    """Balance de sumas y saldos por cuenta del año fiscal (o de from_date/to_date)"""
     print("\n--- Petición de obtener Trial Balance recibida ---")
 
     session, headers, user_id, error_response = get_session_with_auth()
@@ -1446,113 +1450,50 @@ def get_trial_balance():
 
         # Obtener el año fiscal (del parámetro o usar el más reciente)
         fiscal_year = request.args.get('fiscal_year', '')
+        from_date = request.args.get('from_date')
+        to_date = request.args.get('to_date')
 
-        # Si no se especifica año fiscal, obtener el más reciente
-        if not fiscal_year:
-            fiscal_year = get_latest_fiscal_year(session, headers)
+        if from_date and to_date:
+            # Rango explícito (puede abarcar varios años fiscales)
+            try:
+                fiscal_range = (
+                    datetime.strptime(from_date[:10], "%Y-%m-%d").date(),
+                    datetime.strptime(to_date[:10], "%Y-%m-%d").date()
+                )
+            except ValueError:
+                return jsonify({"success": False, "message": "from_date y to_date deben tener formato YYYY-MM-DD"}), 400
+            if fiscal_range[0] > fiscal_range[1]:
+                return jsonify({"success": False, "message": "from_date no puede ser posterior a to_date"}), 400
+        else:
+            # Si no se especifica año fiscal, obtener el más reciente
             if not fiscal_year:
-                return jsonify({"success": False, "message": "No se pudo determinar el año fiscal"}), 400
-
-        # Llamar al endpoint de ERPNext para obtener el Trial Balance
-        # Usar el endpoint directo del reporte en lugar de query_report.run
-        fields = json.dumps(["account","debit","credit","voucher_no","voucher_type","posting_date","fiscal_year"])
-        filters = json.dumps([["company", "=", active_company]])
-
-        response, error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/GL Entry",
-            params={
-                "fields": fields,
-                "filters": filters,
-                "limit_page_length": 10000
-            },
-            operation_name="Get GL entries for trial balance"
+                fiscal_year = get_latest_fiscal_year(session, headers)
+                if not fiscal_year:
+                    return jsonify({"success": False, "message": "No se pudo determinar el año fiscal"}), 400
+
+            fiscal_range, range_error = get_fiscal_year_range(session, fiscal_year)
+            if range_error:
+                return handle_erpnext_error(range_error, "Failed to fetch fiscal year for trial balance")
+            if not fiscal_range:
+                return jsonify({"success": False, "message": f"No se encontró el año fiscal {fiscal_year}"}), 404
+
+        # Sumas agrupadas por cuenta en ERPNext + meses cerrados desde el cache (services/trial_balance)
+        account_balances, engine_info, balance_error = build_trial_balance(
+            session, active_company, fiscal_range[0], fiscal_range[1]
         )
-        
-        if error:
-            return handle_erpnext_error(error, "Failed to fetch GL entries for trial balance")
-
-        if response.status_code == 200:
-            data = response.json()
-            gl_entries = data.get("data", [])
-
-            # Filtrar por año fiscal en el código (más confiable)
-            if fiscal_year:
-                gl_entries = [entry for entry in gl_entries if entry.get("fiscal_year") == fiscal_year]
-
-            # Obtener estados de los vouchers para excluir cancelados en batch
-
-            voucher_map = defaultdict(set)
-
-            for entry in gl_entries:
-
-                voucher_no = entry.get("voucher_no")
-
-                voucher_type = entry.get("voucher_type")
-
-                if voucher_no and voucher_type:
-
-                    voucher_map[voucher_type].add(voucher_no)
-
-
+        if balance_error:
+            return handle_erpnext_error(balance_error, "Failed to fetch GL entries for trial balance")
 
-            voucher_metadata = fetch_voucher_metadata_batch(
-
-                session,
-
-                voucher_map,
-
-                "voucher metadata para Trial Balance"
-
-            )
-
-
-
-            cancelled_vouchers = {name for name, meta in voucher_metadata.items() if meta.get("docstatus") == 2}
-
-            draft_vouchers = {name for name, meta in voucher_metadata.items() if meta.get("docstatus") == 0}
-
-            # Procesar los datos del GL Entry para calcular saldos
-            # EXCLUYENDO movimientos cancelados y borradores
-            account_balances = {}
-            for entry in gl_entries:
-                account = entry.get('account', '')
-                debit = entry.get('debit', 0) or 0
-                credit = entry.get('credit', 0) or 0
-                voucher_no = entry.get('voucher_no', '')
-                voucher_type = entry.get('voucher_type', '')
-
-                # Excluir movimientos que estén asociados a vouchers cancelados o borradores
-                should_exclude = False
-                if voucher_no and voucher_no in cancelled_vouchers:
-                    should_exclude = True
-                elif voucher_no and voucher_no in draft_vouchers:
-                    should_exclude = True
-
-                if account and not should_exclude:
-                    if account not in account_balances:
-                        account_balances[account] = {
-                            'debit': 0,
-                            'credit': 0,
-                            'balance': 0
-                        }
-
-                    account_balances[account]['debit'] += debit
-                    account_balances[account]['credit'] += credit
-                    account_balances[account]['balance'] = account_balances[account]['debit'] - account_balances[account]['credit']
-
-            print(f"--- Trial Balance: {len(account_balances)} registros")
-            return jsonify({
-                "success": True,
-                "data": account_balances,
-                "company": active_company,
-                "fiscal_year": fiscal_year
-            })
-
-        else:
-            print("--- Trial Balance: error")
-            return jsonify({"success": False, "message": "Error al obtener Trial Balance desde ERPNext"}), 500
+        print(f"--- Trial Balance: {len(account_balances)} registros")
+        return jsonify({
+            "success": True,
+            "data": account_balances,
+            "company": active_company,
+            "fiscal_year": fiscal_year,
+            "from_date": fiscal_range[0].isoformat(),
+            "to_date": fiscal_range[1].isoformat(),
+            "cache": engine_info
+        })
 
     except requests.exceptions.HTTPError as err:
         print("--- Trial Balance: error")
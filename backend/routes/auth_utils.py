@@ -2,9 +2,12 @@
 Utilidades de autenticación centralizadas para evitar duplicación
 """
 
+import time
+
 from flask import request, jsonify
-import requests
 from config import ERPNEXT_URL, ERPNEXT_HOST
+from utils.erpnext_transport import ERPNextSession
+from utils.session_cache import get_cached_user, cache_user, invalidate_session
 
 def get_session_with_auth():
     """
@@ -23,20 +26,23 @@ def get_session_with_auth():
     if not sid_token:
         return None, None, None, (jsonify({"success": False, "message": "Sesión no encontrada"}), 401)
 
-    # Usamos una sesión de 'requests' para manejar las cookies automáticamente
-    session = requests.Session()
-    # Establecer la cookie SID en la sesión
+    # Sesión liviana: la cookie SID se inyecta en cada request sobre el pool compartido
     erp_host = ERPNEXT_HOST if ERPNEXT_HOST else ERPNEXT_URL.split('//')[1].split(':')[0]
-    session.cookies.set('sid', sid_token, domain=erp_host)
+    session = ERPNextSession(sid_token, cookie_domain=erp_host)
 
     # Creamos la cabecera 'Host' para conectarnos a ERPNext
     headers = {"Host": erp_host}
 
+    # Sesiones ya validadas se resuelven desde el cache (sin round trip a ERPNext)
+    cached_user = get_cached_user(sid_token)
+    if cached_user:
+        return session, headers, cached_user, None
+
     # Obtener información del usuario actual
     try:
         # Use a separate session for user check to avoid overwriting main session cookies
-        user_session = requests.Session()
-        user_session.cookies.set('sid', sid_token, domain=erp_host)
+        user_session = ERPNextSession(sid_token, cookie_domain=erp_host)
+        started = time.perf_counter()
         user_response = user_session.get(
             f"{ERPNEXT_URL}/api/method/frappe.auth.get_logged_user",
             headers=headers
@@ -44,9 +50,13 @@ def get_session_with_auth():
         if user_response.status_code == 200:
             user_data = user_response.json()
             user_id = user_data.get("message", f"user_{sid_token[:16]}")
+            if user_data.get("message"):
+                cache_user(sid_token, user_id, time.perf_counter() - started)
         else:
+            if user_response.status_code == 401:
+                invalidate_session(sid_token)
             user_id = f"user_{sid_token[:16]}"  # Fallback en caso de error
     except Exception as e:
         user_id = f"user_{sid_token[:16]}"  # Fallback en caso de error
 
-    return session, headers, user_id, None
\ No newline at end of file
+    return session, headers, user_id, None
@@ -10,9 +10,25 @@ from collections import defaultdict
 from routes.auth_utils import get_session_with_auth
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
 from routes.general import get_company_default_currency
+from services.account_balances import invalidate_balances
+from utils.frappe_list import fetch_list_paged
+from utils.logging_utils import get_logger
 
 bank_movements_import_bp = Blueprint('bank_movements_import', __name__)
+logger = get_logger(__name__)
+# frappe.client.insert_many acepta hasta 200 documentos por llamada
 MAX_BANK_TRANSACTION_BATCH = 200
+# Referencias por consulta `in` al buscar duplicados fuera del rango del extracto
+DUPLICATE_LOOKUP_CHUNK = 200
+EXISTING_TRANSACTION_FIELDS = [
+    "name",
+    "date",
+    "description",
+    "reference_number",
+    "transaction_id",
+    "deposit",
+    "withdrawal"
+]
 SEVERITY_ORDER = {
     "none": 0,
     "yellow": 1,
@@ -129,48 +145,6 @@ def _resolve_bank_account(session, bank_account_value, company):
     return None
 
 
-def _check_duplicate_transaction(session, reference_number, transaction_id, bank_account, date):
-    """Check if a transaction with the same reference already exists."""
-    try:
-        filters = [["bank_account", "=", bank_account]]
-        
-        # Add reference_number filter if provided
-        if reference_number:
-            filters.append(["reference_number", "=", reference_number])
-        
-        # If no reference, check by transaction_id
-        if not reference_number and transaction_id:
-            filters = [
-                ["bank_account", "=", bank_account],
-                ["transaction_id", "=", transaction_id]
-            ]
-        
-        # If neither, check by date (less reliable, just log)
-        if not reference_number and not transaction_id:
-            return False
-        
-        response, error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/Bank Transaction",
-            params={
-                "filters": json.dumps(filters),
-                "fields": json.dumps(["name"]),
-                "limit_page_length": 1
-            },
-            operation_name="Check duplicate bank transaction"
-        )
-        
-        if not error and response.status_code == 200:
-            data = response.json().get("data", [])
-            return len(data) > 0
-        
-        return False
-    except Exception as e:
-        print(f"DEBUG: Error checking duplicate: {e}")
-        return False
-
-
 def _normalize_text(value):
     if not value:
         return ''
@@ -238,70 +212,223 @@ def _mark_date_outliers(rows, trackers, day_threshold=30, edge_window=3):
                 _add_issue(row, 'orange', 'date_outlier', message, trackers)
 
 
+def _normalize_existing_transaction(tx):
+    """Bank Transaction de ERPNext -> fila con las claves que usa la deteccion de duplicados."""
+    normalized_date = _parse_date(tx.get("date"))
+    if not normalized_date:
+        return None
+    amount, _, _ = _extract_amount_components({
+        "deposit": tx.get("deposit"),
+        "withdrawal": tx.get("withdrawal")
+    })
+    reference_raw = tx.get("reference_number") or tx.get("transaction_id") or ""
+    return {
+        "name": tx.get("name"),
+        "date": normalized_date,
+        "amount": amount,
+        "description_key": _normalize_text(tx.get("description") or ""),
+        "reference": reference_raw,
+        "reference_key": _normalize_reference(reference_raw),
+        "reference_number_key": _normalize_reference(tx.get("reference_number")),
+        "transaction_id": tx.get("transaction_id") or "",
+        "transaction_id_key": _normalize_reference(tx.get("transaction_id"))
+    }
+
+
+def _query_existing_transactions(session, bank_account, filters, operation_name):
+    """Bank Transactions de la cuenta que cumplen filters, con todas las paginas."""
+    rows, error = fetch_list_paged(
+        session,
+        "Bank Transaction",
+        EXISTING_TRANSACTION_FIELDS,
+        [["bank_account", "=", bank_account]] + filters,
+        order_by="date asc, name asc",
+        operation_name=operation_name
+    )
+    existing = []
+    for tx in rows:
+        normalized = _normalize_existing_transaction(tx)
+        if normalized:
+            existing.append(normalized)
+    return existing, error
+
+
 def _fetch_existing_transactions(session, bank_account, start_date, end_date):
     """Retrieve existing bank transactions within the provided date range."""
     if not bank_account or not start_date or not end_date:
         return []
     try:
-        filters = [
-            ["bank_account", "=", bank_account],
-            ["date", ">=", start_date],
-            ["date", "<=", end_date]
-        ]
-        params = {
-            "filters": json.dumps(filters),
-            "fields": json.dumps([
-                "name",
-                "date",
-                "description",
-                "reference_number",
-                "transaction_id",
-                "deposit",
-                "withdrawal"
-            ]),
-            "limit_page_length": 500
-        }
-        response, error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/Bank Transaction",
-            params=params,
-            operation_name="Fetch existing bank transactions for validation"
+        existing, error = _query_existing_transactions(
+            session,
+            bank_account,
+            [["date", ">=", start_date], ["date", "<=", end_date]],
+            "Fetch existing bank transactions for validation"
         )
-        if error or not response or response.status_code != 200:
-            print(f"DEBUG: Failed to fetch existing transactions: {error or response.status_code}")
-            return []
-        payload = response.json() if response else {}
-        data = payload.get("data", [])
-        existing = []
-        for tx in data:
-            tx_date = tx.get("date")
-            if not tx_date:
-                continue
-            normalized_date = _parse_date(tx_date)
-            if not normalized_date:
-                continue
-            amount, _, _ = _extract_amount_components({
-                "deposit": tx.get("deposit"),
-                "withdrawal": tx.get("withdrawal")
-            })
-            description_key = _normalize_text(tx.get("description") or "")
-            reference_raw = tx.get("reference_number") or tx.get("transaction_id") or ""
-            existing.append({
-                "name": tx.get("name"),
-                "date": normalized_date,
-                "amount": amount,
-                "description_key": description_key,
-                "reference": reference_raw,
-                "reference_key": _normalize_reference(reference_raw),
-                "transaction_id": tx.get("transaction_id") or ""
-            })
+        if error:
+            print(f"DEBUG: Failed to fetch existing transactions: {error}")
         return existing
     except Exception as exc:
         print(f"DEBUG: _fetch_existing_transactions error: {exc}")
         return []
 
 
+def _build_existing_index(existing_transactions):
+    """Indices en memoria: (fecha, monto, descripcion), referencia y transaction_id."""
+    index = {
+        "by_key": defaultdict(list),
+        "by_reference": {},
+        "by_transaction_id": {},
+        "names": set()
+    }
+    _extend_existing_index(index, existing_transactions)
+    return index
+
+
+def _extend_existing_index(index, existing_transactions):
+    for tx in existing_transactions or []:
+        if tx.get("name") in index["names"]:
+            continue
+        index["names"].add(tx.get("name"))
+        index["by_key"][(tx["date"], tx["amount"], tx["description_key"])].append(tx)
+        if tx.get("reference_number_key"):
+            index["by_reference"].setdefault(tx["reference_number_key"], tx)
+        if tx.get("transaction_id_key"):
+            index["by_transaction_id"].setdefault(tx["transaction_id_key"], tx)
+
+
+def _load_duplicate_index(session, bank_account, docs):
+    """
+    Indice de Bank Transactions existentes para deduplicar una importacion completa.
+
+    Trae todo el rango de fechas del extracto paginado y despues, solo para las
+    referencias / transaction_id que no aparecieron en ese rango, consulta con `in`
+    por bloques (antes se validaba la referencia contra todas las fechas, fila por fila).
+
+    Returns:
+        tuple: (indice, error)
+    """
+    start_date = min(doc["date"] for doc in docs)
+    end_date = max(doc["date"] for doc in docs)
+    existing, error = _query_existing_transactions(
+        session,
+        bank_account,
+        [["date", ">=", start_date], ["date", "<=", end_date]],
+        "Fetch existing bank transactions for import"
+    )
+    if error:
+        return None, error
+    index = _build_existing_index(existing)
+
+    lookups = (
+        ("reference_number", "by_reference"),
+        ("transaction_id", "by_transaction_id")
+    )
+    for field, index_name in lookups:
+        missing = list(dict.fromkeys(
+            doc[field] for doc in docs
+            if doc.get(field) and _normalize_reference(doc[field]) not in index[index_name]
+        ))
+        for start in range(0, len(missing), DUPLICATE_LOOKUP_CHUNK):
+            chunk = missing[start:start + DUPLICATE_LOOKUP_CHUNK]
+            matches, error = _query_existing_transactions(
+                session,
+                bank_account,
+                [[field, "in", chunk]],
+                f"Check duplicate bank transactions by {field}"
+            )
+            if error:
+                return None, error
+            _extend_existing_index(index, matches)
+
+    return index, None
+
+
+def _classify_duplicates(candidates, index):
+    """
+    Separar las filas a importar de las que ya existen en ERPNext, sin consultas.
+
+    - Con referencia: duplicado si ya existe esa referencia en la cuenta.
+    - Sin referencia pero con transaction_id: duplicado si ya existe ese transaction_id.
+    - Sin ninguna de las dos: duplicado si existe un movimiento sin referencia con la
+      misma fecha, monto y descripcion.
+
+    Returns:
+        tuple: (candidatos a importar, omitidos)
+    """
+    to_import = []
+    skipped = []
+    for candidate in candidates:
+        doc = candidate["doc"]
+        reference = doc.get("reference_number") or ""
+        transaction_id = doc.get("transaction_id") or ""
+        if reference:
+            match = index["by_reference"].get(_normalize_reference(reference))
+            reason = f"Duplicado: referencia '{reference}' ya existe"
+        elif transaction_id:
+            match = index["by_transaction_id"].get(_normalize_reference(transaction_id))
+            reason = f"Duplicado: referencia '{transaction_id}' ya existe"
+        else:
+            key = (doc["date"], round(doc["deposit"] - doc["withdrawal"], 2), _normalize_text(doc.get("description")))
+            match = next((tx for tx in index["by_key"].get(key, []) if not tx["reference_key"]), None)
+            reason = "Duplicado: ya existe un movimiento con la misma fecha, monto y descripcion"
+        if match:
+            skipped.append({
+                "row": candidate["row"],
+                "reason": reason,
+                "existing": match.get("name")
+            })
+            continue
+        to_import.append(candidate)
+    return to_import, skipped
+
+
+def _insert_transactions_in_chunks(session, candidates, chunk_size=MAX_BANK_TRANSACTION_BATCH):
+    """
+    Insertar con frappe.client.insert_many en lotes de chunk_size.
+
+    Un lote que falla no corta la importacion: se informa con sus filas y se sigue
+    con el resto (cada lote es una transaccion en ERPNext, todo o nada).
+
+    Returns:
+        tuple: (nombres importados, errores por lote)
+    """
+    imported = []
+    chunk_errors = []
+    total_batches = (len(candidates) + chunk_size - 1) // chunk_size
+    for batch_index in range(total_batches):
+        batch = candidates[batch_index * chunk_size:(batch_index + 1) * chunk_size]
+        rows = [candidate["row"] for candidate in batch]
+        label = f"{batch_index + 1}/{total_batches}"
+        try:
+            response, error = make_erpnext_request(
+                session=session,
+                method="POST",
+                endpoint="/api/method/frappe.client.insert_many",
+                data={"docs": [candidate["doc"] for candidate in batch]},
+                operation_name=f"Bulk insert bank transactions (batch {label})"
+            )
+            if error:
+                message = error.get("message") if isinstance(error, dict) else str(error)
+            elif response.status_code not in (200, 201):
+                message = response.text or f"HTTP {response.status_code}"
+            else:
+                names = response.json().get("message", [])
+                names = names if isinstance(names, list) else []
+                imported.extend({"name": name} for name in names)
+                logger.info("Bank import: lote %s importado (%s movimientos)", label, len(names))
+                continue
+        except Exception as exc:
+            message = str(exc)
+        logger.warning("Bank import: lote %s fallo (filas %s-%s): %s", label, rows[0], rows[-1], message)
+        chunk_errors.append({
+            "batch": batch_index + 1,
+            "rows": rows,
+            "count": len(batch),
+            "error": message
+        })
+    return imported, chunk_errors
+
+
 def _analyze_movements(rows, existing_transactions):
     """Detect duplicate or suspicious movements."""
     trackers = {
@@ -592,18 +719,6 @@ def import_bank_movements():
             transaction_id = movement.get('transaction_id') or ''
             currency = movement.get('currency') or movement.get('moneda') or default_currency
             
-            # Check for duplicates if enabled
-            if skip_duplicates and (reference or transaction_id):
-                is_duplicate = _check_duplicate_transaction(
-                    session, reference, transaction_id, resolved_bank_account, parsed_date
-                )
-                if is_duplicate:
-                    skipped.append({
-                        "row": row_num,
-                        "reason": f"Duplicado: referencia '{reference or transaction_id}' ya existe"
-                    })
-                    continue
-            
             # Build transaction document
             doc = {
                 "doctype": "Bank Transaction",
@@ -619,7 +734,24 @@ def import_bank_movements():
                 "status": "Pending"
             }
             
-            transactions_to_import.append(doc)
+            transactions_to_import.append({"row": row_num, "doc": doc})
+        
+        # Deduplicar contra ERPNext en memoria: una carga del rango de fechas en vez de
+        # una consulta por fila
+        if skip_duplicates and transactions_to_import:
+            existing_index, index_error = _load_duplicate_index(
+                session, resolved_bank_account, [candidate["doc"] for candidate in transactions_to_import]
+            )
+            if index_error:
+                print(f"DEBUG: Failed to load existing transactions: {index_error}")
+                return jsonify({
+                    "success": False,
+                    "message": "No se pudieron consultar los movimientos existentes para detectar duplicados",
+                    "errors": errors,
+                    "skipped": skipped
+                }), 502
+            transactions_to_import, duplicate_rows = _classify_duplicates(transactions_to_import, existing_index)
+            skipped.extend(duplicate_rows)
         
         if not transactions_to_import:
             return jsonify({
@@ -631,64 +763,21 @@ def import_bank_movements():
         
         print(f"DEBUG: Importing {len(transactions_to_import)} valid transactions")
         
-        # Bulk insert transactions in batches of MAX_BANK_TRANSACTION_BATCH
-        imported = []
-        import_errors = []
-        total_batches = (len(transactions_to_import) + MAX_BANK_TRANSACTION_BATCH - 1) // MAX_BANK_TRANSACTION_BATCH
-        
-        try:
-            for batch_index in range(total_batches):
-                start = batch_index * MAX_BANK_TRANSACTION_BATCH
-                end = start + MAX_BANK_TRANSACTION_BATCH
-                batch = transactions_to_import[start:end]
-                
-                if not batch:
-                    continue
-                
-                print(f"DEBUG: Importing batch {batch_index + 1}/{total_batches} with {len(batch)} transactions")
-                
-                response, error = make_erpnext_request(
-                    session=session,
-                    method="POST",
-                    endpoint="/api/method/frappe.client.insert_many",
-                    data={"docs": batch},
-                    operation_name=f"Bulk insert bank transactions (batch {batch_index + 1})"
-                )
-                
-                if error:
-                    print(f"DEBUG: Bulk insert error on batch {batch_index + 1}: {error}")
-                    return jsonify({
-                        "success": False,
-                        "message": f"Error al importar movimientos (lote {batch_index + 1}): {error}",
-                        "errors": errors,
-                        "skipped": skipped
-                    }), 500
-                
-                if response.status_code in [200, 201]:
-                    result = response.json()
-                    imported_names = result.get("message", [])
-                    if isinstance(imported_names, list):
-                        imported.extend({"name": name} for name in imported_names)
-                    print(f"DEBUG: Successfully imported batch {batch_index + 1} ({len(imported_names) if isinstance(imported_names, list) else 0} transactions)")
-                else:
-                    error_msg = response.text if response else "Error desconocido"
-                    print(f"DEBUG: Bulk insert failed on batch {batch_index + 1}: {error_msg}")
-                    return jsonify({
-                        "success": False,
-                        "message": f"Error al importar (lote {batch_index + 1}): {error_msg}",
-                        "errors": errors,
-                        "skipped": skipped
-                    }), 500
-                
-        except Exception as e:
-            print(f"DEBUG: Exception in bulk insert: {e}")
-            import traceback
-            traceback.print_exc()
+        imported, chunk_errors = _insert_transactions_in_chunks(session, transactions_to_import)
+        if imported:
+            # Movimientos con fecha en meses cerrados cambian los saldos cacheados de cierre
+            invalidate_balances(
+                'bank',
+                resolved_bank_account,
+                from_date=min(candidate["doc"]["date"] for candidate in transactions_to_import)
+            )
+        if chunk_errors and not imported:
             return jsonify({
                 "success": False,
-                "message": f"Error al importar movimientos: {str(e)}",
+                "message": f"Error al importar movimientos: {chunk_errors[0]['error']}",
                 "errors": errors,
-                "skipped": skipped
+                "skipped": skipped,
+                "chunk_errors": chunk_errors
             }), 500
         
         # Build response
@@ -696,12 +785,15 @@ def import_bank_movements():
         imported_count = len(imported)
         skipped_count = len(skipped)
         error_count = len(errors)
+        failed_count = sum(chunk["count"] for chunk in chunk_errors)
         
         message_parts = [f"{imported_count} movimientos importados"]
         if skipped_count > 0:
             message_parts.append(f"{skipped_count} omitidos (duplicados)")
         if error_count > 0:
             message_parts.append(f"{error_count} con errores")
+        if failed_count > 0:
+            message_parts.append(f"{failed_count} no importados ({len(chunk_errors)} lotes con error)")
         
         return jsonify({
             "success": True,
@@ -711,10 +803,12 @@ def import_bank_movements():
                 "imported": imported_count,
                 "skipped": skipped_count,
                 "errors": error_count,
+                "failed": failed_count,
                 "imported_transactions": imported
             },
             "errors": errors if errors else None,
-            "skipped": skipped if skipped else None
+            "skipped": skipped if skipped else None,
+            "chunk_errors": chunk_errors if chunk_errors else None
         }), 200
         
     except Exception as e:
@@ -25,13 +25,11 @@ from routes.general import update_company_item_count
 # Importar función para obtener conteo de items de compañía
 from routes.general import get_company_item_count
 
-# Importar función para obtener límite inteligente
-from routes.general import get_smart_limit
-
 # Importar función para obtener stock
 # Use fetch_bin_stock from inventory and centralized IVA helper from inventory_utils
 from routes.inventory import fetch_bin_stock
 from routes.inventory_utils import fetch_item_iva_rates_bulk as _fetch_item_iva_rates_bulk
+from services.item_catalog import get_catalog_items_by_code
 
 # Crear el blueprint para las rutas de bulk update
 bulk_update_bp = Blueprint('bulk_update', __name__)
@@ -345,88 +343,69 @@ def bulk_fetch_items():
         if not company_abbr:
             return jsonify({"success": False, "message": f"No se pudo obtener la abreviatura para la compañía '{company}'"}), 400
 
+        fields = [
+            "name", "item_code", "item_name", "description",
+            "stock_uom", "is_stock_item", "standard_rate",
+            "valuation_rate", "item_group", "docstatus",
+            "is_sales_item", "is_purchase_item", "lead_time_days",
+            "min_order_qty", "safety_stock", "max_discount",
+            "grant_commission", "custom_description_type",
+            "custom_product_links", "allow_negative_stock",
+            "brand", "item_defaults"
+        ]
+
+        # Agregar abreviaturas a los códigos para la búsqueda
+        codes_with_abbr = {}  # {codigo_limpio: codigo_con_abbr}
+        for code in codes:
+            code_clean = code.strip()
+            if not code_clean:
+                continue
+            if not code_clean.endswith(f" - {company_abbr}"):
+                codes_with_abbr[code_clean] = f"{code_clean} - {company_abbr}"
+            else:
+                codes_with_abbr[code_clean] = code_clean
+
         # OPTIMIZACIÓN: Si hay pocos códigos (<= 100), filtrar directamente en ERPNext
         # Independientemente del parámetro targeted, para asegurar optimización automática
         if len(codes) <= 100:  # Límite razonable para evitar URLs enormes
             print(f"🚀 OPTIMIZACIÓN: Fetch targeted - filtrando {len(codes)} códigos directamente en ERPNext...")
-            smart_limit = len(codes)  # Exacto al número de códigos
-            
-            # Agregar abreviaturas a los códigos para la búsqueda
-            codes_with_abbr = []
-            print(f"DEBUG: building codes_with_abbr for company_abbr {company_abbr}")
-            for code in codes:
-                code_clean = code.strip()
-                if not code_clean:
-                    continue
-                if not code_clean.endswith(f" - {company_abbr}"):
-                    code_with_abbr = f"{code_clean} - {company_abbr}"
-                else:
-                    code_with_abbr = code_clean
-                codes_with_abbr.append(code_with_abbr)
-            print(f"DEBUG: codes_with_abbr: {codes_with_abbr}")
             
             # Filtros base
             filters_list = [
                 ["disabled", "=", 0],
                 ["custom_company", "=", company],
                 ["docstatus", "in", [0, 1]],
-                ["item_code", "in", codes_with_abbr]  # Filtrar directamente por códigos
-            ]
-        else:
-            # Fallback a fetch completo (para backward compatibility)
-            print("📊 Fetch completo: Consultando inventario completo para filtrar en memoria...")
-            smart_limit = get_smart_limit(company, operation_type='list')
-            print(f"📊 Límite inteligente: {smart_limit}")
-            
-            # Filtros base sin filtro de códigos
-            filters_list = [
-                ["disabled", "=", 0],
-                ["custom_company", "=", company],
-                ["docstatus", "in", [0, 1]]
+                ["item_code", "in", list(codes_with_abbr.values())]  # Filtrar directamente por códigos
             ]
 
-        # If a warehouse is requested we are in stock mode: return only stock items
-        if warehouse:
-            filters_list.append(["is_stock_item", "=", 1])
-
-        params = {
-            "fields": json.dumps([
-                "name", "item_code", "item_name", "description",
-                "stock_uom", "is_stock_item", "standard_rate",
-                "valuation_rate", "item_group", "docstatus",
-                "is_sales_item", "is_purchase_item", "lead_time_days",
-                "min_order_qty", "safety_stock", "max_discount",
-                "grant_commission", "custom_description_type",
-                "custom_product_links", "allow_negative_stock",
-                "brand", "item_defaults"
-            ]),
+            # If a warehouse is requested we are in stock mode: return only stock items
+            if warehouse:
+                filters_list.append(["is_stock_item", "=", 1])
+
+            params = {
+                "fields": json.dumps(fields),
                 "filters": json.dumps(filters_list),
-            "limit_page_length": smart_limit
-        }
-
-        fetch_resp, fetch_error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/Item",
-            params=params,
-            operation_name="Bulk fetch - Get all company items"
-        )
-
-        if fetch_error:
-            print(f"❌ Error obteniendo inventario completo: {fetch_error}")
-            return jsonify({"success": False, "message": "Error obteniendo items del inventario"}), 500
-
-        if fetch_resp.status_code != 200:
-            print(f"❌ Error HTTP {fetch_resp.status_code}: {fetch_resp.text}")
-            return jsonify({"success": False, "message": f"Error HTTP {fetch_resp.status_code}"}), 500
-
-        all_items = fetch_resp.json().get('data', [])
-        print(f"✅ Items obtenidos del inventario: {len(all_items)}")
-
-        # Si fue fetch targeted (pocos códigos), ya viene filtrado, solo procesar
-        if len(codes) <= 100:
+                "limit_page_length": len(codes)  # Exacto al número de códigos
+            }
+
+            fetch_resp, fetch_error = make_erpnext_request(
+                session=session,
+                method="GET",
+                endpoint="/api/resource/Item",
+                params=params,
+                operation_name="Bulk fetch - Get targeted items"
+            )
+
+            if fetch_error:
+                print(f"❌ Error obteniendo items: {fetch_error}")
+                return jsonify({"success": False, "message": "Error obteniendo items del inventario"}), 500
+
+            if fetch_resp.status_code != 200:
+                print(f"❌ Error HTTP {fetch_resp.status_code}: {fetch_resp.text}")
+                return jsonify({"success": False, "message": f"Error HTTP {fetch_resp.status_code}"}), 500
+
             results = {}
-            for item in all_items:
+            for item in fetch_resp.json().get('data', []):
                 item_code = item.get('item_code')
                 if item_code:
                     # Remover sigla de compañía del código mostrado
@@ -434,38 +413,22 @@ def bulk_fetch_items():
                     results[display_code] = item
             print(f"✅ Códigos encontrados (targeted): {len(results)} de {len(codes)}")
         else:
-            # Fetch completo: crear mapa y filtrar en memoria como antes
-            inventory_map = {}
-            for item in all_items:
-                item_code = item.get('item_code')
-                if item_code:
-                    inventory_map[item_code] = item
-            
-            print(f"✅ Mapa de inventario creado: {len(inventory_map)} items")
+            # Muchos códigos: resolver contra la réplica local del catálogo (sin traer
+            # el inventario completo de ERPNext en cada llamada)
+            print("📊 Resolviendo códigos desde la réplica local del catálogo...")
+            inventory_map, catalog_error = get_catalog_items_by_code(
+                session, company, codes_with_abbr.values(), fields=fields, stock_only=bool(warehouse)
+            )
+
+            if catalog_error:
+                print(f"❌ Error obteniendo inventario: {catalog_error}")
+                return jsonify({"success": False, "message": "Error obteniendo items del inventario"}), 500
 
-            # Filtrar solo los códigos solicitados
             results = {}
-            codes_with_abbr = {}  # {codigo_limpio: codigo_con_abbr}
-            
-            for code in codes:
-                code_clean = code.strip()
-                if not code_clean:
-                    continue
-                
-                # Agregar abreviatura si no la tiene
-                code_with_abbr = code_clean
-                if not code_clean.endswith(f" - {company_abbr}"):
-                    code_with_abbr = f"{code_clean} - {company_abbr}"
-                
-                codes_with_abbr[code_clean] = code_with_abbr
-            
-            # Buscar en el mapa (operación O(1) por código)
-            for code_clean, code_with_abbr in codes_with_abbr.items():
-                if code_with_abbr in inventory_map:
-                    item = inventory_map[code_with_abbr]
-                    # Remover sigla de compañía del código mostrado
-                    display_code = remove_company_abbr(item['item_code'], company_abbr)
-                    results[display_code] = item
+            for item_code, item in inventory_map.items():
+                # Remover sigla de compañía del código mostrado
+                display_code = remove_company_abbr(item_code, company_abbr)
+                results[display_code] = item
             
             print(f"✅ Códigos encontrados: {len(results)} de {len(codes_with_abbr)}")
 
@@ -6,13 +6,15 @@ from urllib.parse import quote
 
 # Importar configuración
 from routes.auth_utils import get_session_with_auth
-from config import ERPNEXT_URL, ERPNEXT_HOST
+from config import ERPNEXT_URL, ERPNEXT_HOST, STATE_COUNTER_FLUSH_INTERVAL
+from utils.json_state_store import JsonStateStore
 
 # Importar función centralizada para obtener compañía activa
 from routes.general import get_active_company as get_central_active_company
 
 # Importar utilidades HTTP centralizadas
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
+from utils.company_cache import invalidate_company
 from routes.system_settings import apply_initial_system_settings
 
 # Crear el blueprint para las rutas de empresas
@@ -21,22 +23,25 @@ companies_bp = Blueprint('companies', __name__)
 # Archivo para almacenar empresas activas por usuario
 ACTIVE_COMPANIES_FILE = os.path.join(os.path.dirname(__file__), '..', 'active_companies.json')
 
+# Cache en memoria validado por mtime + escrituras atómicas con lock entre procesos
+active_companies_store = JsonStateStore(
+    ACTIVE_COMPANIES_FILE,
+    default_factory=lambda: {"active_companies": {}},
+    flush_interval=STATE_COUNTER_FLUSH_INTERVAL
+)
+
 def load_active_companies():
-    """Carga las empresas activas desde el archivo JSON"""
+    """Carga las empresas activas (copia del estado cacheado; para modificar usar active_companies_store.edit())"""
     try:
-        if os.path.exists(ACTIVE_COMPANIES_FILE):
-            with open(ACTIVE_COMPANIES_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {"active_companies": {}}
+        return active_companies_store.snapshot()
     except Exception as e:
         print(f"Error al cargar empresas activas: {e}")
         return {"active_companies": {}}
 
 def save_active_companies(data):
-    """Guarda las empresas activas en el archivo JSON"""
+    """Guarda las empresas activas en el archivo JSON (reemplaza el contenido completo)"""
     try:
-        with open(ACTIVE_COMPANIES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        active_companies_store.replace(data)
         return True
     except Exception as e:
         print(f"Error al guardar empresas activas: {e}")
@@ -45,18 +50,15 @@ def save_active_companies(data):
 def remove_company_from_active(user_id, company_name):
     """Remueve una empresa específica de la lista de empresas activas de un usuario"""
     try:
-        active_data = load_active_companies()
-        active_companies = active_data.get('active_companies', {})
+        with active_companies_store.edit() as active_data:
+            active_companies = active_data.setdefault('active_companies', {})
 
-        # Si el usuario tiene esta empresa como activa, removerla
-        if user_id in active_companies and active_companies[user_id] == company_name:
-            del active_companies[user_id]
-            print(f"Empresa '{company_name}' removida de empresas activas para usuario '{user_id}'")
+            # Si el usuario tiene esta empresa como activa, removerla
+            if active_companies.get(user_id) == company_name:
+                del active_companies[user_id]
+                print(f"Empresa '{company_name}' removida de empresas activas para usuario '{user_id}'")
 
-            active_data['active_companies'] = active_companies
-            return save_active_companies(active_data)
-
-        return True  # No había nada que remover
+        return True
     except Exception as e:
         print(f"Error al remover empresa de activas: {e}")
         return False
@@ -307,6 +309,8 @@ def update_company(company_name):
             print(f"Error actualizando empresa: {error}")
             return handle_erpnext_error(error, "Error al actualizar empresa")
 
+        invalidate_company(company_name)
+
         # ERPNext devuelve los datos actualizados de la empresa
         updated_company_data = response.json()
 
@@ -628,6 +632,8 @@ def delete_company(company_name):
             print(f"Error eliminando empresa: {error}")
             return handle_erpnext_error(error, "Error al eliminar empresa")
 
+        invalidate_company(company_name)
+
         print(f"Empresa '{company_name}' eliminada exitosamente")
 
         # SEXTO: Remover la empresa del archivo de empresas activas
@@ -1276,26 +1282,21 @@ def set_active_company():
     print(f"Estableciendo empresa activa '{company_name}' para usuario {user_id}")
 
     try:
-        # Cargar empresas activas actuales (esto incluye todas las secciones del archivo)
-        active_data = load_active_companies()
-        
-        # Asegurarse de que existe la sección active_companies
-        if "active_companies" not in active_data:
-            active_data["active_companies"] = {}
-        
-        # Actualizar la empresa activa del usuario (solo esta sección)
-        active_data["active_companies"][user_id] = company_name
-
-        # Guardar los cambios preservando todas las secciones
-        if save_active_companies(active_data):
-            print(f"Empresa activa '{company_name}' establecida para usuario {user_id}")
-            return jsonify({
-                "success": True,
-                "message": f"Empresa '{company_name}' establecida como activa"
-            })
-        else:
+        # Actualizar solo la empresa activa del usuario (se relee el archivo bajo lock y se
+        # preservan todas las secciones)
+        try:
+            with active_companies_store.edit() as active_data:
+                active_data.setdefault("active_companies", {})[user_id] = company_name
+        except Exception as save_error:
+            print(f"Error al guardar empresa activa: {save_error}")
             return jsonify({"success": False, "message": "Error al guardar empresa activa"}), 500
 
+        print(f"Empresa activa '{company_name}' establecida para usuario {user_id}")
+        return jsonify({
+            "success": True,
+            "message": f"Empresa '{company_name}' establecida como activa"
+        })
+
     except Exception as e:
         print(f"Error al establecer empresa activa: {e}")
         return jsonify({"success": False, "message": "Error al establecer empresa activa"}), 500
@@ -1316,24 +1317,17 @@ def clear_active_company():
     print(f"Eliminando empresa activa para usuario {user_id}")
 
     try:
-        # Cargar empresas activas actuales (esto incluye todas las secciones del archivo)
-        active_data = load_active_companies()
-        
-        # Asegurarse de que existe la sección active_companies
-        if "active_companies" not in active_data:
-            active_data["active_companies"] = {}
-
-        # Eliminar la empresa activa del usuario si existe
-        if user_id in active_data["active_companies"]:
-            del active_data["active_companies"][user_id]
-            if save_active_companies(active_data):
-                print(f"Empresa activa eliminada para usuario {user_id}")
-                return jsonify({
-                    "success": True,
-                    "message": "Empresa activa eliminada"
-                })
-            else:
-                return jsonify({"success": False, "message": "Error al eliminar empresa activa"}), 500
+        # Eliminar la empresa activa del usuario si existe (se relee el archivo bajo lock
+        # y se preservan todas las secciones)
+        with active_companies_store.edit() as active_data:
+            removed = active_data.get("active_companies", {}).pop(user_id, None) is not None
+
+        if removed:
+            print(f"Empresa activa eliminada para usuario {user_id}")
+            return jsonify({
+                "success": True,
+                "message": "Empresa activa eliminada"
+            })
         else:
             print(f"No había empresa activa configurada para usuario {user_id}")
             return jsonify({
@@ -1662,22 +1656,17 @@ def delete_active_company():
     print(f"Eliminando empresa activa para usuario {user_id}")
 
     try:
-        # Cargar empresas activas actuales
-        active_data = load_active_companies()
-        active_companies = active_data.get("active_companies", {})
-
-        # Eliminar la empresa activa del usuario si existe
-        if user_id in active_companies:
-            del active_companies[user_id]
-            active_data["active_companies"] = active_companies
-            if save_active_companies(active_data):
-                print(f"Empresa activa eliminada para usuario {user_id}")
-                return jsonify({
-                    "success": True,
-                    "message": "Empresa activa eliminada"
-                })
-            else:
-                return jsonify({"success": False, "message": "Error al eliminar empresa activa"}), 500
+        # Eliminar la empresa activa del usuario si existe (se relee el archivo bajo lock
+        # y se preservan todas las secciones)
+        with active_companies_store.edit() as active_data:
+            removed = active_data.get("active_companies", {}).pop(user_id, None) is not None
+
+        if removed:
+            print(f"Empresa activa eliminada para usuario {user_id}")
+            return jsonify({
+                "success": True,
+                "message": "Empresa activa eliminada"
+            })
         else:
             print(f"No había empresa activa configurada para usuario {user_id}")
             return jsonify({
@@ -1947,16 +1936,14 @@ def get_inventory_tab_preference():
 
     try:
         # Obtener compañía activa
-        active_data = load_active_companies()
-        company = active_data.get('active_companies', {}).get(user_id)
+        company = active_companies_store.get('active_companies', user_id)
 
         if not company:
             return jsonify({"success": False, "message": "No hay compañía activa"}), 400
 
         # Cargar preferencias
-        preferences = active_data.get('inventory_preferences', {})
         user_company_key = f"{user_id}_{company}"
-        default_tab = preferences.get(user_company_key, 'services')  # Por defecto: servicios
+        default_tab = active_companies_store.get('inventory_preferences', user_company_key, 'services')  # Por defecto: servicios
 
         print(f"Preferencia de tab para {user_id} en {company}: {default_tab}")
 
@@ -1990,33 +1977,30 @@ def set_inventory_tab_preference():
         if not default_tab or default_tab not in ['products', 'services']:
             return jsonify({"success": False, "message": "Tab inválido. Debe ser 'products' o 'services'"}), 400
 
-        # Obtener compañía activa
-        active_data = load_active_companies()
-        company = active_data.get('active_companies', {}).get(user_id)
+        # Obtener compañía activa y guardar la preferencia en la misma edición
+        try:
+            with active_companies_store.edit() as active_data:
+                company = active_data.get('active_companies', {}).get(user_id)
+                if company:
+                    user_company_key = f"{user_id}_{company}"
+                    active_data.setdefault('inventory_preferences', {})[user_company_key] = default_tab
+        except Exception as save_error:
+            print(f"Error guardando preferencia de tab: {save_error}")
+            return jsonify({"success": False, "message": "Error al guardar preferencia"}), 500
 
         if not company:
             return jsonify({"success": False, "message": "No hay compañía activa"}), 400
 
-        # Guardar preferencia
-        if 'inventory_preferences' not in active_data:
-            active_data['inventory_preferences'] = {}
-
-        user_company_key = f"{user_id}_{company}"
-        active_data['inventory_preferences'][user_company_key] = default_tab
-
-        if save_active_companies(active_data):
-            print(f"Preferencia de tab guardada: {user_id} en {company} -> {default_tab}")
-            return jsonify({
-                "success": True,
-                "message": "Preferencia guardada exitosamente",
-                "data": {
-                    "default_tab": default_tab,
-                    "user_id": user_id,
-                    "company": company
-                }
-            })
-        else:
-            return jsonify({"success": False, "message": "Error al guardar preferencia"}), 500
+        print(f"Preferencia de tab guardada: {user_id} en {company} -> {default_tab}")
+        return jsonify({
+            "success": True,
+            "message": "Preferencia guardada exitosamente",
+            "data": {
+                "default_tab": default_tab,
+                "user_id": user_id,
+                "company": company
+            }
+        })
 
     except Exception as e:
         print(f"Error guardando preferencia de tab: {e}")
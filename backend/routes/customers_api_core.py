@@ -3,7 +3,6 @@ import os
 import requests
 import json
 from urllib.parse import quote
-from datetime import datetime, timedelta
 
 # Importar configuración
 from config import ERPNEXT_URL, ERPNEXT_HOST
@@ -14,7 +13,7 @@ from routes.general import get_active_company, get_company_abbr, add_company_abb
 # Importar función de autenticación centralizada
 from routes.auth_utils import get_session_with_auth
 from routes.customer_utils import ensure_customer_by_tax, fetch_customer, get_customer_tax_condition
-from routes.customers_common import _get_active_company_abbr, _safe_float
+from routes.customers_common import _get_active_company_abbr
 
 # Importar utilidades HTTP centralizadas
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
@@ -24,6 +23,7 @@ from utils.conciliation_utils import (
     exclude_balanced_documents,
     summarize_group_balances,
 )
+from services.party_balance_service import get_party_balances
 
 # Crear el blueprint para las rutas de clientes
 
@@ -254,95 +254,18 @@ def register(bp):
             if not company_name:
                 return jsonify({"success": False, "message": f"No hay compañía activa configurada para el usuario {user_id}"}), 400
 
-            closing_balance_map = {}
-            try:
-                try:
-                    to_date = datetime.utcnow().date()
-                except Exception:
-                    to_date = datetime.now().date()
-                from_date = to_date - timedelta(days=30)
-
-                report_params = {
-                    "report_name": "Customer Ledger Summary",
-                    "filters": json.dumps({
-                        "company": company_name,
-                        "from_date": from_date.strftime("%Y-%m-%d"),
-                        "to_date": to_date.strftime("%Y-%m-%d")
-                    }),
-                    "ignore_prepared_report": "false",
-                    "are_default_filters": "false"
-                }
-                report_response, report_error = make_erpnext_request(
-                    session=session,
-                    method="GET",
-                    endpoint="/api/method/frappe.desk.query_report.run",
-                    params=report_params,
-                    operation_name="Fetch Customer Ledger Summary"
-                )
-
-                if not report_error and report_response and report_response.status_code == 200:
-                    report_payload = report_response.json()
-                    for row in report_payload.get("message", {}).get("result", []):
-                        customer_key = row.get("customer_name") or row.get("party_name") or row.get("party")
-                        if not customer_key:
-                            continue
-                        closing_balance = row.get("closing_balance")
-                        if closing_balance is None:
-                            continue
-                        closing_balance_map[customer_key] = closing_balance
-                        if " - " in customer_key:
-                            closing_balance_map[customer_key.split(" - ")[0]] = closing_balance
-            except Exception as err:
-                print(f" Error obteniendo reporte de saldos: {err}")
-
-            balances = {}
-
-            # Para cada cliente, calcular el saldo neto
-            for customer_name in customer_names:
-                try:
-                    # Obtener todas las facturas del cliente para calcular saldo neto
-                    company_abbr = get_company_abbr(session, headers, company_name)
-                    search_customer_name = customer_name
-                    if company_abbr:
-                        search_customer_name = resolve_customer_name(customer_name, company_abbr)
-
-                    invoice_filters = [
-                        ["customer", "=", customer_name],
-                        ["company", "=", company_name],
-                        ["docstatus", "=", 1],  # Solo Submitted
-                    ]
-
-                    fields = '["outstanding_amount"]'
-                    filters_str = json.dumps(invoice_filters)
-                    balance_url = f"/api/resource/Sales%20Invoice?fields={quote(fields)}&filters={quote(filters_str)}&limit_page_length=1000"
-                    balance_response, balance_error = make_erpnext_request(
-                        session=session,
-                        method="GET",
-                        endpoint=balance_url,
-                        operation_name="Fetch Customer Balance"
-                    )
-
-                    closing_balance = None
-                    if closing_balance_map:
-                        closing_balance = closing_balance_map.get(search_customer_name)
-                        if closing_balance is None:
-                            closing_balance = closing_balance_map.get(customer_name)
-                    if closing_balance is not None:
-                        balances[customer_name] = _safe_float(closing_balance)
-                        continue
-
-                    if balance_error:
-                        balances[customer_name] = 0
-                    else:
-                        balance_data = balance_response.json()
-                        invoices = balance_data.get("data", [])
-                    
-                        # Calcular saldo neto sumando todos los outstanding_amount
-                        net_balance = sum(invoice.get("outstanding_amount", 0) for invoice in invoices)
-                        balances[customer_name] = net_balance
-
-                except Exception as e:
-                    balances[customer_name] = 0
+            company_abbr = get_company_abbr(session, headers, company_name)
+            party_balances = get_party_balances(
+                session,
+                'Customer',
+                company_name,
+                customer_names,
+                resolve_name=(lambda name: resolve_customer_name(name, company_abbr)) if company_abbr else None
+            )
+            balances = {
+                customer_name: party_balances.get(customer_name, {}).get('outstanding_amount', 0)
+                for customer_name in customer_names
+            }
 
             return jsonify({"success": True, "data": balances, "message": "Saldos obtenidos correctamente"})
 
@@ -1,7 +1,9 @@
+import json
+import os
 import re
 from urllib.parse import quote, urljoin, urlparse
 
-from flask import Blueprint, request, jsonify, make_response
+from flask import Blueprint, Response, request, jsonify, send_file, stream_with_context
 from werkzeug.utils import secure_filename
 
 from routes.auth_utils import get_session_with_auth
@@ -15,14 +17,34 @@ from services.letterhead_service import (
     upload_file_to_erpnext,
     upsert_letterhead,
     enrich_letterhead_doc,
-    ensure_inline_letterhead_doc
+    ensure_inline_letterhead_doc,
+    get_inline_letterhead_fingerprint,
+    invalidate_inline_letterhead,
+    resolve_inline_letterhead
 )
-from config import ERPNEXT_URL
+from services.pdf_cache import (
+    clear_pdf_cache,
+    iter_file,
+    open_cached_pdf,
+    pdf_cache_key,
+    pdf_cache_stats,
+    record_bypass,
+    stream_and_store
+)
+from services.pdf_export import (
+    clear_print_format_versions,
+    export_path,
+    get_print_format_version,
+    iter_response_chunks,
+    list_export_documents,
+    request_pdf_stream,
+    run_pdf_export
+)
+from services.job_runner import get_job, submit_job
+from config import ERPNEXT_URL, PDF_EXPORT_MAX_DOCUMENTS
 
 document_formats_bp = Blueprint('document_formats', __name__)
 
-DOWNLOAD_ENDPOINT = "/api/method/frappe.utils.print_format.download_pdf"
-
 
 def analyze_printview_images(session, doc_type, doc_name, format_name, no_letterhead, letterhead=None):
     if not ERPNEXT_URL:
@@ -128,6 +150,9 @@ def download_document_pdf(doc_type, doc_name):
     """
     Proxy para descargar PDFs de ERPNext usando el print format configurado.
     Maneja las cookies de sesi�n y resuelve CORS para el frontend.
+
+    Los documentos confirmados se sirven desde el cache en disco (services/pdf_cache);
+    si no están, el PDF se reenvía por bloques a medida que llega de ERPNext.
     """
     if request.method == 'OPTIONS':
         # Responder OK para los preflight y evitar que el navegador bloquee la petici�n
@@ -142,35 +167,24 @@ def download_document_pdf(doc_type, doc_name):
     filename = request.args.get('filename') or f"{doc_name}.pdf"
     company_name = get_active_company(user_id)
 
-    letterhead_param = None
-    if str(no_letterhead) == '0' and company_name:
-        base_letterhead, base_error = fetch_letterhead(session, company_name)
-        if base_error:
-            print(f"[DocumentFormats] No se pudo obtener el letterhead base: {base_error}")
-        elif base_letterhead:
-            inline_name, inline_error = ensure_inline_letterhead_doc(session, company_name, base_letterhead)
-            if inline_error:
-                print(f"[DocumentFormats] No se pudo asegurar el letterhead embebido: {inline_error}")
-            else:
-                letterhead_param = inline_name
-
-    request_params = {
-        'doctype': doc_type,
-        'name': doc_name,
-        'format': format_name,
-        'no_letterhead': no_letterhead
-    }
-    if letterhead_param:
-        request_params['letterhead'] = letterhead_param
+    letterhead_param, letterhead_hash = _resolve_pdf_letterhead(session, company_name, no_letterhead)
 
-    response, error = make_erpnext_request(
-        session=session,
-        method='GET',
-        endpoint=DOWNLOAD_ENDPOINT,
-        params=request_params,
-        custom_headers={'Accept': 'application/pdf'},
-        operation_name=f'Download PDF {doc_type}:{doc_name}'
-    )
+    cache_key = None
+    modified, docstatus = fetch_document_version(session, doc_type, doc_name)
+    format_version = get_print_format_version(session, format_name) if modified and docstatus >= 1 else None
+    if format_version is not None:
+        cache_key = pdf_cache_key(
+            doc_type, doc_name, modified, format_name, no_letterhead, letterhead_hash, format_version
+        )
+        cached = open_cached_pdf(cache_key)
+        if cached:
+            return _pdf_response(
+                iter_file(cached), filename, cache_status='HIT', content_length=os.fstat(cached.fileno()).st_size
+            )
+    else:
+        record_bypass()
+
+    response, error = request_pdf_stream(session, doc_type, doc_name, format_name, no_letterhead, letterhead_param)
 
     if error:
         message = error.get('message') or 'No se pudo generar el PDF'
@@ -191,12 +205,195 @@ def download_document_pdf(doc_type, doc_name):
             'details': details
         }), error.get('status_code', 500)
 
-    flask_response = make_response(response.content)
-    flask_response.headers.set('Content-Type', 'application/pdf')
+    chunks = iter_response_chunks(response)
+    if cache_key:
+        chunks = stream_and_store(cache_key, chunks)
+    # Con Content-Encoding (gzip) el largo informado no es el de los bytes que se reenvían
+    content_length = None if response.headers.get('Content-Encoding') else response.headers.get('Content-Length')
+    return _pdf_response(chunks, filename, cache_status='MISS' if cache_key else 'BYPASS', content_length=content_length)
+
+
+def _resolve_pdf_letterhead(session, company_name, no_letterhead):
+    """
+    Letter Head embebido a usar en download_pdf y su hash (para la clave del cache).
+
+    Returns:
+        tuple: (nombre o None, hash o None)
+    """
+    if str(no_letterhead) != '0' or not company_name:
+        return None, None
+    # Cacheado por compañía: en una tanda de PDFs solo se llama a download_pdf
+    inline_name, inline_error = resolve_inline_letterhead(session, company_name)
+    if inline_error:
+        print(f"[DocumentFormats] No se pudo asegurar el letterhead embebido: {inline_error}")
+        return None, None
+    if not inline_name:
+        return None, None
+    return inline_name, get_inline_letterhead_fingerprint(company_name)
+
+
+def _pdf_response(chunks, filename, cache_status, content_length=None):
+    """PDF enviado por bloques (sin juntar el archivo entero en memoria)"""
+    flask_response = Response(stream_with_context(chunks), mimetype='application/pdf')
     flask_response.headers.set('Content-Disposition', f'attachment; filename="{filename}"')
+    flask_response.headers.set('X-PDF-Cache', cache_status)
+    if content_length:
+        flask_response.headers.set('Content-Length', str(content_length))
     return flask_response
 
 
+def fetch_document_version(session, doc_type, doc_name):
+    """
+    `modified` y docstatus del documento para armar la clave del cache de PDFs.
+
+    Returns:
+        tuple: (modified o None, docstatus); (None, 0) si no se pudo leer
+    """
+    response, error = make_erpnext_request(
+        session=session,
+        method='GET',
+        endpoint=f"/api/resource/{quote(doc_type)}",
+        params={
+            'filters': json.dumps([["name", "=", doc_name]]),
+            'fields': json.dumps(["modified", "docstatus"]),
+            'limit_page_length': 1
+        },
+        operation_name=f'Get PDF cache version {doc_type}:{doc_name}'
+    )
+    if error or not response or response.status_code != 200:
+        return None, 0
+    rows = response.json().get('data') or []
+    if not rows:
+        return None, 0
+    return rows[0].get('modified'), int(rows[0].get('docstatus') or 0)
+
+
+@document_formats_bp.route('/api/document-formats/pdf-cache/stats', methods=['GET'])
+def get_pdf_cache_stats():
+    """Hits/misses del cache de PDFs de este proceso y ocupación del directorio"""
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+    return jsonify({'success': True, 'data': pdf_cache_stats()})
+
+
+@document_formats_bp.route('/api/document-formats/pdf-cache/clear', methods=['POST'])
+def clear_document_pdf_cache():
+    """Vaciar el cache de PDFs (p. ej. después de editar un print format)"""
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+    clear_print_format_versions()
+    removed = clear_pdf_cache()
+    return jsonify({'success': True, 'data': {'removed': removed}})
+
+
+@document_formats_bp.route('/api/document-formats/pdf-export', methods=['POST'])
+def start_pdf_export():
+    """
+    Exportar PDFs de varios documentos en un zip (job en segundo plano).
+
+    Body: {"doctype": "...", "names": [...]} o {"doctype": "...", "filters": [[...]]},
+    más format/print_format, no_letterhead y filename opcionales. Con filtros se
+    agrega el de la compañía activa si no viene uno. El progreso se consulta en
+    /api/jobs/<process_id> y el zip en download_url cuando termina.
+    """
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
+    payload = request.get_json(silent=True) or {}
+    doc_type = (payload.get('doctype') or '').strip()
+    names = payload.get('names')
+    filters = payload.get('filters')
+    if not doc_type:
+        return jsonify({'success': False, 'message': 'doctype requerido'}), 400
+    if names is None and filters is None:
+        return jsonify({'success': False, 'message': 'Indicá names o filters'}), 400
+    if names is not None and (not isinstance(names, list) or not all(isinstance(name, str) for name in names)):
+        return jsonify({'success': False, 'message': 'names debe ser una lista de nombres'}), 400
+    if filters is not None and not isinstance(filters, list):
+        return jsonify({'success': False, 'message': 'filters debe ser una lista de filtros'}), 400
+
+    company_name = get_active_company(user_id)
+    if names is None:
+        filters = [list(condition) for condition in filters]
+        if company_name and not any(condition and condition[0] == 'company' for condition in filters):
+            filters.append(['company', '=', company_name])
+
+    format_name = payload.get('format') or payload.get('print_format') or 'Standard'
+    no_letterhead = str(payload.get('no_letterhead', '0'))
+
+    try:
+        rows, missing, list_error = list_export_documents(session, doc_type, names=names, filters=filters)
+        if list_error:
+            return jsonify({
+                'success': False,
+                'message': list_error.get('message') or 'No se pudieron listar los documentos'
+            }), list_error.get('status_code', 500)
+        total = len(rows) + len(missing)
+        if not rows:
+            return jsonify({'success': False, 'message': 'No hay documentos para exportar'}), 404
+        if total > PDF_EXPORT_MAX_DOCUMENTS:
+            return jsonify({
+                'success': False,
+                'message': f'Se pueden exportar hasta {PDF_EXPORT_MAX_DOCUMENTS} documentos por vez ({total} pedidos)'
+            }), 400
+
+        # Un solo letterhead resuelto para todo el lote
+        letterhead_param, letterhead_hash = _resolve_pdf_letterhead(session, company_name, no_letterhead)
+        options = {
+            'format': format_name,
+            'format_version': get_print_format_version(session, format_name),
+            'no_letterhead': no_letterhead,
+            'letterhead': letterhead_param,
+            'letterhead_hash': letterhead_hash,
+        }
+        file_name = secure_filename(payload.get('filename') or '') or f"{secure_filename(doc_type) or 'documentos'}.zip"
+        if not file_name.lower().endswith('.zip'):
+            file_name += '.zip'
+
+        process_id = submit_job(
+            "pdf_export",
+            run_pdf_export,
+            session,
+            doc_type,
+            rows,
+            missing,
+            options,
+            file_name,
+            company=company_name,
+            user_id=user_id,
+            total=total,
+            current_item="Iniciando exportación...",
+            message=f"Exportando {total} PDFs de {doc_type}...",
+            data={'doctype': doc_type, 'file_name': file_name}
+        )
+        return jsonify({'success': True, 'process_id': process_id, 'total': total, 'missing': missing})
+    except Exception as exc:
+        print(f"[DocumentFormats] Error iniciando exportación de PDFs: {exc}")
+        return jsonify({'success': False, 'message': str(exc)}), 500
+
+
+@document_formats_bp.route('/api/document-formats/pdf-export/<job_id>/download', methods=['GET'])
+def download_pdf_export(job_id):
+    """Zip generado por /api/document-formats/pdf-export"""
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
+    job = get_job(job_id)
+    if not job or job.get('kind') != 'pdf_export' or job.get('user_id') != user_id:
+        return jsonify({'success': False, 'message': 'Exportación no encontrada'}), 404
+    if job.get('status') != 'completed':
+        return jsonify({'success': False, 'message': f"La exportación no terminó ({job.get('status')})", 'data': job}), 409
+
+    path = export_path(job_id)
+    if not os.path.exists(path):
+        return jsonify({'success': False, 'message': 'El archivo de la exportación ya no está disponible'}), 410
+    return send_file(path, mimetype='application/zip', as_attachment=True, download_name=job.get('file_name') or f"{job_id}.zip")
+
+
 @document_formats_bp.route('/api/document-formats/logo', methods=['POST'])
 def upload_letterhead_logo():
     session, headers, user_id, error_response = get_session_with_auth()
@@ -332,6 +529,7 @@ def save_letterhead():
 
     data = response.json().get('data') if response is not None else letterhead_payload
     enriched = enrich_letterhead_doc(data)
+    invalidate_inline_letterhead(company_name)
     inline_name, inline_error = ensure_inline_letterhead_doc(session, company_name, enriched)
     if inline_error:
         print(f"[DocumentFormats] No se pudo preparar el letterhead embebido: {inline_error}")
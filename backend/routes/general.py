@@ -1,7 +1,4 @@
 from flask import Blueprint, request, jsonify
-from urllib.parse import quote
-import os
-import json
 
 # Importar configuración
 from config import ERPNEXT_URL, ERPNEXT_HOST
@@ -10,27 +7,21 @@ from config import ERPNEXT_URL, ERPNEXT_HOST
 from routes.auth_utils import get_session_with_auth
 
 # Importar utilidades HTTP
-from utils.http_utils import make_erpnext_request, handle_erpnext_error
+from utils.http_utils import handle_erpnext_error
+from utils.company_cache import get_company_doc, get_company_field
+from utils.ttl_cache import get_all_cache_stats
+from utils.schema_registry import forget_schema, schema_registry_stats
 
 # Crear el blueprint para rutas generales
 general_bp = Blueprint('general', __name__)
 
 def get_company_abbr(session, headers, company_name):
-    """Obtener la sigla (abbr) de una compañía desde ERPNext"""
+    """Obtener la sigla (abbr) de una compañía desde ERPNext (cacheada por compañía)"""
     try:
-        response, error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint=f"/api/resource/Company/{quote(company_name)}",
-            operation_name="Get Company Abbr"
-        )
-        
-        if not error and response.status_code == 200:
-            company_data = response.json().get('data', {})
-            abbr = company_data.get('abbr')
-            if abbr:
-                return abbr
-        
+        abbr = get_company_field(session, company_name, 'abbr')
+        if abbr:
+            return abbr
+
         print("--- Company abbr: not found")
         return None
     except Exception as e:
@@ -38,25 +29,16 @@ def get_company_abbr(session, headers, company_name):
         return None
 
 def get_company_default_currency(session, headers, company_name):
-    """Obtener la moneda por defecto de una compañía desde ERPNext"""
+    """Obtener la moneda por defecto de una compañía desde ERPNext (cacheada por compañía)"""
     try:
         if not company_name:
             return None
 
-        params = {"fields": json.dumps(["default_currency"])}
-        response, error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint=f"/api/resource/Company/{quote(company_name)}",
-            params=params,
-            operation_name="Get Company Default Currency"
-        )
-
-        if error or not response or response.status_code != 200:
+        company_data = get_company_doc(session, company_name)
+        if not company_data:
             print(f"--- Company default currency: failed to load {company_name}")
             return None
 
-        company_data = response.json().get('data', {})
         return company_data.get('default_currency')
     except Exception as e:
         print(f"--- Company default currency: error - {e}")
@@ -65,14 +47,10 @@ def get_company_default_currency(session, headers, company_name):
 def get_active_company(user_id):
     """Obtener la compañía activa para un usuario específico"""
     try:
-        # Importar la función load_active_companies desde companies.py
-        from routes.companies import load_active_companies
-        
-        active_data = load_active_companies()
-        active_companies = active_data.get("active_companies", {})
-        active_company = active_companies.get(user_id)
+        # Store de active_companies.json (companies.py); lectura desde memoria validada por mtime
+        from routes.companies import active_companies_store
 
-        return active_company
+        return active_companies_store.get("active_companies", user_id)
     except Exception as e:
         return None
 
@@ -174,52 +152,33 @@ def resolve_customer_name(customer_name, company_abbr):
 def get_company_item_count(company_name):
     """Obtener el conteo de items para una compañía desde active_companies.json"""
     try:
-        config_path = os.path.join(os.path.dirname(__file__), '..', 'active_companies.json')
-        
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        
-        company_item_counts = config.get('company_item_counts', {})
-        return company_item_counts.get(company_name, 0)
-    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        from routes.companies import active_companies_store
+        return active_companies_store.get_counter('company_item_counts', company_name)
+    except Exception:
         return 0
 
 def update_company_item_count(company_name, operation='increment'):
     """Actualizar el conteo de items para una compañía en active_companies.json
-    
+
+    Los cambios se acumulan en memoria y se escriben juntos (STATE_COUNTER_FLUSH_INTERVAL),
+    releyendo el archivo bajo lock: una creación masiva de items no reescribe el archivo
+    por cada item ni pisa los conteos de otro worker.
+
     Args:
         company_name: Nombre de la compañía
         operation: 'increment' o 'decrement' para aumentar o disminuir el conteo
     """
     try:
-        config_path = os.path.join(os.path.dirname(__file__), '..', 'active_companies.json')
-        
-        # Leer configuración actual
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            config = {'company_item_counts': {}}
-        
-        company_item_counts = config.get('company_item_counts', {})
-        current_count = company_item_counts.get(company_name, 0)
-        
-        # Actualizar conteo
+        from routes.companies import active_companies_store
+
         if operation == 'increment':
-            company_item_counts[company_name] = current_count + 1
+            active_companies_store.increment('company_item_counts', company_name, 1, minimum=0)
         elif operation == 'decrement':
-            company_item_counts[company_name] = max(0, current_count - 1)
+            active_companies_store.increment('company_item_counts', company_name, -1, minimum=0)
         else:
             print(f"--- Invalid operation for update_company_item_count: {operation}")
             return
-        
-        # Guardar configuración actualizada
-        config['company_item_counts'] = company_item_counts
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        
-        print(f"--- Company item count updated: {company_name} {operation}d to {company_item_counts[company_name]}")
-        
+
     except Exception as e:
         print(f"--- Error updating company item count: {e}")
         # No fallar si no se puede actualizar el conteo
@@ -268,13 +227,11 @@ def get_formula_history_entries(user_id, company_name, limit=5):
         key = _get_formula_history_key(user_id, company_name)
         if not key:
             return []
-        from routes.companies import load_active_companies  # lazy import to avoid circular deps
-        data = load_active_companies()
-        history_map = data.get("formula_history", {})
-        history = history_map.get(key, [])
+        from routes.companies import active_companies_store  # lazy import to avoid circular deps
+        history = active_companies_store.get("formula_history", key, [])
         if not isinstance(history, list):
             return []
-        return history[:limit]
+        return list(history[:limit])
     except Exception as e:
         print(f"--- Formula history read error: {e}")
         return []
@@ -290,28 +247,26 @@ def append_formula_history_entry(user_id, company_name, formula, limit=5):
         if not trimmed:
             return get_formula_history_entries(user_id, company_name, limit=limit)
 
-        from routes.companies import load_active_companies, save_active_companies  # lazy import
-        data = load_active_companies()
-        history_map = data.get("formula_history")
-        if not isinstance(history_map, dict):
-            history_map = {}
-
-        existing = history_map.get(key, [])
-        if not isinstance(existing, list):
-            existing = []
-
-        new_history = [trimmed]
-        for entry in existing:
-            if entry == trimmed:
-                continue
-            new_history.append(entry)
-            if len(new_history) >= limit:
-                break
-
-        history_map[key] = new_history[:limit]
-        data["formula_history"] = history_map
-        if not save_active_companies(data):
-            print("--- Warning: failed to persist formula history")
+        from routes.companies import active_companies_store  # lazy import
+        with active_companies_store.edit() as data:
+            history_map = data.get("formula_history")
+            if not isinstance(history_map, dict):
+                history_map = {}
+
+            existing = history_map.get(key, [])
+            if not isinstance(existing, list):
+                existing = []
+
+            new_history = [trimmed]
+            for entry in existing:
+                if entry == trimmed:
+                    continue
+                new_history.append(entry)
+                if len(new_history) >= limit:
+                    break
+
+            history_map[key] = new_history[:limit]
+            data["formula_history"] = history_map
         return history_map.get(key, [])[:limit]
     except Exception as e:
         print(f"--- Formula history write error: {e}")
@@ -411,3 +366,35 @@ def store_formula_history():
 
     history = append_formula_history_entry(user_id, company, formula)
     return jsonify({"success": True, "data": history})
+
+
+@general_bp.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Estadísticas de los caches en memoria del proceso (hit rate, tamaño, invalidaciones)"""
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
+    return jsonify({"success": True, "data": get_all_cache_stats()})
+
+
+@general_bp.route('/api/schema-registry', methods=['GET'])
+def get_schema_registry_stats():
+    """Custom fields, DocTypes y grupos confirmados en este proceso"""
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
+    return jsonify({"success": True, "data": schema_registry_stats()})
+
+
+@general_bp.route('/api/schema-registry/refresh', methods=['POST'])
+def refresh_schema_registry():
+    """Olvidar lo confirmado para que se vuelva a verificar (opcional: {"kind": "..."})"""
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
+    payload = request.get_json(silent=True) or {}
+    forgotten = forget_schema(kind=payload.get('kind') or None, name=payload.get('name') or None)
+    return jsonify({"success": True, "data": {"forgotten": forgotten, **schema_registry_stats()}})
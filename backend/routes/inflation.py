@@ -11,6 +11,7 @@ from routes.Configuracion.setup_doctype_inflacion import (
     ensure_inflacion_doctype,
 )
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
+from utils.schema_registry import DOCTYPE, ensure_ready
 
 inflation_bp = Blueprint("inflation", __name__)
 
@@ -51,7 +52,10 @@ def _normalize_number(value):
 
 
 def _ensure_doctype(session, headers):
-    created = ensure_inflacion_doctype(session, headers, ERPNEXT_URL)
+    # Verificado una vez por proceso (utils/schema_registry), no en cada request
+    created = ensure_ready(
+        DOCTYPE, DOCTYPE_NAME, lambda: ensure_inflacion_doctype(session, headers, ERPNEXT_URL)
+    )
     if not created:
         return jsonify(
             {
@@ -29,7 +29,9 @@ from routes.general import (
     update_company_item_count, get_active_company, get_smart_limit
 )
 from utils.warehouse_tokens import tokenize_warehouse_name, ensure_warehouse
+from utils.warehouse_api import get_company_leaf_warehouses
 from routes.inventory_utils import fetch_item_iva_rates_bulk as _fetch_item_iva_rates_bulk
+from services.item_catalog import get_catalog_items_by_code, search_catalog_items, item_catalog_stats
 
 # Crear el blueprint principal (mantiene compatibilidad con app.py)
 inventory_bp = Blueprint('inventory', __name__)
@@ -664,9 +666,6 @@ def search_inventory_items():
         if not query_param or len(query_param) < 2:
             return jsonify({"success": True, "data": []}), 200
 
-        item_count = get_company_item_count(company)
-        search_limit = max(get_smart_limit(company, 'search'), item_count + 100)
-
         fields = [
             "name", "item_code", "item_name", "item_group",
             "description", "custom_company", "stock_uom", "item_defaults",
@@ -674,41 +673,14 @@ def search_inventory_items():
             "is_stock_item"
         ]
 
-        filters = [
-            ["disabled", "=", 0],
-            ["custom_company", "=", company],
-            ["docstatus", "in", [0, 1]]
-        ]
-
-        or_filters = []
-        if field == 'item_code':
-            or_filters.append(["item_code", "like", f"{query_param}%"])
-            or_filters.append(["name", "like", f"{query_param}%"])
-        elif field == 'description':
-            like_query = f"%{query_param}%"
-            or_filters.append(["item_name", "like", like_query])
-            or_filters.append(["description", "like", like_query])
-            or_filters.append(["item_code", "like", like_query])
-
-        response, error = query_items(
-            session=session,
-            headers=headers,
-            filters=filters,
-            fields=fields,
-            limit_page_length=search_limit,
-            order_by="modified desc",
-            or_filters=or_filters,
-            include_child_tables=["item_defaults"],
-            operation_name="Search Inventory Items"
+        # Réplica local del catálogo: ya no se piden item_count + 100 items para devolver 20
+        filtered_items, error = search_catalog_items(
+            session, company, query_param, field=field, limit=20, fields=fields
         )
 
-        if not response or response.status_code != 200:
+        if error:
             return handle_erpnext_error(error, "Failed to search inventory items")
 
-        items_data = response.json().get('data', [])
-        filtered_items = [item for item in items_data if item.get('docstatus', 0) in [0, 1]]
-        filtered_items = filtered_items[:20]
-
         company_abbr = get_company_abbr(session, headers, company) if company else None
         print(f"🏢 Company abbreviation: {company_abbr}")
         if company_abbr:
@@ -740,6 +712,16 @@ def search_inventory_items():
         return jsonify({"success": False, "message": f"Error interno del servidor: {str(e)}"}), 500
 
 
+@inventory_bp.route('/api/inventory/search-index/stats', methods=['GET'])
+def get_search_index_stats():
+    """Estado de la réplica del catálogo y memoria del índice de búsqueda por compañía"""
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
+    return jsonify({"success": True, "data": item_catalog_stats()})
+
+
 @inventory_bp.route('/api/inventory/items/recognize-skus', methods=['POST'])
 def recognize_skus():
     """Reconoce SKUs masivamente en el backend"""
@@ -783,9 +765,7 @@ def recognize_skus():
         if not sku_with_abbr_map:
             return jsonify({"success": False, "message": "No hay SKUs válidos para procesar"}), 400
         
-        # Consultar items del inventario
-        smart_limit = get_smart_limit(company, operation_type='list')
-        
+        # Consultar items del inventario (réplica local, sincronizada por modified)
         fields = [
             "name", "item_code", "item_name", "description", 
             "stock_uom", "is_stock_item", "standard_rate",
@@ -793,34 +773,13 @@ def recognize_skus():
             "brand", "item_defaults"
         ]
         
-        filters = [
-            ["disabled", "=", 0],
-            ["custom_company", "=", company],
-            ["docstatus", "in", [0, 1]]
-        ]
-        
-        response, error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/Item",
-            params={
-                "fields": json.dumps(fields),
-                "filters": json.dumps(filters),
-                "limit_page_length": smart_limit
-            },
-            operation_name="Get all company items for SKU recognition"
+        inventory_map, error = get_catalog_items_by_code(
+            session, company, list(sku_with_abbr_map.values()), fields=fields
         )
         
         if error:
             return handle_erpnext_error(error, "Error obteniendo items del inventario")
         
-        inventory_items = response.json().get('data', [])
-        inventory_map = {}
-        for item in inventory_items:
-            item_code = item.get('item_code') or item.get('name')
-            if item_code:
-                inventory_map[item_code] = item
-        
         # Comparar SKUs con inventario
         recognized_items = {}
         unrecognized_skus = []
@@ -957,7 +916,15 @@ def get_warehouse_tabs():
         if not company:
             return jsonify({'success': False, 'message': 'Parámetro company requerido'}), 400
 
-        stock_map = fetch_bin_stock(session, headers, None, company)
+        # Solo almacenes con nombre tokenizado (los demás no forman tabs)
+        tab_warehouses = [
+            warehouse for warehouse in get_company_leaf_warehouses(session, company)
+            if tokenize_warehouse_name(warehouse)
+        ]
+        if not tab_warehouses:
+            return jsonify({'success': True, 'data': [], 'total': 0, 'page': page, 'page_size': page_size})
+
+        stock_map = fetch_bin_stock(session, headers, None, company, warehouses=tab_warehouses)
 
         if not stock_map:
             return jsonify({'success': True, 'data': [], 'total': 0, 'page': page, 'page_size': page_size})
@@ -1061,7 +1028,16 @@ def get_warehouse_tab_items():
         if not company or not base_code:
             return jsonify({'success': False, 'message': 'Parámetros company y base_code requeridos'}), 400
 
-        stock_map = fetch_bin_stock(session, headers, None, company)
+        # Solo los almacenes del base_code pedido
+        base_warehouses = []
+        for warehouse in get_company_leaf_warehouses(session, company):
+            tokens = tokenize_warehouse_name(warehouse)
+            if tokens and tokens['base_code'] == base_code:
+                base_warehouses.append(warehouse)
+        if not base_warehouses:
+            return jsonify({'success': True, 'data': [], 'total': 0, 'page': page, 'page_size': page_size})
+
+        stock_map = fetch_bin_stock(session, headers, None, company, warehouses=base_warehouses)
 
         if not stock_map:
             return jsonify({'success': True, 'data': [], 'total': 0, 'page': page, 'page_size': page_size})
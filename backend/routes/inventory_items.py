@@ -11,16 +11,18 @@ from urllib.parse import quote
 
 # Importar utilidades
 from utils.http_utils import handle_erpnext_error, make_erpnext_request
+from utils.schema_registry import ITEM_GROUP, get_ready, mark_ready
 from routes.auth_utils import get_session_with_auth
 from routes.general import (
     remove_company_abbr, get_company_abbr, get_company_item_count,
     update_company_item_count, get_active_company, get_smart_limit,
     add_company_abbr, validate_company_abbr_operation, get_company_default_currency
 )
-from routes.inventory_utils import fetch_bin_stock, round_qty, query_items
+from routes.inventory_utils import fetch_bin_stock, round_qty, query_items, resolve_stock_movements
 from services import price_list_automation_service
 from routes.inventory_utils import fetch_item_iva_rates_bulk as _fetch_item_iva_rates_bulk
 from routes.items import assign_tax_template_by_rate, get_tax_template_map
+from services.item_catalog import mark_item_catalog_stale, remove_catalog_items
 
 # Crear el blueprint
 inventory_items_bp = Blueprint('inventory_items', __name__)
@@ -175,6 +177,10 @@ def _fetch_item_group(session, group_name):
     """Return the ERPNext docname for the given item group if it exists."""
     if not group_name:
         return None
+    # Grupos ya confirmados en este proceso no se vuelven a consultar
+    confirmed = get_ready(ITEM_GROUP, group_name)
+    if confirmed:
+        return confirmed
     try:
         params = {
             "fields": '["name"]',
@@ -192,7 +198,9 @@ def _fetch_item_group(session, group_name):
             return None
         data = response.json().get('data', [])
         if data:
-            return data[0].get('name') or group_name
+            docname = data[0].get('name') or group_name
+            mark_ready(ITEM_GROUP, group_name, docname)
+            return docname
     except Exception as lookup_exc:
         print(f"[ensure_item_group] Error buscando grupo '{group_name}': {lookup_exc}")
     return None
@@ -217,7 +225,9 @@ def _ensure_root_group(session):
     )
     if error or not response or response.status_code not in [200, 201]:
         return None
-    return response.json().get('data', {}).get('name', root_name)
+    created_name = response.json().get('data', {}).get('name', root_name)
+    mark_ready(ITEM_GROUP, root_name, created_name)
+    return created_name
 
 
 def _ensure_item_group(session, company, company_abbr, requested_group):
@@ -252,6 +262,7 @@ def _ensure_item_group(session, company, company_abbr, requested_group):
                 )
                 if not error and response and response.status_code in [200, 201]:
                     abbr_root = response.json().get('data', {}).get('name', abbr_root_name)
+                    mark_ready(ITEM_GROUP, abbr_root_name, abbr_root)
         parent_group = abbr_root
 
     if not parent_group:
@@ -286,6 +297,7 @@ def _ensure_item_group(session, company, company_abbr, requested_group):
         return None, message
 
     created_name = response.json().get('data', {}).get('name', canonical_name)
+    mark_ready(ITEM_GROUP, canonical_name, created_name)
     return created_name, None
 
 
@@ -1210,7 +1222,8 @@ def get_item_movements(item_code):
             "name", "posting_date", "posting_time", "warehouse",
             "actual_qty", "qty_after_transaction", "incoming_rate",
             "valuation_rate", "stock_value", "voucher_type",
-            "voucher_no", "stock_uom", "company", "docstatus", "is_cancelled"
+            "voucher_no", "stock_uom", "company", "docstatus", "is_cancelled",
+            "item_code"
         ]
 
         params = {
@@ -1233,112 +1246,9 @@ def get_item_movements(item_code):
         movements = response.json().get('data', [])
         print(f"Movimientos obtenidos del Stock Ledger: {len(movements)}")
 
-        # Filtrar movimientos verificando el docstatus del documento voucher referenciado
-        # Solo incluir movimientos donde el documento voucher también tenga docstatus=1
-        filtered_movements = []
-        voucher_cache = {}  # Cache para evitar consultas repetidas
-
-        for movement in movements:
-            voucher_type = movement.get('voucher_type')
-            voucher_no = movement.get('voucher_no')
-            
-            if not voucher_type or not voucher_no:
-                # Si no hay voucher, incluir el movimiento (caso raro pero posible)
-                filtered_movements.append(movement)
-                continue
-            
-            # Crear key para cache
-            cache_key = f"{voucher_type}::{voucher_no}"
-            
-            # Verificar si ya consultamos este voucher
-            if cache_key not in voucher_cache:
-                try:
-                    # Consultar el docstatus del voucher
-                    voucher_response, voucher_error = make_erpnext_request(
-                        session=session,
-                        method="GET",
-                        endpoint=f"/api/resource/{quote(voucher_type)}/{quote(voucher_no)}",
-                        operation_name=f"Check Voucher Status",
-                        params={"fields": '["docstatus"]'}
-                    )
-                    
-                    if voucher_response and voucher_response.status_code == 200:
-                        voucher_data = voucher_response.json().get('data', {})
-                        voucher_docstatus = voucher_data.get('docstatus', 0)
-                        voucher_cache[cache_key] = voucher_docstatus
-                    elif voucher_response and voucher_response.status_code == 404:
-                        # Voucher no encontrado - probablemente fue eliminado, excluir
-                        print(f"Voucher no encontrado (404): {voucher_type} {voucher_no}")
-                        voucher_cache[cache_key] = 0
-                    else:
-                        # Error de conexión u otro - incluir el movimiento para no perder datos
-                        # El Stock Ledger Entry ya tiene docstatus=1, así que el movimiento es válido
-                        print(f"Error verificando voucher {voucher_type} {voucher_no}, asumiendo válido (SLE ya tiene docstatus=1)")
-                        voucher_cache[cache_key] = 1
-                except Exception as voucher_ex:
-                    print(f"Excepción al verificar voucher {voucher_type} {voucher_no}: {voucher_ex}")
-                    # En caso de error de excepción, incluir el movimiento (el SLE ya tiene docstatus=1)
-                    voucher_cache[cache_key] = 1
-            
-            # Solo incluir si el voucher tiene docstatus=1 (submitted/confirmado)
-            if voucher_cache[cache_key] == 1:
-                filtered_movements.append(movement)
-            else:
-                print(f"Movimiento excluido: voucher {voucher_type} {voucher_no} tiene docstatus={voucher_cache[cache_key]}")
-
-        print(f"Movimientos filtrados después de verificar vouchers: {len(filtered_movements)}")
-
-        # Enriquecer movimientos de Stock Reconciliation que tienen actual_qty = 0
-        # Estos movimientos necesitan consultar el documento padre para obtener el quantity_difference real
-        stock_reco_cache = {}  # Cache para Stock Reconciliation documents
-        enriched_movements = []
-        
-        for movement in filtered_movements:
-            voucher_type = movement.get('voucher_type', '')
-            voucher_no = movement.get('voucher_no', '')
-            actual_qty = float(movement.get('actual_qty', 0))
-            
-            # Si es Stock Reconciliation con qty = 0, necesitamos obtener el quantity_difference real
-            if voucher_type == 'Stock Reconciliation' and actual_qty == 0 and voucher_no:
-                if voucher_no not in stock_reco_cache:
-                    try:
-                        reco_response, reco_error = make_erpnext_request(
-                            session=session,
-                            method="GET",
-                            endpoint=f"/api/resource/Stock Reconciliation/{quote(voucher_no)}",
-                            operation_name=f"Fetch Stock Reconciliation {voucher_no}",
-                            params={"fields": '["name", "items"]'}
-                        )
-                        if reco_response and reco_response.status_code == 200:
-                            reco_data = reco_response.json().get('data', {})
-                            stock_reco_cache[voucher_no] = reco_data.get('items', [])
-                        else:
-                            stock_reco_cache[voucher_no] = []
-                    except Exception as e:
-                        print(f"Error fetching Stock Reconciliation {voucher_no}: {e}")
-                        stock_reco_cache[voucher_no] = []
-                
-                # Buscar el item en los items del Stock Reconciliation
-                reco_items = stock_reco_cache.get(voucher_no, [])
-                for reco_item in reco_items:
-                    if reco_item.get('item_code') == erp_item_code:
-                        # Obtener el quantity_difference - puede ser string o número
-                        qty_diff = reco_item.get('quantity_difference', 0)
-                        if isinstance(qty_diff, str):
-                            try:
-                                qty_diff = float(qty_diff)
-                            except:
-                                qty_diff = 0
-                        
-                        # Si hay un quantity_difference significativo, usarlo
-                        if qty_diff != 0:
-                            movement = dict(movement)  # Crear copia para no modificar el original
-                            movement['actual_qty'] = qty_diff
-                            movement['_enriched_from_reco'] = True
-                            print(f"Stock Reconciliation {voucher_no}: enriched actual_qty from 0 to {qty_diff} for item {erp_item_code}")
-                        break
-            
-            enriched_movements.append(movement)
+        # Solo movimientos cuyo voucher también tiene docstatus=1; los Stock Reconciliation
+        # con qty 0 toman el quantity_difference real (queries agrupadas por doctype)
+        enriched_movements = resolve_stock_movements(session, movements, item_code=erp_item_code)
 
         print(f"Movimientos enriquecidos: {len(enriched_movements)}")
         
@@ -1551,6 +1461,7 @@ def quick_create_inventory_item():
                 automation_result = {"success": False, "error": str(automation_exc)}
 
         update_company_item_count(company, 'increment')
+        mark_item_catalog_stale(company)
 
         if company_abbr:
             original_code = created_item.get('item_code')
@@ -1703,6 +1614,7 @@ def create_inventory_item():
 
         # Actualizar conteo
         update_company_item_count(company, 'increment')
+        mark_item_catalog_stale(company)
 
         # Remover sigla
         if company_abbr:
@@ -1856,6 +1768,8 @@ def update_inventory_item(item_code):
                 except Exception:
                     pass
 
+        mark_item_catalog_stale(company)
+
         return jsonify({"success": True, "data": updated_item})
 
     except Exception as e:
@@ -1895,6 +1809,7 @@ def delete_inventory_item(item_code):
             return handle_erpnext_error(error, "Failed to delete inventory item")
 
         update_company_item_count(company, 'decrement')
+        remove_catalog_items(company, [full_code])
 
         return jsonify({"success": True, "message": "Item eliminado exitosamente"})
 
@@ -1967,6 +1882,7 @@ def bulk_delete_inventory_items():
                 if resp and resp.status_code in [200, 202, 204]:
                     results.append({"item": full_code, "success": True})
                     success_count += 1
+                    remove_catalog_items(company, [full_code])
                     try:
                         update_company_item_count(company, 'decrement')
                     except Exception:
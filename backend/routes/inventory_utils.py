@@ -5,7 +5,16 @@ Contiene funciones helper que son usadas por múltiples módulos de inventario.
 
 import json
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from config import STOCK_FETCH_MAX_WORKERS
 from utils.http_utils import make_erpnext_request
+from utils.frappe_list import fetch_list_paged, iter_resource_batches
+from utils.warehouse_api import get_company_leaf_warehouses
+
+
+# Tope de códigos por lote; el largo de URL puede achicarlo (ver iter_resource_batches)
+STOCK_FETCH_MAX_BATCH_SIZE = 500
 
 
 def round_qty(value):
@@ -16,11 +25,70 @@ def round_qty(value):
         return 0.0
 
 
+RESERVATION_FIELDS = [
+    "name",
+    "item_code",
+    "warehouse",
+    "reserved_qty",
+    "delivered_qty",
+    "status",
+    "voucher_type",
+    "voucher_no"
+]
+
+
+def _accumulate_reservations(reservation_map, reservations):
+    """Sumar reservas activas al mapa item_code -> total, por almacén y detalle"""
+    for entry in reservations:
+        code = entry.get("item_code")
+        if not code:
+            continue
+
+        # Calcular cantidad efectivamente reservada (reserved - delivered)
+        reserved = round_qty(entry.get("reserved_qty", 0))
+        delivered = round_qty(entry.get("delivered_qty", 0))
+        effective_reserved = max(0, reserved - delivered)
+
+        if effective_reserved <= 0:
+            continue
+
+        warehouse = entry.get("warehouse")
+
+        if code not in reservation_map:
+            reservation_map[code] = {
+                "total_reserved": 0.0,
+                "warehouses": {},
+                "reservations": []
+            }
+
+        reservation_map[code]["total_reserved"] += effective_reserved
+
+        if warehouse:
+            if warehouse not in reservation_map[code]["warehouses"]:
+                reservation_map[code]["warehouses"][warehouse] = 0.0
+            reservation_map[code]["warehouses"][warehouse] += effective_reserved
+
+        # Guardar detalle de la reserva para mostrar en movimientos
+        reservation_map[code]["reservations"].append({
+            "name": entry.get("name"),
+            "warehouse": warehouse,
+            "reserved_qty": reserved,
+            "delivered_qty": delivered,
+            "effective_reserved": effective_reserved,
+            "status": entry.get("status"),
+            "voucher_type": entry.get("voucher_type"),
+            "voucher_no": entry.get("voucher_no")
+        })
+
+
 def fetch_stock_reservations(session, headers, item_codes, company=None):
     """
     Obtiene las reservas de stock activas desde Stock Reservation Entry.
     ERPNext no actualiza el campo reserved_qty del Bin automáticamente,
     por lo que necesitamos consultar directamente las reservas.
+
+    Los códigos se piden en lotes que entran en la URL, en paralelo
+    (STOCK_FETCH_MAX_WORKERS), y cada lote se suma al mapa apenas llega.
     
     Returns:
         dict: Mapa de item_code -> {total_reserved: X, warehouses: {warehouse: qty}}
@@ -36,7 +104,6 @@ def fetch_stock_reservations(session, headers, item_codes, company=None):
     
     # Solo reservas activas (status != Cancelled/Delivered)
     filters = [
-        ["item_code", "in", unique_codes],
         ["docstatus", "=", 1],
         ["status", "not in", ["Cancelled", "Delivered"]]
     ]
@@ -44,79 +111,27 @@ def fetch_stock_reservations(session, headers, item_codes, company=None):
     if company:
         filters.append(["company", "=", company])
     
-    params = {
-        "fields": json.dumps([
-            "name",
-            "item_code",
-            "warehouse",
-            "reserved_qty",
-            "delivered_qty",
-            "status",
-            "voucher_type",
-            "voucher_no"
-        ]),
-        "filters": json.dumps(filters),
-        "limit_page_length": 5000
-    }
-    
     try:
-        response, error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/Stock Reservation Entry",
-            params=params,
-            operation_name="Get stock reservations"
-        )
-        
-        if error:
-            print(f"Error obteniendo reservas de stock: {error}")
-            return {}
-        
-        reservations = response.json().get("data", [])
-        print(f"Reservas encontradas: {len(reservations)}")
-        
-        # Agrupar por item_code
         reservation_map = {}
-        for entry in reservations:
-            code = entry.get("item_code")
-            if not code:
-                continue
-            
-            # Calcular cantidad efectivamente reservada (reserved - delivered)
-            reserved = round_qty(entry.get("reserved_qty", 0))
-            delivered = round_qty(entry.get("delivered_qty", 0))
-            effective_reserved = max(0, reserved - delivered)
-            
-            if effective_reserved <= 0:
+        found = 0
+        for reservations, error in iter_resource_batches(
+            session,
+            "Stock Reservation Entry",
+            RESERVATION_FIELDS,
+            "item_code",
+            unique_codes,
+            extra_filters=filters,
+            max_workers=STOCK_FETCH_MAX_WORKERS,
+            max_batch_size=STOCK_FETCH_MAX_BATCH_SIZE,
+            operation_name="Get stock reservations"
+        ):
+            if error:
+                print(f"Error obteniendo reservas de stock: {error}")
                 continue
-            
-            warehouse = entry.get("warehouse")
-            
-            if code not in reservation_map:
-                reservation_map[code] = {
-                    "total_reserved": 0.0,
-                    "warehouses": {},
-                    "reservations": []
-                }
-            
-            reservation_map[code]["total_reserved"] += effective_reserved
-            
-            if warehouse:
-                if warehouse not in reservation_map[code]["warehouses"]:
-                    reservation_map[code]["warehouses"][warehouse] = 0.0
-                reservation_map[code]["warehouses"][warehouse] += effective_reserved
-            
-            # Guardar detalle de la reserva para mostrar en movimientos
-            reservation_map[code]["reservations"].append({
-                "name": entry.get("name"),
-                "warehouse": warehouse,
-                "reserved_qty": reserved,
-                "delivered_qty": delivered,
-                "effective_reserved": effective_reserved,
-                "status": entry.get("status"),
-                "voucher_type": entry.get("voucher_type"),
-                "voucher_no": entry.get("voucher_no")
-            })
+            found += len(reservations)
+            _accumulate_reservations(reservation_map, reservations)
+
+        print(f"Reservas encontradas: {found}")
         
         # Redondear totales
         for code in reservation_map:
@@ -133,127 +148,109 @@ def fetch_stock_reservations(session, headers, item_codes, company=None):
         return {}
 
 
-def fetch_bin_stock(session, headers, item_codes, company=None):
-    """Retrieve Bin stock information for the given item codes."""
-    if not item_codes:
-        return {}
+BIN_FIELDS = ["item_code", "warehouse", "actual_qty", "reserved_qty", "projected_qty"]
 
-    unique_codes = list({code for code in item_codes if code})
-    if not unique_codes:
-        return {}
 
-    # Dividir los códigos en lotes para evitar URLs demasiado largas
-    batch_size = 100
-    all_stock_map = {}
+def _accumulate_bins(stock_map, bins):
+    """Sumar filas de Bin al mapa item_code -> totales + detalle por almacén"""
+    for entry in bins:
+        code = entry.get("item_code")
+        if not code:
+            continue
 
-    print(f"Obteniendo stock para {len(unique_codes)} items en lotes de {batch_size}")
+        item_entry = stock_map.setdefault(code, {
+            "total_actual_qty": 0.0,
+            "total_reserved_qty": 0.0,
+            "total_projected_qty": 0.0,
+            "bins": []
+        })
+
+        actual_qty = round_qty(entry.get("actual_qty"))
+        reserved_qty = round_qty(entry.get("reserved_qty"))
+        projected_qty = round_qty(entry.get("projected_qty"))
+
+        item_entry["total_actual_qty"] += actual_qty
+        item_entry["total_reserved_qty"] += reserved_qty
+        item_entry["total_projected_qty"] += projected_qty
+        item_entry["bins"].append({
+            "warehouse": entry.get("warehouse"),
+            "actual_qty": actual_qty,
+            "reserved_qty": reserved_qty,
+            "projected_qty": projected_qty
+        })
+
+
+def fetch_bin_stock(session, headers, item_codes, company=None, warehouses=None):
+    """
+    Retrieve Bin stock information for the given item codes.
 
-    for i in range(0, len(unique_codes), batch_size):
-        batch_codes = unique_codes[i:i + batch_size]
-        print(f"Procesando lote {i//batch_size + 1}/{(len(unique_codes) + batch_size - 1)//batch_size}: {len(batch_codes)} items")
+    - item_codes=None con company: stock de todos los items en los almacenes de la compañía.
+    - warehouses: restringe a esos almacenes (por defecto, los almacenes hoja de la compañía,
+      tomados del índice cacheado de utils.warehouse_api).
+    """
+    if company and warehouses is None:
+        warehouses = get_company_leaf_warehouses(session, company)
+        if not warehouses:
+            print(f"Sin almacenes para compañía {company}")
+            return {}
 
-        filters = [["item_code", "in", batch_codes]]
+    all_stock_map = {}
+    reservation_map = None
 
-        # Filter by warehouses of the company
-        if company:
-            warehouse_filters = [["company", "=", company], ["disabled", "=", 0], ["is_group", "=", 0]]
-            warehouse_params = {
-                "fields": '["name"]',
-                "filters": json.dumps(warehouse_filters),
-                "limit_page_length": 5000
-            }
-            warehouse_response, warehouse_error = make_erpnext_request(
-                session=session,
-                method="GET",
-                endpoint="/api/resource/Warehouse",
-                params=warehouse_params,
-                operation_name="Get company warehouses for stock filtering"
-            )
+    if item_codes is None:
+        if not warehouses:
+            return {}
+        bins, error = fetch_list_paged(
+            session,
+            "Bin",
+            BIN_FIELDS,
+            [["warehouse", "in", list(warehouses)]],
+            order_by="item_code asc, warehouse asc",
+            page_size=5000,
+            operation_name="Get bin stock data (company)"
+        )
+        if error:
+            print(f"Error obteniendo stock desde Bin para compañía {company}: {error}")
+        _accumulate_bins(all_stock_map, bins)
+    else:
+        unique_codes = list({code for code in item_codes if code})
+        if not unique_codes:
+            return {}
 
-            if warehouse_error:
-                print(f"Error obteniendo warehouses para compañía {company}: {warehouse_error}")
-                continue
-            
-            warehouses = [w['name'] for w in warehouse_response.json().get('data', [])]
-            if warehouses:
-                filters.append(["warehouse", "in", warehouses])
-            else:
-                # No warehouses for company, return empty
-                continue
+        # Las reservas no dependen de los Bins cuando ya conocemos los códigos:
+        # se piden en paralelo mientras llegan los lotes de stock
+        reservation_pool = ThreadPoolExecutor(max_workers=1)
+        reservation_future = reservation_pool.submit(
+            fetch_stock_reservations, session, headers, unique_codes, company
+        )
 
-        params = {
-            "fields": json.dumps([
-                "item_code",
-                "warehouse",
-                "actual_qty",
-                "reserved_qty",
-                "projected_qty"
-            ]),
-            "filters": json.dumps(filters),
-            "limit_page_length": 5000
-        }
+        extra_filters = [["warehouse", "in", list(warehouses)]] if warehouses else None
+        print(f"Obteniendo stock para {len(unique_codes)} items (hasta {STOCK_FETCH_MAX_WORKERS} lotes en paralelo)")
 
         try:
-            response, error = make_erpnext_request(
-                session=session,
-                method="GET",
-                endpoint="/api/resource/Bin",
-                params=params,
-                operation_name=f"Get bin stock data (batch {i//batch_size + 1})"
-            )
-
-            if error:
-                print(f"Error obteniendo stock desde Bin (lote {i//batch_size + 1}): {error}")
-                continue
-
-            bins = response.json().get("data", [])
-            stock_map = {}
-
-            for entry in bins:
-                code = entry.get("item_code")
-                if not code:
+            for bins, error in iter_resource_batches(
+                session,
+                "Bin",
+                BIN_FIELDS,
+                "item_code",
+                unique_codes,
+                extra_filters=extra_filters,
+                max_workers=STOCK_FETCH_MAX_WORKERS,
+                max_batch_size=STOCK_FETCH_MAX_BATCH_SIZE,
+                operation_name="Get bin stock data"
+            ):
+                if error:
+                    print(f"Error obteniendo stock desde Bin: {error}")
                     continue
-
-                item_entry = stock_map.setdefault(code, {
-                    "total_actual_qty": 0.0,
-                    "total_reserved_qty": 0.0,
-                    "total_projected_qty": 0.0,
-                    "bins": []
-                })
-
-                actual_qty = round_qty(entry.get("actual_qty"))
-                reserved_qty = round_qty(entry.get("reserved_qty"))
-                projected_qty = round_qty(entry.get("projected_qty"))
-
-                item_entry["total_actual_qty"] += actual_qty
-                item_entry["total_reserved_qty"] += reserved_qty
-                item_entry["total_projected_qty"] += projected_qty
-                item_entry["bins"].append({
-                    "warehouse": entry.get("warehouse"),
-                    "actual_qty": actual_qty,
-                    "reserved_qty": reserved_qty,
-                    "projected_qty": projected_qty
-                })
-
-            # Agregar los resultados de este lote al mapa general
-            for code, item_entry in stock_map.items():
-                if code not in all_stock_map:
-                    all_stock_map[code] = item_entry
-                else:
-                    # Combinar con resultados previos si el item ya existe
-                    existing = all_stock_map[code]
-                    existing["total_actual_qty"] += item_entry["total_actual_qty"]
-                    existing["total_reserved_qty"] += item_entry["total_reserved_qty"]
-                    existing["total_projected_qty"] += item_entry["total_projected_qty"]
-                    existing["bins"].extend(item_entry["bins"])
-
-        except Exception as exc:
-            print(f"Error procesando lote {i//batch_size + 1}: {exc}")
-            continue
-
-    # Obtener reservas de stock desde Stock Reservation Entry
-    # (el campo reserved_qty del Bin no se actualiza automáticamente en ERPNext)
-    reservation_map = fetch_stock_reservations(session, headers, list(all_stock_map.keys()), company)
+                _accumulate_bins(all_stock_map, bins)
+            reservation_map = reservation_future.result()
+        finally:
+            reservation_pool.shutdown(wait=True)
+
+    if reservation_map is None:
+        # Obtener reservas de stock desde Stock Reservation Entry
+        # (el campo reserved_qty del Bin no se actualiza automáticamente en ERPNext)
+        reservation_map = fetch_stock_reservations(session, headers, list(all_stock_map.keys()), company)
     
     # Combinar stock con reservas reales
     for code, item_entry in all_stock_map.items():
@@ -492,3 +489,132 @@ def fetch_item_iva_rates_bulk(session, headers, item_names, company):
         print(f"Error en fetch_item_iva_rates_bulk: {e}")
         print(f"Traceback: {traceback.format_exc()}")
         return result
+
+
+# Vouchers por query `in` (POST get_list, sin límite de URL)
+VOUCHER_IN_CHUNK_SIZE = 500
+
+
+def resolve_voucher_docstatus(session, vouchers):
+    """
+    docstatus de muchos vouchers de Stock Ledger Entry con una query `in` por doctype
+    (en lugar de un GET por voucher).
+
+    Args:
+        vouchers: iterable de (voucher_type, voucher_no)
+
+    Returns:
+        dict: (voucher_type, voucher_no) -> docstatus. Los que no existen quedan en 0;
+        si la consulta de un doctype falla quedan en 1 (el SLE ya está confirmado).
+    """
+    by_type = {}
+    for voucher_type, voucher_no in vouchers:
+        if voucher_type and voucher_no:
+            by_type.setdefault(voucher_type, set()).add(voucher_no)
+
+    statuses = {}
+    for voucher_type, names in by_type.items():
+        names = sorted(names)
+        for start in range(0, len(names), VOUCHER_IN_CHUNK_SIZE):
+            chunk = names[start:start + VOUCHER_IN_CHUNK_SIZE]
+            rows, error = fetch_list_paged(
+                session,
+                voucher_type,
+                ["name", "docstatus"],
+                [["name", "in", chunk]],
+                page_size=VOUCHER_IN_CHUNK_SIZE,
+                operation_name=f"Check voucher status ({voucher_type})"
+            )
+            if error:
+                print(f"Error verificando vouchers {voucher_type}, asumiendo válidos (SLE ya tiene docstatus=1): {error}")
+                statuses.update({(voucher_type, name): 1 for name in chunk})
+                continue
+            found = {row.get("name"): int(row.get("docstatus") or 0) for row in rows}
+            for name in chunk:
+                # No encontrado: probablemente fue eliminado, excluir
+                statuses[(voucher_type, name)] = found.get(name, 0)
+    return statuses
+
+
+def fetch_reconciliation_differences(session, voucher_nos, item_codes):
+    """
+    quantity_difference de las filas de Stock Reconciliation, en una query a la tabla hija.
+
+    Returns:
+        dict: (voucher_no, item_code) -> quantity_difference de la primera fila del item
+    """
+    voucher_nos = sorted({name for name in voucher_nos if name})
+    item_codes = sorted({code for code in item_codes if code})
+    differences = {}
+    if not voucher_nos or not item_codes:
+        return differences
+
+    for start in range(0, len(voucher_nos), VOUCHER_IN_CHUNK_SIZE):
+        chunk = voucher_nos[start:start + VOUCHER_IN_CHUNK_SIZE]
+        rows, error = fetch_list_paged(
+            session,
+            "Stock Reconciliation Item",
+            ["parent", "item_code", "quantity_difference", "idx"],
+            [["parent", "in", chunk], ["item_code", "in", item_codes]],
+            order_by="idx asc",
+            parent="Stock Reconciliation",
+            operation_name="Fetch Stock Reconciliation items"
+        )
+        if error:
+            print(f"Error obteniendo items de Stock Reconciliation: {error}")
+            continue
+        for row in rows:
+            try:
+                qty_diff = float(row.get("quantity_difference") or 0)
+            except (TypeError, ValueError):
+                qty_diff = 0
+            differences.setdefault((row.get("parent"), row.get("item_code")), qty_diff)
+    return differences
+
+
+def resolve_stock_movements(session, movements, item_code=None):
+    """
+    Filtrar y completar movimientos de Stock Ledger Entry para mostrar historial.
+
+    - Excluye los movimientos cuyo voucher no está confirmado (docstatus != 1).
+    - Los Stock Reconciliation con actual_qty = 0 toman el quantity_difference de la
+      fila del item (marcados con _enriched_from_reco).
+
+    item_code se usa para los movimientos que no traen el campo item_code.
+    Todo se resuelve con queries agrupadas por doctype, sin consultas por movimiento.
+    """
+    statuses = resolve_voucher_docstatus(
+        session, [(movement.get('voucher_type'), movement.get('voucher_no')) for movement in movements]
+    )
+    submitted = []
+    for movement in movements:
+        key = (movement.get('voucher_type'), movement.get('voucher_no'))
+        if key[0] and key[1] and statuses.get(key, 0) != 1:
+            continue
+        submitted.append(movement)
+
+    reco_movements = [
+        movement for movement in submitted
+        if movement.get('voucher_type') == 'Stock Reconciliation'
+        and movement.get('voucher_no')
+        and float(movement.get('actual_qty') or 0) == 0
+    ]
+    if not reco_movements:
+        return submitted
+
+    differences = fetch_reconciliation_differences(
+        session,
+        [movement.get('voucher_no') for movement in reco_movements],
+        [movement.get('item_code') or item_code for movement in reco_movements]
+    )
+    reco_ids = {id(movement) for movement in reco_movements}
+    resolved = []
+    for movement in submitted:
+        if id(movement) in reco_ids:
+            qty_diff = differences.get((movement.get('voucher_no'), movement.get('item_code') or item_code), 0)
+            if qty_diff != 0:
+                movement = dict(movement)
+                movement['actual_qty'] = qty_diff
+                movement['_enriched_from_reco'] = True
+        resolved.append(movement)
+    return resolved
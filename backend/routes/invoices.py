@@ -13,7 +13,6 @@ from routes.general import get_active_company, get_company_abbr, add_company_abb
 
 # Importar funciones de items.py para manejo de items
 from routes.items import (
-    process_invoice_item,
     find_or_create_item_by_description,
     create_item_with_description,
     create_free_item,
@@ -23,6 +22,7 @@ from routes.items import (
     determine_income_account,
     get_company_defaults
 )
+from routes.item_resolution import process_invoice_items_batch, fetch_items_stock_info
 
 # Importar función para obtener cuenta específica del cliente
 from routes.customers import get_customer_receivable_account
@@ -701,44 +701,42 @@ def create_invoice():
         has_stock_items = False
         linked_sales_orders = False
 
-        for item in data['items']:
-            processed_item = process_invoice_item(item, session, headers, data['company'], tax_map, data.get('customer'))
+        # Resolución en lote: existencia, plantillas de IVA y cuentas una sola vez por factura
+        batch_items = process_invoice_items_batch(data['items'], session, headers, data['company'], tax_map, data.get('customer'))
+        stock_info, stock_error = fetch_items_stock_info(
+            session,
+            [processed_item['item_code'] for processed_item in batch_items if processed_item],
+            data['company']
+        )
+        if stock_error:
+            # Igual que la consulta por item: los que no se pudieron leer se tratan como no stock
+            print(f"--- Item stock status: error, partial result ({stock_error})")
+
+        for item, processed_item in zip(data['items'], batch_items):
             if processed_item:
                 if processed_item.get('sales_order') or processed_item.get('so_detail'):
                     linked_sales_orders = True
                     print(f"--- Invoice item linked to Sales Order: {processed_item.get('sales_order')} (so_detail={processed_item.get('so_detail')})")
 
                 # Verificar si este item es de stock
-                item_response, error = make_erpnext_request(
-                    session=session,
-                    method="GET",
-                    endpoint=f"/api/resource/Item/{processed_item['item_code']}",
-                    operation_name="Check Item Stock Status in Create"
-                )
-                
-                if not error and item_response.status_code == 200:
-                    item_data = item_response.json()['data']
-                    if item_data.get('is_stock_item') == 1:
-                        has_stock_items = True
-                        print("--- Invoice items: stock item detected")
-                        # Verificar si el processed_item ya tiene warehouse (puede venir de la Sales Order)
-                        if not processed_item.get('warehouse') or not processed_item.get('warehouse').strip():
-                            # Buscar default_warehouse en item_defaults para la compañía
-                            default_warehouse = None
-                            for default in item_data.get('item_defaults', []):
-                                if default.get('company') == data['company']:
-                                    default_warehouse = default.get('default_warehouse')
-                                    break
-                            if not default_warehouse:
-                                default_warehouse = company_defaults.get('default_warehouse')
-
-                            if default_warehouse:
-                                processed_item['warehouse'] = default_warehouse
-                                print("--- Invoice items: using default warehouse")
-                            else:
-                                error_msg = f"El ítem {processed_item['item_code']} es un ítem de stock y requiere un almacén asignado"
-                                print("--- Invoice items: warehouse required")
-                                return jsonify({"success": False, "message": error_msg}), 400
+                item_info = stock_info.get(processed_item['item_code'])
+                if item_info and item_info.get('is_stock_item') == 1:
+                    has_stock_items = True
+                    print("--- Invoice items: stock item detected")
+                    # Verificar si el processed_item ya tiene warehouse (puede venir de la Sales Order)
+                    if not processed_item.get('warehouse') or not processed_item.get('warehouse').strip():
+                        # default_warehouse de item_defaults para la compañía, o el de la compañía
+                        default_warehouse = item_info.get('default_warehouse')
+                        if not default_warehouse:
+                            default_warehouse = company_defaults.get('default_warehouse')
+
+                        if default_warehouse:
+                            processed_item['warehouse'] = default_warehouse
+                            print("--- Invoice items: using default warehouse")
+                        else:
+                            error_msg = f"El ítem {processed_item['item_code']} es un ítem de stock y requiere un almacén asignado"
+                            print("--- Invoice items: warehouse required")
+                            return jsonify({"success": False, "message": error_msg}), 400
                 processed_items.append(processed_item)
             else:
                 return jsonify({"success": False, "message": f"Error procesando item: {item.get('item_name', 'Sin nombre')}"}), 400
@@ -1331,8 +1329,8 @@ def update_draft_invoice(invoice_name, data, session, headers):
         # NOTA: Las facturas con Sales Order NO pueden ser borradores, así que no necesitamos
         # la lógica compleja de verificación de warehouse aquí
         processed_items = []
-        for item in data.get('items', []):
-            processed_item = process_invoice_item(item, session, headers, data.get('company', ''), tax_map, data.get('customer'))
+        batch_items = process_invoice_items_batch(data.get('items', []), session, headers, data.get('company', ''), tax_map, data.get('customer'))
+        for item, processed_item in zip(data.get('items', []), batch_items):
             if processed_item:
                 processed_items.append(processed_item)
             else:
@@ -1772,8 +1770,8 @@ def update_confirmed_invoice(invoice_name, data, session, headers):
             }), 400
         
         processed_items = []
-        for item in data.get('items', []):
-            processed_item = process_invoice_item(item, session, headers, data.get('company', ''), tax_map, data.get('customer'))
+        batch_items = process_invoice_items_batch(data.get('items', []), session, headers, data.get('company', ''), tax_map, data.get('customer'))
+        for item, processed_item in zip(data.get('items', []), batch_items):
             if processed_item:
                 processed_items.append(processed_item)
             else:
@@ -14,6 +14,7 @@ from routes.general import get_company_abbr, get_active_company
 
 # Importar utilidades HTTP centralizadas
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
+from utils.schema_registry import ITEM_GROUP, forget_schema
 
 # Crear el blueprint para las rutas de grupos de items
 item_groups_bp = Blueprint('item_groups', __name__)
@@ -229,8 +230,8 @@ def create_item_group():
         return jsonify({"success": False, "message": f"Error interno del servidor: {str(e)}"}), 500
 
 
-@item_groups_bp.route('/api/inventory/item-groups/<path:group_name>', methods=['PUT', 'DELETE', 'OPTIONS'])
-@item_groups_bp.route('/api/item-groups/<path:group_name>', methods=['PUT', 'DELETE', 'OPTIONS'])
+@item_groups_bp.route('/api/inventory/item-groups/<path:group_name>', methods=['PUT', 'OPTIONS'])
+@item_groups_bp.route('/api/item-groups/<path:group_name>', methods=['PUT', 'OPTIONS'])
 def update_item_group(group_name):
     """Actualizar un grupo de items"""
     print(f"\n--- Petición para actualizar grupo de items: {group_name} ---")
@@ -309,6 +310,7 @@ def update_item_group(group_name):
 
 
 @item_groups_bp.route('/api/inventory/item-groups/<path:group_name>', methods=['DELETE', 'OPTIONS'])
+@item_groups_bp.route('/api/item-groups/<path:group_name>', methods=['DELETE', 'OPTIONS'])
 def delete_item_group(group_name):
     """Eliminar un grupo de items"""
     print(f"\n--- Petición para eliminar grupo de items: {group_name} ---")
@@ -351,6 +353,10 @@ def delete_item_group(group_name):
         if error:
             return handle_erpnext_error(error, "Failed to delete item group")
 
+        if delete_response.status_code in [200, 202, 204]:
+            # Que ensure_item_group no lo siga dando por existente
+            forget_schema(ITEM_GROUP, decoded_group_name)
+
         if delete_response.status_code in [200, 204]:
             print(f"Grupo de items eliminado exitosamente: {decoded_group_name}")
             return jsonify({
@@ -427,6 +433,7 @@ def bulk_delete_item_groups():
                 )
 
                 if resp and resp.status_code in [200, 202, 204]:
+                    forget_schema(ITEM_GROUP, decoded)
                     results.append({"group": decoded, "success": True})
                     deleted += 1
                 else:
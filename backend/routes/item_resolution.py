@@ -0,0 +1,468 @@
+"""
+Resolución de items en lote para facturas de venta y compra.
+
+process_invoice_item / process_purchase_invoice_item resuelven cada línea por separado
+(abbr de la compañía, existencia del item, plantilla de IVA, cuenta de ingresos/gastos),
+lo que en una factura de 60 líneas genera cientos de requests secuenciales.
+
+Este módulo resuelve todas las líneas juntas:
+  1. Junta los item_code y consulta los existentes con una sola query `in`.
+  2. Crea solo los faltantes.
+  3. Resuelve plantillas de IVA por tasa y cuentas por cliente/proveedor una sola vez.
+  4. Asigna plantillas a los items con un PUT por item solo cuando falta la plantilla.
+  5. Construye los items procesados con el mismo formato que las funciones por línea.
+"""
+
+from urllib.parse import quote
+
+from routes.general import get_company_abbr, add_company_abbr, remove_company_abbr
+from routes.items import (
+    find_or_create_item_by_description,
+    create_free_item,
+    get_tax_template_map,
+    determine_income_account,
+    determine_expense_account,
+    get_company_defaults,
+    build_item_tax_rate_for_purchase,
+)
+from utils.http_utils import make_erpnext_request
+from utils.frappe_list import fetch_list_by_names
+
+
+def fetch_items_by_codes(session, item_codes, fields=None, operation_name="Batch fetch items"):
+    """
+    Obtiene los Items existentes para una lista de códigos con queries `in`.
+
+    Returns:
+        tuple: (dict name -> fila del Item solo de los que existen, error). Con error
+        el dict es parcial: un código ausente no implica que el Item no exista
+    """
+    requested_fields = list(fields or ["name"])
+    if "name" not in requested_fields:
+        requested_fields.insert(0, "name")
+
+    rows, error = fetch_list_by_names(session, "Item", item_codes, requested_fields, operation_name=operation_name)
+    return {row["name"]: row for row in rows if row.get("name")}, error
+
+
+def fetch_item_child_rows(session, child_doctype, parents, fields, extra_filters=None, operation_name="Batch fetch item child rows"):
+    """
+    Obtiene filas de una tabla hija de Item (Item Tax, Item Default...) para varios items.
+
+    Returns:
+        tuple: (dict parent -> [filas], error). Con error el dict es parcial
+    """
+    requested_fields = list(fields)
+    if "parent" not in requested_fields:
+        requested_fields.append("parent")
+
+    rows, error = fetch_list_by_names(
+        session,
+        child_doctype,
+        parents,
+        requested_fields,
+        filter_field="parent",
+        extra_filters=[["parenttype", "=", "Item"]] + list(extra_filters or []),
+        order_by="idx asc",
+        parent="Item",
+        operation_name=operation_name
+    )
+    rows_by_parent = {}
+    for row in rows:
+        rows_by_parent.setdefault(row.get("parent"), []).append(row)
+    return rows_by_parent, error
+
+
+def fetch_items_stock_info(session, item_codes, company):
+    """
+    Devuelve is_stock_item y el almacén por defecto (Item Default de la compañía) de varios items.
+
+    Returns:
+        tuple: (dict item_code -> {"is_stock_item": 0/1, "default_warehouse": str|None}, error).
+        Con error faltan los items de los bloques que no se pudieron leer
+    """
+    items, error = fetch_items_by_codes(session, item_codes, fields=["name", "is_stock_item"], operation_name="Batch check item stock status")
+    defaults, defaults_error = fetch_item_child_rows(
+        session,
+        "Item Default",
+        [code for code, row in items.items() if row.get("is_stock_item") == 1],
+        ["default_warehouse"],
+        extra_filters=[["company", "=", company]] if company else None,
+        operation_name="Batch fetch item defaults"
+    )
+    info = {}
+    for code, row in items.items():
+        default_warehouse = None
+        for default in defaults.get(code, []):
+            if default.get("default_warehouse"):
+                default_warehouse = default["default_warehouse"]
+                break
+        info[code] = {"is_stock_item": row.get("is_stock_item"), "default_warehouse": default_warehouse}
+    return info, error or defaults_error
+
+
+def _create_missing_item(item_code, item, session):
+    """Crear un item faltante como servicio no stock (mismo cuerpo que ensure_item_exists)"""
+    description = item.get('item_name') or item.get('description') or item_code
+    item_body = {
+        "item_code": item_code,
+        "item_name": description,
+        "item_group": item.get('item_group') or 'Services',
+        "stock_uom": item.get('uom') or item.get('stock_uom') or 'Unit',
+        "is_stock_item": 0,
+        "docstatus": 0
+    }
+    print(f"--- Creating missing item '{item_code}' como servicio no stock")
+    response, error = make_erpnext_request(
+        session=session,
+        method="POST",
+        endpoint="/api/resource/Item",
+        data={"data": item_body},
+        operation_name=f"Create missing item '{item_code}'"
+    )
+    if error or (response and response.status_code not in (200, 201)):
+        print(f"--- Failed to create missing item '{item_code}': {error or (response.text if response else 'unknown error')}")
+
+
+def _tax_assignment_candidates(item_code, company_abbr):
+    """Mismo orden de búsqueda que assign_tax_template_by_rate"""
+    if not company_abbr:
+        return [item_code]
+    suffix = f" - {company_abbr}"
+    if not item_code.endswith(suffix):
+        candidate = add_company_abbr(item_code, company_abbr)
+        if candidate != item_code:
+            return [candidate, item_code]
+        return [item_code]
+    stripped = remove_company_abbr(item_code, company_abbr)
+    if stripped != item_code:
+        return [item_code, stripped]
+    return [item_code]
+
+
+def _assign_tax_templates_batch(assignments, existing_codes, session, company_abbr):
+    """
+    Asignar plantillas de IVA a varios items.
+
+    assignments: lista de (item_code, template_name). Se resuelve el item destino con los
+    mismos candidatos que assign_tax_template_by_rate, se leen las filas Item Tax de todos
+    los destinos en una query y se hace un PUT por item solo si le falta alguna plantilla.
+    """
+    if not assignments:
+        return
+
+    templates_by_target = {}
+    for item_code, template_name in assignments:
+        target = None
+        for candidate in _tax_assignment_candidates(item_code, company_abbr):
+            if candidate in existing_codes:
+                target = candidate
+                break
+        if not target:
+            if company_abbr and not item_code.endswith(f" - {company_abbr}"):
+                target = add_company_abbr(item_code, company_abbr)
+            else:
+                target = item_code
+        templates = templates_by_target.setdefault(target, [])
+        if template_name not in templates:
+            templates.append(template_name)
+
+    current_taxes_by_item, error = fetch_item_child_rows(
+        session,
+        "Item Tax",
+        list(templates_by_target.keys()),
+        ["name", "idx", "item_tax_template", "tax_category", "valid_from", "minimum_net_rate", "maximum_net_rate"],
+        operation_name="Batch fetch current item taxes"
+    )
+    if error:
+        # El PUT reemplaza la tabla de impuestos: sin las filas actuales se borrarían
+        print(f"--- Tax template assignment: skipped, could not read current item taxes ({error})")
+        return
+
+    for target, templates in templates_by_target.items():
+        current_taxes = [
+            {key: value for key, value in row.items() if key != "parent"}
+            for row in current_taxes_by_item.get(target, [])
+        ]
+        existing_templates = {tax.get('item_tax_template') for tax in current_taxes if tax.get('item_tax_template')}
+        missing = [template for template in templates if template not in existing_templates]
+        if not missing:
+            continue
+        current_taxes.extend({"item_tax_template": template} for template in missing)
+        response, error = make_erpnext_request(
+            session=session,
+            method="PUT",
+            endpoint=f"/api/resource/Item/{quote(target)}",
+            data={"data": {"taxes": current_taxes}},
+            operation_name="Assign tax template to item"
+        )
+        if error:
+            print(f"--- Tax template assignment: error ({target})")
+
+
+def _resolve_items_without_code(items, session, headers, company, tax_map, transaction_type):
+    """
+    Resolver líneas sin item_code (por descripción o items libres).
+
+    Las descripciones repetidas dentro de la misma factura se resuelven una sola vez.
+    Returns: lista alineada con items (código resuelto, None si no aplica, False si falló)
+    """
+    resolved = []
+    by_description = {}
+    for item in items:
+        if not isinstance(item, dict) or item.get('item_code'):
+            resolved.append(None)
+            continue
+        description = item.get('description')
+        if description:
+            key = (description.strip(), str(item.get('iva_percent', '')))
+            if key not in by_description:
+                by_description[key] = find_or_create_item_by_description(
+                    item, session, headers, company, tax_map, transaction_type=transaction_type
+                )
+            resolved.append(by_description[key] or False)
+        else:
+            resolved.append(create_free_item(item, session, headers, company) or False)
+    return resolved
+
+
+def process_invoice_items_batch(items, session, headers, company, tax_map=None, customer=None, transaction_type='sales'):
+    """
+    Versión en lote de process_invoice_item.
+
+    Returns:
+        list: items procesados alineados con `items` (None en las líneas que fallaron)
+    """
+    items = items or []
+    print(f"--- Batch processing {len(items)} invoice items")
+
+    company_abbr = get_company_abbr(session, headers, company) if company else None
+
+    # Líneas sin código (descripción / libres)
+    generated_codes = _resolve_items_without_code(items, session, headers, company, tax_map, transaction_type)
+
+    # Existencia de todos los códigos provistos (y sus variantes con/sin abbr) en una query
+    provided_codes = []
+    for item in items:
+        if isinstance(item, dict) and item.get('item_code'):
+            provided_codes.append(item['item_code'])
+    lookup_codes = set(provided_codes)
+    for code in provided_codes:
+        lookup_codes.update(_tax_assignment_candidates(code, company_abbr))
+        if transaction_type == 'purchase' and company_abbr:
+            lookup_codes.add(add_company_abbr(code, company_abbr))
+    for code in generated_codes:
+        if code:
+            lookup_codes.update(_tax_assignment_candidates(code, company_abbr))
+    found_codes, lookup_error = fetch_items_by_codes(session, list(lookup_codes), operation_name="Batch check item existence")
+    existing_codes = set(found_codes)
+    if lookup_error:
+        print(f"--- Batch item lookup: error, missing items will not be created ({lookup_error})")
+
+    # Crear solo los faltantes (una vez por código)
+    for item in items:
+        if not isinstance(item, dict) or not item.get('item_code'):
+            continue
+        codes_to_ensure = [item['item_code']]
+        if transaction_type == 'purchase' and company_abbr and not item['item_code'].endswith(f" - {company_abbr}"):
+            codes_to_ensure.append(add_company_abbr(item['item_code'], company_abbr))
+        for code in codes_to_ensure:
+            # Si la consulta falló no se sabe si el código existe: no crear duplicados
+            if code not in existing_codes and not lookup_error:
+                _create_missing_item(code, item, session)
+                existing_codes.add(code)
+    existing_codes.update(code for code in generated_codes if code)
+
+    # Plantillas de IVA: mapa por tasa una sola vez
+    if tax_map is None and any(isinstance(item, dict) and 'iva_percent' in item for item in items):
+        tax_map = get_tax_template_map(session, headers, company, transaction_type=transaction_type)
+
+    # Cuenta de ingresos: una vez por cliente para las líneas sin cuenta propia
+    income_accounts = {}
+
+    processed_items = []
+    tax_assignments = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            print("--- Item processing: error - invalid format")
+            processed_items.append(None)
+            continue
+        try:
+            processed_item = {
+                "qty": item.get('qty', 1),
+                "rate": item.get('rate', 0)
+            }
+
+            if not item.get('item_code'):
+                if not generated_codes[index]:
+                    print("--- Item creation: error")
+                    processed_items.append(None)
+                    continue
+                processed_item["item_code"] = generated_codes[index]
+            else:
+                processed_item["item_code"] = item['item_code']
+
+            if 'iva_percent' in item:
+                search_key = str(float(item['iva_percent']))
+                if tax_map and search_key in tax_map:
+                    template_name = tax_map[search_key]
+                    processed_item["item_tax_template"] = template_name
+                    tax_assignments.append((processed_item['item_code'], template_name))
+                else:
+                    print(f"--- Tax template: not found for rate {search_key}")
+            elif item.get('item_tax_template'):
+                processed_item["item_tax_template"] = item['item_tax_template']
+
+            if item.get('income_account'):
+                income_account = item['income_account']
+            else:
+                if customer not in income_accounts:
+                    income_accounts[customer] = determine_income_account({'customer': customer}, session, headers, company)
+                income_account = income_accounts[customer]
+            if income_account:
+                processed_item["income_account"] = income_account
+
+            if transaction_type == 'purchase' and company_abbr:
+                code = processed_item.get("item_code")
+                if code and not code.endswith(f" - {company_abbr}"):
+                    processed_item["item_code"] = add_company_abbr(code, company_abbr)
+
+            if item.get('warehouse'):
+                warehouse = item['warehouse']
+                if company_abbr and not warehouse.endswith(f" - {company_abbr}"):
+                    warehouse = add_company_abbr(warehouse, company_abbr)
+                processed_item['warehouse'] = warehouse
+
+            if item.get('delivery_note'):
+                processed_item['delivery_note'] = item['delivery_note']
+            if item.get('dn_detail'):
+                processed_item['dn_detail'] = item['dn_detail']
+
+            if item.get('sales_order'):
+                processed_item['sales_order'] = item['sales_order']
+            if item.get('so_detail'):
+                processed_item['so_detail'] = item['so_detail']
+            if item.get('sales_order_item') and not processed_item.get('so_detail'):
+                processed_item['so_detail'] = item['sales_order_item']
+            if item.get('__source_sales_order') and not processed_item.get('sales_order'):
+                processed_item['sales_order'] = item['__source_sales_order']
+            if item.get('__source_so_detail') and not processed_item.get('so_detail'):
+                processed_item['so_detail'] = item['__source_so_detail']
+
+            processed_items.append(processed_item)
+        except Exception as e:
+            print(f"--- Item processing: error ({e})")
+            processed_items.append(None)
+
+    # Asignar plantillas a los items en ERPNext (un PUT por item que lo necesite)
+    try:
+        _assign_tax_templates_batch(tax_assignments, existing_codes, session, company_abbr)
+    except Exception as e:
+        print(f"--- Batch tax template assignment: error ({e})")
+
+    print(f"--- Batch item processing: completed ({sum(1 for p in processed_items if p)}/{len(items)})")
+    return processed_items
+
+
+def process_purchase_invoice_items_batch(items, session, headers, company, tax_map=None, supplier=None):
+    """
+    Versión en lote de process_purchase_invoice_item.
+
+    Returns:
+        list: items procesados alineados con `items` (None en las líneas que fallaron)
+    """
+    items = items or []
+    print(f"--- Batch processing {len(items)} purchase invoice items")
+
+    generated_codes = _resolve_items_without_code(items, session, headers, company, tax_map, 'purchase')
+
+    # item_tax_rate por tasa y cuenta de gastos por proveedor: una vez por valor distinto
+    item_tax_rates = {}
+    expense_accounts = {}
+    company_defaults = None
+    company_defaults_loaded = False
+
+    processed_items = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            print("--- Purchase item processing: invalid format")
+            processed_items.append(None)
+            continue
+        try:
+            discount_percentage = float(item.get('discount_percent') or item.get('discount_percentage') or 0)
+            qty = float(item.get('qty', 1) or 1)
+            rate = float(item.get('rate', 0) or 0)
+            discount_amount = 0
+            if discount_percentage > 0 and qty > 0 and rate > 0:
+                discount_amount = qty * rate * (discount_percentage / 100)
+
+            processed_item = {
+                "item_code": item.get('item_code', ''),
+                "item_name": item.get('item_name', ''),
+                "description": item.get('description', ''),
+                "qty": qty,
+                "rate": rate,
+                "uom": item.get('uom', 'Unit'),
+            }
+            if discount_percentage > 0:
+                processed_item["discount_percentage"] = discount_percentage
+                processed_item["discount_amount"] = discount_amount
+
+            if not item.get('item_code'):
+                if not generated_codes[index]:
+                    print("--- Purchase item creation: error")
+                    processed_items.append(None)
+                    continue
+                processed_item["item_code"] = generated_codes[index]
+            else:
+                processed_item["item_code"] = item['item_code']
+
+            if 'iva_percent' in item:
+                iva_rate = float(item['iva_percent'])
+                rate_key = str(iva_rate)
+                if tax_map:
+                    purchase_template = tax_map.get(rate_key)
+                    if purchase_template:
+                        processed_item["item_tax_template"] = purchase_template
+                if rate_key not in item_tax_rates:
+                    item_tax_rates[rate_key] = build_item_tax_rate_for_purchase(session, headers, company, iva_rate)
+                if item_tax_rates[rate_key]:
+                    processed_item["item_tax_rate"] = item_tax_rates[rate_key]
+
+            if item.get('expense_account'):
+                expense_account = item['expense_account']
+            else:
+                if supplier not in expense_accounts:
+                    expense_accounts[supplier] = determine_expense_account({}, session, headers, company, supplier)
+                expense_account = expense_accounts[supplier]
+            if not expense_account:
+                if not company_defaults_loaded:
+                    company_defaults = get_company_defaults(company, session, headers)
+                    company_defaults_loaded = True
+                if company_defaults and company_defaults.get('default_expense_account'):
+                    expense_account = company_defaults['default_expense_account']
+            if expense_account:
+                processed_item["expense_account"] = expense_account
+
+            if item.get('purchase_order'):
+                processed_item['purchase_order'] = item['purchase_order']
+            if item.get('purchase_order_item'):
+                processed_item['po_detail'] = item['purchase_order_item']
+            if item.get('po_detail'):
+                processed_item['po_detail'] = item['po_detail']
+            if item.get('purchase_receipt'):
+                processed_item['purchase_receipt'] = item['purchase_receipt']
+            if item.get('pr_detail'):
+                processed_item['pr_detail'] = item['pr_detail']
+            if item.get('warehouse'):
+                processed_item['warehouse'] = item['warehouse']
+            if item.get('cost_center'):
+                processed_item['cost_center'] = item['cost_center']
+
+            processed_items.append(processed_item)
+        except Exception as e:
+            print(f"--- Purchase invoice item processing: error ({e})")
+            processed_items.append(None)
+
+    print(f"--- Batch purchase item processing: completed ({sum(1 for p in processed_items if p)}/{len(items)})")
+    return processed_items
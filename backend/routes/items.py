@@ -22,6 +22,9 @@ from routes.customer_utils import fetch_customer
 
 # Importar utilidades HTTP centralizadas
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
+from utils.schema_registry import ITEM_GROUP, fetch_existing_records, get_ready, is_ready, mark_ready
+from utils.company_cache import get_company_doc
+from services.job_runner import submit_job, update_job
 
 # Crear el blueprint para las rutas de ítems
 items_bp = Blueprint('items', __name__)
@@ -29,103 +32,58 @@ items_bp = Blueprint('items', __name__)
 # Cache global para mapas de impuestos por compañía
 tax_template_cache = {}
 
-def ensure_item_groups_exist(session, headers, user_id):
-    """Asegura que existan los grupos de ítems necesarios para una nueva compañía"""
-    print("--- Verificar grupos items: procesando")
+ROOT_ITEM_GROUP = "All Item Groups"
+DEFAULT_ITEM_GROUPS = [
+    {"item_group_name": ROOT_ITEM_GROUP, "is_group": 1},
+    {"item_group_name": "Services", "parent_item_group": ROOT_ITEM_GROUP, "is_group": 0},
+]
 
-    try:
-        # Verificar si existe "All Item Groups"
-        # Extract filters to avoid nested quotes in f-string
-        # Consultar Item Group usando params JSON para 'filters'
-        root_response, root_error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/Item Group",
-            params={
-                "filters": json.dumps([["item_group_name", "=", "All Item Groups"]]),
-                "limit_page_length": 1
-            },
-            operation_name="Check All Item Groups existence"
-        )
-        if root_error:
-            return False
 
-        if root_response.status_code == 200:
-            root_data = root_response.json()
-            if root_data.get("data"):
-                print("--- Verificar grupos items: All Item Groups existe")
-                root_group_name = root_data["data"][0]["name"]
-            else:
-                # Crear "All Item Groups"
-                root_group_data = {
-                    "item_group_name": "All Item Groups",
-                    "is_group": 1
-                }
-                create_root_url = "/api/resource/Item Group"
-                create_root_response, create_root_error = make_erpnext_request(
-                    session=session,
-                    method="POST",
-                    endpoint=create_root_url,
-                    data=root_group_data,
-                    operation_name="Create All Item Groups"
-                )
+def ensure_item_groups_exist(session, headers, user_id):
+    """Asegura que existan los grupos de ítems necesarios para una nueva compañía
 
-                if create_root_error:
-                    return False
+    Una sola consulta para los dos grupos; una vez confirmados (utils/schema_registry)
+    no se vuelven a consultar en este proceso.
+    """
+    print("--- Verificar grupos items: procesando")
 
-                created_root = create_root_response.json()
-                root_group_name = created_root["data"]["name"]
-                print("--- All Item Groups: created")
-        else:
-            print("--- All Item Groups: error")
-            return False
+    pending = [group for group in DEFAULT_ITEM_GROUPS if not is_ready(ITEM_GROUP, group["item_group_name"])]
+    if not pending:
+        print("--- Item groups: verified")
+        return True
 
-        # Verificar si existe "Services"
-        print("--- Services: checking")
-        # Extract filters to avoid nested quotes in f-string
-        services_response, services_error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/Item Group",
-            params={
-                "filters": json.dumps([["item_group_name", "=", "Services"]]),
-                "limit_page_length": 1
-            },
-            operation_name="Check Services existence"
+    try:
+        existing = fetch_existing_records(
+            session, "Item Group", [group["item_group_name"] for group in pending], field="item_group_name"
         )
-
-        if services_error:
+        if existing is None:
             return False
 
-        if services_response.status_code == 200:
-            services_data = services_response.json()
-            if services_data.get("data"):
-                print("--- Services: exists")
-            else:
-                # Crear "Services"
-                print("--- Services: creating")
-                services_group_data = {
-                    "item_group_name": "Services",
-                    "parent_item_group": "All Item Groups",
-                    "is_group": 0
-                }
-                create_services_url = "/api/resource/Item Group"
-                create_services_response, create_services_error = make_erpnext_request(
-                    session=session,
-                    method="POST",
-                    endpoint=create_services_url,
-                    data=services_group_data,
-                    operation_name="Create Services group"
-                )
+        # La raíz va primero en DEFAULT_ITEM_GROUPS: Services se crea debajo de ella
+        for group in pending:
+            group_name = group["item_group_name"]
+            if group_name in existing:
+                print(f"--- {group_name}: exists")
+                mark_ready(ITEM_GROUP, group_name, existing[group_name])
+                continue
 
-                if create_services_error:
-                    return False
+            print(f"--- {group_name}: creating")
+            group_data = dict(group)
+            if group_data.get("parent_item_group"):
+                group_data["parent_item_group"] = get_ready(ITEM_GROUP, ROOT_ITEM_GROUP) or ROOT_ITEM_GROUP
+            create_response, create_error = make_erpnext_request(
+                session=session,
+                method="POST",
+                endpoint="/api/resource/Item Group",
+                data=group_data,
+                operation_name=f"Create {group_name} group"
+            )
+            if create_error:
+                return False
 
-                created_services = create_services_response.json()
-                print("--- Services: created")
-        else:
-            print("--- Services: error")
-            return False
+            created = create_response.json()
+            mark_ready(ITEM_GROUP, group_name, created["data"]["name"])
+            print(f"--- {group_name}: created")
 
         print("--- Item groups: verified/created")
         return True
@@ -1349,20 +1307,13 @@ def get_tax_template_for_rate(rate, tax_map):
 
 
 def get_company_defaults(company_name, session, headers):
-    """Obtener las cuentas por defecto de la compañía"""
+    """Obtener las cuentas por defecto de la compañía (desde el cache de compañías)"""
     try:
-        response, error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint=f"/api/resource/Company/{quote(company_name)}",
-            operation_name="Get company defaults"
-        )
-
-        if error:
+        company_data = get_company_doc(session, company_name)
+        if not company_data:
             print("--- Company retrieval: error")
             return None
 
-        company_data = response.json()['data']
         # Some deployments store the default warehouse in 'custom_default_warehouse'
         # while others use 'default_warehouse'. Support both and prefer the custom field
         default_warehouse = company_data.get('custom_default_warehouse') or company_data.get('default_warehouse') or ''
@@ -1781,10 +1732,6 @@ def ensure_brands_for_import(items, session, headers):
         return False
 
 
-# Almacenamiento temporal de progreso de importaciones de items
-items_import_progress = {}
-
-
 @items_bp.route('/api/inventory/items/bulk-import', methods=['POST'])
 def bulk_import_items():
     """Importar múltiples items usando Data Import Tool de ERPNext"""
@@ -1890,39 +1837,30 @@ def bulk_import_items():
         csv_data = output.getvalue()
         print(f"📄 CSV generado con {len(processed_items)} filas válidas")
 
-        # Generar ID único para este proceso
-        import uuid
-        process_id = str(uuid.uuid4())
-
-        # Inicializar progreso
-        items_import_progress[process_id] = {
-            "success": True,
-            "progress": 0,
-            "total": len(processed_items),
-            "current_item": "Iniciando importación...",
-            "message": f"Importando {len(processed_items)} items...",
-            "status": "running"
-        }
-
-        # Iniciar procesamiento en un hilo separado
-        import threading
-        def process_import():
+        # Procesar en el pool de jobs (estado persistido, consultable en /api/jobs/<id>)
+        def process_import(job):
+            process_id = job.id
             try:
                 _do_bulk_import_csv(session, headers, user_id, process_id, csv_data, mode)
             except Exception as e:
                 print(f"Error en procesamiento de importación {process_id}: {e}")
-                items_import_progress[process_id] = {
-                    "success": False,
-                    "progress": 0,
-                    "total": len(processed_items),
-                    "current_item": "Error en procesamiento",
-                    "message": f"Error: {str(e)}",
-                    "status": "error"
-                }
+                job.update(
+                    success=False,
+                    progress=0,
+                    current_item="Error en procesamiento",
+                    message=f"Error: {str(e)}",
+                    status="error"
+                )
 
-        thread = threading.Thread(target=process_import)
-        thread.daemon = True
-        thread.start()
+        process_id = submit_job(
+            "items_bulk_import",
+            process_import,
+            company=company,
+            user_id=user_id,
+            total=len(processed_items),
+            current_item="Iniciando importación...",
+            message=f"Importando {len(processed_items)} items..."
+        )
 
         # Devolver inmediatamente con el process_id
         return jsonify({
@@ -2238,15 +2176,13 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, csv_data, mode):
             except:
                 pass
             print(f"❌ Upload CSV File falló: {error_msg}")
-            items_import_progress[process_id]["status"] = "error"
-            items_import_progress[process_id]["message"] = f"Error subiendo archivo: {error_msg}"
+            update_job(process_id, status="error", message=f"Error subiendo archivo: {error_msg}")
             return
 
         print("✅ Upload CSV File completada exitosamente")
     except Exception as e:
         print(f"❌ Error de conexión en Upload CSV File: {e}")
-        items_import_progress[process_id]["status"] = "error"
-        items_import_progress[process_id]["message"] = f"Error de conexión subiendo archivo: {str(e)}"
+        update_job(process_id, status="error", message=f"Error de conexión subiendo archivo: {str(e)}")
         return
 
     upload_result = upload_response.json()
@@ -2257,8 +2193,7 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, csv_data, mode):
 
     if not file_url:
         print(f"❌ No se pudo obtener file_url del upload: {upload_result}")
-        items_import_progress[process_id]["status"] = "error"
-        items_import_progress[process_id]["message"] = "Error: No se pudo obtener file_url del upload"
+        update_job(process_id, status="error", message="Error: No se pudo obtener file_url del upload")
         return
 
     print(f"✅ Archivo subido: {file_url}")
@@ -2287,8 +2222,7 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, csv_data, mode):
     if create_import_error:
         error_msg = create_import_error.get('message', 'Error creando Data Import document')
         print(f"❌ Error creando Data Import document: {error_msg}")
-        items_import_progress[process_id]["status"] = "error"
-        items_import_progress[process_id]["message"] = f"Error creando Data Import document: {error_msg}"
+        update_job(process_id, status="error", message=f"Error creando Data Import document: {error_msg}")
         return
 
     import_doc = create_import_response.json().get('data', {})
@@ -2312,8 +2246,7 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, csv_data, mode):
     if import_error:
         error_msg = import_error.get('message', 'Error en Data Import')
         print(f"❌ Error en Data Import: {error_msg}")
-        items_import_progress[process_id]["status"] = "error"
-        items_import_progress[process_id]["message"] = f"Error en Data Import: {error_msg}"
+        update_job(process_id, status="error", message=f"Error en Data Import: {error_msg}")
         return
 
     import_result = import_response.json()
@@ -2323,11 +2256,14 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, csv_data, mode):
     print(f"✅ Data Import iniciado: {message}")
 
     # Actualizar progreso
-    items_import_progress[process_id]["status"] = "completed"
-    items_import_progress[process_id]["message"] = f"Importación de items iniciada exitosamente. Import ID: {import_name}"
-    items_import_progress[process_id]["import_name"] = import_name
-    items_import_progress[process_id]["saved"] = payload_count if payload_count > 0 else len(csv_data.split('\n')) - 1
-    items_import_progress[process_id]["failed"] = 0
+    update_job(
+        process_id,
+        status="completed",
+        message=f"Importación de items iniciada exitosamente. Import ID: {import_name}",
+        import_name=import_name,
+        saved=payload_count if payload_count > 0 else len(csv_data.split('\n')) - 1,
+        failed=0
+    )
 
     print(f"✅ Bulk import de items completado con archivo subido")
 
@@ -0,0 +1,64 @@
+"""
+Jobs Routes
+Estado y cancelación de los jobs en segundo plano (services/job_runner.py)
+"""
+
+from flask import Blueprint, request, jsonify
+import traceback
+
+from routes.auth_utils import get_session_with_auth
+from services.job_runner import get_job, list_jobs, cancel_job, job_runner_stats
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+@jobs_bp.route('/api/jobs', methods=['GET'])
+def get_user_jobs():
+    """Últimos jobs del usuario (opcional: ?kind=...&company=...&limit=...)"""
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
+    try:
+        limit = min(int(request.args.get('limit', 50)), 200)
+        jobs = list_jobs(
+            user_id=user_id,
+            company=request.args.get('company'),
+            kind=request.args.get('kind'),
+            limit=limit
+        )
+        return jsonify({"success": True, "data": jobs, "runner": job_runner_stats()})
+    except Exception as e:
+        print(f"Error en get_user_jobs: {e}")
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"Error interno del servidor: {str(e)}"}), 500
+
+
+@jobs_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Estado y progreso de un job"""
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
+    job = get_job(job_id)
+    # Los jobs de otros usuarios se informan como inexistentes
+    if not job or job.get('user_id') != user_id:
+        return jsonify({"success": False, "message": "Job no encontrado"}), 404
+    return jsonify({"success": True, "data": job})
+
+
+@jobs_bp.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job_request(job_id):
+    """Cancelar un job en cola o pedir la cancelación de uno en curso"""
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
+    job = get_job(job_id)
+    if not job or job.get('user_id') != user_id:
+        return jsonify({"success": False, "message": "Job no encontrado"}), 404
+    if job.get('status') in ('completed', 'error', 'cancelled'):
+        return jsonify({"success": False, "message": f"El job ya terminó ({job.get('status')})", "data": job}), 409
+
+    return jsonify({"success": True, "data": cancel_job(job_id)})
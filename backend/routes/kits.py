@@ -13,9 +13,10 @@ import math
 from urllib.parse import quote
 
 from utils.http_utils import handle_erpnext_error, make_erpnext_request
+from utils.schema_registry import ITEM_GROUP, get_ready, mark_ready
 from routes.auth_utils import get_session_with_auth
 from routes.general import get_company_abbr, update_company_item_count
-from routes.inventory_utils import fetch_bin_stock, round_qty
+from routes.inventory_utils import fetch_bin_stock, round_qty, resolve_stock_movements
 # NOTE: Backend automatically appends company abbreviation to new_item_code and component item_codes before sending to ERPNext.
 # Frontend sends bare codes (e.g. 'ART012', 'ART005'); backend adds ' - ABBR' if needed.
 
@@ -41,6 +42,10 @@ def ensure_item_group(session, headers, group_name, company):
         if not group_name.endswith(f" - {abbr}"):
             canonical_name = f"{group_name} - {abbr}"
 
+    confirmed = get_ready(ITEM_GROUP, canonical_name)
+    if confirmed:
+        return confirmed
+
     # Try fetch by canonical name only (no fallbacks)
     try:
         resp, err = make_erpnext_request(
@@ -52,7 +57,9 @@ def ensure_item_group(session, headers, group_name, company):
         if not err and resp.status_code == 200:
             data = resp.json().get('data')
             if data:
-                return data.get('name') or canonical_name
+                docname = data.get('name') or canonical_name
+                mark_ready(ITEM_GROUP, canonical_name, docname)
+                return docname
     except Exception:
         # proceed to creation attempt
         pass
@@ -74,7 +81,9 @@ def ensure_item_group(session, headers, group_name, company):
         if err:
             return None
         created = resp.json().get('data')
-        return created.get('name') if created else canonical_name
+        docname = created.get('name') if created else canonical_name
+        mark_ready(ITEM_GROUP, canonical_name, docname)
+        return docname
     except Exception:
         return None
 
@@ -1151,8 +1160,6 @@ def get_kit_movements(kit_name):
         print(f"--- get_kit_movements: Kit {kit_name} has {len(kit_items)} items, company abbr: {abbr}")
 
         all_movements = []
-        voucher_cache = {}  # Cache para verificar docstatus de vouchers
-        stock_reco_cache = {}  # Cache para Stock Reconciliation documents
         
         for kit_item in kit_items:
             item_code = kit_item.get('item_code')
@@ -1180,79 +1187,6 @@ def get_kit_movements(kit_name):
                 print(f"--- get_kit_movements: Found {len(item_movements)} movements for {erp_item_code}")
                 
                 for movement in item_movements:
-                    voucher_type = movement.get('voucher_type')
-                    voucher_no = movement.get('voucher_no')
-                    
-                    # Verificar docstatus del voucher padre
-                    if voucher_type and voucher_no:
-                        cache_key = f"{voucher_type}::{voucher_no}"
-                        
-                        if cache_key not in voucher_cache:
-                            try:
-                                voucher_response, voucher_error = make_erpnext_request(
-                                    session=session,
-                                    method="GET",
-                                    endpoint=f"/api/resource/{quote(voucher_type)}/{quote(voucher_no)}",
-                                    operation_name=f"Check Voucher Status for kit movement",
-                                    params={"fields": '["docstatus"]'}
-                                )
-                                
-                                if voucher_response and voucher_response.status_code == 200:
-                                    voucher_data = voucher_response.json().get('data', {})
-                                    voucher_cache[cache_key] = voucher_data.get('docstatus', 0)
-                                elif voucher_response and voucher_response.status_code == 404:
-                                    voucher_cache[cache_key] = 0
-                                else:
-                                    # Error de conexión - asumir válido ya que SLE tiene docstatus=1
-                                    voucher_cache[cache_key] = 1
-                            except Exception as e:
-                                print(f"Error verificando voucher {voucher_type} {voucher_no}: {e}")
-                                voucher_cache[cache_key] = 1
-                        
-                        # Excluir si el voucher no tiene docstatus=1
-                        if voucher_cache.get(cache_key, 0) != 1:
-                            continue
-                    
-                    # Enriquecer Stock Reconciliation con qty=0
-                    actual_qty = float(movement.get('actual_qty', 0))
-                    if voucher_type == 'Stock Reconciliation' and actual_qty == 0 and voucher_no:
-                        if voucher_no not in stock_reco_cache:
-                            try:
-                                reco_response, reco_error = make_erpnext_request(
-                                    session=session,
-                                    method="GET",
-                                    endpoint=f"/api/resource/Stock Reconciliation/{quote(voucher_no)}",
-                                    operation_name=f"Fetch Stock Reconciliation {voucher_no} for kit",
-                                    params={"fields": '["name", "items"]'}
-                                )
-                                if reco_response and reco_response.status_code == 200:
-                                    reco_data = reco_response.json().get('data', {})
-                                    stock_reco_cache[voucher_no] = reco_data.get('items', [])
-                                else:
-                                    stock_reco_cache[voucher_no] = []
-                            except Exception as e:
-                                print(f"Error fetching Stock Reconciliation {voucher_no}: {e}")
-                                stock_reco_cache[voucher_no] = []
-                        
-                        # Buscar el item en los items del Stock Reconciliation
-                        reco_items = stock_reco_cache.get(voucher_no, [])
-                        for reco_item in reco_items:
-                            # Comparar con erp_item_code (con sufijo de compañía)
-                            if reco_item.get('item_code') == erp_item_code:
-                                qty_diff = reco_item.get('quantity_difference', 0)
-                                if isinstance(qty_diff, str):
-                                    try:
-                                        qty_diff = float(qty_diff)
-                                    except:
-                                        qty_diff = 0
-                                
-                                if qty_diff != 0:
-                                    movement = dict(movement)  # Crear copia
-                                    movement['actual_qty'] = qty_diff
-                                    movement['_enriched_from_reco'] = True
-                                    print(f"--- get_kit_movements: Enriched Stock Reco {voucher_no} for {erp_item_code}: qty_diff={qty_diff}")
-                                break
-                    
                     # Agregar metadata del kit
                     movement['kit_name'] = kit_name
                     movement['kit_item_code'] = kit_item.get('item_code')
@@ -1262,6 +1196,9 @@ def get_kit_movements(kit_name):
             else:
                 print(f"--- get_kit_movements: Error or no response for {erp_item_code}: error={movements_error}")
 
+        # Verificar vouchers y enriquecer Stock Reconciliation de todos los componentes juntos
+        all_movements = resolve_stock_movements(session, all_movements)
+
         print(f"--- get_kit_movements: Total movements collected: {len(all_movements)}")
         all_movements.sort(key=lambda x: (x.get('posting_date', ''), x.get('posting_time', '')), reverse=True)
         return jsonify({"success": True, "data": all_movements})
@@ -4,7 +4,7 @@ Handles month closure operations for bank accounts and account reconciliation
 """
 
 from flask import Blueprint, request, jsonify
-from datetime import datetime
+from datetime import datetime, timedelta
 import calendar
 import json
 import traceback
@@ -12,6 +12,8 @@ import traceback
 from routes.auth_utils import get_session_with_auth
 from routes.general import get_active_company, get_company_abbr
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
+from services.account_balances import balance_from_totals, get_monthly_totals, invalidate_balances
+from services.trial_balance import invalidate_trial_balance
 
 month_closure_bp = Blueprint('month_closure', __name__)
 
@@ -79,6 +81,25 @@ def get_bank_account_from_gl_account(session, headers, gl_account_name):
         return None
 
 
+def get_account_lock_date(session, account_name):
+    """custom_lock_posting_before de una cuenta contable (None si no tiene cierre)"""
+    resp, err = make_erpnext_request(
+        session=session,
+        method="GET",
+        endpoint="/api/resource/Account",
+        params={
+            "filters": json.dumps([["name", "=", account_name]]),
+            "fields": json.dumps(["name", "custom_lock_posting_before"]),
+            "limit_page_length": 1
+        },
+        operation_name="Get account lock date"
+    )
+    if err or not resp or resp.status_code != 200:
+        return None
+    data = resp.json().get("data", [])
+    return data[0].get("custom_lock_posting_before") if data else None
+
+
 @month_closure_bp.route('/api/month-closure/account-summary/<account_name>', methods=['GET'])
 def get_account_month_summary(account_name):
     """
@@ -127,76 +148,38 @@ def get_account_month_summary(account_name):
 
         account_data = account_resp.json().get("data", {})
         
-        # Obtener rangos de fechas de movimientos contables
-        gl_filters = [
-            ["account", "=", account_name_with_abbr],
-            ["company", "=", company_name]
-        ]
-        
-        gl_resp, gl_err = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/GL Entry",
-            params={
-                "filters": json.dumps(gl_filters),
-                "fields": json.dumps(["posting_date"]),
-                "order_by": "posting_date asc",
-                "limit_page_length": 10000
-            },
-            operation_name="Get GL Entry dates"
+        lock_date_str = account_data.get("custom_lock_posting_before")
+
+        # Totales mensuales agrupados en ERPNext; los meses cerrados salen del cache
+        gl_months, gl_err = get_monthly_totals(
+            session, 'gl', company_name, account_name_with_abbr, lock_date=lock_date_str
         )
+        if gl_err:
+            print(f"DEBUG: Error aggregating GL Entries for {account_name_with_abbr}: {gl_err}")
 
         # Obtener el Bank Account asociado a esta cuenta contable
         bank_account_name = get_bank_account_from_gl_account(session, headers, account_name_with_abbr)
-        
-        if not bank_account_name:
-            print(f"DEBUG: No Bank Account found for GL Account {account_name_with_abbr}, skipping Bank Transactions")
-            # Continue without bank transactions
-            bt_filters = None
-        else:
-            # Obtener rangos de fechas de bank transactions
-            bt_filters = [["bank_account", "=", bank_account_name]]
-        
-        bt_resp = None
-        bt_err = None
-        if bt_filters:
-            bt_resp, bt_err = make_erpnext_request(
-                session=session,
-                method="GET",
-                endpoint="/api/resource/Bank Transaction",
-                params={
-                    "filters": json.dumps(bt_filters),
-                    "fields": json.dumps(["date"]),
-                    "order_by": "date asc",
-                    "limit_page_length": 10000
-                },
-                operation_name="Get Bank Transaction dates"
+
+        bank_months = {}
+        if bank_account_name:
+            bank_months, bt_err = get_monthly_totals(
+                session, 'bank', company_name, bank_account_name, lock_date=lock_date_str
             )
+            if bt_err:
+                print(f"DEBUG: Error aggregating Bank Transactions for {bank_account_name}: {bt_err}")
+        else:
+            print(f"DEBUG: No Bank Account found for GL Account {account_name_with_abbr}, skipping Bank Transactions")
 
         # Construir lista de meses con movimientos
-        months_with_movements = set()
-        
-        if gl_resp and gl_resp.status_code == 200:
-            gl_entries = gl_resp.json().get("data", [])
-            for entry in gl_entries:
-                date_str = entry.get("posting_date")
-                if date_str:
-                    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-                    months_with_movements.add((date_obj.year, date_obj.month))
-
-        if bt_resp and bt_resp.status_code == 200:
-            bt_entries = bt_resp.json().get("data", [])
-            for entry in bt_entries:
-                date_str = entry.get("date")
-                if date_str:
-                    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-                    months_with_movements.add((date_obj.year, date_obj.month))
+        months_with_movements = {
+            (int(month[:4]), int(month[5:7]))
+            for month in list(gl_months) + list(bank_months)
+        }
 
         # Ordenar meses
         sorted_months = sorted(list(months_with_movements), reverse=True)
 
         # Determinar qué meses están cerrados
-        lock_date_str = account_data.get("custom_lock_posting_before")
         lock_date = None
         if lock_date_str:
             lock_date = datetime.strptime(lock_date_str, "%Y-%m-%d")
@@ -218,60 +201,8 @@ def get_account_month_summary(account_name):
                 "is_closed": is_closed
             })
 
-        # Calcular saldo contable actual
-        gl_balance_resp, gl_balance_err = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/GL Entry",
-            params={
-                "filters": json.dumps(gl_filters),
-                "fields": json.dumps(["debit", "credit"]),
-                "limit_page_length": 99999
-            },
-            operation_name="Get GL Balance"
-        )
-
-        accounting_balance = 0
-        if gl_balance_resp and gl_balance_resp.status_code == 200:
-            gl_entries = gl_balance_resp.json().get("data", [])
-            for entry in gl_entries:
-                accounting_balance += float(entry.get("debit", 0) or 0)
-                accounting_balance -= float(entry.get("credit", 0) or 0)
-
-        # Calcular saldo de bank transactions
-        bank_balance = 0
-        if bt_filters:
-            print(f"DEBUG: Fetching Bank Transactions with filters: {bt_filters}")
-            bt_balance_resp, bt_balance_err = make_erpnext_request(
-                session=session,
-                method="GET",
-                endpoint="/api/resource/Bank Transaction",
-                params={
-                    "filters": json.dumps(bt_filters),
-                    "fields": json.dumps(["name", "date", "deposit", "withdrawal", "bank_account"]),
-                    "limit_page_length": 99999
-                },
-                operation_name="Get Bank Transaction Balance"
-            )
-
-            if bt_balance_resp and bt_balance_resp.status_code == 200:
-                bt_entries = bt_balance_resp.json().get("data", [])
-                print(f"DEBUG: Found {len(bt_entries)} bank transactions for balance calculation")
-                if len(bt_entries) > 0:
-                    print(f"DEBUG: First entry sample: {bt_entries[0]}")
-                for entry in bt_entries:
-                    deposit = float(entry.get("deposit") or 0)
-                    withdrawal = float(entry.get("withdrawal") or 0)
-                    print(f"DEBUG: Entry {entry.get('name')} ({entry.get('date')}) - deposit: {deposit}, withdrawal: {withdrawal}")
-                    bank_balance += deposit
-                    bank_balance -= withdrawal
-                print(f"DEBUG: Total bank balance: {bank_balance}")
-            else:
-                print(f"DEBUG: Error fetching Bank Transactions: {bt_balance_err}")
-                if bt_balance_resp:
-                    print(f"DEBUG: Response status: {bt_balance_resp.status_code}, body: {bt_balance_resp.text}")
-        else:
-            print(f"DEBUG: No Bank Account found, bank balance will be 0")
+        accounting_balance = balance_from_totals(gl_months)
+        bank_balance = balance_from_totals(bank_months)
 
         return jsonify({
             "success": True,
@@ -335,31 +266,15 @@ def get_month_balances():
         first_day = get_first_day_of_month(year, month)
         last_day = get_last_day_of_month(year, month)
 
-        # Saldo contable hasta el fin del mes
-        gl_filters = [
-            ["account", "=", account_name_with_abbr],
-            ["company", "=", company_name],
-            ["posting_date", "<=", last_day]
-        ]
-        
-        gl_resp, gl_err = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/GL Entry",
-            params={
-                "filters": json.dumps(gl_filters),
-                "fields": json.dumps(["debit", "credit"]),
-                "limit_page_length": 99999
-            },
-            operation_name="Get GL Balance for month"
-        )
+        lock_date = get_account_lock_date(session, account_name_with_abbr)
 
-        accounting_balance = 0
-        if gl_resp and gl_resp.status_code == 200:
-            gl_entries = gl_resp.json().get("data", [])
-            for entry in gl_entries:
-                accounting_balance += float(entry.get("debit", 0) or 0)
-                accounting_balance -= float(entry.get("credit", 0) or 0)
+        # Saldo contable hasta el fin del mes (sumas agrupadas; meses cerrados desde cache)
+        gl_months, gl_err = get_monthly_totals(
+            session, 'gl', company_name, account_name_with_abbr, lock_date=lock_date, to_date=last_day
+        )
+        if gl_err:
+            print(f"DEBUG: Error aggregating GL Entries for {account_name_with_abbr}: {gl_err}")
+        accounting_balance = balance_from_totals(gl_months, last_day)
 
         # Obtener el Bank Account asociado a esta cuenta contable
         bank_account_name = get_bank_account_from_gl_account(session, headers, account_name_with_abbr)
@@ -367,30 +282,12 @@ def get_month_balances():
         # Saldo de bank transactions hasta el fin del mes
         bank_balance = 0
         if bank_account_name:
-            bt_filters = [
-                ["bank_account", "=", bank_account_name],
-                ["date", "<=", last_day]
-            ]
-            
-            bt_resp, bt_err = make_erpnext_request(
-                session=session,
-                method="GET",
-                endpoint="/api/resource/Bank Transaction",
-                params={
-                    "filters": json.dumps(bt_filters),
-                    "fields": json.dumps(["deposit", "withdrawal"]),
-                    "limit_page_length": 99999
-                },
-                operation_name="Get Bank Transaction Balance for month"
+            bank_months, bt_err = get_monthly_totals(
+                session, 'bank', company_name, bank_account_name, lock_date=lock_date, to_date=last_day
             )
-
-            if bt_resp and bt_resp.status_code == 200:
-                bt_entries = bt_resp.json().get("data", [])
-                for entry in bt_entries:
-                    deposit = float(entry.get("deposit") or 0)
-                    withdrawal = float(entry.get("withdrawal") or 0)
-                    bank_balance += deposit
-                    bank_balance -= withdrawal
+            if bt_err:
+                print(f"DEBUG: Error aggregating Bank Transactions for {bank_account_name}: {bt_err}")
+            bank_balance = balance_from_totals(bank_months, last_day)
         else:
             print(f"DEBUG: No Bank Account found for GL Account {account_name_with_abbr} in get_month_balances")
 
@@ -564,6 +461,16 @@ def unlock_month():
                 "message": f"Error desbloqueando mes: {update_err or update_resp.text}"
             }), 500
 
+        # Los meses reabiertos pueden cambiar: descartar sus totales cacheados
+        reopened_from = None
+        if new_lock_date:
+            reopened_from = (datetime.strptime(str(new_lock_date)[:10], "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        invalidate_balances('gl', account_name_with_abbr, company=company_name, from_date=reopened_from)
+        invalidate_trial_balance(company_name, account_name_with_abbr, from_date=reopened_from)
+        bank_account_name = get_bank_account_from_gl_account(session, headers, account_name_with_abbr)
+        if bank_account_name:
+            invalidate_balances('bank', bank_account_name, company=company_name, from_date=reopened_from)
+
         return jsonify({
             "success": True,
             "message": "Meses desbloqueados exitosamente",
@@ -24,6 +24,7 @@ from routes.sales_withholdings import build_payment_entry_withholdings, validate
 # Importar utilidades de conciliación
 from utils.conciliation_utils import CONCILIATION_FIELD, build_conciliation_groups, DEFAULT_THRESHOLD, generate_conciliation_id
 from utils.comprobante_utils import get_payment_prefix
+from services.party_balance_service import invalidate_party_balances
 
 # Crear el blueprint para las rutas de pagos/cobranzas
 pagos_bp = Blueprint('pagos', __name__)
@@ -154,6 +155,17 @@ def handle_payment_conciliation(session, payment_name, invoice_references, invoi
     return True, None
 
 
+def invalidate_payment_party_balances(payment_doc=None, company=None):
+    """Descartar saldos cacheados de la parte del pago (o de toda la compañía si no se conoce)"""
+    doc = payment_doc or {}
+    party = doc.get('party')
+    invalidate_party_balances(
+        party_type=doc.get('party_type') or None,
+        company=doc.get('company') or company,
+        party_names=[party] if party else None
+    )
+
+
 def create_payment_entry_from_context(context, session):
     payment_data = context['payment_data']
     create_response, create_error = make_erpnext_request(
@@ -166,6 +178,8 @@ def create_payment_entry_from_context(context, session):
     if create_error:
         return {"success": False, "error": create_error}
 
+    invalidate_payment_party_balances(payment_data.get('data'))
+
     result = create_response.json()
     payment_name = result.get('data', {}).get('name')
     return {"success": True, "payment_name": payment_name}
@@ -1040,6 +1054,7 @@ def update_pago(payment_name):
             )
             if cancel_error:
                 return handle_erpnext_error(cancel_error, "Failed to cancel existing confirmed payment")
+            invalidate_payment_party_balances(company=get_active_company(user_id))
 
             # Obtener el pago existente para usar reference_no y naming_series base
             payment_response, payment_error = make_erpnext_request(
@@ -1222,6 +1237,8 @@ def update_pago(payment_name):
                 if cancel_error:
                     return handle_erpnext_error(cancel_error, "Failed to cancel replaced payment")
 
+                invalidate_payment_party_balances(existing_payment, company=get_active_company(user_id))
+
                 print("--- Reemplazar pago confirmado (workaround): ok")
                 return jsonify({
                     "success": True,
@@ -1257,6 +1274,8 @@ def update_pago(payment_name):
         if error:
             return handle_erpnext_error(error, "Failed to update payment")
 
+        invalidate_payment_party_balances(company=get_active_company(user_id))
+
         print("--- Actualizar pago: ok")
         return jsonify({
             "success": True,
@@ -1328,6 +1347,8 @@ def delete_payment(payment_name):
             if cancel_error:
                 return handle_erpnext_error(cancel_error, "Failed to cancel payment")
 
+            invalidate_payment_party_balances(company=get_active_company(user_id))
+
             print("--- Payment delete: payment cancelled successfully")
             return jsonify({
                 "success": True,
@@ -1578,6 +1599,9 @@ def bulk_remove_payment_entries():
                 "message": str(exc)
             })
 
+    if summary["cancelled"]:
+        invalidate_payment_party_balances(company=get_active_company(user_id))
+
     success = summary["failed"] == 0
     message = (
         f"Procesados {len(payments)} pagos "
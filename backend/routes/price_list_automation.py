@@ -1,62 +1,71 @@
 from flask import Blueprint, request, jsonify
 import json
 import re
-import threading
-import uuid
 import io
 import csv
-import math
 import traceback
 from urllib.parse import quote
 
 from routes.auth_utils import get_session_with_auth
 from routes.general import get_active_company, get_company_abbr, get_smart_limit
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
+from utils.schema_registry import CUSTOM_FIELD, custom_field_name, fetch_existing_custom_fields, is_ready, mark_ready
+from services.job_runner import submit_job, JobCancelled
+# Traducción/validación/compilación de fórmulas (re-exportadas: sales_price_lists y el servicio las importan de acá)
+from utils.price_formula import (
+    _translate_and_sanitize_formula,
+    SafeEvaluator,
+    ALLOWED_NAMES,
+    FormulaBooleanResult,
+    compile_formula,
+    safe_eval_formula,
+)
 
 price_list_automation_bp = Blueprint('price_list_automation', __name__)
 
-# Progress tracking for apply operations
-automation_import_progress = {}
+
+PRICE_LIST_CUSTOM_FIELDS = [
+    {
+        "dt": "Price List",
+        "label": "Actualización automática",
+        "fieldname": "auto_update_enabled",
+        "fieldtype": "Check",
+        "insert_after": "custom_exchange_rate"
+    },
+    {
+        "dt": "Price List",
+        "label": "Fórmula de actualización",
+        "fieldname": "auto_update_formula",
+        "fieldtype": "Code",
+        "insert_after": "auto_update_enabled"
+    }
+]
 
 
 def ensure_price_list_custom_fields(session, headers):
     """Ensure the two custom fields used by the automation UI exist on Price List.
     This is idempotent and will attempt to create missing fields via ERPNext API.
+    Once both are confirmed (schema registry) later calls make no requests.
     """
-    try:
-        custom_fields = [
-            {
-                "dt": "Price List",
-                "label": "Actualización automática",
-                "fieldname": "auto_update_enabled",
-                "fieldtype": "Check",
-                "insert_after": "custom_exchange_rate"
-            },
-            {
-                "dt": "Price List",
-                "label": "Fórmula de actualización",
-                "fieldname": "auto_update_formula",
-                "fieldtype": "Code",
-                "insert_after": "auto_update_enabled"
-            }
-        ]
+    pending = [
+        field_def for field_def in PRICE_LIST_CUSTOM_FIELDS
+        if not is_ready(CUSTOM_FIELD, custom_field_name(field_def['dt'], field_def['fieldname']))
+    ]
+    if not pending:
+        return
 
-        for field_def in custom_fields:
+    try:
+        # One lookup for all the missing fields instead of one per field
+        existing = fetch_existing_custom_fields(session, "Price List", [field_def['fieldname'] for field_def in pending])
+        if existing is None:
+            return
+
+        for field_def in pending:
+            registry_name = custom_field_name(field_def['dt'], field_def['fieldname'])
+            if field_def['fieldname'] in existing:
+                mark_ready(CUSTOM_FIELD, registry_name)
+                continue
             try:
-                filters_list = [["fieldname", "=", field_def['fieldname']], ["dt", "=", field_def['dt']]]
-                check_resp, check_err = make_erpnext_request(
-                    session=session,
-                    method='GET',
-                    endpoint='/api/resource/Custom Field',
-                    params={"filters": json.dumps(filters_list), "limit_page_length": 1},
-                    operation_name=f"Check Custom Field {field_def['fieldname']} in {field_def['dt']}"
-                )
-                if check_err:
-                    print(f"Warning: error checking custom field {field_def['fieldname']}: {check_err}")
-                    continue
-                if check_resp.status_code == 200 and check_resp.json().get('data'):
-                    continue
-
                 # Create the custom field
                 create_resp, create_err = make_erpnext_request(
                     session=session,
@@ -72,6 +81,7 @@ def ensure_price_list_custom_fields(session, headers):
                 else:
                     if create_resp.status_code in (200, 201):
                         print(f"Created custom field {field_def['fieldname']} on {field_def['dt']}")
+                        mark_ready(CUSTOM_FIELD, registry_name)
                     else:
                         print(f"Unexpected response creating custom field {field_def['fieldname']}: {create_resp.status_code} {create_resp.text}")
 
@@ -84,125 +94,6 @@ def ensure_price_list_custom_fields(session, headers):
         traceback.print_exc()
 
 
-def _translate_and_sanitize_formula(expr: str) -> str:
-    """Translate IF(...) and logical operators to Python and map Math.* to math.*"""
-    if not expr or not isinstance(expr, str):
-        return ''
-
-    s = expr
-    # Replace Math. -> math.
-    s = s.replace('Math.', 'math.')
-    # Replace AND/OR -> and/or
-    s = s.replace('\bAND\b', ' and ').replace('\bOR\b', ' or ')
-    s = s.replace('AND', ' and ').replace('OR', ' or ')
-
-    # Replace IF(cond, a, b) with (a if cond else b) - handle nested by simple parse
-    def replace_if(original):
-        out = ''
-        i = 0
-        while i < len(original):
-            idx = original.upper().find('IF(', i)
-            if idx == -1:
-                out += original[i:]
-                break
-            out += original[i:idx]
-            pos = idx + 3
-            depth = 1
-            while pos < len(original) and depth > 0:
-                if original[pos] == '(':
-                    depth += 1
-                elif original[pos] == ')':
-                    depth -= 1
-                pos += 1
-            inside = original[idx + 3: pos - 1]
-            # split top-level commas
-            parts = []
-            buf = ''
-            d = 0
-            for ch in inside:
-                if ch == '(':
-                    d += 1
-                    buf += ch
-                elif ch == ')':
-                    d -= 1
-                    buf += ch
-                elif ch == ',' and d == 0:
-                    parts.append(buf.strip())
-                    buf = ''
-                else:
-                    buf += ch
-            if buf.strip():
-                parts.append(buf.strip())
-            if len(parts) == 3:
-                out += f"(({parts[1]}) if ({parts[0]}) else ({parts[2]}))"
-            else:
-                out += f"IF({inside})"
-            i = pos
-        return out
-
-    s = replace_if(s)
-
-    # Replace price variables
-    s = s.replace('price.actual', 'actual')
-    s = s.replace('price.compra', 'compra')
-    s = s.replace('\bprice\b', 'actual')
-
-    return s
-
-
-import ast
-
-ALLOWED_NAMES = {'actual', 'compra', 'math', 'round', 'abs', 'max', 'min', 'pow'}
-
-
-class SafeEvaluator(ast.NodeTransformer):
-    """Validate AST nodes to allow only safe expressions."""
-    ALLOWED_NODE_TYPES = (
-        ast.Expression, ast.BinOp, ast.UnaryOp, ast.Num, ast.Call, ast.Name,
-        ast.Load, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow,
-        ast.USub, ast.UAdd, ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE,
-        ast.Gt, ast.GtE, ast.BoolOp, ast.And, ast.Or, ast.IfExp, ast.Attribute,
-        ast.Tuple, ast.List, ast.Constant
-    )
-
-    def generic_visit(self, node):
-        if not isinstance(node, self.ALLOWED_NODE_TYPES):
-            raise ValueError(f'Unsupported expression element: {type(node).__name__}')
-        return super().generic_visit(node)
-
-    def visit_Name(self, node):
-        if node.id not in ALLOWED_NAMES:
-            raise ValueError(f'Use of name "{node.id}" not allowed')
-        return node
-
-    def visit_Call(self, node):
-        # Allow calls to whitelisted names or math.<func>
-        if isinstance(node.func, ast.Name):
-            if node.func.id not in ALLOWED_NAMES:
-                raise ValueError(f'Call to function "{node.func.id}" is not allowed')
-        elif isinstance(node.func, ast.Attribute):
-            # e.g., math.floor
-            if not (isinstance(node.func.value, ast.Name) and node.func.value.id == 'math'):
-                raise ValueError('Only math.* calls allowed as attributes')
-        else:
-            raise ValueError('Unsupported call type')
-        return self.generic_visit(node)
-
-
-def safe_eval_formula(py_expr: str, actual: float = 0.0, compra: float = 0.0):
-    """Evaluate translated python expression safely returning number or boolean."""
-    try:
-        tree = ast.parse(py_expr, mode='eval')
-        SafeEvaluator().visit(tree)
-        compiled = compile(tree, filename='<ast>', mode='eval')
-        safe_globals = {'__builtins__': None, 'math': math, 'round': round, 'abs': abs, 'max': max, 'min': min, 'pow': pow}
-        safe_locals = {'actual': actual, 'compra': compra}
-        result = eval(compiled, safe_globals, safe_locals)
-        return result
-    except Exception as e:
-        raise
-
-
 @price_list_automation_bp.route('/api/price-list-automation/settings', methods=['GET'])
 def get_settings():
     """Return automation settings: global toggle and price lists with automation fields."""
@@ -511,38 +402,43 @@ def apply_updates():
         if not price_lists:
             return jsonify({'success': False, 'message': 'No price lists with automation enabled found'}), 400
 
-        process_id = str(uuid.uuid4())
-        automation_import_progress[process_id] = {'success': True, 'status': 'running', 'progress': 0, 'total': len(items) * len(price_lists), 'message': 'Processing', 'results': []}
-
-        def worker():
+        def worker(job):
             try:
                 updates = []
+                results = []
                 total = 0
-                for item in items:
-                    item_code = item.get('item_code')
-                    compra = float(item.get('compra') or item.get('cost') or 0)
-                    actual = float(item.get('actual') or 0)
-                    for pl in price_lists:
-                        formula = pl.get('auto_update_formula') or ''
-                        try:
-                            pyexpr = _translate_and_sanitize_formula(formula)
-                            res = safe_eval_formula(pyexpr, actual=actual or 0, compra=compra or 0)
-                            # Numeric results expected for rates, booleans are ignored
-                            if isinstance(res, bool):
-                                # skip boolean result for rate
-                                continue
-                            rate = float(res)
-                            updates.append({
-                                'item_code': item_code,
-                                'price_list': pl.get('price_list_name') or pl.get('name'),
-                                'rate': round(rate, 4),
-                                'currency': pl.get('currency'),
-                                'selling': 1 if list_type == 'sales' else 0
-                            })
-                        except Exception as fe:
-                            automation_import_progress[process_id]['results'].append({'item_code': item_code, 'price_list': pl.get('price_list_name'), 'error': str(fe)})
-                        total += 1
-                        automation_import_progress[process_id]['progress'] = total
+                item_codes = [item.get('item_code') for item in items]
+                compras = [float(item.get('compra') or item.get('cost') or 0) for item in items]
+                actuals = [float(item.get('actual') or 0) for item in items]
+                # Una compilación por lista y evaluación en lote sobre todos los items
+                for pl in price_lists:
+                    job.check_cancelled()
+                    formula = pl.get('auto_update_formula') or ''
+                    try:
+                        rates, row_errors = compile_formula(formula).evaluate_batch(compras, actuals)
+                    except Exception as fe:
+                        rates, row_errors = [None] * len(items), {index: fe for index in range(len(items))}
+                    price_list_name = pl.get('price_list_name') or pl.get('name')
+                    for index, rate in enumerate(rates):
+                        error = row_errors.get(index)
+                        # Numeric results expected for rates, booleans are ignored
+                        if isinstance(error, FormulaBooleanResult):
+                            continue
+                        if error is not None:
+                            results.append({'item_code': item_codes[index], 'price_list': pl.get('price_list_name'), 'error': str(error)})
+                            continue
+                        updates.append({
+                            'item_code': item_codes[index],
+                            'price_list': price_list_name,
+                            'rate': round(rate, 4),
+                            'currency': pl.get('currency'),
+                            'selling': 1 if list_type == 'sales' else 0
+                        })
+                    total += len(items)
+                    if row_errors:
+                        job.set_progress(total, results=results)
+                    else:
+                        job.set_progress(total)
 
                     # Build CSV and run Data Import similar to sales bulk save
                 if updates:
@@ -553,19 +449,25 @@ def apply_updates():
                     else:
                         csv_data, has_ids = csv_result, False
                     sample_lines = csv_data.split('\n')[:21]  # header + 20 rows
-                    automation_import_progress[process_id]['status'] = 'completed'
-                    automation_import_progress[process_id]['results'].append({'applied_rows': len(updates), 'csv_preview_lines': sample_lines, 'has_identifiers': bool(has_ids)})
+                    results.append({'applied_rows': len(updates), 'csv_preview_lines': sample_lines, 'has_identifiers': bool(has_ids)})
                 else:
-                    automation_import_progress[process_id]['status'] = 'completed'
-                    automation_import_progress[process_id]['results'].append({'applied_rows': 0})
+                    results.append({'applied_rows': 0})
+                job.update(status='completed', progress=total, results=results)
+            except JobCancelled:
+                raise
             except Exception as e:
-                automation_import_progress[process_id]['status'] = 'error'
-                automation_import_progress[process_id]['message'] = str(e)
-                automation_import_progress[process_id]['results'].append({'error': str(e)})
-
-        thread = threading.Thread(target=worker)
-        thread.daemon = True
-        thread.start()
+                job.append_result({'error': str(e)})
+                job.update(status='error', message=str(e))
+
+        process_id = submit_job(
+            'price_list_automation_apply',
+            worker,
+            company=get_active_company(user_id),
+            user_id=user_id,
+            total=len(items) * len(price_lists),
+            message='Processing',
+            data={'results': []}
+        )
 
         return jsonify({'success': True, 'process_id': process_id, 'message': 'Apply started (async)'}), 202
 
@@ -588,8 +490,7 @@ def preview_formula():
         compra = float(item.get('compra') or item.get('cost') or 0)
         actual = float(item.get('actual') or 0)
 
-        pyexpr = _translate_and_sanitize_formula(formula)
-        res = safe_eval_formula(pyexpr, actual=actual, compra=compra)
+        res = compile_formula(formula).evaluate(actual=actual, compra=compra)
         return jsonify({'success': True, 'result': res})
 
     except Exception as e:
@@ -13,8 +13,6 @@ from routes.general import get_active_company, get_company_abbr, add_company_abb
 
 # Importar funciones de items.py para manejo de items
 from routes.items import (
-    process_invoice_item,
-    process_purchase_invoice_item,
     find_or_create_item_by_description,
     create_item_with_description,
     create_free_item,
@@ -24,6 +22,7 @@ from routes.items import (
     determine_income_account,
     get_company_defaults
 )
+from routes.item_resolution import process_purchase_invoice_items_batch, fetch_items_stock_info
 
 # Importar función para obtener cuenta específica del proveedor
 from routes.suppliers import get_supplier_payable_account
@@ -682,8 +681,21 @@ def create_invoice():
         has_stock_items = False
         linked_purchase_receipts = set()
         
-        for item in data['items']:
-            processed_item = process_purchase_invoice_item(item, session, headers, data['company'], tax_map, data.get('supplier'))
+        # Resolución en lote de items (plantillas, cuentas) y de su condición de stock
+        batch_items = process_purchase_invoice_items_batch(data['items'], session, headers, data['company'], tax_map, data.get('supplier'))
+        stock_info, stock_error = fetch_items_stock_info(
+            session,
+            [
+                add_company_abbr(processed_item['item_code'], company_abbr) if company_abbr else processed_item['item_code']
+                for processed_item in batch_items if processed_item
+            ],
+            data['company']
+        )
+        if stock_error:
+            # Igual que la consulta por item: los que no se pudieron leer se tratan como no stock
+            print(f"--- Item stock status: error, partial result ({stock_error})")
+
+        for item, processed_item in zip(data['items'], batch_items):
             if processed_item:
                 # Agregar la abbr de la compañía al código del item antes de enviar a ERPNext
                 if company_abbr and not processed_item['item_code'].endswith(f' - {company_abbr}'):
@@ -714,37 +726,23 @@ def create_invoice():
                         print(f"--- Warning: Error updating valuation_rate for item {processed_item['item_code']}: {str(e)}")
                 
                 # Verificar si este item es de stock
-                item_response, item_error = make_erpnext_request(
-                    session=session,
-                    method="GET",
-                    endpoint=f"/api/resource/Item/{processed_item['item_code']}",
-                    operation_name=f"Check if item '{processed_item['item_code']}' is stock item"
-                )
-
-                if item_error:
-                    print(f"Error verificando si item es de stock: {item_error}")
-                elif item_response and item_response.status_code == 200:
-                    item_data = item_response.json()['data']
-                    if item_data.get('is_stock_item') == 1:
-                        has_stock_items = True
-                        print(f"📦 Item de stock detectado: {processed_item['item_code']}")
-                        if not item.get('warehouse') or not item.get('warehouse').strip():
-                            # Buscar default_warehouse en item_defaults para la compañía
-                            default_warehouse = None
-                            for default in item_data.get('item_defaults', []):
-                                if default.get('company') == data['company']:
-                                    default_warehouse = default.get('default_warehouse')
-                                    break
-                            if not default_warehouse:
-                                default_warehouse = company_defaults.get('default_warehouse')
-                            if default_warehouse:
-                                item['warehouse'] = default_warehouse
-                                processed_item['warehouse'] = default_warehouse
-                                print(f"📦 Usando almacén por defecto: {default_warehouse} para ítem {processed_item['item_code']}")
-                            else:
-                                error_msg = f"El ítem {processed_item['item_code']} es un ítem de stock y requiere un almacén asignado"
-                                print(f"❌ {error_msg}")
-                                return jsonify({"success": False, "message": error_msg}), 400
+                item_info = stock_info.get(processed_item['item_code'])
+                if item_info and item_info.get('is_stock_item') == 1:
+                    has_stock_items = True
+                    print(f"📦 Item de stock detectado: {processed_item['item_code']}")
+                    if not item.get('warehouse') or not item.get('warehouse').strip():
+                        # default_warehouse de item_defaults para la compañía, o el de la compañía
+                        default_warehouse = item_info.get('default_warehouse')
+                        if not default_warehouse:
+                            default_warehouse = company_defaults.get('default_warehouse')
+                        if default_warehouse:
+                            item['warehouse'] = default_warehouse
+                            processed_item['warehouse'] = default_warehouse
+                            print(f"📦 Usando almacén por defecto: {default_warehouse} para ítem {processed_item['item_code']}")
+                        else:
+                            error_msg = f"El ítem {processed_item['item_code']} es un ítem de stock y requiere un almacén asignado"
+                            print(f"❌ {error_msg}")
+                            return jsonify({"success": False, "message": error_msg}), 400
                 # Normalizar almacenes con la abreviatura de la compania
                 if processed_item.get('warehouse'):
                     warehouse_name = processed_item['warehouse'].strip()
@@ -1515,11 +1513,11 @@ def update_draft_invoice(invoice_name, data, session, headers):
             return jsonify({"success": False, "message": "El borrador debe contener al menos un item"}), 400
 
         processed_items = []
-        for item in effective_items:
-            processed_item = process_purchase_invoice_item(item, session, headers, data.get('company', ''), tax_map, data.get('supplier'))
+        company_abbr = get_company_abbr(session, headers, data.get('company', ''))
+        batch_items = process_purchase_invoice_items_batch(effective_items, session, headers, data.get('company', ''), tax_map, data.get('supplier'))
+        for item, processed_item in zip(effective_items, batch_items):
             if processed_item:
                 # Agregar la abbr de la compañía al código del item antes de enviar a ERPNext
-                company_abbr = get_company_abbr(session, headers, data.get('company', ''))
                 if company_abbr and not processed_item['item_code'].endswith(f' - {company_abbr}'):
                     processed_item['item_code'] = f"{processed_item['item_code']} - {company_abbr}"
                     print(f"🏷️ Item code expanded for ERPNext: {processed_item['item_code']}")
@@ -2061,11 +2059,17 @@ def update_confirmed_invoice(invoice_name, data, session, headers):
         data['items'] = items_for_processing
         
         processed_items = []
-        for item in data.get('items', []):
-            processed_item = process_purchase_invoice_item(item, session, headers, data.get('company', current_invoice_data.get('company')), tax_map, data.get('supplier', current_invoice_data.get('supplier')))
+        batch_items = process_purchase_invoice_items_batch(
+            data.get('items', []),
+            session,
+            headers,
+            data.get('company', current_invoice_data.get('company')),
+            tax_map,
+            data.get('supplier', current_invoice_data.get('supplier'))
+        )
+        for item, processed_item in zip(data.get('items', []), batch_items):
             if processed_item:
                 # Agregar la abbr de la compañía al código del item antes de enviar a ERPNext
-                company_abbr = get_company_abbr(session, headers, data.get('company', current_invoice_data.get('company')))
                 if company_abbr and not processed_item['item_code'].endswith(f' - {company_abbr}'):
                     processed_item['item_code'] = f"{processed_item['item_code']} - {company_abbr}"
                     print(f"🏷️ Item code expanded for ERPNext: {processed_item['item_code']}")
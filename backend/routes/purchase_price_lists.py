@@ -3,8 +3,7 @@ import requests
 import datetime
 import traceback
 import json
-import uuid
-import threading
+import logging
 import time
 import csv
 import io
@@ -15,8 +14,6 @@ from flask_cors import cross_origin
 # Importar configuración
 from config import ERPNEXT_URL, ERPNEXT_HOST
 
-# Almacenamiento temporal de progreso de importaciones
-import_progress = {}
 
 # Importar función de autenticación centralizada
 from routes.auth_utils import get_session_with_auth
@@ -26,12 +23,16 @@ from routes.general import get_company_abbr, remove_company_abbr, add_company_ab
 
 # Importar utilidades HTTP centralizadas
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
+from services.job_runner import submit_job, update_job, get_job_progress
+from utils.logging_utils import get_logger
 # Import automation service for scheduling recalculations
 from services import price_list_automation_service
 
 # Crear el blueprint para las rutas de purchase price lists
 purchase_price_lists_bp = Blueprint('purchase_price_lists', __name__)
 
+logger = get_logger(__name__)
+
 
 # Helper: elegir la fila más reciente dentro de una lista de Item Price
 def _pick_latest_price_row(prices):
@@ -314,7 +315,7 @@ def bulk_import_purchase_price_lists():
 
             # Si el frontend no aportó item_name, saltar (no se puede crear/actualizar sin referencia)
             if not item_name:
-                print(f"⏭️ Skipping item {item_code}: no item_name provided")
+                logger.sampled("price_skip", "⏭️ Skipping item %s: no item_name provided", item_code, level=logging.INFO, every=100)
                 continue
 
             # Agregar sigla al supplier para ERPNext
@@ -323,10 +324,10 @@ def bulk_import_purchase_price_lists():
                 original_supplier = item_supplier
                 erpnext_supplier = add_company_abbr(item_supplier, company_abbr)
                 if not validate_company_abbr_operation(original_supplier, erpnext_supplier, company_abbr, 'add'):
-                    print(f"⚠️ Validation failed for supplier name abbreviation: {original_supplier} -> {erpnext_supplier}")
+                    logger.sampled("supplier_abbr", "⚠️ Validation failed for supplier name abbreviation: %s -> %s", original_supplier, erpnext_supplier, level=logging.WARNING, every=100)
 
             if not item_code or not price:
-                print(f"⏭️ Skipping item {item_code}: missing code or price")
+                logger.sampled("price_skip", "⏭️ Skipping item %s: missing code or price", item_code, level=logging.INFO, every=100)
                 continue
 
             # Cuando el frontend nos envía item_name sin sigla, en el backend agregamos
@@ -336,9 +337,9 @@ def bulk_import_purchase_price_lists():
                 original_item_name = item_name
                 item_name = add_company_abbr(item_name, company_abbr)
                 if not validate_company_abbr_operation(original_item_name, item_name, company_abbr, 'add'):
-                    print(f"⚠️ Warning: item_name abbreviation addition validation failed: {original_item_name} -> {item_name}")
+                    logger.sampled("item_name_abbr", "⚠️ item_name abbreviation addition validation failed: %s -> %s", original_item_name, item_name, level=logging.WARNING, every=100)
                 else:
-                    print(f"🧾 Added company abbr to item_name: {item_name}")
+                    logger.sampled("item_name_abbr_added", "🧾 Added company abbr to item_name: %s", item_name)
 
             # Manejar company abbr: asegurar que el final del código tenga el abbr
             if company_abbr:
@@ -354,7 +355,7 @@ def bulk_import_purchase_price_lists():
             try:
                 rate_value = float(price)
             except Exception:
-                print(f"?? Skipping item {item_code}: invalid price '{price}'")
+                logger.sampled("price_skip", "⏭️ Skipping item %s: invalid price '%s'", item_code, price, level=logging.INFO, every=100)
                 continue
 
             base_row = {
@@ -498,22 +499,9 @@ def bulk_import_purchase_price_lists():
             valid_items_count += len([l for l in insert_csv.split('\n') if l.strip()]) - 1
         print(f"📄 CSVs generados - updates: {len(update_rows)}, inserts: {len(insert_rows)} (total filas válidas: {valid_items_count})")
 
-        # Generar ID único para este proceso
-        process_id = str(uuid.uuid4())
-
-        # Inicializar progreso
-        import_progress[process_id] = {
-            "success": True,
-            "progress": 0,
-            "total": valid_items_count,  # Usar la cantidad real de items válidos
-            "current_item": "Iniciando importación...",
-            "message": f"Importando {valid_items_count} precios...",
-            "status": "running"
-        }
-
-
-        # Iniciar procesamiento en un hilo separado
-        def process_import():
+        # Procesar en el pool de jobs (estado persistido, consultable en /api/jobs/<id>)
+        def process_import(job):
+            process_id = job.id
             try:
                 # Ejecutar imports por separado: updates primero, luego inserts
                 results = {
@@ -567,10 +555,10 @@ def bulk_import_purchase_price_lists():
                             company_abbr=company_abbr,
                             company_name=company_name
                         )
-                        import_progress[process_id]["automation"] = au_result
+                        update_job(process_id, automation=au_result)
                         print(f"✅ Automatic updates result: {au_result}")
                 except Exception as ae:
-                    import_progress[process_id]["automation_error"] = str(ae)
+                    update_job(process_id, automation_error=str(ae))
                     print(f"⚠️ Error applying automatic updates: {ae}")
 
                 # Consolidated result: collect saved/failed counts from both results
@@ -583,25 +571,29 @@ def bulk_import_purchase_price_lists():
                     if results.get('inserts'):
                         saved += results['inserts'].get('saved', 0)
                         failed += results['inserts'].get('failed', 0)
-                    import_progress[process_id]["saved"] = saved
-                    import_progress[process_id]["failed"] = failed
+                    update_job(process_id, saved=saved, failed=failed)
                 except Exception:
                     pass
 
             except Exception as e:
                 print(f"Error en procesamiento de importación {process_id}: {e}")
-                import_progress[process_id] = {
-                    "success": False,
-                    "progress": 0,
-                    "total": valid_items_count,
-                    "current_item": "Error en procesamiento",
-                    "message": f"Error: {str(e)}",
-                    "status": "error"
-                }
+                job.update(
+                    success=False,
+                    progress=0,
+                    current_item="Error en procesamiento",
+                    message=f"Error: {str(e)}",
+                    status="error"
+                )
 
-        thread = threading.Thread(target=process_import)
-        thread.daemon = True
-        thread.start()
+        process_id = submit_job(
+            "purchase_price_list_import",
+            process_import,
+            company=company_name,
+            user_id=user_id,
+            total=valid_items_count,  # Usar la cantidad real de items válidos
+            current_item="Iniciando importación...",
+            message=f"Importando {valid_items_count} precios..."
+        )
 
         # Devolver inmediatamente con el process_id
         return jsonify({
@@ -656,8 +648,7 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, price_list_name,
             if existing_company != company_name:
                 msg = f"La lista de precios '{price_list_name}' pertenece a otra compañía ({existing_company or 'sin asignar'})"
                 print(f"❌ {msg}")
-                import_progress[process_id]["status"] = "error"
-                import_progress[process_id]["message"] = msg
+                update_job(process_id, status="error", message=msg)
                 return
         print(f"🔍 Price List '{price_list_name}' existe: {price_list_exists}")
     else:
@@ -688,14 +679,12 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, price_list_name,
 
         if create_error:
             print(f"❌ Error creando Price List: {create_error}")
-            import_progress[process_id]["status"] = "error"
-            import_progress[process_id]["message"] = f"Error creando Price List: {create_error}"
+            update_job(process_id, status="error", message=f"Error creando Price List: {create_error}")
             return
 
         if create_response.status_code not in [200, 201]:
             print(f"❌ Error creando Price List: {create_response.text}")
-            import_progress[process_id]["status"] = "error"
-            import_progress[process_id]["message"] = f"Error creando Price List: {create_response.text}"
+            update_job(process_id, status="error", message=f"Error creando Price List: {create_response.text}")
             return
 
         print(f"✅ Price List creada: {price_list_name}")
@@ -726,8 +715,7 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, price_list_name,
 
     if upload_response.status_code not in [200, 201]:
         print(f"❌ Error subiendo archivo: {upload_response.text}")
-        import_progress[process_id]["status"] = "error"
-        import_progress[process_id]["message"] = f"Error subiendo archivo: {upload_response.text}"
+        update_job(process_id, status="error", message=f"Error subiendo archivo: {upload_response.text}")
         return
 
     upload_result = upload_response.json()
@@ -738,8 +726,7 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, price_list_name,
 
     if not file_url:
         print(f"❌ No se pudo obtener file_url del upload: {upload_result}")
-        import_progress[process_id]["status"] = "error"
-        import_progress[process_id]["message"] = "Error: No se pudo obtener file_url del upload"
+        update_job(process_id, status="error", message="Error: No se pudo obtener file_url del upload")
         return
 
     print(f"✅ Archivo subido: {file_url}")
@@ -772,15 +759,13 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, price_list_name,
     if create_import_error:
         error_text = create_import_error
         print(f"❌ Error creando Data Import document: {error_text}")
-        import_progress[process_id]["status"] = "error"
-        import_progress[process_id]["message"] = f"Error creando Data Import document: {error_text}"
+        update_job(process_id, status="error", message=f"Error creando Data Import document: {error_text}")
         return
 
     if create_import_response.status_code not in [200, 201]:
         error_text = create_import_response.text
         print(f"❌ Error creando Data Import document: {error_text}")
-        import_progress[process_id]["status"] = "error"
-        import_progress[process_id]["message"] = f"Error creando Data Import document: {error_text}"
+        update_job(process_id, status="error", message=f"Error creando Data Import document: {error_text}")
         return
 
     import_doc = create_import_response.json().get('data', {})
@@ -811,8 +796,7 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, price_list_name,
     if import_error:
         error_text = import_error
         print(f"❌ Error en Data Import: {error_text}")
-        import_progress[process_id]["status"] = "error"
-        import_progress[process_id]["message"] = f"Error en Data Import: {error_text}"
+        update_job(process_id, status="error", message=f"Error en Data Import: {error_text}")
         return
 
     if import_response.status_code in [200, 201]:
@@ -845,15 +829,16 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, price_list_name,
         # Determinar si fue exitoso basado en el status final
         if final_status == "Success":
             # Actualizar progreso como completado
-            import_progress[process_id]["status"] = "completed"
-            import_progress[process_id]["message"] = f"Importación bulk completada exitosamente. Import ID: {import_name}"
-            import_progress[process_id]["import_name"] = import_name
+            update_job(
+                process_id,
+                status="completed",
+                message=f"Importación bulk completada exitosamente. Import ID: {import_name}",
+                import_name=import_name
+            )
             # Calcular la cantidad real de items válidos del CSV
             csv_lines_count = len([line for line in csv_data.split('\n') if line.strip()]) - 1  # Restar header
             saved_count = csv_lines_count if csv_lines_count > 0 else payload_count
-            import_progress[process_id]["saved"] = saved_count
-            import_progress[process_id]["failed"] = 0
-            import_progress[process_id]["price_list_name"] = price_list_name
+            update_job(process_id, saved=saved_count, failed=0, price_list_name=price_list_name)
             print(f"✅ Bulk import completado exitosamente (import: {import_name}) saved={saved_count}")
             # Devolver resumen del import para que el caller lo consuma
             return {
@@ -864,12 +849,15 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, price_list_name,
             }
         else:
             # Status es Error, Pending u otro - marcar como error
-            import_progress[process_id]["status"] = "error"
-            import_progress[process_id]["message"] = f"Error en la importación bulk. Status: {final_status}. Import ID: {import_name}"
-            import_progress[process_id]["import_name"] = import_name
-            import_progress[process_id]["saved"] = 0
-            import_progress[process_id]["failed"] = payload_count if payload_count > 0 else 1
-            import_progress[process_id]["price_list_name"] = price_list_name
+            update_job(
+                process_id,
+                status="error",
+                message=f"Error en la importación bulk. Status: {final_status}. Import ID: {import_name}",
+                import_name=import_name,
+                saved=0,
+                failed=payload_count if payload_count > 0 else 1,
+                price_list_name=price_list_name
+            )
             print(f"❌ Bulk import falló con status: {final_status} (import: {import_name})")
             return {
                 'status': 'error',
@@ -880,19 +868,22 @@ def _do_bulk_import_csv(session, headers, user_id, process_id, price_list_name,
     else:
         error_text = import_response.text
         print(f"❌ Error en Data Import: {error_text}")
-        import_progress[process_id]["status"] = "error"
-        import_progress[process_id]["message"] = f"Error en Data Import: {error_text}"
+        update_job(process_id, status="error", message=f"Error en Data Import: {error_text}")
 
 
 @purchase_price_lists_bp.route('/api/inventory/purchase-price-lists/bulk-import-progress/<process_id>', methods=['GET'])
 def get_bulk_import_progress(process_id):
     """Obtener el progreso de una importación en curso"""
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
     try:
-        if process_id not in import_progress:
+        progress_data = get_job_progress(process_id)
+        # Los procesos de otros usuarios se informan como inexistentes
+        if progress_data is None or progress_data.get('user_id') != user_id:
             return jsonify({"success": False, "message": "Proceso no encontrado"}), 404
         
-        progress_data = import_progress[process_id]
-        
         # Calcular porcentaje
         total = progress_data.get('total', 0)
         current = progress_data.get('progress', 0)
@@ -1024,14 +1015,14 @@ def verify_items_batch():
             
             # Si se especificó compañía y el item pertenece a otra compañía, saltarlo
             if company and item_company and item_company != company:
-                print(f"⏭️ Skipping item {item_code} from company {item_company} (filtering for {company})")
+                logger.sampled("verify_other_company", "⏭️ Skipping item %s from company %s (filtering for %s)", item_code, item_company, company)
                 continue
             
             # Si el código tiene sufijo de compañía, crear entrada con código base
             if company and company_abbr and item_code.endswith(f' - {company_abbr}'):
                 base_code = item_code.replace(f' - {company_abbr}', '')
                 mapping[base_code] = item
-                print(f"🔄 Mapped {item_code} -> {base_code}")
+                logger.sampled("verify_mapped", "🔄 Mapped %s -> %s", item_code, base_code)
             else:
                 # También mantener el código completo por si acaso
                 mapping[item_code] = item
@@ -1798,19 +1789,19 @@ def get_price_list_prices(price_list_name):
                     # Normalizar clave removiendo el sufijo de compañía si corresponde
                     key = remove_company_abbr(item_code_raw, company_abbr) if company_abbr else item_code_raw
                     if not key:
-                        print(f"⚠️ Skipping price {i}: empty key after normalization (raw: '{item_code_raw}')")
+                        logger.sampled("dedupe_empty_key", "⚠️ Skipping price %s: empty key after normalization (raw: '%s')", i, item_code_raw, level=logging.WARNING, every=100)
                         continue
                     
                     existing = latest_map.get(key)
                     if not existing:
                         latest_map[key] = p
-                        print(f"➕ Added first price for key '{key}': {item_code_raw}")
+                        logger.sampled("dedupe_added", "➕ Added first price for key '%s': %s", key, item_code_raw)
                     else:
                         # pick latest between existing and p
                         cand = _pick_latest_price_row([existing, p])
                         latest_map[key] = cand or existing
                         chosen_code = (cand or existing).get('item_code')
-                        print(f"🔄 Deduped key '{key}': kept {chosen_code} (had {existing.get('item_code')} vs {item_code_raw})")
+                        logger.sampled("dedupe_replaced", "🔄 Deduped key '%s': kept %s (had %s vs %s)", key, chosen_code, existing.get('item_code'), item_code_raw)
                 
                 # Rebuild prices list
                 deduped_prices = list(latest_map.values())
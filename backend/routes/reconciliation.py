@@ -15,6 +15,8 @@ from utils.conciliation_utils import (
     summarize_group_balances,
 )
 
+from services.reconciliation_queries import get_party_reconciliations
+
 reconciliation_bp = Blueprint('reconciliation', __name__)
 
 
@@ -264,168 +266,18 @@ def get_reconciliations():
         if not customer or not company:
             return jsonify({"success": False, "message": "Parámetros requeridos: customer, company"}), 400
 
-        # Sólo documentos submitidos (docstatus = 1)
-        filters = json.dumps([
-            ["company", "=", company],
-            ["docstatus", "=", 1]
-        ])
-        fields = json.dumps(["*"])
-        inv_resp, inv_error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/Sales Invoice",
-            params={
-                "filters": filters,
-                "fields": fields,
-                "limit_page_length": 1000
-            },
-            operation_name="Get sales invoices with conciliation id"
+        # Sólo documentos submitidos (docstatus = 1); se suman al grupo los pagos aplicados
+        # a sus facturas aunque no tengan el campo de conciliación
+        reconciliations_list, error = get_party_reconciliations(
+            session,
+            'Customer',
+            customer,
+            company,
+            submitted_only=True,
+            include_related_payments=True,
         )
-        invoices = inv_resp.json().get('data', []) if inv_resp and inv_resp.status_code == 200 else []
-
-        # Filtrar por customer y conciliation_id
-        invoices = [inv for inv in invoices if inv.get("customer") == customer and inv.get(CONCILIATION_FIELD)]
-
-        pe_filters = json.dumps([
-            ["party_type", "=", "Customer"],
-            ["company", "=", company],
-            ["docstatus", "=", 1]
-        ])
-        # Para pagos necesitamos también los 'references' (child table) para verificar asignaciones
-        payment_fields = json.dumps(["name", "references", "paid_amount", "unallocated_amount", "docstatus"])
-        pe_resp, pe_error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/Payment Entry",
-            params={
-                "filters": pe_filters,
-                "fields": payment_fields,
-                "limit_page_length": 1000
-            },
-            operation_name="Get payment entries with conciliation id"
-        )
-        payments = pe_resp.json().get('data', []) if pe_resp and pe_resp.status_code == 200 else []
-
-        # Filtrar por party y conciliation_id
-        payments = [pay for pay in payments if pay.get("party") == customer and pay.get(CONCILIATION_FIELD)]
-
-        reconciliations_dict = {}
-        for inv in invoices:
-            rec_id = inv.get(CONCILIATION_FIELD)
-            if not rec_id:
-                continue
-            group = reconciliations_dict.setdefault(rec_id, {
-                "reconciliation_id": rec_id,
-                "documents": [],
-                "total_amount": 0,
-                "posting_date": inv.get("posting_date")
-            })
-            group["documents"].append({
-                "voucher_no": inv.get("name"),
-                "voucher_type": "Nota de Crédito" if inv.get("is_return") else "Factura",
-                "posting_date": inv.get("posting_date"),
-                "amount": abs(float(inv.get("grand_total", 0))),
-                "outstanding": float(inv.get("outstanding_amount", 0)),
-                CONCILIATION_FIELD: rec_id
-            })
-
-        for pe in payments:
-            rec_id = pe.get(CONCILIATION_FIELD)
-            if not rec_id:
-                continue
-            group = reconciliations_dict.setdefault(rec_id, {
-                "reconciliation_id": rec_id,
-                "documents": [],
-                "total_amount": 0,
-                "posting_date": pe.get("posting_date")
-            })
-            group["documents"].append({
-                "voucher_no": pe.get("name"),
-                "voucher_type": "Pago",
-                "posting_date": pe.get("posting_date"),
-                "amount": float(pe.get("paid_amount", 0)),
-                "outstanding": -float(pe.get("unallocated_amount", 0)),
-                CONCILIATION_FIELD: rec_id
-            })
-
-        # Además: incluir pagos que no tengan el campo de conciliación pero que estén relacionados
-        # con facturas de alguna conciliación (por ejemplo pagos que ya fueron aplicados en ERPNext)
-        try:
-            invoice_to_rec = {}
-            for rec_id, rec_data in reconciliations_dict.items():
-                for d in rec_data.get('documents', []):
-                    if d.get('voucher_type') in ('Factura', 'Invoice'):
-                        invoice_to_rec[d.get('voucher_no')] = rec_id
-
-            if invoice_to_rec:
-                # Buscar todos los pagos del cliente (docstatus 1)
-                payments_all_fields = json.dumps(["name", "references", "paid_amount", "unallocated_amount", "posting_date", "docstatus", "party"])
-                payments_all_resp, payments_all_err = make_erpnext_request(
-                    session=session,
-                    method="GET",
-                    endpoint="/api/resource/Payment Entry",
-                    params={
-                        "filters": json.dumps([["party", "=", customer], ["company", "=", company], ["docstatus", "=", 1]]),
-                        "fields": payments_all_fields,
-                        "limit_page_length": 1000
-                    },
-                    operation_name="Get all payment entries for customer to infer relations"
-                )
-
-                if payments_all_resp and payments_all_resp.status_code == 200:
-                    for pay in payments_all_resp.json().get('data', []):
-                        refs = pay.get('references')
-                        # Si no vinieron las referencias en la consulta masiva, pedir detalle por pago
-                        if not refs:
-                            try:
-                                detail_resp, detail_err = make_erpnext_request(
-                                    session=session,
-                                    method="GET",
-                                    endpoint=f"/api/resource/Payment%20Entry/{quote(pay.get('name'))}",
-                                    params={"fields": json.dumps(["references"])},
-                                    operation_name=f"Get Payment Entry {pay.get('name')} references"
-                                )
-                                if detail_resp and detail_resp.status_code == 200:
-                                    refs = detail_resp.json().get('data', {}).get('references')
-                                    # Persist the fetched references into the payment dict so later code can use them
-                                    pay['references'] = refs
-                            except Exception:
-                                refs = []
-                        if not refs:
-                            continue
-                        # Verificar si alguna referencia apunta a una factura del grupo
-                        # Use the local 'refs' (which may have been filled from detail fetch) to avoid missing references
-                        for r in (refs or pay.get('references', [])):
-                            ref_name = r.get('reference_name') or r.get('against_voucher') or r.get('reference_docname') or r.get('reference')
-                            if ref_name and ref_name in invoice_to_rec:
-                                rec_id = invoice_to_rec[ref_name]
-                                group = reconciliations_dict.setdefault(rec_id, {
-                                    "reconciliation_id": rec_id,
-                                    "documents": [],
-                                    "total_amount": 0,
-                                    "posting_date": pay.get('posting_date')
-                                })
-                                # Añadir sólo si no existe ya un documento con ese nombre
-                                if not any(d.get('voucher_no') == pay.get('name') for d in group['documents']):
-                                    group['documents'].append({
-                                        'voucher_no': pay.get('name'),
-                                        'voucher_type': 'Pago',
-                                        'posting_date': pay.get('posting_date'),
-                                        'amount': float(pay.get('paid_amount', 0)),
-                                        'outstanding': -float(pay.get('unallocated_amount', 0)),
-                                        CONCILIATION_FIELD: None
-                                    })
-                                break
-        except Exception:
-            # No criticar el flujo principal si falla esta heurística
-            pass
-
-        for rec_id, rec_data in reconciliations_dict.items():
-            rec_data["total_amount"] = sum(doc["outstanding"] for doc in rec_data["documents"])
-            rec_data["total_amount"] = round(rec_data["total_amount"], 2)
-
-        reconciliations_list = list(reconciliations_dict.values())
-        reconciliations_list.sort(key=lambda x: x["posting_date"], reverse=True)
+        if error:
+            return handle_erpnext_error(error, "Error obteniendo conciliaciones del cliente")
 
         return jsonify({
             "success": True,
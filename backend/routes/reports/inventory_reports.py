@@ -17,7 +17,8 @@ import pandas as pd
 from utils.http_utils import handle_erpnext_error, make_erpnext_request
 from routes.auth_utils import get_session_with_auth
 from routes.general import get_company_abbr, remove_company_abbr, get_smart_limit
-from routes.inventory_utils import round_qty
+from routes.inventory_utils import round_qty, resolve_stock_movements
+from utils.warehouse_api import get_company_leaf_warehouses
 
 inventory_reports_bp = Blueprint('inventory_reports', __name__)
 
@@ -26,34 +27,12 @@ def _get_company_leaf_warehouses(session, company):
     """Return leaf Warehouse names for the given company (no groups, not disabled).
 
     Some ERPNext instances don't allow filtering Bin by `company` directly (Bin has no company field),
-    so we filter by the company's warehouses instead.
+    so we filter by the company's warehouses instead (cached company warehouse index).
     """
     try:
         if not company:
             return []
-
-        filters = [
-            ["company", "=", company],
-            ["disabled", "=", 0],
-            ["is_group", "=", 0]
-        ]
-        params = {
-            "fields": json.dumps(["name"]),
-            "filters": json.dumps(filters),
-            "limit_page_length": 2000
-        }
-        resp, err = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/Warehouse",
-            params=params,
-            operation_name="Get company warehouses for Bin filtering"
-        )
-        if err or not resp or resp.status_code != 200:
-            return []
-
-        rows = resp.json().get("data", []) or []
-        return [r.get("name") for r in rows if r.get("name")]
+        return get_company_leaf_warehouses(session, company)
     except Exception:
         return []
 
@@ -343,6 +322,10 @@ def get_item_movements():
         
         entries = response.json().get("data", [])
         print(f"Movimientos obtenidos: {len(entries)}")
+
+        # Mismo criterio que el historial del item: vouchers confirmados y Stock
+        # Reconciliation con la diferencia real
+        entries = resolve_stock_movements(session, entries)
         
         # Procesar y limpiar datos
         result = []
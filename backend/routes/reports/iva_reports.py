@@ -2,7 +2,6 @@ from flask import Blueprint, request, jsonify, send_file
 from datetime import date, datetime
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 from io import BytesIO
-from urllib.parse import quote
 import calendar
 import json
 
@@ -11,9 +10,16 @@ from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from fpdf import FPDF
 
 from routes.auth_utils import get_session_with_auth
-from routes.general import get_active_company, get_smart_limit
+from routes.general import get_active_company
 from routes.items import get_tax_template_map
-from utils.http_utils import make_erpnext_request
+from services.report_snapshots import (
+    snapshot_lock,
+    load_snapshot,
+    save_snapshot,
+    diff_documents,
+    snapshot_context,
+)
+from utils.frappe_list import fetch_list_paged, fetch_list_by_names
 
 
 iva_reports_bp = Blueprint('iva_reports_bp', __name__)
@@ -32,7 +38,8 @@ REPORT_TYPES = {
         'party_field': 'supplier',
         'party_name_field': 'supplier_name',
         'tax_id_field': 'supplier_tax_id',
-        'bill_date_field': 'bill_date'
+        'bill_date_field': 'bill_date',
+        'item_doctype': 'Purchase Invoice Item'
     },
     'ventas': {
         'doctype': 'Sales Invoice',
@@ -41,7 +48,8 @@ REPORT_TYPES = {
         'party_field': 'customer',
         'party_name_field': 'customer_name',
         'tax_id_field': 'customer_tax_id',
-        'bill_date_field': 'posting_date'
+        'bill_date_field': 'posting_date',
+        'item_doctype': 'Sales Invoice Item'
     }
 }
 
@@ -49,21 +57,12 @@ DECIMAL_ZERO = Decimal('0')
 TWO_PLACES = Decimal('0.01')
 EXCLUDED_LETTER = 'X'
 
-DETAIL_FIELDS = [
-    "name", "posting_date", "company", "invoice_type", "voucher_type_code", "voucher_type",
-    "punto_de_venta", "invoice_number", "docstatus", "currency", "grand_total", "total",
-    "metodo_numeracion_factura_venta", "naming_series", "is_return", "return_against",
-    "percepcion_iibb", "percepcion_iva", "net_total", "total_taxes_and_charges",
-    "discount_amount", "supplier", "supplier_name", "supplier_tax_id",
-    "customer", "customer_name", "customer_tax_id", "title", "posting_time",
-    "bill_date", "remarks"
-] + [
-    "items.item_code", "items.item_name", "items.description", "items.qty", "items.rate",
-    "items.amount", "items.base_amount", "items.item_tax_rate", "items.item_tax_template",
-    "items.discount_amount"
+# Campos de las filas de items (tabla hija) usados para el desglose por alícuota
+ITEM_FIELDS = [
+    "parent", "idx", "item_code", "item_name", "description", "qty", "rate",
+    "amount", "base_amount", "item_tax_rate", "item_tax_template", "discount_amount"
 ]
 
-
 @iva_reports_bp.route('/api/reports/iva', methods=['GET', 'OPTIONS'])
 def iva_reports():
     if request.method == 'OPTIONS':
@@ -77,20 +76,10 @@ def iva_reports():
     if not company:
         return jsonify({"success": False, "message": "No se pudo determinar la compania activa"}), 400
 
-    report_type_key = (request.args.get('type') or 'compras').lower()
-    if report_type_key not in REPORT_TYPES:
-        return jsonify({"success": False, "message": "Tipo de reporte invalido. Use 'compras' o 'ventas'"}), 400
-
-    try:
-        month = int(request.args.get('month'))
-        year = int(request.args.get('year'))
-    except (TypeError, ValueError):
-        return jsonify({"success": False, "message": "Debe indicar mes y anio"}), 400
-
-    if month < 1 or month > 12:
-        return jsonify({"success": False, "message": "Mes invalido"}), 400
-    if year < 2000 or year > 2100:
-        return jsonify({"success": False, "message": "Anio invalido"}), 400
+    params, param_error = _parse_report_params(request.args)
+    if param_error:
+        return jsonify({"success": False, "message": param_error}), 400
+    report_type_key, month, year = params
 
     fmt = (request.args.get('format') or 'json').lower()
 
@@ -117,6 +106,61 @@ def iva_reports():
     return jsonify({"success": True, "data": report_payload})
 
 
+@iva_reports_bp.route('/api/reports/iva/rebuild', methods=['POST', 'OPTIONS'])
+def rebuild_iva_report():
+    """Descartar el snapshot del período y recalcular el reporte completo"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
+    company = _resolve_company(user_id)
+    if not company:
+        return jsonify({"success": False, "message": "No se pudo determinar la compania activa"}), 400
+
+    params, param_error = _parse_report_params(request.get_json(silent=True) or request.args)
+    if param_error:
+        return jsonify({"success": False, "message": param_error}), 400
+    report_type_key, month, year = params
+
+    try:
+        report_payload = _build_report(session, headers, company, report_type_key, month, year, force_rebuild=True)
+    except ValueError as ve:
+        return jsonify({"success": False, "message": str(ve)}), 400
+    except Exception as exc:
+        print(f"IVA report rebuild error: {exc}")
+        return jsonify({"success": False, "message": "No se pudo regenerar el reporte IVA"}), 500
+
+    return jsonify({"success": True, "data": {
+        "company": company,
+        "type": report_type_key,
+        "month": month,
+        "year": year,
+        "metadata": report_payload["metadata"],
+        "totals": report_payload["totals"]
+    }})
+
+
+def _parse_report_params(source):
+    report_type_key = str(source.get('type') or 'compras').lower()
+    if report_type_key not in REPORT_TYPES:
+        return None, "Tipo de reporte invalido. Use 'compras' o 'ventas'"
+
+    try:
+        month = int(source.get('month'))
+        year = int(source.get('year'))
+    except (TypeError, ValueError):
+        return None, "Debe indicar mes y anio"
+
+    if month < 1 or month > 12:
+        return None, "Mes invalido"
+    if year < 2000 or year > 2100:
+        return None, "Anio invalido"
+    return (report_type_key, month, year), None
+
+
 def _resolve_company(user_id):
     company = request.args.get('company')
     if company:
@@ -129,22 +173,35 @@ def _resolve_company(user_id):
     return None
 
 
-def _build_report(session, headers, company, report_type_key, month, year):
+def _build_report(session, headers, company, report_type_key, month, year, force_rebuild=False):
     config = REPORT_TYPES[report_type_key]
 
     start_date = date(year, month, 1)
     last_day = calendar.monthrange(year, month)[1]
     end_date = date(year, month, last_day)
+    period = f"{year}-{month:02d}"
 
-    document_names = _fetch_document_names(session, headers, config['doctype'], company, start_date, end_date)
-    # Use purchase templates for 'compras' reports and sales templates for 'ventas'
+    # Tasas de los templates (cacheadas por proceso): si cambian, se recalcula todo el período
     txn_type = 'purchase' if report_type_key == 'compras' else 'sales'
     tax_map = get_tax_template_map(session, headers, company, transaction_type=txn_type) or {}
-    # tax_map is a mapping rate -> template_name
     template_rate_map = {template: Decimal(str(rate)) for rate, template in tax_map.items()}
+    context = snapshot_context(sorted((template, str(rate)) for template, rate in template_rate_map.items()))
+
+    with snapshot_lock(company, report_type_key, period):
+        snapshot = None if force_rebuild else load_snapshot(company, report_type_key, period, context=context)
+        # Los cierres de mes bloquean cuentas, no facturas: siempre se lista el período
+        listing = _list_period_documents(session, config['doctype'], company, start_date, end_date)
+        stale, documents = diff_documents(snapshot, listing)
+        if stale:
+            documents.update(_build_document_entries(session, config, stale, template_rate_map))
+        refreshed = len(stale)
+        previous_count = len((snapshot or {}).get('documents') or {})
+        if snapshot is None or stale or previous_count != len(documents):
+            snapshot = save_snapshot(
+                company, report_type_key, period, documents,
+                context=context, built_at=(snapshot or {}).get('built_at')
+            )
 
-    party_cache = {}
-    address_cache = {}
     rows = []
     totals = {
         'neto': DECIMAL_ZERO,
@@ -155,72 +212,19 @@ def _build_report(session, headers, company, report_type_key, month, year):
     }
     skipped_letters = 0
 
-    for doc_name in document_names:
-        detail = _fetch_document_detail(session, headers, config['doctype'], doc_name)
-        if not detail:
-            continue
-
-        letter = _extract_letter(detail)
-        if letter == EXCLUDED_LETTER:
+    ordered = sorted(documents.values(), key=lambda entry: (entry.get('posting_date') or '', entry.get('name') or ''))
+    for entry in ordered:
+        if entry.get('skipped'):
             skipped_letters += 1
             continue
-
-        party_info = _get_party_info(
-            session,
-            headers,
-            config,
-            detail,
-            party_cache,
-            address_cache
-        )
-
-        breakdown = _build_tax_breakdown(detail, template_rate_map)
-        if not breakdown:
-            fallback_net = _to_decimal(detail.get('net_total'))
-            if fallback_net == DECIMAL_ZERO:
-                fallback_net = _to_decimal(detail.get('total'))
-            breakdown = {Decimal('0'): fallback_net}
-
-        sorted_breakdown = sorted(breakdown.items(), key=lambda item: float(item[0]))
-
-        percepcion_iibb = _to_decimal(detail.get('percepcion_iibb'))
-        percepcion_iva = _to_decimal(detail.get('percepcion_iva'))
-        percepcion_consumed = False
-
-        for rate, net_amount in sorted_breakdown:
-            iva_amount = (net_amount * rate / Decimal('100')).quantize(TWO_PLACES) if rate is not None else DECIMAL_ZERO
-
-            row_perc_iibb = percepcion_iibb if not percepcion_consumed else DECIMAL_ZERO
-            row_perc_iva = percepcion_iva if not percepcion_consumed else DECIMAL_ZERO
-            percepcion_consumed = True
-
-            total_row = net_amount + iva_amount + row_perc_iibb + row_perc_iva
-
-            row = {
-                "fecha_factura": _format_date(detail.get(config.get('bill_date_field')) or detail.get('posting_date')),
-                "fecha_contable": _format_date(detail.get('posting_date')),
-                "comprobante": _build_document_label(detail),
-                "cuit": detail.get(config['tax_id_field']) or party_info.get('tax_id') or '',
-                "razon_social": detail.get(config['party_name_field']) or party_info.get('display_name') or '',
-                "condicion_iva": party_info.get('condicion_iva') or 'Sin datos',
-                "neto": net_amount.quantize(TWO_PLACES),
-                "iva_porcentaje": float(rate) if rate is not None else 0,
-                "iva_monto": iva_amount.quantize(TWO_PLACES),
-                "provincia": party_info.get('province') or 'Sin datos',
-                "percepcion_iibb": row_perc_iibb.quantize(TWO_PLACES),
-                "percepcion_iva": row_perc_iva.quantize(TWO_PLACES),
-                "total": total_row.quantize(TWO_PLACES),
-                "moneda": detail.get('currency')
-            }
+        for row in entry.get('rows') or []:
             rows.append(row)
+            totals['neto'] += _to_decimal(row['neto'])
+            totals['iva'] += _to_decimal(row['iva_monto'])
+            totals['percepcion_iibb'] += _to_decimal(row['percepcion_iibb'])
+            totals['percepcion_iva'] += _to_decimal(row['percepcion_iva'])
+            totals['total'] += _to_decimal(row['total'])
 
-            totals['neto'] += row['neto']
-            totals['iva'] += row['iva_monto']
-            totals['percepcion_iibb'] += row['percepcion_iibb']
-            totals['percepcion_iva'] += row['percepcion_iva']
-            totals['total'] += row['total']
-
-    response_rows = [_serialize_decimal_row(row) for row in rows]
     response_totals = {key: float(value.quantize(TWO_PLACES)) for key, value in totals.items()}
 
     return {
@@ -230,12 +234,18 @@ def _build_report(session, headers, company, report_type_key, month, year):
         "period_label": f"{MONTH_NAMES_ES.get(month, month)} {year}",
         "month": month,
         "year": year,
-        "rows": response_rows,
+        "rows": [dict(row) for row in rows],
         "totals": response_totals,
         "metadata": {
             "row_count": len(rows),
             "skipped_by_letter_x": skipped_letters,
-            "generated_at": datetime.utcnow().isoformat()
+            "generated_at": datetime.utcnow().isoformat(),
+            "snapshot": {
+                "period": period,
+                "refreshed_documents": refreshed,
+                "built_at": (snapshot or {}).get('built_at'),
+                "updated_at": (snapshot or {}).get('updated_at')
+            }
         },
         "filters": {
             "company": company,
@@ -246,139 +256,222 @@ def _build_report(session, headers, company, report_type_key, month, year):
     }
 
 
-def _fetch_document_names(session, headers, doctype, company, start_date, end_date):
+def _build_document_entries(session, config, names, template_rate_map):
+    """Calcular las filas del reporte de cada comprobante indicado (name -> entrada del snapshot)"""
+    documents = _fetch_documents_bulk(session, config, names)
+
+    entries = {}
+    included = []
+    for detail in documents:
+        entry = {
+            "name": detail.get('name'),
+            "modified": detail.get('modified'),
+            "posting_date": detail.get('posting_date'),
+            "skipped": False,
+            "rows": []
+        }
+        entries[entry['name']] = entry
+        if _extract_letter(detail) == EXCLUDED_LETTER:
+            entry['skipped'] = True
+            continue
+        included.append(detail)
+
+    party_infos = _resolve_party_infos(session, config, included)
+
+    for detail in included:
+        party_info = party_infos.get(detail.get(config['party_field'])) or {}
+        entries[detail['name']]['rows'] = [
+            _serialize_decimal_row(row)
+            for row in _build_document_rows(detail, config, party_info, template_rate_map)
+        ]
+    return entries
+
+
+def _build_document_rows(detail, config, party_info, template_rate_map):
+    breakdown = _build_tax_breakdown(detail, template_rate_map)
+    if not breakdown:
+        fallback_net = _to_decimal(detail.get('net_total'))
+        if fallback_net == DECIMAL_ZERO:
+            fallback_net = _to_decimal(detail.get('total'))
+        breakdown = {Decimal('0'): fallback_net}
+
+    sorted_breakdown = sorted(breakdown.items(), key=lambda item: float(item[0]))
+
+    percepcion_iibb = _to_decimal(detail.get('percepcion_iibb'))
+    percepcion_iva = _to_decimal(detail.get('percepcion_iva'))
+    percepcion_consumed = False
+
+    rows = []
+    for rate, net_amount in sorted_breakdown:
+        iva_amount = (net_amount * rate / Decimal('100')).quantize(TWO_PLACES) if rate is not None else DECIMAL_ZERO
+
+        row_perc_iibb = percepcion_iibb if not percepcion_consumed else DECIMAL_ZERO
+        row_perc_iva = percepcion_iva if not percepcion_consumed else DECIMAL_ZERO
+        percepcion_consumed = True
+
+        total_row = net_amount + iva_amount + row_perc_iibb + row_perc_iva
+
+        rows.append({
+            "fecha_factura": _format_date(detail.get(config.get('bill_date_field')) or detail.get('posting_date')),
+            "fecha_contable": _format_date(detail.get('posting_date')),
+            "comprobante": _build_document_label(detail),
+            "cuit": detail.get(config['tax_id_field']) or party_info.get('tax_id') or '',
+            "razon_social": detail.get(config['party_name_field']) or party_info.get('display_name') or '',
+            "condicion_iva": party_info.get('condicion_iva') or 'Sin datos',
+            "neto": net_amount.quantize(TWO_PLACES),
+            "iva_porcentaje": float(rate) if rate is not None else 0,
+            "iva_monto": iva_amount.quantize(TWO_PLACES),
+            "provincia": party_info.get('province') or 'Sin datos',
+            "percepcion_iibb": row_perc_iibb.quantize(TWO_PLACES),
+            "percepcion_iva": row_perc_iva.quantize(TWO_PLACES),
+            "total": total_row.quantize(TWO_PLACES),
+            "moneda": detail.get('currency')
+        })
+    return rows
+
+
+def _list_period_documents(session, doctype, company, start_date, end_date):
+    """Comprobantes del período con su `modified` (name -> modified)"""
     filters = [
         ["company", "=", company],
         ["posting_date", ">=", start_date.isoformat()],
         ["posting_date", "<=", end_date.isoformat()],
         ["docstatus", "=", 1]
     ]
-
-    params = {
-        "filters": json.dumps(filters),
-        "fields": json.dumps(["name"]),
-        "order_by": "posting_date asc",
-        "limit_page_length": get_smart_limit(company, 'calculate')
-    }
-
-    resp, err = make_erpnext_request(
-        session=session,
-        method='GET',
-        endpoint=f"/api/resource/{doctype}",
-        params=params,
+    rows, err = fetch_list_paged(
+        session,
+        doctype,
+        ["name", "modified"],
+        filters,
+        order_by="posting_date asc, name asc",
         operation_name=f"IVA report list for {doctype}"
     )
-
     if err:
-        message = err.get('message') if isinstance(err, dict) else 'No se pudo obtener el listado de comprobantes'
+        message = err.get('message') if isinstance(err, dict) else None
         raise ValueError(message or 'No se pudo obtener el listado de comprobantes')
-
-    if resp.status_code != 200:
-        raise ValueError(f"Error al obtener documentos: {resp.status_code}")
-
-    data = resp.json().get('data', [])
-    return [row.get('name') for row in data if row.get('name')]
-
-
-def _fetch_document_detail(session, headers, doctype, doc_name):
-    params = {
-        "fields": json.dumps(DETAIL_FIELDS)
-    }
-
-    resp, err = make_erpnext_request(
-        session=session,
-        method='GET',
-        endpoint=f"/api/resource/{doctype}/{quote(doc_name)}",
-        params=params,
-        operation_name=f"IVA report detail for {doctype} {doc_name}"
+    return {row['name']: row.get('modified') for row in rows if row.get('name')}
+
+
+def _fetch_documents_bulk(session, config, names):
+    """
+    Cabeceras de los comprobantes indicados con sus items, en queries `in` por bloques.
+
+    Reemplaza el GET por comprobante: la cabecera se pide con todos sus campos ("*",
+    igual que el GET del documento) y los items de todas las facturas se traen de la
+    tabla hija filtrando por parent.
+    """
+    doctype = config['doctype']
+    headers_rows, err = fetch_list_by_names(
+        session,
+        doctype,
+        names,
+        ["*"],
+        operation_name=f"IVA report documents for {doctype}"
     )
-
     if err:
-        print(f"IVA report detail error for {doc_name}: {err}")
-        return None
-
-    if resp.status_code != 200:
-        print(f"IVA report detail status {resp.status_code} for {doc_name}")
-        return None
-
-    return resp.json().get('data', {})
-
+        raise ValueError('No se pudieron obtener los comprobantes del período')
 
-def _get_party_info(session, headers, config, detail, cache, address_cache):
-    party_name = detail.get(config['party_field'])
-    if not party_name:
-        return {}
-
-    cache_key = (config['party_doctype'], party_name)
-    if cache_key in cache:
-        return cache[cache_key]
-
-    fields = json.dumps([
-        "name", "tax_id", "custom_condicion_iva", "condicion_iva", config['party_name_field'],
-        "default_address", "supplier_primary_address", "customer_primary_address",
-        "state", "province", "custom_provincia"
-    ])
-
-    resp, err = make_erpnext_request(
-        session=session,
-        method='GET',
-        endpoint=f"/api/resource/{config['party_doctype']}/{quote(party_name)}",
-        params={"fields": fields},
-        operation_name=f"IVA report party {party_name}"
+    documents = []
+    seen = set()
+    for row in headers_rows:
+        name = row.get('name')
+        if not name or name in seen or row.get('docstatus') != 1:
+            continue
+        seen.add(name)
+        documents.append(row)
+
+    item_rows, err = fetch_list_by_names(
+        session,
+        config['item_doctype'],
+        seen,
+        ITEM_FIELDS,
+        filter_field="parent",
+        parent=doctype,
+        order_by="parent asc, idx asc",
+        operation_name=f"IVA report items for {doctype}"
     )
-
-    info = {
-        "tax_id": detail.get(config['tax_id_field']),
-        "condicion_iva": detail.get('custom_condicion_iva') or detail.get('condicion_iva'),
-        "display_name": detail.get(config['party_name_field']) or party_name,
-        "province": None
-    }
-
-    if not err and resp.status_code == 200:
-        data = resp.json().get('data', {})
-        info['tax_id'] = data.get('tax_id') or info['tax_id']
-        info['condicion_iva'] = data.get('custom_condicion_iva') or data.get('condicion_iva') or info['condicion_iva']
-        info['display_name'] = data.get(config['party_name_field']) or info['display_name']
-        info['province'] = data.get('state') or data.get('province') or data.get('custom_provincia')
-
-        address_name = data.get('default_address') or data.get('supplier_primary_address') or data.get('customer_primary_address')
-        if not info['province'] and address_name:
-            info['province'] = _fetch_address_state(session, headers, address_name, address_cache)
-    else:
-        print(f"IVA report party fetch error for {party_name}: {err}")
-
-    if not info['province']:
-        info['province'] = 'Sin datos'
-
-    cache[cache_key] = info
-    return info
-
-
-def _fetch_address_state(session, headers, address_name, cache):
-    if address_name in cache:
-        return cache[address_name]
-
-    params = {
-        "fields": json.dumps(["name", "state", "province", "county", "custom_provincia"])
-    }
-
-    resp, err = make_erpnext_request(
-        session=session,
-        method='GET',
-        endpoint=f"/api/resource/Address/{quote(address_name)}",
-        params=params,
-        operation_name=f"IVA report address {address_name}"
+    if err:
+        raise ValueError('No se pudieron obtener los items de los comprobantes')
+    items_by_parent = {}
+    for item in item_rows:
+        items_by_parent.setdefault(item.get('parent'), []).append(item)
+
+    for document in documents:
+        document['items'] = items_by_parent.get(document['name'], [])
+    return documents
+
+
+def _resolve_party_infos(session, config, documents):
+    """
+    Datos fiscales de todos los clientes/proveedores del período.
+
+    Partes y direcciones se resuelven con una query `in` por bloque; la información
+    de cada parte se arma con el primer comprobante en que aparece (mismo criterio
+    que el cache por parte que se usaba al recorrer los comprobantes uno a uno).
+    """
+    party_field = config['party_field']
+    first_detail = {}
+    for detail in documents:
+        party_name = detail.get(party_field)
+        if party_name and party_name not in first_detail:
+            first_detail[party_name] = detail
+
+    parties, err = fetch_list_by_names(
+        session,
+        config['party_doctype'],
+        first_detail.keys(),
+        ["*"],
+        operation_name=f"IVA report parties {config['party_doctype']}"
     )
+    if err:
+        raise ValueError('No se pudieron obtener los datos fiscales de las partes')
+    party_rows = {row.get('name'): row for row in parties}
+
+    infos = {}
+    pending_addresses = {}
+    for party_name, detail in first_detail.items():
+        info = {
+            "tax_id": detail.get(config['tax_id_field']),
+            "condicion_iva": detail.get('custom_condicion_iva') or detail.get('condicion_iva'),
+            "display_name": detail.get(config['party_name_field']) or party_name,
+            "province": None
+        }
+        data = party_rows.get(party_name)
+        if data:
+            info['tax_id'] = data.get('tax_id') or info['tax_id']
+            info['condicion_iva'] = data.get('custom_condicion_iva') or data.get('condicion_iva') or info['condicion_iva']
+            info['display_name'] = data.get(config['party_name_field']) or info['display_name']
+            info['province'] = data.get('state') or data.get('province') or data.get('custom_provincia')
+
+            address_name = data.get('default_address') or data.get('supplier_primary_address') or data.get('customer_primary_address')
+            if not info['province'] and address_name:
+                pending_addresses[party_name] = address_name
+        else:
+            print(f"IVA report party not found: {party_name}")
+        infos[party_name] = info
 
-    province = None
-    if not err and resp.status_code == 200:
-        data = resp.json().get('data', {})
-        province = data.get('state') or data.get('province') or data.get('custom_provincia') or data.get('county')
-    else:
-        print(f"IVA address fetch error for {address_name}: {err}")
-
-    cache[address_name] = province or 'Sin datos'
-    return cache[address_name]
+    if pending_addresses:
+        addresses, err = fetch_list_by_names(
+            session,
+            "Address",
+            pending_addresses.values(),
+            ["*"],
+            operation_name="IVA report addresses"
+        )
+        if err:
+            raise ValueError('No se pudieron obtener las direcciones de las partes')
+        address_states = {}
+        for data in addresses:
+            address_states[data.get('name')] = (
+                data.get('state') or data.get('province') or data.get('custom_provincia') or data.get('county')
+            )
+        for party_name, address_name in pending_addresses.items():
+            infos[party_name]['province'] = address_states.get(address_name) or 'Sin datos'
+
+    for info in infos.values():
+        if not info['province']:
+            info['province'] = 'Sin datos'
+    return infos
 
 
 def _build_tax_breakdown(detail, template_rate_map):
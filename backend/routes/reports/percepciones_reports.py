@@ -15,7 +15,6 @@ from flask import Blueprint, request, jsonify, send_file
 from datetime import date, datetime
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 from io import BytesIO
-from urllib.parse import quote
 import calendar
 import json
 import os
@@ -25,8 +24,14 @@ from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from fpdf import FPDF
 
 from routes.auth_utils import get_session_with_auth
-from routes.general import get_active_company, get_smart_limit
-from utils.http_utils import make_erpnext_request
+from routes.general import get_active_company
+from services.report_snapshots import (
+    snapshot_lock,
+    load_snapshot,
+    save_snapshot,
+    diff_documents,
+)
+from utils.frappe_list import fetch_list_paged, fetch_list_by_names
 
 
 percepciones_reports_bp = Blueprint('percepciones_reports_bp', __name__)
@@ -40,6 +45,8 @@ MONTH_NAMES_ES = {
 DECIMAL_ZERO = Decimal('0')
 TWO_PLACES = Decimal('0.01')
 
+SNAPSHOT_REPORT_TYPE = 'percepciones'
+
 # Cache para configuración de provincias
 _provinces_config = None
 
@@ -98,23 +105,10 @@ def percepciones_report():
         return jsonify({"success": False, "message": "No se pudo determinar la compañía activa"}), 400
 
     # Parsear parámetros
-    try:
-        year = int(request.args.get('year'))
-    except (TypeError, ValueError):
-        return jsonify({"success": False, "message": "Debe indicar año"}), 400
-
-    if year < 2000 or year > 2100:
-        return jsonify({"success": False, "message": "Año inválido"}), 400
-
-    month = None
-    month_param = request.args.get('month')
-    if month_param:
-        try:
-            month = int(month_param)
-            if month < 1 or month > 12:
-                return jsonify({"success": False, "message": "Mes inválido"}), 400
-        except ValueError:
-            return jsonify({"success": False, "message": "Mes inválido"}), 400
+    period, period_error = _parse_period_params(request.args)
+    if period_error:
+        return jsonify({"success": False, "message": period_error}), 400
+    year, month = period
 
     perception_type = request.args.get('perception_type', '').upper() or None
     if perception_type and perception_type not in ('INGRESOS_BRUTOS', 'IVA', 'GANANCIAS'):
@@ -152,6 +146,68 @@ def percepciones_report():
     return jsonify({"success": True, "data": report_payload})
 
 
+@percepciones_reports_bp.route('/api/reports/percepciones/rebuild', methods=['POST', 'OPTIONS'])
+def rebuild_percepciones_report():
+    """
+    Descartar el snapshot del período y recalcular las percepciones.
+
+    Body JSON (o query params): year (obligatorio), month (opcional)
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
+    company = _resolve_company(user_id)
+    if not company:
+        return jsonify({"success": False, "message": "No se pudo determinar la compañía activa"}), 400
+
+    period, period_error = _parse_period_params(request.get_json(silent=True) or request.args)
+    if period_error:
+        return jsonify({"success": False, "message": period_error}), 400
+    year, month = period
+
+    try:
+        report_payload = _build_report(session, headers, company, year, month, None, None, force_rebuild=True)
+    except ValueError as ve:
+        return jsonify({"success": False, "message": str(ve)}), 400
+    except Exception as exc:
+        print(f"Percepciones report rebuild error: {exc}")
+        return jsonify({"success": False, "message": "No se pudo regenerar el reporte de percepciones"}), 500
+
+    return jsonify({"success": True, "data": {
+        "company": company,
+        "year": year,
+        "month": month,
+        "metadata": report_payload["metadata"],
+        "totals": report_payload["totals"]
+    }})
+
+
+def _parse_period_params(source):
+    """Validar año (obligatorio) y mes (opcional); devuelve ((year, month), error)"""
+    try:
+        year = int(source.get('year'))
+    except (TypeError, ValueError):
+        return None, "Debe indicar año"
+
+    if year < 2000 or year > 2100:
+        return None, "Año inválido"
+
+    month = None
+    month_param = source.get('month')
+    if month_param:
+        try:
+            month = int(month_param)
+        except (TypeError, ValueError):
+            return None, "Mes inválido"
+        if month < 1 or month > 12:
+            return None, "Mes inválido"
+    return (year, month), None
+
+
 def _resolve_company(user_id):
     """Resolver la compañía activa"""
     company = request.args.get('company')
@@ -165,7 +221,7 @@ def _resolve_company(user_id):
     return None
 
 
-def _build_report(session, headers, company, year, month, perception_type, province_code):
+def _build_report(session, headers, company, year, month, perception_type, province_code, force_rebuild=False):
     """Construir el reporte de percepciones"""
     
     # Determinar rango de fechas
@@ -174,13 +230,28 @@ def _build_report(session, headers, company, year, month, perception_type, provi
         last_day = calendar.monthrange(year, month)[1]
         end_date = date(year, month, last_day)
         period_label = f"{MONTH_NAMES_ES.get(month)} {year}"
+        period = f"{year}-{month:02d}"
     else:
         start_date = date(year, 1, 1)
         end_date = date(year, 12, 31)
         period_label = f"Año {year}"
-
-    # Obtener todas las Purchase Invoices del período
-    invoices = _fetch_invoices_with_perceptions(session, headers, company, start_date, end_date)
+        period = f"{year}"
+
+    # El snapshot guarda todas las percepciones del período; los filtros se aplican después
+    with snapshot_lock(company, SNAPSHOT_REPORT_TYPE, period):
+        snapshot = None if force_rebuild else load_snapshot(company, SNAPSHOT_REPORT_TYPE, period)
+        # Los cierres de mes bloquean cuentas, no facturas: siempre se lista el período
+        listing = _list_period_invoices(session, company, start_date, end_date)
+        stale, documents = diff_documents(snapshot, listing)
+        if stale:
+            documents.update(_build_invoice_entries(session, stale))
+        refreshed = len(stale)
+        previous_count = len((snapshot or {}).get('documents') or {})
+        if snapshot is None or stale or previous_count != len(documents):
+            snapshot = save_snapshot(
+                company, SNAPSHOT_REPORT_TYPE, period, documents,
+                built_at=(snapshot or {}).get('built_at')
+            )
     
     rows = []
     totals = {
@@ -192,68 +263,32 @@ def _build_report(session, headers, company, year, month, perception_type, provi
         },
         'by_province': {}
     }
-    
-    supplier_cache = {}
-    
-    for invoice in invoices:
-        # Obtener taxes de la factura
-        taxes = invoice.get('taxes') or []
-        
-        for tax in taxes:
-            # Solo procesar percepciones
-            if not tax.get('custom_is_perception'):
-                continue
-            
-            tax_perception_type = tax.get('custom_perception_type', '').upper()
-            
+
+    ordered = sorted(
+        documents.values(),
+        key=lambda entry: (entry.get('posting_date') or '', entry.get('name') or ''),
+        reverse=True
+    )
+    for entry in ordered:
+        for row in entry.get('rows') or []:
             # Filtrar por tipo si se especificó
-            if perception_type and tax_perception_type != perception_type:
+            if perception_type and row['perception_type'] != perception_type:
                 continue
-            
-            tax_province_code = tax.get('custom_province_code') or None
-            
             # Filtrar por provincia si se especificó
-            if province_code and tax_province_code != province_code:
+            if province_code and row['province_code'] != province_code:
                 continue
-            
-            # Obtener información del proveedor
-            supplier_name = invoice.get('supplier_name') or invoice.get('supplier')
-            if invoice.get('supplier') and invoice.get('supplier') not in supplier_cache:
-                supplier_info = _fetch_supplier_info(session, headers, invoice.get('supplier'))
-                supplier_cache[invoice.get('supplier')] = supplier_info
-            else:
-                supplier_info = supplier_cache.get(invoice.get('supplier'), {})
-            
-            # Construir fila
-            tax_amount = _to_decimal(tax.get('tax_amount', 0))
-            percentage = _to_decimal(tax.get('custom_percentage') or tax.get('rate') or 0)
-            province_name = tax.get('custom_province_name') or _get_province_name(tax_province_code)
-            
-            row = {
-                'posting_date': _format_date(invoice.get('posting_date')),
-                'document_name': invoice.get('name'),
-                'document_label': _build_document_label(invoice),
-                'supplier': invoice.get('supplier'),
-                'supplier_name': supplier_name or supplier_info.get('supplier_name', ''),
-                'supplier_tax_id': invoice.get('tax_id') or supplier_info.get('tax_id', ''),
-                'perception_type': tax_perception_type,
-                'province_code': tax_province_code,
-                'province_name': province_name or '',
-                'regimen_code': tax.get('custom_regimen_code') or '',
-                'percentage': float(percentage),
-                'total_amount': float(tax_amount),
-                'description': tax.get('description') or '',
-                'account_head': tax.get('account_head') or ''
-            }
-            rows.append(row)
-            
+
+            rows.append(dict(row))
+
             # Acumular totales
+            tax_amount = _to_decimal(row['total_amount'])
             totals['total'] += tax_amount
-            if tax_perception_type in totals['by_type']:
-                totals['by_type'][tax_perception_type] += tax_amount
+            if row['perception_type'] in totals['by_type']:
+                totals['by_type'][row['perception_type']] += tax_amount
             
             # Acumular por provincia (solo IIBB)
-            if tax_perception_type == 'INGRESOS_BRUTOS' and province_name:
+            province_name = row.get('province_name')
+            if row['perception_type'] == 'INGRESOS_BRUTOS' and province_name:
                 if province_name not in totals['by_province']:
                     totals['by_province'][province_name] = DECIMAL_ZERO
                 totals['by_province'][province_name] += tax_amount
@@ -278,7 +313,13 @@ def _build_report(session, headers, company, year, month, perception_type, provi
         "totals": response_totals,
         "metadata": {
             "row_count": len(rows),
-            "generated_at": datetime.utcnow().isoformat()
+            "generated_at": datetime.utcnow().isoformat(),
+            "snapshot": {
+                "period": period,
+                "refreshed_documents": refreshed,
+                "built_at": (snapshot or {}).get('built_at'),
+                "updated_at": (snapshot or {}).get('updated_at')
+            }
         },
         "filters": {
             "company": company,
@@ -290,9 +331,8 @@ def _build_report(session, headers, company, year, month, perception_type, provi
     }
 
 
-def _fetch_invoices_with_perceptions(session, headers, company, start_date, end_date):
-    """Obtener facturas de compra con sus taxes"""
-    
+def _list_period_invoices(session, company, start_date, end_date):
+    """Facturas de compra del período con su `modified` (name -> modified)"""
     filters = [
         ["company", "=", company],
         ["posting_date", ">=", start_date.isoformat()],
@@ -300,82 +340,106 @@ def _fetch_invoices_with_perceptions(session, headers, company, start_date, end_
         ["docstatus", "=", 1]
     ]
 
-    fields = [
-        "name", "posting_date", "supplier", "supplier_name", "tax_id",
-        "grand_total", "currency"
-    ]
-
-    params = {
-        "filters": json.dumps(filters),
-        "fields": json.dumps(fields),
-        "order_by": "posting_date desc",
-        "limit_page_length": get_smart_limit(company, 'calculate')
-    }
-
-    resp, err = make_erpnext_request(
-        session=session,
-        method='GET',
-        endpoint="/api/resource/Purchase Invoice",
-        params=params,
+    invoices, err = fetch_list_paged(
+        session,
+        "Purchase Invoice",
+        ["name", "modified"],
+        filters,
+        order_by="posting_date desc, name desc",
         operation_name="Percepciones report list invoices"
     )
-
     if err:
         raise ValueError(f"Error obteniendo facturas: {err}")
 
-    if resp.status_code != 200:
-        raise ValueError(f"Error al obtener facturas: {resp.status_code}")
+    return {invoice['name']: invoice.get('modified') for invoice in invoices if invoice.get('name')}
 
-    invoices_list = resp.json().get('data', [])
-    
-    # Ahora obtener los taxes de cada factura
-    invoices_with_taxes = []
-    for invoice in invoices_list:
-        invoice_name = invoice.get('name')
-        
-        # Obtener taxes de la factura
-        taxes_resp, taxes_err = make_erpnext_request(
-            session=session,
-            method='GET',
-            endpoint=f"/api/resource/Purchase Invoice/{quote(invoice_name)}",
-            params={"fields": json.dumps(["taxes"])},
-            operation_name=f"Fetch taxes for invoice {invoice_name}"
-        )
-        
-        if not taxes_err and taxes_resp.status_code == 200:
-            invoice_data = taxes_resp.json().get('data', {})
-            taxes = invoice_data.get('taxes', [])
-            
-            # Solo incluir si tiene percepciones
-            has_perceptions = any(
-                tax.get('custom_is_perception') 
-                for tax in taxes
-            )
-            
-            if has_perceptions:
-                invoice['taxes'] = taxes
-                invoices_with_taxes.append(invoice)
-    
-    return invoices_with_taxes
 
+def _build_invoice_entries(session, invoice_names):
+    """
+    Calcular las filas (sin filtrar) de cada factura indicada.
 
-def _fetch_supplier_info(session, headers, supplier_name):
-    """Obtener información del proveedor"""
-    if not supplier_name:
-        return {}
-    
-    resp, err = make_erpnext_request(
-        session=session,
-        method='GET',
-        endpoint=f"/api/resource/Supplier/{quote(supplier_name)}",
-        params={"fields": json.dumps(["name", "supplier_name", "tax_id"])},
-        operation_name=f"Fetch supplier info {supplier_name}"
+    Cabeceras, percepciones (Purchase Taxes and Charges) y proveedores se traen con
+    queries `in` por bloques en lugar de un GET por factura.
+    """
+    invoices, err = fetch_list_by_names(
+        session,
+        "Purchase Invoice",
+        invoice_names,
+        ["name", "posting_date", "supplier", "supplier_name", "tax_id",
+         "grand_total", "currency", "modified", "docstatus"],
+        operation_name="Percepciones report invoices"
     )
-    
-    if err or resp.status_code != 200:
-        return {}
-    
-    return resp.json().get('data', {})
+    if err:
+        raise ValueError(f"Error obteniendo facturas: {err}")
+    invoices = [invoice for invoice in invoices if invoice.get('docstatus') == 1]
+
+    taxes, err = fetch_list_by_names(
+        session,
+        "Purchase Taxes and Charges",
+        [invoice['name'] for invoice in invoices],
+        ["*"],
+        filter_field="parent",
+        extra_filters=[["parenttype", "=", "Purchase Invoice"], ["custom_is_perception", "=", 1]],
+        parent="Purchase Invoice",
+        order_by="parent asc, idx asc",
+        operation_name="Percepciones report taxes"
+    )
+    if err:
+        raise ValueError(f"Error obteniendo percepciones: {err}")
+    taxes_by_invoice = {}
+    for tax in taxes:
+        taxes_by_invoice.setdefault(tax.get('parent'), []).append(tax)
+
+    supplier_rows, err = fetch_list_by_names(
+        session,
+        "Supplier",
+        [invoice.get('supplier') for invoice in invoices if taxes_by_invoice.get(invoice['name'])],
+        ["name", "supplier_name", "tax_id"],
+        operation_name="Percepciones report suppliers"
+    )
+    if err:
+        raise ValueError(f"Error obteniendo proveedores: {err}")
+    suppliers = {supplier.get('name'): supplier for supplier in supplier_rows}
+
+    entries = {}
+    for invoice in invoices:
+        supplier_info = suppliers.get(invoice.get('supplier'), {})
+        entries[invoice['name']] = {
+            "name": invoice['name'],
+            "modified": invoice.get('modified'),
+            "posting_date": invoice.get('posting_date'),
+            "rows": [
+                _build_perception_row(invoice, tax, supplier_info)
+                for tax in taxes_by_invoice.get(invoice['name'], [])
+                if tax.get('custom_is_perception')
+            ]
+        }
+    return entries
+
+
+def _build_perception_row(invoice, tax, supplier_info):
+    supplier_name = invoice.get('supplier_name') or invoice.get('supplier')
+    tax_province_code = tax.get('custom_province_code') or None
+    tax_amount = _to_decimal(tax.get('tax_amount', 0))
+    percentage = _to_decimal(tax.get('custom_percentage') or tax.get('rate') or 0)
+    province_name = tax.get('custom_province_name') or _get_province_name(tax_province_code)
+
+    return {
+        'posting_date': _format_date(invoice.get('posting_date')),
+        'document_name': invoice.get('name'),
+        'document_label': _build_document_label(invoice),
+        'supplier': invoice.get('supplier'),
+        'supplier_name': supplier_name or supplier_info.get('supplier_name', ''),
+        'supplier_tax_id': invoice.get('tax_id') or supplier_info.get('tax_id', ''),
+        'perception_type': (tax.get('custom_perception_type') or '').upper(),
+        'province_code': tax_province_code,
+        'province_name': province_name or '',
+        'regimen_code': tax.get('custom_regimen_code') or '',
+        'percentage': float(percentage),
+        'total_amount': float(tax_amount),
+        'description': tax.get('description') or '',
+        'account_head': tax.get('account_head') or ''
+    }
 
 
 def _build_document_label(invoice):
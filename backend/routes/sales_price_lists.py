@@ -3,8 +3,7 @@ import requests
 import datetime
 import traceback
 import json
-import uuid
-import threading
+import logging
 import time
 import csv
 import io
@@ -14,18 +13,17 @@ from urllib.parse import quote
 # Importar configuración
 from config import ERPNEXT_URL, ERPNEXT_HOST
 
-# Almacenamiento temporal de progreso de importaciones
-sales_import_progress = {}
-
 # Importar función de autenticación centralizada
 from routes.auth_utils import get_session_with_auth
 
 # Importar utilidades HTTP centralizadas
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
+from utils.logging_utils import get_logger
+from services.job_runner import submit_job, update_job, get_job_progress
 
 # Importar función para obtener sigla de compañía
 from routes.general import get_company_abbr, get_active_company
-from routes.price_list_automation import _translate_and_sanitize_formula, safe_eval_formula
+from utils.price_formula import compile_formula, FormulaBooleanResult
 
 # Importar función para calcular límites inteligentes
 from routes.general import get_smart_limit
@@ -36,6 +34,8 @@ from flask_cors import cross_origin
 # Crear el blueprint para las rutas de sales price lists
 sales_price_lists_bp = Blueprint('sales_price_lists', __name__)
 
+logger = get_logger(__name__)
+
 
 @sales_price_lists_bp.route('/api/sales-price-lists/<path:price_list_name>', methods=['OPTIONS'])
 @cross_origin(supports_credentials=True)
@@ -661,17 +661,16 @@ def apply_formula_to_sales_items():
             return jsonify({"success": False, "message": "Lista de items vacía"}), 400
 
         try:
-            pyexpr = _translate_and_sanitize_formula(formula)
+            compiled_formula = compile_formula(formula)
         except Exception as e:
             return jsonify({"success": False, "message": f"Fórmula inválida: {str(e)}"}), 400
 
         results = []
         row_errors = []
+        actuals = []
+        compras = []
 
-        for idx, row in enumerate(items):
-            row_id = row.get('id', f"row-{idx}")
-            item_code = row.get('item_code') or row.get('code') or ''
-
+        for row in items:
             try:
                 actual = float(row.get('existing_price') or row.get('actual') or row.get('valor') or 0)
             except Exception:
@@ -686,12 +685,23 @@ def apply_formula_to_sales_items():
                 )
             except Exception:
                 compra = 0
+            actuals.append(actual)
+            compras.append(compra)
+
+        # Una sola compilación y evaluación en lote (NumPy cuando la fórmula lo permite)
+        values, value_errors = compiled_formula.evaluate_batch(compras, actuals)
+
+        for idx, row in enumerate(items):
+            row_id = row.get('id', f"row-{idx}")
+            item_code = row.get('item_code') or row.get('code') or ''
 
             try:
-                res = safe_eval_formula(pyexpr, actual=actual, compra=compra)
-                if isinstance(res, bool):
+                error = value_errors.get(idx)
+                if isinstance(error, FormulaBooleanResult):
                     raise ValueError("La fórmula devolvió un valor booleano")
-                value = float(res)
+                if error is not None:
+                    raise error
+                value = values[idx]
                 if not math.isfinite(value):
                     raise ValueError("La fórmula devolvió un número no válido")
                 normalized = round(value, 2)
@@ -852,40 +862,32 @@ def bulk_save_sales_price_list():
                 "message": "Preview generado. Revisa las líneas y envía sin 'preview' para importar."
             })
 
-        # Generar ID único para este proceso
-        process_id = str(uuid.uuid4())
-
-        # Inicializar progreso
-        sales_import_progress[process_id] = {
-            "success": True,
-            "progress": 0,
-            "total": total_items,
-            "current_item": "Iniciando guardado...",
-            "message": f"Guardando {total_items} precios de venta...",
-            "status": "running"
-        }
-
-        print(f"CSV recibido con {total_items} filas, Lista: {price_list_name}, Process ID: {process_id}")
-
-        # Iniciar procesamiento en un hilo separado
-        def process_save():
+        # Procesar en el pool de jobs (estado persistido, consultable en /api/jobs/<id>)
+        def process_save(job):
             try:
                 processed_csv = _process_csv_data(csv_data, price_list_name, currency, company_abbr, allowed_item_codes=allowed_kits)
-                _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, currency, valid_from, processed_csv, mode, company_abbr, allowed_item_codes=allowed_kits)
+                _do_bulk_save_csv(session, headers, user_id, job.id, price_list_name, currency, valid_from, processed_csv, mode, company_abbr, allowed_item_codes=allowed_kits)
             except Exception as e:
-                print(f"Error en procesamiento de guardado {process_id}: {e}")
-                sales_import_progress[process_id] = {
-                    "success": False,
-                    "progress": 0,
-                    "total": total_items,
-                    "current_item": "Error en procesamiento",
-                    "message": f"Error: {str(e)}",
-                    "status": "error"
-                }
+                print(f"Error en procesamiento de guardado {job.id}: {e}")
+                job.update(
+                    success=False,
+                    progress=0,
+                    current_item="Error en procesamiento",
+                    message=f"Error: {str(e)}",
+                    status="error"
+                )
 
-        thread = threading.Thread(target=process_save)
-        thread.daemon = True
-        thread.start()
+        process_id = submit_job(
+            "sales_price_list_bulk_save",
+            process_save,
+            company=company_name,
+            user_id=user_id,
+            total=total_items,
+            current_item="Iniciando guardado...",
+            message=f"Guardando {total_items} precios de venta..."
+        )
+
+        print(f"CSV recibido con {total_items} filas, Lista: {price_list_name}, Process ID: {process_id}")
 
         # Devolver inmediatamente con el process_id
         return jsonify({
@@ -907,9 +909,10 @@ def _process_csv_data(csv_data, price_list_name, currency, company_abbr, allowed
     allowed_item_codes: optional set of item codes (canonical or stripped) that are allowed.
     If provided, rows whose item code does not match any value in this set will be skipped.
     """
-    print(f"BACKEND: Iniciando _process_csv_data con csv_data length: {len(csv_data)}")
-    print(f"BACKEND: Primeras 300 chars del CSV recibido:")
-    print(csv_data[:300])
+    logger.info("Procesando CSV de lista de precios", price_list=price_list_name, chars=len(csv_data))
+    if logger.is_enabled():
+        logger.debug("Primeras 300 chars del CSV recibido:\n%s", csv_data[:300])
+    logger.reset_samples("csv_row")
     try:
         csv_input = io.StringIO(csv_data)
         csv_reader = csv.DictReader(csv_input)
@@ -925,7 +928,6 @@ def _process_csv_data(csv_data, price_list_name, currency, company_abbr, allowed
         skipped_count = 0
 
         for row in csv_reader:
-            print(f"BACKEND: Procesando fila cruda: {row}")
             processed_row = {
                 "Item Code": row.get("Item Code", row.get("item_code", "")).strip('"'),
                 "Price List": price_list_name,
@@ -934,19 +936,17 @@ def _process_csv_data(csv_data, price_list_name, currency, company_abbr, allowed
                 "Buying": "0",
                 "Selling": "1"
             }
-            
-            print(f"BACKEND: Fila procesada: Item Code='{processed_row['Item Code']}', Rate='{processed_row['Rate']}'")
-            
+            logger.sampled("csv_row", "Fila cruda %s -> Item Code='%s', Rate='%s'", row, processed_row["Item Code"], processed_row["Rate"])
+
             # Validate Price List Rate: must be present, numeric, and > 0
             try:
                 rate = float(processed_row["Rate"])
-                print(f"BACKEND: Rate convertido a float: {rate}")
                 if rate <= 0:
-                    print(f"⚠️ BACKEND: Skipping row with invalid Rate: {rate}")
+                    logger.sampled("csv_skip_rate", "⚠️ Fila salteada por Rate inválido: %s", rate, level=logging.INFO, every=100)
                     skipped_count += 1
                     continue
             except (ValueError, TypeError):
-                print(f"⚠️ BACKEND: Skipping row with non-numeric Rate: {processed_row['Rate']}")
+                logger.sampled("csv_skip_rate", "⚠️ Fila salteada por Rate no numérico: %s", processed_row["Rate"], level=logging.INFO, every=100)
                 skipped_count += 1
                 continue
             # Si se pidió validar por una lista de allowed_item_codes, comprobar aquí.
@@ -966,29 +966,24 @@ def _process_csv_data(csv_data, price_list_name, currency, company_abbr, allowed
 
                 allowed_match = any((c in allowed_item_codes) for c in candidates)
                 if not allowed_match:
-                    print(f"⚠️ BACKEND: Skipping row porque Item Code '{item_code}' no está en allowed_item_codes")
+                    logger.sampled("csv_skip_code", "⚠️ Fila salteada: Item Code '%s' no está en allowed_item_codes", item_code, level=logging.INFO, every=100)
                     skipped_count += 1
                     continue
 
             # Agregar el abbr de la compañía al item code si no está presente
             if company_abbr and f" - {company_abbr}" not in item_code:
                 processed_row["Item Code"] = f"{item_code} - {company_abbr}"
-                print(f"BACKEND: Item code adjusted: '{item_code}' -> '{processed_row['Item Code']}'")
-            
+
             writer.writerow(processed_row)
             processed_count += 1
-            if processed_count <= 5:
-                print(f"BACKEND: Fila escrita {processed_count}: {processed_row}")
 
         processed_csv = output.getvalue()
-        print(f"BACKEND: Procesamiento completado - Procesadas: {processed_count}, Saltadas: {skipped_count}")
-        print(f"BACKEND: CSV procesado length: {len(processed_csv)}")
-        print(f"BACKEND: Primeras 300 chars del CSV procesado:")
-        print(processed_csv[:300])
+        logger.info("CSV procesado", processed=processed_count, skipped=skipped_count, chars=len(processed_csv))
+        if logger.is_enabled():
+            logger.debug("Primeras 300 chars del CSV procesado:\n%s", processed_csv[:300])
         return processed_csv
     except Exception as csv_error:
-        print(f"⚠️ BACKEND: Error procesando CSV: {csv_error}")
-        print(f"BACKEND: Traceback: {traceback.format_exc()}")
+        logger.exception("⚠️ Error procesando CSV: %s", csv_error)
         return csv_data
 
 
@@ -999,26 +994,19 @@ def _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, cu
     company_abbr: company abbreviation used to normalize item codes (if any)
     """
 
-    print(f"🔍 [DEBUG] Iniciando _do_bulk_save_csv con process_id: {process_id}")
-    print(f"🔍 [DEBUG] price_list_name: {price_list_name}")
-    print(f"🔍 [DEBUG] currency: {currency}")
-    print(f"🔍 [DEBUG] valid_from: {valid_from}")
-    print(f"🔍 [DEBUG] csv_data type: {type(csv_data)}")
-    print(f"🔍 [DEBUG] csv_data length: {len(csv_data) if csv_data else 'None'}")
-
     # El CSV ya viene procesado, no necesitamos obtener company_abbr ni procesar de nuevo
-    print(f"🔍 [DEBUG] Company abbr ya obtenido: {company_abbr}")
-
-    if csv_data:
-        csv_lines = csv_data.split('\n')
-        print(f"🔍 [DEBUG] Número de líneas en CSV procesado: {len(csv_lines)}")
-        print(f"🔍 [DEBUG] Primeras 5 líneas del CSV procesado:")
-        for i, line in enumerate(csv_lines[:5]):
-            print(f"🔍 [DEBUG]   Línea {i+1}: '{line}'")
-        if len(csv_lines) > 5:
-            print(f"🔍 [DEBUG]   ... y {len(csv_lines) - 5} líneas más")
-    else:
-        print(f"🔍 [DEBUG] csv_data es None o vacío!")
+    logger.info(
+        "Guardado masivo de lista de precios", process_id=process_id, price_list=price_list_name,
+        currency=currency, valid_from=valid_from, mode=mode, chars=len(csv_data) if csv_data else 0
+    )
+    if not csv_data:
+        logger.warning("csv_data es None o vacío", process_id=process_id)
+    elif logger.is_enabled():
+        # Contar líneas recorre todo el CSV: solo con DEBUG habilitado
+        logger.debug(
+            "Primeras 5 líneas del CSV procesado (%s líneas):\n%s",
+            csv_data.count('\n') + 1, '\n'.join(csv_data.split('\n', 5)[:5])
+        )
 
     # Ya no procesamos el CSV aquí, asumimos que viene procesado
 
@@ -1043,7 +1031,7 @@ def _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, cu
 
     price_list_exists = False
     if check_error:
-        print(f"🔍 [DEBUG] Error checking price list existence: {check_error}")
+        logger.warning("⚠️ Error checking price list existence: %s", check_error)
     elif check_response.status_code == 200:
         existing = check_response.json().get('data', [])
         price_list_exists = len(existing) > 0
@@ -1051,9 +1039,9 @@ def _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, cu
             existing_company = existing[0].get('custom_company')
             if existing_company != company_name:
                 raise ValueError(f"La lista de precios '{price_list_name}' pertenece a otra compañía ({existing_company})")
-        print(f"🔍 [DEBUG] Price List '{price_list_name}' existe: {price_list_exists}")
+        logger.debug("Price List '%s' existe: %s", price_list_name, price_list_exists)
     else:
-        print(f"🔍 [DEBUG] Error checking price list existence: {check_response.status_code}")
+        logger.warning("⚠️ Error checking price list existence: %s", check_response.status_code)
 
     if not price_list_exists:
         # Crear la Price List de venta
@@ -1069,7 +1057,7 @@ def _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, cu
         if valid_from:
             price_list_data["valid_from"] = valid_from
 
-        print(f"🔍 [DEBUG] Creando Price List con data: {price_list_data}")
+        logger.debug("Creando Price List con data: %s", price_list_data)
 
         create_response, create_error = make_erpnext_request(
             session=session,
@@ -1080,23 +1068,21 @@ def _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, cu
         )
 
         if create_error:
-            print(f"❌ Error creando Price List de venta: {create_error}")
-            sales_import_progress[process_id]["status"] = "error"
-            sales_import_progress[process_id]["message"] = f"Error creando Price List: {create_error}"
+            logger.error("❌ Error creando Price List de venta: %s", create_error)
+            update_job(process_id, status="error", message=f"Error creando Price List: {create_error}")
             return
 
         if create_response.status_code not in [200, 201]:
-            print(f"❌ Error creando Price List de venta: {create_response.text}")
-            sales_import_progress[process_id]["status"] = "error"
-            sales_import_progress[process_id]["message"] = f"Error creando Price List: {create_response.text}"
+            logger.error("❌ Error creando Price List de venta: %s", create_response.text)
+            update_job(process_id, status="error", message=f"Error creando Price List: {create_response.text}")
             return
 
-        print(f"✅ Price List de venta creada: {price_list_name}")
+        logger.info("✅ Price List de venta creada: %s", price_list_name)
     else:
-        print(f"✅ Price List de venta ya existe: {price_list_name}")
+        logger.info("✅ Price List de venta ya existe: %s", price_list_name)
 
     # PASO 1: Subir el CSV como archivo
-    print("🚀 Subiendo archivo CSV...")
+    logger.info("🚀 Subiendo archivo CSV...")
     
     # If allowed_item_codes provided, validate CSV contains only allowed codes (or filter out disallowed)
     if allowed_item_codes is not None and csv_data:
@@ -1125,12 +1111,15 @@ def _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, cu
                         disallowed.append(code)
 
             if disallowed:
-                print(f"🔍 [DEBUG] Se encontraron códigos no permitidos y serán omitidos: {disallowed}")
+                logger.debug("Se encontraron códigos no permitidos y serán omitidos: %s", disallowed)
 
             if not filtered_rows:
-                print(f"❌ Ninguna fila válida permanece después de filtrar por kits. Abortando import.")
-                sales_import_progress[process_id]["status"] = "error"
-                sales_import_progress[process_id]["message"] = "Ninguna fila válida para importar después de filtrar por kits"
+                logger.error("❌ Ninguna fila válida permanece después de filtrar por kits. Abortando import.")
+                update_job(
+                    process_id,
+                    status="error",
+                    message="Ninguna fila válida para importar después de filtrar por kits"
+                )
                 return
 
             # Rebuild csv_data with header
@@ -1140,9 +1129,9 @@ def _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, cu
             writer.writeheader()
             writer.writerows(filtered_rows)
             csv_data = output_io.getvalue()
-            print(f"🔍 [DEBUG] CSV filtrado size: {len(csv_data)}")
+            logger.debug("CSV filtrado size: %s", len(csv_data))
         except Exception as fe:
-            print(f"⚠️ Error filtrando CSV por allowed_item_codes: {fe}")
+            logger.warning("⚠️ Error filtrando CSV por allowed_item_codes: %s", fe)
     files = {
         'file': (f'import_{process_id}.csv', csv_data.encode('utf-8'), 'text/csv'),
         'is_private': (None, '0'),
@@ -1160,13 +1149,12 @@ def _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, cu
         headers=upload_headers
     )
     
-    print(f"🔍 [DEBUG] Respuesta de upload_file - Status: {upload_response.status_code}")
-    print(f"🔍 [DEBUG] Respuesta completa: {upload_response.text}")
+    logger.debug("Respuesta de upload_file - Status: %s", upload_response.status_code)
+    logger.debug("Respuesta completa: %s", upload_response.text)
     
     if upload_response.status_code not in [200, 201]:
-        print(f"❌ Error subiendo archivo: {upload_response.text}")
-        sales_import_progress[process_id]["status"] = "error"
-        sales_import_progress[process_id]["message"] = f"Error subiendo archivo: {upload_response.text}"
+        logger.error("❌ Error subiendo archivo: %s", upload_response.text)
+        update_job(process_id, status="error", message=f"Error subiendo archivo: {upload_response.text}")
         return
     
     upload_result = upload_response.json()
@@ -1176,12 +1164,11 @@ def _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, cu
     file_url = message_data.get('file_url') or message_data.get('file_name')
     
     if not file_url:
-        print(f"❌ No se pudo obtener file_url del upload: {upload_result}")
-        sales_import_progress[process_id]["status"] = "error"
-        sales_import_progress[process_id]["message"] = "Error: No se pudo obtener file_url del upload"
+        logger.error("❌ No se pudo obtener file_url del upload: %s", upload_result)
+        update_job(process_id, status="error", message="Error: No se pudo obtener file_url del upload")
         return
     
-    print(f"✅ Archivo subido: {file_url}")
+    logger.info("✅ Archivo subido: %s", file_url)
     
     # PASO 2: Crear el Data Import con el archivo adjunto
     import_type = "Update Existing Records" if mode == 'update' else "Insert New Records"
@@ -1193,7 +1180,7 @@ def _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, cu
         "mute_emails": 1
     }
     
-    print(f"🔍 [DEBUG] Creando Data Import con import_file: {file_url}")
+    logger.debug("Creando Data Import con import_file: %s", file_url)
     
     create_import_response, create_import_error = make_erpnext_request(
         session=session,
@@ -1203,36 +1190,34 @@ def _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, cu
         operation_name=f"Create data import for '{price_list_name}'"
     )
     
-    print(f"🔍 [DEBUG] Respuesta de creación de Data Import - Status: {create_import_response.status_code}")
-    print(f"🔍 [DEBUG] Respuesta completa: {create_import_response.text}")
+    logger.debug("Respuesta de creación de Data Import - Status: %s", create_import_response.status_code)
+    logger.debug("Respuesta completa: %s", create_import_response.text)
     
     if create_import_error:
         error_text = create_import_error
-        print(f"❌ Error creando Data Import document: {error_text}")
-        sales_import_progress[process_id]["status"] = "error"
-        sales_import_progress[process_id]["message"] = f"Error creando Data Import document: {error_text}"
+        logger.error("❌ Error creando Data Import document: %s", error_text)
+        update_job(process_id, status="error", message=f"Error creando Data Import document: {error_text}")
         return
     
     if create_import_response.status_code not in [200, 201]:
         error_text = create_import_response.text
-        print(f"❌ Error creando Data Import document: {error_text}")
-        sales_import_progress[process_id]["status"] = "error"
-        sales_import_progress[process_id]["message"] = f"Error creando Data Import document: {error_text}"
+        logger.error("❌ Error creando Data Import document: %s", error_text)
+        update_job(process_id, status="error", message=f"Error creando Data Import document: {error_text}")
         return
     
     import_doc = create_import_response.json().get('data', {})
     import_name = import_doc.get('name')
-    print(f"✅ Data Import document creado: {import_name}")
-    print(f"🔍 [DEBUG] import_doc completo: {import_doc}")
+    logger.info("✅ Data Import document creado: %s", import_name)
+    logger.debug("import_doc completo: %s", import_doc)
     
     payload_count = import_doc.get('payload_count', 0)
-    print(f"🔍 [DEBUG] payload_count: {payload_count}")
+    logger.debug("payload_count: %s", payload_count)
     
     if payload_count == 0:
-        print(f"⚠️ WARNING: payload_count es 0, pero continuando con start_import...")
+        logger.warning("⚠️ payload_count es 0, pero continuando con start_import...")
     
     # PASO 3: Iniciar el import
-    print("🚀 Iniciando Data Import...")
+    logger.info("🚀 Iniciando Data Import...")
     
     import_response, import_error = make_erpnext_request(
         session=session,
@@ -1242,48 +1227,53 @@ def _do_bulk_save_csv(session, headers, user_id, process_id, price_list_name, cu
         operation_name=f"Start data import '{import_name}'"
     )
     
-    print(f"🔍 [DEBUG] Respuesta de form_start_import - Status: {import_response.status_code}")
-    print(f"🔍 [DEBUG] Respuesta completa: {import_response.text}")
+    logger.debug("Respuesta de form_start_import - Status: %s", import_response.status_code)
+    logger.debug("Respuesta completa: %s", import_response.text)
     
     if import_error:
         error_text = import_error
-        print(f"❌ Error en Data Import: {error_text}")
-        sales_import_progress[process_id]["status"] = "error"
-        sales_import_progress[process_id]["message"] = f"Error en Data Import: {error_text}"
+        logger.error("❌ Error en Data Import: %s", error_text)
+        update_job(process_id, status="error", message=f"Error en Data Import: {error_text}")
         return
     
     if import_response.status_code in [200, 201]:
         import_result = import_response.json()
-        print(f"🔍 [DEBUG] import_result: {import_result}")
+        logger.debug("import_result: %s", import_result)
         
         message = import_result.get('message', '')
-        print(f"✅ Data Import iniciado: {message}")
+        logger.info("✅ Data Import iniciado: %s", message)
         
         # Actualizar progreso
-        sales_import_progress[process_id]["status"] = "completed"
-        sales_import_progress[process_id]["message"] = f"Importación bulk iniciada exitosamente. Import ID: {import_name}"
-        sales_import_progress[process_id]["import_name"] = import_name
-        sales_import_progress[process_id]["saved"] = payload_count if payload_count > 0 else len(csv_data.split('\n')) - 1
-        sales_import_progress[process_id]["failed"] = 0
-        sales_import_progress[process_id]["price_list_name"] = price_list_name
+        update_job(
+            process_id,
+            status="completed",
+            message=f"Importación bulk iniciada exitosamente. Import ID: {import_name}",
+            import_name=import_name,
+            saved=payload_count if payload_count > 0 else len(csv_data.split('\n')) - 1,
+            failed=0,
+            price_list_name=price_list_name
+        )
         
         print(f"✅ Bulk import completado con archivo subido")
     else:
         error_text = import_response.text
         print(f"❌ Error en Data Import: {error_text}")
-        sales_import_progress[process_id]["status"] = "error"
-        sales_import_progress[process_id]["message"] = f"Error en Data Import: {error_text}"
+        update_job(process_id, status="error", message=f"Error en Data Import: {error_text}")
 
 
 @sales_price_lists_bp.route('/api/sales-price-lists/bulk-save-progress/<process_id>', methods=['GET'])
 def get_bulk_save_progress(process_id):
     """Obtener el progreso de un guardado en curso"""
+    session, headers, user_id, error_response = get_session_with_auth()
+    if error_response:
+        return error_response
+
     try:
-        if process_id not in sales_import_progress:
+        progress_data = get_job_progress(process_id)
+        # Los procesos de otros usuarios se informan como inexistentes
+        if progress_data is None or progress_data.get('user_id') != user_id:
             return jsonify({"success": False, "message": "Proceso no encontrado"}), 404
 
-        progress_data = sales_import_progress[process_id]
-
         # Calcular porcentaje
         total = progress_data.get('total', 0)
         current = progress_data.get('progress', 0)
@@ -1855,16 +1845,16 @@ def import_sales_price_list_data():
                 price_val = (row.get('price') or row.get('valor') or row.get('precio') or row.get('Rate') or '').strip()
 
                 if not item_code:
-                    print(f"⚠️ Fila {row_idx}: Código de item faltante, omitiendo")
+                    logger.sampled("bulk_row_skip", "⚠️ Fila %s: Código de item faltante, omitiendo", row_idx, level=logging.INFO, every=100)
                     continue
                 if not price_val:
-                    print(f"⚠️ Fila {row_idx}: Precio faltante, omitiendo")
+                    logger.sampled("bulk_row_skip", "⚠️ Fila %s: Precio faltante, omitiendo", row_idx, level=logging.INFO, every=100)
                     continue
 
                 try:
                     price_float = float(price_val.replace(',', '.'))
                 except ValueError:
-                    print(f"⚠️ Fila {row_idx}: Precio inválido '{price_val}', omitiendo")
+                    logger.sampled("bulk_row_skip", "⚠️ Fila %s: Precio inválido '%s', omitiendo", row_idx, price_val, level=logging.INFO, every=100)
                     continue
 
                 # Normalize item_code to include company abbr when present (for ERPNext storage)
@@ -1887,7 +1877,7 @@ def import_sales_price_list_data():
                 row_out['_original_row'] = row
                 rows.append(row_out)
             except Exception as row_error:
-                print(f"⚠️ Error procesando fila {row_idx}: {row_error}")
+                logger.sampled("bulk_row_error", "⚠️ Error procesando fila %s: %s", row_idx, row_error, level=logging.WARNING, every=100)
                 continue
 
         if not rows:
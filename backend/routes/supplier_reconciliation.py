@@ -4,8 +4,9 @@ import json
 
 from routes.auth_utils import get_session_with_auth
 from routes.general import get_company_abbr, add_company_abbr
-from utils.http_utils import make_erpnext_request
+from utils.http_utils import make_erpnext_request, handle_erpnext_error
 from utils.conciliation_utils import CONCILIATION_FIELD, generate_conciliation_id
+from services.reconciliation_queries import get_party_reconciliations
 
 supplier_reconciliation_bp = Blueprint('supplier_reconciliation', __name__)
 
@@ -172,93 +173,17 @@ def get_supplier_reconciliations():
 
         erp_supplier = _normalize_supplier_name(session, headers, supplier, company)
 
-        filters = json.dumps([
-            ["company", "=", company]
-        ])
-        fields = json.dumps(["*"])
-        inv_resp, inv_error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/Purchase Invoice",
-            params={
-                "filters": filters,
-                "fields": fields,
-                "limit_page_length": 1000
-            },
-            operation_name="Get purchase invoices with conciliation id"
+        # Incluye borradores (los documentos conservan su docstatus en la respuesta)
+        reconciliations_list, error = get_party_reconciliations(
+            session,
+            'Supplier',
+            erp_supplier,
+            company,
+            submitted_only=False,
+            include_docstatus=True,
         )
-        invoices = inv_resp.json().get('data', []) if inv_resp and inv_resp.status_code == 200 else []
-
-        # Filtrar por supplier y conciliation_id
-        invoices = [inv for inv in invoices if inv.get("supplier") == erp_supplier and inv.get(CONCILIATION_FIELD)]
-
-        pe_filters = json.dumps([
-            ["party_type", "=", "Supplier"],
-            ["company", "=", company]
-        ])
-        pe_resp, pe_error = make_erpnext_request(
-            session=session,
-            method="GET",
-            endpoint="/api/resource/Payment Entry",
-            params={
-                "filters": pe_filters,
-                "fields": fields,
-                "limit_page_length": 1000
-            },
-            operation_name="Get supplier payments with conciliation id"
-        )
-        payments = pe_resp.json().get('data', []) if pe_resp and pe_resp.status_code == 200 else []
-
-        # Filtrar por party y conciliation_id
-        payments = [pay for pay in payments if pay.get("party") == erp_supplier and pay.get(CONCILIATION_FIELD)]
-
-        reconciliations_dict = {}
-        for inv in invoices:
-            rec_id = inv.get(CONCILIATION_FIELD)
-            if not rec_id:
-                continue
-            group = reconciliations_dict.setdefault(rec_id, {
-                "reconciliation_id": rec_id,
-                "documents": [],
-                "total_amount": 0,
-                "posting_date": inv.get("posting_date")
-            })
-            group["documents"].append({
-                "voucher_no": inv.get("name"),
-                "voucher_type": "Nota de Débito" if inv.get("is_return") else "Factura",
-                "posting_date": inv.get("posting_date"),
-                "amount": abs(float(inv.get("grand_total", 0))),
-                "outstanding": float(inv.get("outstanding_amount", 0)),
-                "docstatus": int(inv.get("docstatus") or 0),
-                CONCILIATION_FIELD: rec_id
-            })
-
-        for pe in payments:
-            rec_id = pe.get(CONCILIATION_FIELD)
-            if not rec_id:
-                continue
-            group = reconciliations_dict.setdefault(rec_id, {
-                "reconciliation_id": rec_id,
-                "documents": [],
-                "total_amount": 0,
-                "posting_date": pe.get("posting_date")
-            })
-            group["documents"].append({
-                "voucher_no": pe.get("name"),
-                "voucher_type": "Pago",
-                "posting_date": pe.get("posting_date"),
-                "amount": float(pe.get("paid_amount", 0)),
-                "outstanding": -float(pe.get("unallocated_amount", 0)),
-                "docstatus": int(pe.get("docstatus") or 0),
-                CONCILIATION_FIELD: rec_id
-            })
-
-        for rec_id, rec_data in reconciliations_dict.items():
-            rec_data["total_amount"] = sum(doc["outstanding"] for doc in rec_data["documents"])
-            rec_data["total_amount"] = round(rec_data["total_amount"], 2)
-
-        reconciliations_list = list(reconciliations_dict.values())
-        reconciliations_list.sort(key=lambda x: x["posting_date"], reverse=True)
+        if error:
+            return handle_erpnext_error(error, "Error obteniendo conciliaciones del proveedor")
 
         return jsonify({
             "success": True,
@@ -26,7 +26,7 @@ from utils.conciliation_utils import (
     exclude_balanced_documents,
     summarize_group_balances,
 )
-from datetime import datetime, timedelta
+from services.party_balance_service import get_party_balances
 
 # Crear el blueprint para las rutas de proveedores
 suppliers_bp = Blueprint('suppliers', __name__)
@@ -1544,129 +1544,23 @@ def get_suppliers_balances():
 
         print(f"Calculando saldos para {len(supplier_names)} proveedores en compañía: {company_name}")
 
-        closing_balance_map = {}
-        try:
-            try:
-                to_date = datetime.utcnow().date()
-            except Exception:
-                to_date = datetime.now().date()
-            from_date = to_date - timedelta(days=30)
-
-            report_params = {
-                'report_name': 'Supplier Ledger Summary',
-                'filters': json.dumps({
-                    'company': company_name,
-                    'from_date': from_date.strftime('%Y-%m-%d'),
-                    'to_date': to_date.strftime('%Y-%m-%d')
-                }),
-                'ignore_prepared_report': 'false',
-                'are_default_filters': 'false'
-            }
-            report_response, report_error = make_erpnext_request(
-                session=session,
-                method='GET',
-                endpoint='/api/method/frappe.desk.query_report.run',
-                params=report_params,
-                operation_name='Fetch Supplier Ledger Summary'
-            )
-
-            if not report_error and report_response and report_response.status_code == 200:
-                report_payload = report_response.json()
-                for row in report_payload.get('message', {}).get('result', []):
-                    supplier_key = row.get('supplier_name') or row.get('party_name') or row.get('party')
-                    if not supplier_key:
-                        continue
-                    closing_balance = row.get('closing_balance')
-                    closing_balance_map[supplier_key] = closing_balance
-                    if ' - ' in supplier_key:
-                        closing_balance_map[supplier_key.split(' - ')[0]] = closing_balance
-        except Exception as err:
-            print(f" Error obteniendo reporte de saldos: {err}")
+        company_abbr = get_company_abbr(session, headers, company_name)
+        party_balances = get_party_balances(
+            session,
+            'Supplier',
+            company_name,
+            supplier_names,
+            resolve_name=(lambda name: add_company_abbr(name, company_abbr)) if company_abbr else None
+        )
 
         balances = []
-
-        # Para cada proveedor solicitado, calcular su saldo
         for supplier_name in supplier_names:
-            try:
-                print(f"🔍 Calculando saldo para proveedor: '{supplier_name}'")
-
-                # Obtener compañía activa para manejar siglas
-                company_abbr = get_company_abbr(session, headers, company_name) if company_name else None
-
-                # Agregar sigla al supplier_name para buscar en ERPNext
-                search_supplier_name = supplier_name
-                if company_abbr:
-                    search_supplier_name = add_company_abbr(supplier_name, company_abbr)
-                    print(f"🏷️ Searching balance for supplier with abbr: {search_supplier_name}")
-
-                closing_balance = None
-                if closing_balance_map:
-                    closing_balance = closing_balance_map.get(search_supplier_name)
-                    if closing_balance is None:
-                        closing_balance = closing_balance_map.get(supplier_name)
-                if closing_balance is not None:
-                    balances.append({
-                        'name': supplier_name,
-                        'outstanding_amount': _safe_float(closing_balance),
-                        'invoice_count': 0
-                    })
-                    print(f" 💸 Saldo tomado del reporte para {supplier_name}: ${closing_balance}")
-                    continue
-
-                # Obtener todas las facturas CONFIRMADAS del proveedor (docstatus = 1)
-                filters = f'[["supplier","=","{search_supplier_name}"],["company","=","{company_name}"],["docstatus","=","1"]]'
-                fields = '["name","outstanding_amount","status","grand_total"]'
-
-                params_inv = {
-                    'filters': filters,
-                    'fields': fields,
-                    'limit_page_length': 1000
-                }
-                invoices_response, invoices_error = make_erpnext_request(
-                    session=session,
-                    method="GET",
-                    endpoint="/api/resource/Purchase Invoice",
-                    params=params_inv,
-                    operation_name=f"Get invoices for supplier balance '{search_supplier_name}'"
-                )
-
-                if invoices_error:
-                    print(f"❌ Error obteniendo facturas para {supplier_name}: {invoices_error}")
-                    balances.append({
-                        'name': supplier_name,
-                        'outstanding_amount': 0,
-                        'invoice_count': 0
-                    })
-                    continue
-
-                if invoices_response.status_code == 200:
-                    invoices_data = invoices_response.json()
-                    invoices = invoices_data.get('data', [])
-
-                    total_outstanding = sum(float(invoice.get('outstanding_amount', 0)) for invoice in invoices)
-
-                    balances.append({
-                        'name': supplier_name,
-                        'outstanding_amount': total_outstanding,
-                        'invoice_count': len(invoices)
-                    })
-
-                    print(f"✅ Saldo calculado para {supplier_name}: ${total_outstanding} (de {len(invoices)} facturas)")
-                else:
-                    print(f"❌ Error obteniendo facturas para {supplier_name}: {invoices_response.status_code}")
-                    balances.append({
-                        'name': supplier_name,
-                        'outstanding_amount': 0,
-                        'invoice_count': 0
-                    })
-
-            except Exception as e:
-                print(f"❌ Error calculando saldo para proveedor {supplier_name}: {e}")
-                balances.append({
-                    'name': supplier_name,
-                    'outstanding_amount': 0,
-                    'invoice_count': 0
-                })
+            entry = party_balances.get(supplier_name) or {}
+            balances.append({
+                'name': supplier_name,
+                'outstanding_amount': entry.get('outstanding_amount', 0),
+                'invoice_count': entry.get('invoice_count', 0)
+            })
 
         print(f"Saldos calculados para {len(balances)} proveedores")
 
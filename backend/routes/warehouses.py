@@ -24,7 +24,7 @@ from routes.general import remove_company_abbr
 from utils.warehouse_tokens import ensure_warehouse, sanitize_supplier_code, validate_warehouse_name, tokenize_warehouse_name
 
 # Importar helper de query de warehouses
-from utils.warehouse_api import fetch_company_warehouses
+from utils.warehouse_api import fetch_company_warehouses, invalidate_company_warehouses
 
 # Crear el blueprint para las rutas de warehouses
 warehouses_bp = Blueprint('warehouses', __name__)
@@ -347,6 +347,8 @@ def create_warehouse():
             if create_error:
                 return handle_erpnext_error(create_error, "Failed to create warehouse")
 
+            invalidate_company_warehouses(company)
+
             created_data = create_response.json()
             warehouse_name_created = created_data.get('data', {}).get('name', warehouse_code)
 
@@ -460,6 +462,8 @@ def update_warehouse(warehouse_name):
         if update_error:
             return handle_erpnext_error(update_error, "Failed to update warehouse")
 
+        invalidate_company_warehouses((update_response.json().get('data') or {}).get('company'))
+
         updated_data = update_response.json()
 
         print("--- Actualizar warehouse: ok")
@@ -523,6 +527,9 @@ def delete_warehouse(warehouse_name):
             operation_name="Delete Warehouse"
         )
 
+        # Borrado o deshabilitado, el almacén deja de estar en el índice
+        invalidate_company_warehouses()
+
         if delete_error:
             disable_response, disable_error = make_erpnext_request(
                 session=session,
@@ -0,0 +1,295 @@
+"""
+Saldos de cuentas contables (GL Entry) y bancarias (Bank Transaction) agregados en ERPNext.
+
+En lugar de traer cada asiento y sumar en Python, se pide a frappe.client.get_list la
+suma de debe/haber (depósitos/retiros) agrupada por día y se arma el total por mes:
+el tamaño de la respuesta depende de los días con movimientos, no de los asientos.
+
+Los totales de los meses cerrados (fin de mes <= custom_lock_posting_before de la
+cuenta contable) se guardan en ACCOUNT_BALANCE_CACHE_PATH y en el request siguiente
+solo se consultan los días posteriores al último mes cerrado. Los server scripts de
+cierre solo bloquean Payment Entry, Journal Entry y Bank Transaction: facturas,
+comprobantes de stock y reposteos pueden seguir asentando en un mes cerrado. Por eso
+cada mes cacheado guarda la cantidad de registros y su max(modified), y antes de usar
+el cache se comparan con una consulta agrupada (count/max(modified)) sobre el tramo
+cacheado; si no coinciden se descarta la entrada y se vuelve a pedir todo.
+
+Al desbloquear meses o importar movimientos con fecha en un mes cacheado, la entrada
+se invalida (invalidate_balances).
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from config import ACCOUNT_BALANCE_CACHE_PATH
+from utils.frappe_list import fetch_list_paged
+from utils.json_state_store import JsonStateStore
+
+CACHE_VERSION = 2
+
+SOURCES = {
+    'gl': {
+        'doctype': 'GL Entry',
+        'date_field': 'posting_date',
+        'target_field': 'account',
+        'debit_field': 'debit',
+        'credit_field': 'credit',
+    },
+    'bank': {
+        'doctype': 'Bank Transaction',
+        'date_field': 'date',
+        'target_field': 'bank_account',
+        'debit_field': 'deposit',
+        'credit_field': 'withdrawal',
+    },
+}
+
+_store = JsonStateStore(
+    ACCOUNT_BALANCE_CACHE_PATH,
+    default_factory=lambda: {"version": CACHE_VERSION, "entries": {}},
+    flush_interval=0
+)
+
+
+def _safe_float(value, default=0.0):
+    try:
+        if value in (None, ''):
+            return default
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _cache_key(source, company, target):
+    return f"{source}::{company}::{target}"
+
+
+def month_key(value) -> str:
+    """Mes (YYYY-MM) de una fecha o texto de fecha"""
+    return str(value)[:7]
+
+
+def month_end(month: str) -> date:
+    """Último día de un mes YYYY-MM"""
+    year, month_number = (int(part) for part in month.split('-'))
+    first_next = date(year + (month_number == 12), month_number % 12 + 1, 1)
+    return first_next - timedelta(days=1)
+
+
+def locked_month(lock_date) -> Optional[str]:
+    """Último mes completo (YYYY-MM) con fin de mes <= lock_date"""
+    if not lock_date:
+        return None
+    lock = datetime.strptime(str(lock_date)[:10], "%Y-%m-%d").date()
+    month = month_key(lock.isoformat())
+    if month_end(month) <= lock:
+        return month
+    previous = lock.replace(day=1) - timedelta(days=1)
+    return month_key(previous.isoformat())
+
+
+def _base_filters(source, company, target):
+    config = SOURCES[source]
+    filters = [[config['target_field'], "=", target]]
+    if source == 'gl':
+        filters += [["company", "=", company], ["is_cancelled", "=", 0]]
+    return filters
+
+
+def fetch_monthly_totals(session, source, company, target, from_date=None, to_date=None):
+    """
+    Totales por mes agrupados en ERPNext (por día) entre from_date y to_date inclusive.
+
+    Returns:
+        tuple: ({"YYYY-MM": {"debit", "credit", "entries", "last_modified"}}, error)
+    """
+    config = SOURCES[source]
+    date_field = config['date_field']
+    filters = _base_filters(source, company, target)
+    if from_date:
+        filters.append([date_field, ">=", str(from_date)])
+    if to_date:
+        filters.append([date_field, "<=", str(to_date)])
+
+    rows, error = fetch_list_paged(
+        session,
+        config['doctype'],
+        [
+            date_field,
+            f"sum({config['debit_field']}) as debit",
+            f"sum({config['credit_field']}) as credit",
+            "count(name) as entries",
+            "max(modified) as last_modified",
+        ],
+        filters,
+        group_by=date_field,
+        order_by=f"{date_field} asc",
+        page_size=5000,
+        operation_name=f"Aggregate {config['doctype']} totals by day"
+    )
+    if error:
+        return {}, error
+
+    months: Dict[str, Dict[str, float]] = {}
+    for row in rows:
+        if not row.get(date_field):
+            continue
+        totals = months.setdefault(
+            month_key(row[date_field]), {"debit": 0.0, "credit": 0.0, "entries": 0, "last_modified": None}
+        )
+        totals["debit"] += _safe_float(row.get("debit"))
+        totals["credit"] += _safe_float(row.get("credit"))
+        totals["entries"] += int(row.get("entries") or 0)
+        if row.get("last_modified"):
+            totals["last_modified"] = max(totals["last_modified"] or "", str(row["last_modified"]))
+    return months, None
+
+
+def fetch_stamp(session, source, company, target, to_date):
+    """
+    Cantidad de registros y max(modified) de la cuenta hasta to_date inclusive.
+
+    Returns:
+        tuple: ({"entries": n, "last_modified": x}, error)
+    """
+    config = SOURCES[source]
+    filters = _base_filters(source, company, target) + [[config['date_field'], "<=", str(to_date)]]
+    rows, error = fetch_list_paged(
+        session,
+        config['doctype'],
+        [config['target_field'], "count(name) as entries", "max(modified) as last_modified"],
+        filters,
+        group_by=config['target_field'],
+        operation_name=f"Validate cached {config['doctype']} totals"
+    )
+    if error:
+        return {}, error
+    row = rows[0] if rows else {}
+    return {
+        "entries": int(row.get("entries") or 0),
+        "last_modified": str(row["last_modified"]) if row.get("last_modified") else None,
+    }, None
+
+
+def _cache_is_current(session, source, company, target, months, through) -> bool:
+    """True si los meses cacheados hasta `through` coinciden con lo que hay hoy en ERPNext"""
+    stamp, error = fetch_stamp(session, source, company, target, month_end(through))
+    if error:
+        return False
+    entries = sum(int(totals.get("entries") or 0) for totals in months.values())
+    last_modified = max((totals.get("last_modified") or "" for totals in months.values()), default="") or None
+    return stamp["entries"] == entries and stamp["last_modified"] == last_modified
+
+
+def get_monthly_totals(session, source, company, target, lock_date=None, to_date=None):
+    """
+    Totales por mes de la cuenta (desde el primer movimiento hasta to_date o hoy).
+
+    Los meses cerrados según lock_date salen del cache persistido (validado con
+    count/max(modified)); solo se consulta ERPNext por lo posterior al último mes
+    cacheado. Los meses que quedaron cerrados desde la última vez se agregan al cache.
+
+    Returns:
+        tuple: (totales por mes, error)
+    """
+    key = _cache_key(source, company, target)
+    cutoff = locked_month(lock_date)
+
+    cached_months: Dict[str, Dict[str, float]] = {}
+    cached_through = None
+    if cutoff and _store.get("version") == CACHE_VERSION:
+        entry = _store.get("entries", key) or {}
+        if entry.get("locked_through"):
+            cached_through = min(entry["locked_through"], cutoff)
+            cached_months = {
+                month: dict(totals)
+                for month, totals in (entry.get("months") or {}).items()
+                if month <= cached_through
+            }
+            if not _cache_is_current(session, source, company, target, cached_months, cached_through):
+                print(f"--- Saldos: cache desactualizado para {key}, se vuelve a calcular")
+                cached_through = None
+                cached_months = {}
+
+    if to_date and cached_through and month_key(to_date) <= cached_through:
+        limit = month_key(to_date)
+        return {month: totals for month, totals in cached_months.items() if month <= limit}, None
+
+    from_date = (month_end(cached_through) + timedelta(days=1)) if cached_through else None
+    fetched, error = fetch_monthly_totals(session, source, company, target, from_date=from_date, to_date=to_date)
+    if error:
+        return {}, error
+
+    months = dict(cached_months)
+    months.update(fetched)
+
+    # Los meses recién cerrados (y completos dentro de lo consultado) pasan al cache
+    new_through = cutoff
+    if new_through and to_date and month_end(new_through) > datetime.strptime(str(to_date)[:10], "%Y-%m-%d").date():
+        new_through = locked_month(to_date)
+    if new_through and new_through != cached_through and (not cached_through or new_through > cached_through):
+        try:
+            with _store.edit() as data:
+                if data.get("version") != CACHE_VERSION:
+                    data.clear()
+                    data.update({"version": CACHE_VERSION, "entries": {}})
+                data.setdefault("entries", {})[key] = {
+                    "locked_through": new_through,
+                    "months": {month: totals for month, totals in months.items() if month <= new_through},
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                }
+        except Exception as exc:
+            print(f"--- Saldos: no se pudo guardar el cache de {key}: {exc}")
+
+    return months, None
+
+
+def balance_from_totals(months: Dict[str, Dict[str, float]], through=None) -> float:
+    """Saldo (debe - haber) acumulado hasta el mes de `through` inclusive (o de todo)"""
+    limit = month_key(through) if through else None
+    return sum(
+        totals["debit"] - totals["credit"]
+        for month, totals in months.items()
+        if limit is None or month <= limit
+    )
+
+
+def invalidate_balances(source, target, company=None, from_date=None) -> int:
+    """
+    Descartar los meses cacheados de target desde el mes de from_date (todos si es None).
+
+    Returns:
+        int: entradas modificadas
+    """
+    prefix = f"{source}::"
+    suffix = f"::{target}"
+    from_month = month_key(from_date) if from_date else None
+    changed = 0
+    with _store.edit() as data:
+        entries = data.get("entries") or {}
+        for key in list(entries):
+            if not (key.startswith(prefix) and key.endswith(suffix)):
+                continue
+            if company and key != _cache_key(source, company, target):
+                continue
+            entry = entries[key]
+            if from_month is None:
+                del entries[key]
+                changed += 1
+                continue
+            if (entry.get("locked_through") or "") < from_month:
+                continue
+            first_day = datetime.strptime(f"{from_month}-01", "%Y-%m-%d").date()
+            previous = month_key((first_day - timedelta(days=1)).isoformat())
+            entry["locked_through"] = previous
+            entry["months"] = {month: totals for month, totals in (entry.get("months") or {}).items() if month <= previous}
+            changed += 1
+    return changed
+
+
+def balance_cache_stats() -> Dict[str, Any]:
+    entries = _store.get("entries") or {}
+    return {
+        "entries": len(entries),
+        "path": ACCOUNT_BALANCE_CACHE_PATH,
+    }
@@ -0,0 +1,454 @@
+"""
+Réplica local del catálogo de items por compañía.
+
+Reconocer SKUs, el fetch masivo de más de 100 códigos y el buscador de inventario
+traían todo el Item de la compañía desde ERPNext en cada llamada para filtrar en
+Python. Este servicio mantiene una copia en memoria por compañía:
+
+  1. Se siembra una vez con el listado completo (paginado).
+  2. En cada uso, si pasaron ITEM_CATALOG_POLL_INTERVAL segundos (o un endpoint de
+     items la marcó como desactualizada), trae solo los items con modified >= último
+     modified visto y las bajas registradas en Deleted Document.
+  3. Cada ITEM_CATALOG_FULL_SYNC_INTERVAL se vuelve a sembrar completa.
+
+Se guardan todos los items de la compañía (también deshabilitados/cancelados) para
+que las actualizaciones incrementales reflejen bajas lógicas; los filtros de activos
+se aplican al consultar. Con ITEM_CATALOG_SQLITE_PATH la réplica se persiste en
+SQLite y el proceso arranca ya sembrado (solo hace falta el poll incremental).
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import (
+    ITEM_CATALOG_POLL_INTERVAL,
+    ITEM_CATALOG_FULL_SYNC_INTERVAL,
+    ITEM_CATALOG_SQLITE_PATH,
+)
+from utils.http_utils import make_erpnext_request
+from utils.search_index import ItemSearchIndex
+
+# Unión de los campos que usan los endpoints servidos desde la réplica
+CATALOG_FIELDS = [
+    "name", "item_code", "item_name", "description",
+    "stock_uom", "is_stock_item", "standard_rate",
+    "valuation_rate", "item_group", "docstatus",
+    "is_sales_item", "is_purchase_item", "lead_time_days",
+    "min_order_qty", "safety_stock", "max_discount",
+    "grant_commission", "custom_description_type",
+    "custom_product_links", "allow_negative_stock",
+    "brand", "item_defaults", "custom_company", "disabled", "modified"
+]
+
+SYNC_PAGE_SIZE = 5000
+
+
+class _CompanyCatalog:
+    """Estado de la réplica de una compañía (protegido por lock)"""
+
+    def __init__(self, company: str):
+        self.company = company
+        self.lock = threading.RLock()
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.by_code: Dict[str, str] = {}
+        self.cursor: Optional[str] = None
+        self.seeded = False
+        self.stale = False
+        self.last_poll = 0.0
+        self.last_full_sync = 0.0
+        self.version = 0
+        self.search_index = ItemSearchIndex()
+
+    def upsert(self, rows: Iterable[Dict[str, Any]], index: bool = True) -> int:
+        changed = 0
+        for row in rows:
+            name = row.get("name")
+            if not name:
+                continue
+            previous = self.items.get(name)
+            if previous is not None:
+                previous_code = previous.get("item_code") or name
+                if self.by_code.get(previous_code) == name:
+                    del self.by_code[previous_code]
+            self.items[name] = row
+            self.by_code[row.get("item_code") or name] = name
+            if index:
+                self.search_index.add(row)
+            modified = row.get("modified")
+            if modified and (self.cursor is None or modified > self.cursor):
+                self.cursor = modified
+            changed += 1
+        if changed:
+            self._touch()
+        return changed
+
+    def remove(self, names: Iterable[str]) -> List[str]:
+        removed = []
+        for name in names:
+            row = self.items.pop(name, None)
+            if row is None:
+                continue
+            code = row.get("item_code") or name
+            if self.by_code.get(code) == name:
+                del self.by_code[code]
+            self.search_index.remove(name)
+            removed.append(name)
+        if removed:
+            self._touch()
+        return removed
+
+    def replace_all(self, rows: List[Dict[str, Any]]) -> None:
+        self.items = {}
+        self.by_code = {}
+        self.cursor = None
+        self.upsert(rows, index=False)
+        self.search_index.rebuild(self.items.values())
+        self._touch()
+
+    def _touch(self) -> None:
+        self.version += 1
+
+
+_catalogs: Dict[str, _CompanyCatalog] = {}
+_catalogs_lock = threading.Lock()
+_stats = {"seeds": 0, "polls": 0, "rows_synced": 0, "rows_deleted": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _bump(key: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _get_catalog(company: str) -> _CompanyCatalog:
+    with _catalogs_lock:
+        catalog = _catalogs.get(company)
+        if catalog is None:
+            catalog = _CompanyCatalog(company)
+            _catalogs[company] = catalog
+        return catalog
+
+
+def is_active_item(row: Dict[str, Any]) -> bool:
+    """Mismo criterio que los filtros de los endpoints: no deshabilitado y docstatus 0/1"""
+    return not int(row.get("disabled") or 0) and int(row.get("docstatus") or 0) in (0, 1)
+
+
+# ---------------------------------------------------------------------------
+# Lecturas desde ERPNext
+# ---------------------------------------------------------------------------
+
+def _fetch_company_items(session, company: str, since: Optional[str] = None):
+    """Items de la compañía (todos los estados), opcionalmente con modified >= since"""
+    filters: List[List[Any]] = [["custom_company", "=", company]]
+    if since:
+        filters.append(["modified", ">=", since])
+
+    rows: List[Dict[str, Any]] = []
+    start = 0
+    while True:
+        response, error = make_erpnext_request(
+            session=session,
+            method="GET",
+            endpoint="/api/resource/Item",
+            params={
+                "fields": json.dumps(CATALOG_FIELDS),
+                "filters": json.dumps(filters),
+                "order_by": "modified asc",
+                "limit_start": start,
+                "limit_page_length": SYNC_PAGE_SIZE
+            },
+            operation_name="Item catalog sync"
+        )
+        if error:
+            return rows, error
+        if response.status_code != 200:
+            return rows, {"success": False, "status_code": response.status_code, "message": response.text}
+
+        page = response.json().get("data", []) or []
+        rows.extend(page)
+        if len(page) < SYNC_PAGE_SIZE:
+            return rows, None
+        start += SYNC_PAGE_SIZE
+
+
+def _fetch_deleted_item_names(session, since: str) -> List[str]:
+    """Items borrados desde since (Deleted Document); sin permisos se ignora"""
+    response, error = make_erpnext_request(
+        session=session,
+        method="GET",
+        endpoint="/api/resource/Deleted Document",
+        params={
+            "fields": json.dumps(["deleted_name"]),
+            "filters": json.dumps([["deleted_doctype", "=", "Item"], ["creation", ">=", since]]),
+            "limit_page_length": 0
+        },
+        operation_name="Item catalog deleted items"
+    )
+    if error or response.status_code != 200:
+        return []
+    return [row.get("deleted_name") for row in response.json().get("data", []) if row.get("deleted_name")]
+
+
+# ---------------------------------------------------------------------------
+# Persistencia opcional en SQLite
+# ---------------------------------------------------------------------------
+
+def _sqlite_connect():
+    connection = sqlite3.connect(ITEM_CATALOG_SQLITE_PATH, timeout=30)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS catalog_items ("
+        "company TEXT NOT NULL, name TEXT NOT NULL, data TEXT NOT NULL, "
+        "PRIMARY KEY (company, name))"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS catalog_state ("
+        "company TEXT PRIMARY KEY, cursor TEXT, full_sync_at REAL)"
+    )
+    return connection
+
+
+def _sqlite_load(catalog: _CompanyCatalog) -> bool:
+    if not ITEM_CATALOG_SQLITE_PATH:
+        return False
+    try:
+        with _sqlite_connect() as connection:
+            state = connection.execute(
+                "SELECT cursor, full_sync_at FROM catalog_state WHERE company = ?",
+                (catalog.company,)
+            ).fetchone()
+            if not state:
+                return False
+            rows = [
+                json.loads(data) for (data,) in connection.execute(
+                    "SELECT data FROM catalog_items WHERE company = ?", (catalog.company,)
+                )
+            ]
+        catalog.replace_all(rows)
+        catalog.cursor = state[0] or catalog.cursor
+        catalog.last_full_sync = state[1] or 0.0
+        print(f"--- Item catalog {catalog.company}: {len(rows)} items cargados desde SQLite")
+        return True
+    except Exception as exc:
+        print(f"--- Item catalog {catalog.company}: no se pudo leer SQLite ({exc})")
+        return False
+
+
+def _sqlite_save(catalog: _CompanyCatalog, rows: List[Dict[str, Any]], deleted: List[str], full: bool) -> None:
+    if not ITEM_CATALOG_SQLITE_PATH:
+        return
+    try:
+        with _sqlite_connect() as connection:
+            if full:
+                connection.execute("DELETE FROM catalog_items WHERE company = ?", (catalog.company,))
+            connection.executemany(
+                "INSERT OR REPLACE INTO catalog_items (company, name, data) VALUES (?, ?, ?)",
+                [(catalog.company, row["name"], json.dumps(row)) for row in rows if row.get("name")]
+            )
+            connection.executemany(
+                "DELETE FROM catalog_items WHERE company = ? AND name = ?",
+                [(catalog.company, name) for name in deleted]
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO catalog_state (company, cursor, full_sync_at) VALUES (?, ?, ?)",
+                (catalog.company, catalog.cursor, catalog.last_full_sync)
+            )
+    except Exception as exc:
+        print(f"--- Item catalog {catalog.company}: no se pudo escribir SQLite ({exc})")
+
+
+# ---------------------------------------------------------------------------
+# Sincronización
+# ---------------------------------------------------------------------------
+
+def _sync(session, catalog: _CompanyCatalog, force_full: bool = False):
+    """Sembrar o actualizar la réplica; devuelve el error de ERPNext o None"""
+    now = time.time()
+    if not catalog.seeded and not force_full:
+        catalog.seeded = _sqlite_load(catalog)
+
+    needs_full = (
+        force_full
+        or not catalog.seeded
+        or now - catalog.last_full_sync >= ITEM_CATALOG_FULL_SYNC_INTERVAL
+    )
+    if needs_full:
+        rows, error = _fetch_company_items(session, catalog.company)
+        if error:
+            _bump("errors")
+            return error
+        catalog.replace_all(rows)
+        catalog.seeded = True
+        catalog.stale = False
+        catalog.last_full_sync = catalog.last_poll = now
+        _bump("seeds")
+        _bump("rows_synced", len(rows))
+        _sqlite_save(catalog, rows, [], full=True)
+        print(f"--- Item catalog {catalog.company}: sembrado con {len(rows)} items")
+        return None
+
+    if not catalog.stale and now - catalog.last_poll < ITEM_CATALOG_POLL_INTERVAL:
+        return None
+
+    since = catalog.cursor
+    rows, error = _fetch_company_items(session, catalog.company, since=since)
+    if error:
+        _bump("errors")
+        return error
+    deleted = catalog.remove(_fetch_deleted_item_names(session, since)) if since else []
+    catalog.upsert(rows)
+    catalog.stale = False
+    catalog.last_poll = now
+    _bump("polls")
+    _bump("rows_synced", len(rows))
+    _bump("rows_deleted", len(deleted))
+    if rows or deleted:
+        _sqlite_save(catalog, rows, deleted, full=False)
+    return None
+
+
+def ensure_item_catalog(session, company: str, force_full: bool = False):
+    """
+    Réplica de la compañía lista para consultar.
+
+    Si el poll falla pero ya había datos sembrados se sigue sirviendo la copia anterior.
+
+    Returns:
+        tuple: (catalog, error)
+    """
+    catalog = _get_catalog(company)
+    with catalog.lock:
+        error = _sync(session, catalog, force_full=force_full)
+        if error and not catalog.seeded:
+            return None, error
+        if error:
+            print(f"--- Item catalog {company}: sirviendo copia anterior ({error})")
+        return catalog, None
+
+
+def _project(row: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    if not fields:
+        return dict(row)
+    return {field: row.get(field) for field in fields}
+
+
+def get_catalog_items_by_code(
+    session,
+    company: str,
+    item_codes: Iterable[str],
+    fields: Optional[List[str]] = None,
+    stock_only: bool = False
+):
+    """
+    Items activos cuyo item_code (con sigla) está en item_codes.
+
+    Returns:
+        tuple: ({item_code: item (copia con fields)}, error)
+    """
+    catalog, error = ensure_item_catalog(session, company)
+    if error:
+        return None, error
+
+    results = {}
+    with catalog.lock:
+        for code in item_codes:
+            name = catalog.by_code.get(code)
+            row = catalog.items.get(name) if name else None
+            if not row or not is_active_item(row):
+                continue
+            if stock_only and not int(row.get("is_stock_item") or 0):
+                continue
+            results[code] = _project(row, fields)
+    return results, None
+
+
+def search_catalog_items(
+    session,
+    company: str,
+    query: str,
+    field: str = "item_code",
+    limit: int = 20,
+    fields: Optional[List[str]] = None
+):
+    """
+    Buscar items activos para el typeahead (índice de utils/search_index.py, sin acentos).
+
+    - field='item_code': item_code o name empiezan con query (exacto primero)
+    - field='description': cada palabra de query aparece en item_name, description o
+      item_code, con ranking por código/nombre y desempate por modified desc
+
+    Returns:
+        tuple: (items, error)
+    """
+    catalog, error = ensure_item_catalog(session, company)
+    if error:
+        return None, error
+
+    if not (query or "").strip():
+        return [], None
+
+    with catalog.lock:
+        def accept(name):
+            return is_active_item(catalog.items[name])
+
+        if field == "description":
+            names = catalog.search_index.search_text(query, limit=limit, accept=accept)
+        else:
+            names = catalog.search_index.search_prefix(query, limit=limit, accept=accept)
+        results = [_project(catalog.items[name], fields) for name in names]
+    return results, None
+
+
+def mark_item_catalog_stale(company: Optional[str]) -> None:
+    """Forzar el poll incremental en el próximo uso (alta/edición de items)"""
+    if not company:
+        return
+    with _catalogs_lock:
+        catalog = _catalogs.get(company)
+    if catalog is not None:
+        with catalog.lock:
+            catalog.stale = True
+
+
+def remove_catalog_items(company: Optional[str], names: Iterable[str]) -> None:
+    """Sacar de la réplica items borrados desde esta app"""
+    if not company:
+        return
+    with _catalogs_lock:
+        catalog = _catalogs.get(company)
+    if catalog is None:
+        return
+    with catalog.lock:
+        removed = catalog.remove(names)
+        if removed:
+            _sqlite_save(catalog, [], removed, full=False)
+
+
+def invalidate_item_catalog(company: Optional[str] = None) -> None:
+    """Descartar la réplica (de una compañía o todas); se vuelve a sembrar al usarla"""
+    with _catalogs_lock:
+        if company is None:
+            _catalogs.clear()
+        else:
+            _catalogs.pop(company, None)
+
+
+def item_catalog_stats() -> Dict[str, Any]:
+    with _catalogs_lock:
+        companies = {
+            name: {
+                "items": len(catalog.items),
+                "cursor": catalog.cursor,
+                "seeded": catalog.seeded,
+                "version": catalog.version,
+                "search_index": catalog.search_index.memory_usage(),
+            }
+            for name, catalog in _catalogs.items()
+        }
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["companies"] = companies
+    return stats
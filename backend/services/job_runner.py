@@ -0,0 +1,504 @@
+"""
+Jobs en segundo plano con estado persistido.
+
+Reemplaza los threading.Thread(daemon=True) + dicts de progreso por módulo
+(guardado de listas de precios, aplicación de automatizaciones, importación de items):
+
+  - Estado y progreso en SQLite (JOB_STORE_PATH): lo ven todos los workers de
+    gunicorn y sobrevive a reinicios. Los jobs terminados se borran después de
+    JOB_RETENTION_DAYS. La función del job solo existe en memoria del proceso que lo
+    encoló (owner_pid), así que si ese proceso muere sus jobs en cola o corriendo se
+    marcan con error (al iniciar, al buscar cupo y al consultar el job).
+  - Pool acotado (JOB_MAX_WORKERS) por proceso y como máximo JOB_MAX_PER_COMPANY jobs
+    corriendo por compañía entre todos los procesos; el resto queda 'queued'.
+  - Cancelación: cancel_job marca el pedido; los jobs en cola no arrancan y los que
+    corren lo consultan con job.check_cancelled().
+
+La función del job recibe un JobContext como primer argumento. Los campos que no son
+columnas (saved, failed, import_name, results, ...) se guardan en `data` y get_job
+los devuelve aplanados, igual que los dicts de progreso anteriores.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.logging_utils import get_correlation_id, set_correlation_id
+from config import JOB_STORE_PATH, JOB_MAX_WORKERS, JOB_MAX_PER_COMPANY, JOB_RETENTION_DAYS
+
+JOB_COLUMNS = ("status", "progress", "total", "message", "current_item")
+FINISHED_STATUSES = ("completed", "error", "cancelled")
+
+# Reintento de la cola cuando otra instancia ocupa el cupo de la compañía
+_REQUEUE_DELAY = 1.0
+# Cada cuánto un job vuelve a leer el pedido de cancelación / escribe progreso
+_CANCEL_CHECK_INTERVAL = 1.0
+_PROGRESS_WRITE_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    """El job se canceló desde /api/jobs/<id>/cancel"""
+
+
+# ---------------------------------------------------------------------------
+# Store (SQLite)
+# ---------------------------------------------------------------------------
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def _connect():
+    connection = sqlite3.connect(JOB_STORE_PATH, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def _ensure_schema():
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        os.makedirs(os.path.dirname(JOB_STORE_PATH) or ".", exist_ok=True)
+        connection = _connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, company TEXT, user_id TEXT, "
+                "status TEXT NOT NULL, progress INTEGER DEFAULT 0, total INTEGER DEFAULT 0, "
+                "message TEXT DEFAULT '', current_item TEXT DEFAULT '', data TEXT DEFAULT '{}', "
+                "cancel_requested INTEGER DEFAULT 0, owner_pid INTEGER, "
+                "created_at REAL, updated_at REAL, started_at REAL, finished_at REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_company_status ON jobs (company, status)")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_user_created ON jobs (user_id, created_at)")
+        finally:
+            connection.close()
+        _schema_ready = True
+        _recover_orphans()
+
+
+def _pid_alive(pid) -> bool:
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _recover_orphans(company: Optional[str] = None, job_id: Optional[str] = None) -> int:
+    """
+    Marcar con error los jobs 'queued' o 'running' cuyo proceso dueño ya no existe
+    (reinicio, crash): otro proceso no puede retomarlos porque la función del job solo
+    vive en la memoria del que lo encoló.
+    """
+    connection = _connect()
+    try:
+        query = "SELECT id, status, owner_pid FROM jobs WHERE status IN ('queued', 'running')"
+        params: List[Any] = []
+        if company is not None:
+            query += " AND company = ?"
+            params.append(company)
+        if job_id is not None:
+            query += " AND id = ?"
+            params.append(job_id)
+        orphans = [
+            (row["id"], row["status"])
+            for row in connection.execute(query, params)
+            if not _pid_alive(row["owner_pid"])
+        ]
+        now = time.time()
+        for orphan_id, status in orphans:
+            message = (
+                "Proceso interrumpido antes de empezar (reinicio del servidor)" if status == "queued"
+                else "Proceso interrumpido (reinicio del servidor)"
+            )
+            connection.execute(
+                "UPDATE jobs SET status = 'error', message = ?, updated_at = ?, finished_at = ? "
+                "WHERE id = ? AND status = ?",
+                (message, now, now, orphan_id, status)
+            )
+        if orphans:
+            print(f"--- Jobs: {len(orphans)} jobs huérfanos marcados con error")
+        return len(orphans)
+    finally:
+        connection.close()
+
+
+def _row_to_job(row) -> Dict[str, Any]:
+    job = {}
+    try:
+        job.update(json.loads(row["data"] or "{}"))
+    except (TypeError, ValueError):
+        pass
+    for key in row.keys():
+        if key != "data":
+            job[key] = row[key]
+    job["cancel_requested"] = bool(job.get("cancel_requested"))
+    total = job.get("total") or 0
+    job["percentage"] = int((job.get("progress") or 0) * 100 / total) if total > 0 else 0
+    return job
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Estado del job (columnas + data aplanada) o None"""
+    _ensure_schema()
+    connection = _connect()
+    try:
+        row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is not None and row["status"] in ("queued", "running") and not _pid_alive(row["owner_pid"]):
+            # Sin esto el frontend sigue consultando un job que nadie va a correr
+            if _recover_orphans(job_id=job_id):
+                row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+    finally:
+        connection.close()
+
+
+def get_job_progress(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Estado para los endpoints de progreso que ya consume el frontend: 'queued' se
+    informa como 'running' y 'cancelled' como 'error' (solo conocen esos estados).
+    """
+    job = get_job(job_id)
+    if job is None:
+        return None
+    if job.get("status") == "queued":
+        job["status"] = "running"
+    elif job.get("status") == "cancelled":
+        job["status"] = "error"
+    return job
+
+
+def list_jobs(user_id: Optional[str] = None, company: Optional[str] = None,
+              kind: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    _ensure_schema()
+    clauses, params = [], []
+    for column, value in (("user_id", user_id), ("company", company), ("kind", kind)):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    connection = _connect()
+    try:
+        rows = connection.execute(
+            f"SELECT * FROM jobs {where} ORDER BY created_at DESC LIMIT ?", (*params, limit)
+        ).fetchall()
+        return [_row_to_job(row) for row in rows]
+    finally:
+        connection.close()
+
+
+def update_job(job_id: str, **fields) -> None:
+    """Actualizar columnas (status, progress, total, message, current_item) y/o data"""
+    if not job_id or not fields:
+        return
+    _ensure_schema()
+    columns = {key: fields.pop(key) for key in list(fields) if key in JOB_COLUMNS}
+    now = time.time()
+    connection = _connect()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        row = connection.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            connection.execute("ROLLBACK")
+            return
+        assignments = [f"{column} = ?" for column in columns]
+        params: List[Any] = list(columns.values())
+        if fields:
+            data = json.loads(row["data"] or "{}")
+            data.update(fields)
+            assignments.append("data = ?")
+            params.append(json.dumps(data, default=str))
+        if columns.get("status") in FINISHED_STATUSES:
+            assignments.append("finished_at = ?")
+            params.append(now)
+        assignments.append("updated_at = ?")
+        params.append(now)
+        connection.execute(f"UPDATE jobs SET {', '.join(assignments)} WHERE id = ?", (*params, job_id))
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+
+def append_job_result(job_id: str, result: Any) -> None:
+    """Agregar un elemento a data.results (como results.append en los dicts anteriores)"""
+    _ensure_schema()
+    connection = _connect()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        row = connection.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is not None:
+            data = json.loads(row["data"] or "{}")
+            data.setdefault("results", []).append(result)
+            connection.execute(
+                "UPDATE jobs SET data = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(data, default=str), time.time(), job_id)
+            )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+
+def cancel_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Pedir la cancelación; un job en cola pasa directo a 'cancelled'. Devuelve el estado"""
+    _ensure_schema()
+    now = time.time()
+    connection = _connect()
+    try:
+        connection.execute(
+            "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status NOT IN (?, ?, ?)",
+            (now, job_id, *FINISHED_STATUSES)
+        )
+        connection.execute(
+            "UPDATE jobs SET status = 'cancelled', message = 'Cancelado', finished_at = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (now, job_id)
+        )
+    finally:
+        connection.close()
+    return get_job(job_id)
+
+
+def _purge_finished_jobs() -> None:
+    cutoff = time.time() - JOB_RETENTION_DAYS * 86400
+    connection = _connect()
+    try:
+        connection.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?, ?) AND COALESCE(finished_at, updated_at) < ?",
+            (*FINISHED_STATUSES, cutoff)
+        )
+    finally:
+        connection.close()
+
+
+def _claim(job_id: str, company: Optional[str]) -> Optional[bool]:
+    """
+    Pasar el job de 'queued' a 'running' si la compañía tiene cupo.
+
+    Returns:
+        True si se tomó, False si no hay cupo, None si ya no está en cola (cancelado)
+    """
+    connection = _connect()
+    try:
+        for attempt in range(2):
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row["status"] != "queued":
+                connection.execute("ROLLBACK")
+                return None
+            if company:
+                running = connection.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE company = ? AND status = 'running'", (company,)
+                ).fetchone()[0]
+                if running >= JOB_MAX_PER_COMPANY:
+                    connection.execute("ROLLBACK")
+                    # Un cupo puede estar tomado por un proceso que murió
+                    if attempt == 0 and _recover_orphans(company):
+                        continue
+                    return False
+            now = time.time()
+            connection.execute(
+                "UPDATE jobs SET status = 'running', owner_pid = ?, started_at = ?, updated_at = ? WHERE id = ?",
+                (os.getpid(), now, now, job_id)
+            )
+            connection.execute("COMMIT")
+            return True
+        return False
+    finally:
+        connection.close()
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+class JobContext:
+    """Handle que recibe la función del job para informar progreso y ver cancelaciones"""
+
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self._last_cancel_check = 0.0
+        self._cancelled = False
+        self._last_progress_write = 0.0
+        self._pending_progress: Optional[int] = None
+
+    def update(self, **fields) -> None:
+        update_job(self.id, **fields)
+
+    def set_progress(self, progress: int, force: bool = False, **fields) -> None:
+        """Progreso con escrituras espaciadas (para loops por item)"""
+        now = time.monotonic()
+        if force or fields or now - self._last_progress_write >= _PROGRESS_WRITE_INTERVAL:
+            self._last_progress_write = now
+            self._pending_progress = None
+            update_job(self.id, progress=progress, **fields)
+        else:
+            self._pending_progress = progress
+
+    def flush(self) -> None:
+        """Escribir el último progreso que quedó retenido por el espaciado"""
+        if self._pending_progress is not None:
+            progress, self._pending_progress = self._pending_progress, None
+            update_job(self.id, progress=progress)
+
+    def append_result(self, result: Any) -> None:
+        append_job_result(self.id, result)
+
+    def cancel_requested(self) -> bool:
+        now = time.monotonic()
+        if not self._cancelled and now - self._last_cancel_check >= _CANCEL_CHECK_INTERVAL:
+            self._last_cancel_check = now
+            job = get_job(self.id)
+            self._cancelled = bool(job and job.get("cancel_requested"))
+        return self._cancelled
+
+    def check_cancelled(self) -> None:
+        if self.cancel_requested():
+            raise JobCancelled()
+
+
+_executor = ThreadPoolExecutor(max_workers=JOB_MAX_WORKERS, thread_name_prefix="job")
+_queue: deque = deque()
+_queue_lock = threading.Lock()
+_active = 0
+_retry_timer: Optional[threading.Timer] = None
+
+
+def submit_job(
+    kind: str,
+    target: Callable[..., Any],
+    *args,
+    company: Optional[str] = None,
+    user_id: Optional[str] = None,
+    total: int = 0,
+    message: str = "",
+    current_item: str = "",
+    data: Optional[Dict[str, Any]] = None,
+    **kwargs
+) -> str:
+    """
+    Registrar y encolar un job; target(job, *args, **kwargs) corre en el pool.
+
+    Returns:
+        str: id del job (se consulta en /api/jobs/<id>)
+    """
+    _ensure_schema()
+    _purge_finished_jobs()
+    job_id = str(uuid.uuid4())
+    now = time.time()
+    payload = {"success": True}
+    payload.update(data or {})
+    connection = _connect()
+    try:
+        connection.execute(
+            "INSERT INTO jobs (id, kind, company, user_id, status, progress, total, message, current_item, "
+            "data, owner_pid, created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', 0, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, company, user_id, total, message, current_item, json.dumps(payload, default=str),
+             os.getpid(), now, now)
+        )
+    finally:
+        connection.close()
+
+    with _queue_lock:
+        _queue.append((job_id, company, target, args, kwargs, get_correlation_id()))
+    _dispatch()
+    print(f"--- Job {kind} {job_id} encolado (compañía: {company})")
+    return job_id
+
+
+def _dispatch() -> None:
+    """Arrancar los jobs en cola que tengan lugar en el pool y cupo en su compañía"""
+    global _active, _retry_timer
+    with _queue_lock:
+        blocked = deque()
+        while _queue and _active < JOB_MAX_WORKERS:
+            entry = _queue.popleft()
+            job_id, company = entry[0], entry[1]
+            try:
+                claimed = _claim(job_id, company)
+            except sqlite3.Error as exc:
+                print(f"--- Job {job_id}: no se pudo tomar ({exc})")
+                claimed = False
+            if claimed is None:
+                continue
+            if not claimed:
+                blocked.append(entry)
+                continue
+            _active += 1
+            _executor.submit(_run, *entry)
+        blocked.extend(_queue)
+        _queue.clear()
+        _queue.extend(blocked)
+
+        if _queue and _retry_timer is None:
+            _retry_timer = threading.Timer(_REQUEUE_DELAY, _retry_dispatch)
+            _retry_timer.daemon = True
+            _retry_timer.start()
+
+
+def _retry_dispatch() -> None:
+    global _retry_timer
+    with _queue_lock:
+        _retry_timer = None
+    _dispatch()
+
+
+def _run(job_id: str, company: Optional[str], target: Callable[..., Any], args, kwargs,
+         correlation_id: Optional[str] = None) -> None:
+    global _active
+    # Los logs del job llevan el correlation id del request que lo creó
+    set_correlation_id(correlation_id)
+    job = JobContext(job_id)
+    try:
+        target(job, *args, **kwargs)
+        job.flush()
+        state = get_job(job_id) or {}
+        if state.get("status") in ("queued", "running"):
+            update_job(job_id, status="completed")
+    except JobCancelled:
+        print(f"--- Job {job_id} cancelado")
+        update_job(job_id, status="cancelled", message="Cancelado")
+    except Exception as exc:
+        print(f"--- Job {job_id} falló: {exc}")
+        traceback.print_exc()
+        try:
+            update_job(job_id, status="error", message=f"Error: {exc}", success=False)
+        except Exception:
+            traceback.print_exc()
+    finally:
+        with _queue_lock:
+            _active -= 1
+        _dispatch()
+
+
+def job_runner_stats() -> Dict[str, Any]:
+    with _queue_lock:
+        return {
+            "active": _active,
+            "queued_local": len(_queue),
+            "max_workers": JOB_MAX_WORKERS,
+            "max_per_company": JOB_MAX_PER_COMPANY,
+        }
@@ -1,17 +1,35 @@
 import base64
+import hashlib
 import json
 import re
 from io import BytesIO
 from urllib.parse import quote
 
-from config import ERPNEXT_URL
+from config import (
+    ERPNEXT_URL,
+    LETTERHEAD_CACHE_TTL,
+    LOGO_CACHE_MAX_BYTES,
+    LOGO_CACHE_MAXSIZE,
+    LOGO_CACHE_TTL,
+)
 from utils.http_utils import make_erpnext_request
+from utils.ttl_cache import TTLCache
 
 PLACEHOLDER_LOGO_BASE64 = (
     "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAusB9Y2ZxXwAAAAASUVORK5CYII="
 )
 INLINE_SUFFIX = " (Inline)"
 
+# El Letter Head embebido lleva en el header un comentario con el hash de lo que lo
+# generó (HTML base + bytes del logo): si no cambió, no se vuelve a escribir
+INLINE_FINGERPRINT_VERSION = 1
+_FINGERPRINT_PATTERN = re.compile(r'<!--\s*inline-letterhead:([0-9a-f]{16,64})\s*-->')
+
+# url absoluta del logo -> (data URI, sha256 de los bytes)
+_logo_cache = TTLCache(maxsize=LOGO_CACHE_MAXSIZE, ttl=LOGO_CACHE_TTL, name="letterhead_logos")
+# compañía -> (nombre del Letter Head embebido ya verificado, hash de su contenido)
+_inline_letterhead_cache = TTLCache(maxsize=256, ttl=LETTERHEAD_CACHE_TTL, name="inline_letterheads")
+
 
 def build_file_url(file_path):
     if not file_path:
@@ -43,28 +61,40 @@ def _slugify(value):
     return value or "logo"
 
 
-def build_embedded_logo_src(session, file_path):
-    """
-    Descarga el logo desde ERPNext y devuelve un data URI para evitar dependencias de red en wkhtmltopdf.
-    """
+def _fetch_logo(session, file_path):
+    """(data URI, sha256 de los bytes) del logo, desde el cache acotado o descargándolo"""
     if not session or not file_path:
-        return None
+        return None, None
 
     absolute_url = build_file_url(file_path)
     if not absolute_url:
-        return None
+        return None, None
+
+    cached = _logo_cache.get(absolute_url)
+    if cached is not None:
+        return cached
 
     try:
         response = session.get(absolute_url, timeout=30)
         if response.status_code != 200:
             print(f"[LetterheadService] No se pudo descargar el logo ({response.status_code}) desde {absolute_url}")
-            return None
+            return None, None
         content_type = response.headers.get('Content-Type') or 'application/octet-stream'
         encoded = base64.b64encode(response.content).decode('ascii')
-        return f"data:{content_type};base64,{encoded}"
+        result = (f"data:{content_type};base64,{encoded}", hashlib.sha256(response.content).hexdigest())
+        if len(response.content) <= LOGO_CACHE_MAX_BYTES:
+            _logo_cache.set(absolute_url, result)
+        return result
     except Exception as exc:
         print(f"[LetterheadService] Error embedding logo {absolute_url}: {exc}")
-        return None
+        return None, None
+
+
+def build_embedded_logo_src(session, file_path):
+    """
+    Descarga el logo desde ERPNext y devuelve un data URI para evitar dependencias de red en wkhtmltopdf.
+    """
+    return _fetch_logo(session, file_path)[0]
 
 
 def upload_file_to_erpnext(session, headers, filename, file_obj, content_type="application/octet-stream", is_private="0",
@@ -297,8 +327,7 @@ def fetch_letterhead_by_name(session, doc_name):
     return None, None
 
 
-def _build_embedded_header_html(session, company_name, header_html, logo_url):
-    raw_logo_src = build_embedded_logo_src(session, logo_url)
+def _build_embedded_header_html(company_name, header_html, logo_url, raw_logo_src):
     if not raw_logo_src:
         return header_html
 
@@ -312,7 +341,31 @@ def _build_embedded_header_html(session, company_name, header_html, logo_url):
     return build_default_header_html(company_name, logo_url, raw_logo_src=raw_logo_src)
 
 
+def inline_letterhead_fingerprint(company_name, base_doc, logo_digest):
+    """Hash del HTML base (header, footer, logo) y de los bytes del logo"""
+    source = json.dumps([
+        INLINE_FINGERPRINT_VERSION,
+        company_name,
+        base_doc.get('header') or base_doc.get('content') or '',
+        base_doc.get('footer') or '',
+        base_doc.get('image') or '',
+        logo_digest or '',
+    ], ensure_ascii=False)
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def _read_fingerprint(doc):
+    match = _FINGERPRINT_PATTERN.search((doc or {}).get('header') or (doc or {}).get('content') or '')
+    return match.group(1) if match else None
+
+
 def ensure_inline_letterhead_doc(session, company_name, base_doc):
+    """
+    Crear o actualizar el Letter Head "<base> (Inline)" con el logo embebido.
+
+    Solo escribe si cambió el hash del HTML base + logo respecto del que tiene guardado
+    el Letter Head embebido; el logo sale del cache de data URIs.
+    """
     if not session or not company_name or not base_doc:
         return None, None
 
@@ -322,12 +375,22 @@ def ensure_inline_letterhead_doc(session, company_name, base_doc):
 
     inline_name = get_inline_letterhead_name(base_name)
     header_html = base_doc.get('header') or base_doc.get('content')
-    embedded_header = _build_embedded_header_html(session, company_name, header_html, base_doc.get('image'))
+    raw_logo_src, logo_digest = _fetch_logo(session, base_doc.get('image'))
+    fingerprint = inline_letterhead_fingerprint(company_name, base_doc, logo_digest)
+
+    existing_inline, fetch_error = fetch_letterhead_by_name(session, inline_name)
+    if fetch_error:
+        return None, fetch_error
+    if existing_inline and _read_fingerprint(existing_inline) == fingerprint:
+        _inline_letterhead_cache.set(company_name, (inline_name, fingerprint))
+        return inline_name, None
 
+    embedded_header = _build_embedded_header_html(company_name, header_html, base_doc.get('image'), raw_logo_src)
+    header = embedded_header or header_html or build_default_header_html(company_name, base_doc.get('image'))
     inline_payload = {
         'letter_head_name': inline_name,
         'source': 'HTML',
-        'header': embedded_header or header_html or build_default_header_html(company_name, base_doc.get('image')),
+        'header': f"<!-- inline-letterhead:{fingerprint} -->{header}",
         'footer': base_doc.get('footer') or build_default_footer_html(company_name),
         'image': base_doc.get('image'),
         'is_default': 0,
@@ -335,9 +398,6 @@ def ensure_inline_letterhead_doc(session, company_name, base_doc):
     }
     inline_payload['content'] = inline_payload['header']
 
-    existing_inline, fetch_error = fetch_letterhead_by_name(session, inline_name)
-    if fetch_error:
-        return None, fetch_error
     existing_name = inline_name if existing_inline else None
 
     response, error = upsert_letterhead(
@@ -348,4 +408,43 @@ def ensure_inline_letterhead_doc(session, company_name, base_doc):
     )
     if error:
         return None, error
+    _inline_letterhead_cache.set(company_name, (inline_name, fingerprint))
     return inline_name, None
+
+
+def resolve_inline_letterhead(session, company_name):
+    """
+    Nombre del Letter Head embebido de la compañía para pasar a download_pdf.
+
+    Mientras está en cache (LETTERHEAD_CACHE_TTL) no hace ninguna llamada a ERPNext;
+    al vencer se vuelve a leer el letterhead base y solo se reescribe si cambió su hash.
+
+    Returns:
+        tuple: (nombre o None, error)
+    """
+    if not company_name:
+        return None, None
+    cached = _inline_letterhead_cache.get(company_name)
+    if cached:
+        return cached[0], None
+
+    base_letterhead, base_error = fetch_letterhead(session, company_name)
+    if base_error:
+        return None, base_error
+    if not base_letterhead:
+        return None, None
+    return ensure_inline_letterhead_doc(session, company_name, base_letterhead)
+
+
+def get_inline_letterhead_fingerprint(company_name):
+    """Hash del letterhead embebido ya resuelto por resolve_inline_letterhead (o None)"""
+    cached = _inline_letterhead_cache.get(company_name) if company_name else None
+    return cached[1] if cached else None
+
+
+def invalidate_inline_letterhead(company_name=None):
+    """Olvidar el letterhead embebido resuelto (de una compañía o de todas)"""
+    if company_name:
+        _inline_letterhead_cache.invalidate(company_name)
+    else:
+        _inline_letterhead_cache.clear()
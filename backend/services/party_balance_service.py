@@ -0,0 +1,339 @@
+"""
+Saldos de clientes y proveedores en lote.
+
+Los endpoints de saldos recorrían las partes una por una (abbr de la compañía + un
+listado de facturas por parte). Este servicio, compartido por clientes y proveedores,
+resuelve todas juntas:
+
+  1. Saldos cacheados (TTL corto) por (tipo de parte, compañía, parte).
+  2. En paralelo: el Ledger Summary de la parte, una única query agrupada por parte
+     con la suma de outstanding_amount de las facturas y otra con los anticipos sin
+     aplicar (unallocated_amount) de los Payment Entry confirmados.
+  3. Las partes que no estén en el reporte toman facturas - anticipos; si la query
+     agrupada falla, se calcula por parte con un pool de threads acotado.
+
+Los pagos invalidan el cache de la parte (ver routes/pagos.py).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import json
+
+from config import PARTY_BALANCE_CACHE_TTL, PARTY_BALANCE_CACHE_MAXSIZE, PARTY_BALANCE_MAX_WORKERS
+from utils.http_utils import make_erpnext_request
+from utils.ttl_cache import TTLCache
+
+PARTY_TYPES = {
+    'Customer': {
+        'invoice_doctype': 'Sales Invoice',
+        'party_field': 'customer',
+        'ledger_report': 'Customer Ledger Summary',
+        'ledger_name_field': 'customer_name',
+        'advance_payment_type': 'Receive',
+    },
+    'Supplier': {
+        'invoice_doctype': 'Purchase Invoice',
+        'party_field': 'supplier',
+        'ledger_report': 'Supplier Ledger Summary',
+        'ledger_name_field': 'supplier_name',
+        'advance_payment_type': 'Pay',
+    },
+}
+
+# Partes por query agrupada (va por POST, sin límite de URL)
+AGGREGATE_CHUNK_SIZE = 1000
+
+_balance_cache = TTLCache(
+    maxsize=PARTY_BALANCE_CACHE_MAXSIZE,
+    ttl=PARTY_BALANCE_CACHE_TTL,
+    name="party_balances"
+)
+
+
+def _safe_float(value, default=0.0):
+    try:
+        if value in (None, ''):
+            return default
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _cache_key(party_type, company, party_name):
+    return (party_type, company, party_name)
+
+
+def fetch_ledger_closing_map(session, party_type, company):
+    """Saldo de cierre por parte según el Ledger Summary de los últimos 30 días"""
+    config = PARTY_TYPES[party_type]
+    closing_balance_map = {}
+    try:
+        to_date = datetime.utcnow().date()
+        from_date = to_date - timedelta(days=30)
+        report_params = {
+            "report_name": config['ledger_report'],
+            "filters": json.dumps({
+                "company": company,
+                "from_date": from_date.strftime("%Y-%m-%d"),
+                "to_date": to_date.strftime("%Y-%m-%d")
+            }),
+            "ignore_prepared_report": "false",
+            "are_default_filters": "false"
+        }
+        report_response, report_error = make_erpnext_request(
+            session=session,
+            method="GET",
+            endpoint="/api/method/frappe.desk.query_report.run",
+            params=report_params,
+            operation_name=f"Fetch {config['ledger_report']}"
+        )
+
+        if not report_error and report_response and report_response.status_code == 200:
+            report_payload = report_response.json()
+            for row in report_payload.get("message", {}).get("result", []):
+                if not isinstance(row, dict):
+                    continue
+                party_key = row.get(config['ledger_name_field']) or row.get("party_name") or row.get("party")
+                if not party_key:
+                    continue
+                closing_balance = row.get("closing_balance")
+                if closing_balance is None:
+                    continue
+                closing_balance_map[party_key] = closing_balance
+                if " - " in party_key:
+                    closing_balance_map[party_key.split(" - ")[0]] = closing_balance
+    except Exception as err:
+        print(f" Error obteniendo reporte de saldos: {err}")
+    return closing_balance_map
+
+
+def fetch_aggregated_outstanding(session, party_type, company, party_names):
+    """
+    Suma de outstanding_amount y cantidad de facturas por parte, agrupado en ERPNext.
+
+    Returns:
+        dict | None: parte -> {outstanding_amount, invoice_count}; None si la query falló
+    """
+    config = PARTY_TYPES[party_type]
+    party_field = config['party_field']
+    unique_names = sorted({name for name in party_names if name})
+    result = {}
+
+    for start in range(0, len(unique_names), AGGREGATE_CHUNK_SIZE):
+        chunk = unique_names[start:start + AGGREGATE_CHUNK_SIZE]
+        response, error = make_erpnext_request(
+            session=session,
+            method="POST",
+            endpoint="/api/method/frappe.client.get_list",
+            data={
+                "doctype": config['invoice_doctype'],
+                "fields": [
+                    party_field,
+                    "sum(outstanding_amount) as outstanding_amount",
+                    "count(name) as invoice_count"
+                ],
+                "filters": [
+                    [party_field, "in", chunk],
+                    ["company", "=", company],
+                    ["docstatus", "=", 1]
+                ],
+                "group_by": party_field,
+                "limit_page_length": 0
+            },
+            operation_name=f"Aggregate {config['invoice_doctype']} outstanding"
+        )
+        if error or not response or response.status_code != 200:
+            print(f"--- Saldos agrupados: error ({error}), se usa cálculo por parte")
+            return None
+        for row in response.json().get("message", []) or []:
+            party = row.get(party_field)
+            if party:
+                result[party] = {
+                    "outstanding_amount": _safe_float(row.get("outstanding_amount")),
+                    "invoice_count": int(row.get("invoice_count") or 0)
+                }
+    return result
+
+
+def fetch_aggregated_advances(session, party_type, company, party_names):
+    """
+    Anticipos sin aplicar por parte (Payment Entry confirmados con unallocated_amount).
+
+    Returns:
+        dict: parte -> monto; las partes sin anticipos no aparecen. Si la query falla
+        se devuelve {} (el saldo queda igual al outstanding de las facturas).
+    """
+    config = PARTY_TYPES[party_type]
+    unique_names = sorted({name for name in party_names if name})
+    result = {}
+
+    for start in range(0, len(unique_names), AGGREGATE_CHUNK_SIZE):
+        chunk = unique_names[start:start + AGGREGATE_CHUNK_SIZE]
+        response, error = make_erpnext_request(
+            session=session,
+            method="POST",
+            endpoint="/api/method/frappe.client.get_list",
+            data={
+                "doctype": "Payment Entry",
+                "fields": ["party", "sum(unallocated_amount) as unallocated_amount"],
+                "filters": [
+                    ["party_type", "=", party_type],
+                    ["party", "in", chunk],
+                    ["company", "=", company],
+                    ["payment_type", "=", config['advance_payment_type']],
+                    ["docstatus", "=", 1],
+                    ["unallocated_amount", ">", 0]
+                ],
+                "group_by": "party",
+                "limit_page_length": 0
+            },
+            operation_name=f"Aggregate {party_type} advances"
+        )
+        if error or not response or response.status_code != 200:
+            print(f"--- Anticipos agrupados: error ({error})")
+            return {}
+        for row in response.json().get("message", []) or []:
+            if row.get("party"):
+                result[row["party"]] = _safe_float(row.get("unallocated_amount"))
+    return result
+
+
+def _fetch_party_outstanding(session, party_type, company, search_names):
+    """Fallback por parte: lista las facturas y suma outstanding_amount"""
+    config = PARTY_TYPES[party_type]
+    invoice_filters = [
+        [config['party_field'], "in", list(search_names)],
+        ["company", "=", company],
+        ["docstatus", "=", 1],
+    ]
+    response, error = make_erpnext_request(
+        session=session,
+        method="GET",
+        endpoint=f"/api/resource/{config['invoice_doctype']}",
+        params={
+            "fields": json.dumps(["outstanding_amount"]),
+            "filters": json.dumps(invoice_filters),
+            "limit_page_length": 0
+        },
+        operation_name=f"Fetch {party_type} Balance"
+    )
+    if error or not response or response.status_code != 200:
+        return {"outstanding_amount": 0, "invoice_count": 0}
+    invoices = response.json().get("data", [])
+    return {
+        "outstanding_amount": sum(_safe_float(invoice.get("outstanding_amount")) for invoice in invoices),
+        "invoice_count": len(invoices)
+    }
+
+
+def get_party_balances(
+    session,
+    party_type: str,
+    company: str,
+    party_names: Iterable[str],
+    resolve_name: Optional[Callable[[str], str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Saldos de varias partes de una compañía.
+
+    Args:
+        resolve_name: convierte el nombre recibido al nombre con sigla de la compañía
+
+    Returns:
+        dict: nombre recibido -> {outstanding_amount, invoice_count, source}
+              source: 'ledger' (Ledger Summary), 'aggregate' o 'fallback'
+    """
+    requested = [name for name in dict.fromkeys(party_names) if name]
+    balances = {}
+    missing = []
+    for name in requested:
+        cached = _balance_cache.get(_cache_key(party_type, company, name))
+        if cached is not None:
+            balances[name] = cached
+        else:
+            missing.append(name)
+
+    if not missing:
+        return balances
+
+    # Cada nombre puede estar en ERPNext con o sin la sigla de la compañía
+    candidates = {}
+    for name in missing:
+        search_name = resolve_name(name) if resolve_name else name
+        candidates[name] = [search_name] if search_name == name else [search_name, name]
+    all_candidates = [candidate for names in candidates.values() for candidate in names]
+
+    # Reporte y queries agrupadas corren en paralelo: una sola espera para toda la lista
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        ledger_future = pool.submit(fetch_ledger_closing_map, session, party_type, company)
+        aggregate_future = pool.submit(fetch_aggregated_outstanding, session, party_type, company, all_candidates)
+        advances_future = pool.submit(fetch_aggregated_advances, session, party_type, company, all_candidates)
+        closing_balance_map = ledger_future.result()
+        aggregated = aggregate_future.result()
+        advances = advances_future.result()
+
+    fallback = []
+    for name in missing:
+        closing_balance = None
+        for candidate in candidates[name]:
+            closing_balance = closing_balance_map.get(candidate)
+            if closing_balance is not None:
+                break
+        if closing_balance is not None:
+            balances[name] = {
+                "outstanding_amount": _safe_float(closing_balance),
+                "invoice_count": 0,
+                "source": "ledger"
+            }
+        elif aggregated is not None:
+            rows = [aggregated[candidate] for candidate in candidates[name] if candidate in aggregated]
+            advance = sum(advances.get(candidate, 0.0) for candidate in candidates[name])
+            balances[name] = {
+                "outstanding_amount": sum(row["outstanding_amount"] for row in rows) - advance,
+                "invoice_count": sum(row["invoice_count"] for row in rows),
+                "source": "aggregate"
+            }
+        else:
+            fallback.append(name)
+
+    if fallback:
+        workers = max(1, min(PARTY_BALANCE_MAX_WORKERS, len(fallback)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(
+                lambda name: _fetch_party_outstanding(session, party_type, company, candidates[name]),
+                fallback
+            )
+            for name, result in zip(fallback, results):
+                advance = sum(advances.get(candidate, 0.0) for candidate in candidates[name])
+                balances[name] = dict(
+                    result,
+                    outstanding_amount=result["outstanding_amount"] - advance,
+                    source="fallback"
+                )
+
+    for name in missing:
+        _balance_cache.set(_cache_key(party_type, company, name), balances[name])
+    return balances
+
+
+def invalidate_party_balances(party_type: Optional[str] = None, company: Optional[str] = None,
+                              party_names: Optional[List[str]] = None) -> int:
+    """Descartar saldos cacheados (todos, por tipo, por compañía y/o por partes)"""
+    names = set()
+    for name in party_names or []:
+        if name:
+            names.add(name)
+            names.add(name.split(" - ")[0])
+
+    def matches(key):
+        key_type, key_company, key_party = key
+        if party_type and key_type != party_type:
+            return False
+        if company and key_company != company:
+            return False
+        if names and key_party not in names and key_party.split(" - ")[0] not in names:
+            return False
+        return True
+
+    return _balance_cache.invalidate_where(matches)
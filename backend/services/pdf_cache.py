@@ -0,0 +1,235 @@
+"""
+Cache en disco de PDFs de documentos (download_pdf de ERPNext).
+
+La clave es el hash de (doctype, nombre, `modified`, print format y su `modified`,
+no_letterhead, hash del letterhead embebido): si el documento, el formato o el
+membrete cambian la clave es otra y la entrada vieja queda para la evicción. El
+`modified` del Print Format se relee cada PRINT_FORMAT_CACHE_TTL segundos; para que un
+cambio se vea al instante está POST /api/document-formats/pdf-cache/clear. Solo se cachean documentos
+confirmados o cancelados (docstatus >= 1), que ya no se editan.
+
+- Los PDFs se escriben en PDF_CACHE_DIR mientras se envían al cliente (tee de los
+  chunks a un archivo temporal + os.replace al terminar); si la descarga se corta,
+  el temporal se descarta y nunca queda un PDF a medio escribir.
+- LRU por tamaño total: un hit actualiza el mtime del archivo y, cuando el directorio
+  supera PDF_CACHE_MAX_BYTES, se borran los menos usados recientemente.
+- Contadores de hits/misses/escrituras/evicciones por proceso (pdf_cache_stats).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from config import PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES, PDF_STREAM_CHUNK_SIZE
+
+CACHE_VERSION = 2
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "bypass": 0, "stores": 0, "aborted": 0, "evictions": 0}
+# Tamaño aproximado del directorio (None = todavía no se recorrió en este proceso)
+_approx_bytes: Optional[int] = None
+
+
+def _count(counter: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[counter] += amount
+
+
+def record_bypass() -> None:
+    """Descarga que no pasa por el cache (borradores, sin `modified`)"""
+    _count("bypass")
+
+
+def pdf_cache_key(doc_type, doc_name, modified, format_name, no_letterhead, letterhead_hash=None,
+                  format_version=None) -> str:
+    source = json.dumps([
+        CACHE_VERSION,
+        doc_type,
+        doc_name,
+        str(modified),
+        format_name,
+        format_version or '',
+        str(no_letterhead),
+        letterhead_hash or '',
+    ], ensure_ascii=False)
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def _entry_path(key: str) -> str:
+    return os.path.join(PDF_CACHE_DIR, key[:2], f"{key}.pdf")
+
+
+def open_cached_pdf(key: str):
+    """
+    Archivo cacheado abierto en modo binario (y marcado como usado) o None si no está.
+    """
+    path = _entry_path(key)
+    try:
+        handle = open(path, 'rb')
+    except FileNotFoundError:
+        _count("misses")
+        return None
+    except OSError as exc:
+        print(f"[PdfCache] No se pudo leer {path}: {exc}")
+        _count("misses")
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    _count("hits")
+    return handle
+
+
+def iter_file(handle, chunk_size: int = PDF_STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Enviar un archivo abierto por bloques y cerrarlo al terminar (o si se corta)"""
+    try:
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        handle.close()
+
+
+def stream_and_store(key: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Reenviar los chunks de ERPNext al cliente y guardarlos a la vez en el cache.
+
+    El archivo solo se publica si el stream terminó completo; si el cliente corta la
+    descarga o ERPNext falla a mitad, el temporal se borra.
+    """
+    path = _entry_path(key)
+    handle = None
+    temp_path = None
+    try:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(prefix=f".{key[:16]}.", suffix=".tmp", dir=directory)
+        handle = os.fdopen(descriptor, 'wb')
+    except OSError as exc:
+        print(f"[PdfCache] No se pudo crear el archivo temporal para {key[:16]}: {exc}")
+        handle = None
+
+    completed = False
+    written = 0
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if handle is not None:
+                try:
+                    handle.write(chunk)
+                    written += len(chunk)
+                except OSError as exc:
+                    print(f"[PdfCache] Error escribiendo {key[:16]}: {exc}")
+                    handle.close()
+                    handle = None
+            yield chunk
+        completed = True
+    finally:
+        if handle is not None:
+            handle.close()
+            if completed and written:
+                try:
+                    os.replace(temp_path, path)
+                    temp_path = None
+                    _count("stores")
+                    _register_written(written)
+                except OSError as exc:
+                    print(f"[PdfCache] No se pudo publicar {key[:16]}: {exc}")
+            else:
+                _count("aborted")
+        if temp_path:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+
+
+def _iter_entries():
+    """(path, tamaño, mtime) de cada PDF del cache"""
+    try:
+        buckets = os.scandir(PDF_CACHE_DIR)
+    except FileNotFoundError:
+        return
+    with buckets:
+        for bucket in buckets:
+            if not bucket.is_dir():
+                continue
+            with os.scandir(bucket.path) as files:
+                for entry in files:
+                    if not entry.name.endswith('.pdf'):
+                        continue
+                    try:
+                        info = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield entry.path, info.st_size, info.st_mtime
+
+
+def _register_written(size: int) -> None:
+    global _approx_bytes
+    with _stats_lock:
+        if _approx_bytes is not None:
+            _approx_bytes += size
+        needs_scan = _approx_bytes is None or _approx_bytes > PDF_CACHE_MAX_BYTES
+    if needs_scan:
+        evict_pdf_cache()
+
+
+def evict_pdf_cache(max_bytes: Optional[int] = None) -> int:
+    """
+    Borrar los PDFs usados hace más tiempo hasta quedar por debajo de max_bytes.
+
+    Recorre el directorio (lo comparten todos los workers), así que también corrige
+    el tamaño aproximado que lleva este proceso.
+
+    Returns:
+        int: archivos borrados
+    """
+    global _approx_bytes
+    limit = PDF_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = sorted(_iter_entries(), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for path, size, _ in entries:
+        if total <= limit:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            print(f"[PdfCache] No se pudo borrar {path}: {exc}")
+            continue
+        total -= size
+        removed += 1
+    with _stats_lock:
+        _approx_bytes = total
+        _stats["evictions"] += removed
+    return removed
+
+
+def clear_pdf_cache() -> int:
+    """Vaciar el cache completo (p. ej. al cambiar un print format)"""
+    return evict_pdf_cache(max_bytes=0)
+
+
+def pdf_cache_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    entries = list(_iter_entries())
+    stats.update({
+        "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+        "files": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+        "max_bytes": PDF_CACHE_MAX_BYTES,
+        "path": PDF_CACHE_DIR,
+    })
+    return stats
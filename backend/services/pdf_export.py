@@ -0,0 +1,287 @@
+"""
+Exportación de PDFs de documentos en lote (un zip por job).
+
+Los documentos se eligen por lista de nombres o por filtros de ERPNext. El job:
+
+  - Renderiza cada PDF con download_pdf (DOWNLOAD_ENDPOINT) en un pool acotado
+    (PDF_EXPORT_MAX_WORKERS), todos con el mismo letterhead embebido resuelto una vez
+    al crear el job. Los documentos confirmados pasan por el cache de PDFs.
+  - Cada PDF llega por bloques a un archivo temporal y se copia al zip desde el
+    thread del job a medida que los renders terminan: nunca hay PDFs enteros en
+    memoria ni más de un puñado de temporales abiertos.
+  - Informa progreso y errores por documento en /api/jobs/<id>; el zip queda en
+    PDF_EXPORT_DIR hasta que vence JOB_RETENTION_DAYS.
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import (
+    JOB_RETENTION_DAYS,
+    PDF_EXPORT_DIR,
+    PDF_EXPORT_MAX_WORKERS,
+    PDF_STREAM_CHUNK_SIZE,
+    PRINT_FORMAT_CACHE_TTL,
+)
+from services.pdf_cache import open_cached_pdf, pdf_cache_key, stream_and_store
+from utils.frappe_list import fetch_list_by_names, fetch_list_paged
+from utils.http_utils import make_erpnext_request
+from utils.ttl_cache import TTLCache
+
+DOWNLOAD_ENDPOINT = "/api/method/frappe.utils.print_format.download_pdf"
+EXPORT_FIELDS = ["name", "modified", "docstatus"]
+# PDFs chicos quedan en memoria; los más grandes pasan a disco
+_SPOOL_MAX_SIZE = 1024 * 1024
+
+# nombre del Print Format -> `modified` ('' si no es un Print Format, p. ej. Standard)
+_print_format_versions = TTLCache(maxsize=256, ttl=PRINT_FORMAT_CACHE_TTL, name="print_format_versions")
+
+
+def get_print_format_version(session, format_name: str) -> Optional[str]:
+    """
+    `modified` del Print Format para la clave del cache de PDFs.
+
+    Returns:
+        str o None: '' si no existe como Print Format; None si no se pudo leer (en ese
+        caso el PDF no se cachea)
+    """
+    if not format_name or format_name == 'Standard':
+        return ''
+
+    def load():
+        response, error = make_erpnext_request(
+            session=session,
+            method='GET',
+            endpoint="/api/resource/Print Format",
+            params={
+                'filters': json.dumps([["name", "=", format_name]]),
+                'fields': json.dumps(["modified"]),
+                'limit_page_length': 1
+            },
+            operation_name=f'Get Print Format version {format_name}'
+        )
+        if error or not response or response.status_code != 200:
+            return None
+        rows = response.json().get('data') or []
+        return str(rows[0].get('modified') or '') if rows else ''
+
+    return _print_format_versions.get_or_load(format_name, load)
+
+
+def clear_print_format_versions() -> None:
+    _print_format_versions.clear()
+
+
+def request_pdf_stream(session, doc_type, doc_name, format_name, no_letterhead, letterhead=None):
+    """
+    Pedir el PDF a ERPNext sin leer el cuerpo (ver iter_response_chunks).
+
+    Returns:
+        tuple: (response, error) de make_erpnext_request
+    """
+    params = {
+        'doctype': doc_type,
+        'name': doc_name,
+        'format': format_name,
+        'no_letterhead': no_letterhead
+    }
+    if letterhead:
+        params['letterhead'] = letterhead
+    return make_erpnext_request(
+        session=session,
+        method='GET',
+        endpoint=DOWNLOAD_ENDPOINT,
+        params=params,
+        custom_headers={'Accept': 'application/pdf'},
+        operation_name=f'Download PDF {doc_type}:{doc_name}',
+        stream=True
+    )
+
+
+def iter_response_chunks(response, chunk_size: int = PDF_STREAM_CHUNK_SIZE):
+    """Bloques del cuerpo de una respuesta en stream; la cierra al terminar o cortarse"""
+    try:
+        yield from response.iter_content(chunk_size=chunk_size)
+    finally:
+        response.close()
+
+
+def list_export_documents(session, doc_type: str, names: Optional[Iterable[str]] = None,
+                          filters: Optional[List[Any]] = None):
+    """
+    Documentos a exportar con su `modified` y docstatus.
+
+    Con names se respeta el orden recibido y los que no existen vuelven en `missing`.
+
+    Returns:
+        tuple: (filas, nombres no encontrados, error)
+    """
+    if names is not None:
+        ordered = list(dict.fromkeys(name for name in names if name))
+        rows, error = fetch_list_by_names(
+            session, doc_type, ordered, EXPORT_FIELDS,
+            operation_name=f"Get {doc_type} for PDF export"
+        )
+        if error:
+            return [], [], error
+        by_name = {row.get("name"): row for row in rows}
+        return (
+            [by_name[name] for name in ordered if name in by_name],
+            [name for name in ordered if name not in by_name],
+            None
+        )
+
+    rows, error = fetch_list_paged(
+        session,
+        doc_type,
+        EXPORT_FIELDS,
+        filters or [],
+        order_by="name asc",
+        operation_name=f"List {doc_type} for PDF export"
+    )
+    return rows, [], error
+
+
+def _archive_name(doc_name: str) -> str:
+    return re.sub(r'[\\/:*?"<>|]+', '_', doc_name).strip() or 'documento'
+
+
+def export_path(job_id: str) -> str:
+    return os.path.join(PDF_EXPORT_DIR, f"{job_id}.zip")
+
+
+def purge_old_exports() -> int:
+    """Borrar los zips (y temporales huérfanos) con más de JOB_RETENTION_DAYS"""
+    cutoff = time.time() - JOB_RETENTION_DAYS * 86400
+    removed = 0
+    try:
+        entries = list(os.scandir(PDF_EXPORT_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def render_document_pdf(session, doc_type: str, row: Dict[str, Any], options: Dict[str, Any]):
+    """
+    PDF de un documento en un archivo temporal posicionado al inicio.
+
+    Returns:
+        tuple: (archivo abierto o None, mensaje de error)
+    """
+    doc_name = row.get("name")
+    cache_key = None
+    format_version = options.get("format_version")
+    if row.get("modified") and int(row.get("docstatus") or 0) >= 1 and format_version is not None:
+        cache_key = pdf_cache_key(
+            doc_type, doc_name, row["modified"], options["format"], options["no_letterhead"],
+            options.get("letterhead_hash"), format_version
+        )
+        cached = open_cached_pdf(cache_key)
+        if cached:
+            return cached, None
+
+    response, error = request_pdf_stream(
+        session, doc_type, doc_name, options["format"], options["no_letterhead"], options.get("letterhead")
+    )
+    if error:
+        return None, error.get("message") or "No se pudo generar el PDF"
+
+    chunks = iter_response_chunks(response)
+    if cache_key:
+        chunks = stream_and_store(cache_key, chunks)
+    spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE, dir=PDF_EXPORT_DIR)
+    try:
+        for chunk in chunks:
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, None
+
+
+def run_pdf_export(job, session, doc_type: str, rows: List[Dict[str, Any]], missing: List[str],
+                   options: Dict[str, Any], file_name: str) -> None:
+    """Función del job (services/job_runner): arma el zip en PDF_EXPORT_DIR/<job_id>.zip"""
+    os.makedirs(PDF_EXPORT_DIR, exist_ok=True)
+    purge_old_exports()
+    target_path = export_path(job.id)
+    temp_path = f"{target_path}.tmp"
+    failed = [{"name": name, "error": "Documento no encontrado"} for name in missing]
+    done = len(missing)
+    exported = 0
+    job.update(status="running", progress=done, message=f"Generando {len(rows)} PDFs...")
+
+    window = max(1, PDF_EXPORT_MAX_WORKERS) * 2
+    pending_rows = iter(rows)
+    try:
+        with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive, \
+                ThreadPoolExecutor(max_workers=max(1, PDF_EXPORT_MAX_WORKERS), thread_name_prefix="pdf-export") as pool:
+            in_flight = {}
+
+            def fill():
+                # Pocos renders adelantados: los temporales se vacían al zip a medida que terminan
+                while len(in_flight) < window:
+                    row = next(pending_rows, None)
+                    if row is None:
+                        return
+                    in_flight[pool.submit(render_document_pdf, session, doc_type, row, options)] = row
+
+            fill()
+            while in_flight:
+                finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    row = in_flight.pop(future)
+                    try:
+                        handle, error = future.result()
+                    except Exception as exc:
+                        handle, error = None, str(exc)
+                    if handle is None:
+                        failed.append({"name": row.get("name"), "error": error})
+                    else:
+                        with handle, archive.open(f"{_archive_name(row['name'])}.pdf", 'w') as member:
+                            shutil.copyfileobj(handle, member, PDF_STREAM_CHUNK_SIZE)
+                        exported += 1
+                    done += 1
+                    job.set_progress(done)
+                if job.cancel_requested():
+                    for future in in_flight:
+                        future.cancel()
+                    job.check_cancelled()
+                fill()
+
+            if failed:
+                lines = [f"{entry['name']}: {entry['error']}" for entry in failed]
+                archive.writestr("errores.txt", "\n".join(lines) + "\n")
+        os.replace(temp_path, target_path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+    job.update(
+        status="completed",
+        progress=done,
+        message=f"{exported} PDFs exportados" + (f", {len(failed)} con error" if failed else ""),
+        current_item="",
+        exported=exported,
+        failed=failed,
+        file_name=file_name,
+        download_url=f"/api/document-formats/pdf-export/{job.id}/download"
+    )
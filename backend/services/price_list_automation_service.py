@@ -17,9 +17,9 @@ from datetime import datetime
 from config import ERPNEXT_URL, PRICE_PIVOT_CURRENCY
 from utils.http_utils import make_erpnext_request, handle_erpnext_error
 
-# Reuse translator and safe evaluator from the route module to ensure
-# consistent behavior with the price_list_automation routes.
-from routes.price_list_automation import _translate_and_sanitize_formula, safe_eval_formula, _build_csv_rows_for_updates
+# Same compiled formulas as the price_list_automation routes (translated/validated once per formula text)
+from utils.price_formula import compile_formula, FormulaBooleanResult
+from routes.price_list_automation import _build_csv_rows_for_updates
 
 # Import company abbr utilities
 from routes.general import get_company_abbr, add_company_abbr, get_company_default_currency
@@ -205,22 +205,41 @@ def calculate_sale_price(purchase_price: float, formula: str, context: Dict[str,
         actual = float(context.get('actual', 0) or 0)
         compra = float(purchase_price or context.get('compra') or context.get('cost') or 0)
 
-        pyexpr = _translate_and_sanitize_formula(formula or '')
-        if not pyexpr:
+        if not (formula or '').strip():
             return (None, 'Empty formula')
 
-        result = safe_eval_formula(pyexpr, actual=actual, compra=compra)
-
         # We expect numeric result for a rate; booleans are considered invalid for rate
-        if isinstance(result, bool):
-            return (None, 'Formula evaluated to boolean; numeric rate expected')
-
-        return (float(result), '')
+        return (compile_formula(formula).evaluate_rate(actual=actual, compra=compra), '')
+    except FormulaBooleanResult as e:
+        return (None, str(e))
     except Exception as e:
         tb = traceback.format_exc()
         return (None, f'Formula evaluation error: {e} - {tb}')
 
 
+def calculate_sale_prices(compras: List[float], formula: str, actuals: List[float] = None) -> Tuple[List[float], Dict[int, str]]:
+    """Batch version of calculate_sale_price: one compile, NumPy evaluation when possible.
+
+    Returns:
+        Tuple of (rates, errors) where rates[i] is a float or None and errors maps
+        row index -> error message (same messages as calculate_sale_price, without traceback).
+    """
+    if not (formula or '').strip():
+        return ([None] * len(compras), {index: 'Empty formula' for index in range(len(compras))})
+    try:
+        compiled = compile_formula(formula)
+    except Exception as e:
+        message = f'Formula evaluation error: {e}'
+        return ([None] * len(compras), {index: message for index in range(len(compras))})
+
+    rates, row_errors = compiled.evaluate_batch(compras, actuals)
+    errors = {
+        index: str(error) if isinstance(error, FormulaBooleanResult) else f'Formula evaluation error: {error}'
+        for index, error in row_errors.items()
+    }
+    return (rates, errors)
+
+
 def build_bulk_payload(items: List[Dict[str, Any]], auto_price_lists: List[Dict[str, Any]], list_type: str = 'sales', source_currency: str = None, source_exchange_rate: float = None, pivot_currency: str = None, sale_price_map: Dict = None, company_abbr: str = None) -> Dict[str, Any]:
     """Build payload(s) required for bulk import of updated prices.
 
@@ -256,35 +275,33 @@ def build_bulk_payload(items: List[Dict[str, Any]], auto_price_lists: List[Dict[
             processed_item['item_code'] = add_company_abbr(item_code, company_abbr)
         processed_items.append(processed_item)
 
-    for item in processed_items:
+    # Compute compra/actual in pivot currency (ARS); they don't depend on the price list
+    compras = [float(item.get('compra') or item.get('cost') or 0) for item in processed_items]
+    actuals = [float(item.get('actual') or 0) for item in processed_items]
+    if source_currency and source_currency != pivot_currency and source_exchange_rate and float(source_exchange_rate) > 0:
+        compras = [compra * float(source_exchange_rate) for compra in compras]
+        actuals = [actual * float(source_exchange_rate) for actual in actuals]
+    # else: no exchange rate provided for source; assume no conversion
+
+    # Evaluate each formula once over every item, in pivot currency (so price.compra refers to pivot)
+    rates_by_list = {}
+    for pl_index, pl in enumerate(auto_price_lists):
+        if pl.get('auto_update_enabled'):
+            rates_by_list[pl_index] = calculate_sale_prices(compras, pl.get('auto_update_formula') or '', actuals)
+
+    for item_index, item in enumerate(processed_items):
         item_code = item.get('item_code')
-        compra = float(item.get('compra') or item.get('cost') or 0)
-        actual = float(item.get('actual') or 0)
 
-        for pl in auto_price_lists:
+        for pl_index, pl in enumerate(auto_price_lists):
             if not pl.get('auto_update_enabled'):
                 continue
-            formula = pl.get('auto_update_formula') or ''
             try:
                 # Determine currencies and exchange rates
                 selling_currency = (pl.get('currency'))
                 selling_exchange = float(pl.get('custom_exchange_rate') or 0.0)
 
-                # Compute compra in pivot currency (ARS)
-                if not source_currency or source_currency == pivot_currency:
-                    compra_in_pivot = compra
-                    actual_in_pivot = actual
-                else:
-                    if source_exchange_rate and float(source_exchange_rate) > 0:
-                        compra_in_pivot = compra * float(source_exchange_rate)
-                        actual_in_pivot = actual * float(source_exchange_rate)
-                    else:
-                        # No exchange rate provided for source; assume no conversion and log a warning
-                        compra_in_pivot = compra
-                        actual_in_pivot = actual
-
-                # Evaluate formula in pivot currency (so price.compra in formulas refers to pivot)
-                rate_pivot, err = calculate_sale_price(compra_in_pivot, formula, {'actual': actual_in_pivot, 'compra': compra_in_pivot})
+                rates, errors = rates_by_list[pl_index]
+                rate_pivot, err = rates[item_index], errors.get(item_index)
                 if err:
                     updates.append({'item_code': item_code, 'price_list': pl.get('price_list_name') or pl.get('name'), 'error': err})
                     continue
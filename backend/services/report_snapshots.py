@@ -0,0 +1,165 @@
+"""
+Snapshots persistidos de reportes fiscales por (compañía, tipo de reporte, período).
+
+Cada snapshot guarda, por comprobante, el `modified` con el que se calculó y las filas
+que aportó al reporte. Al volver a pedir el reporte siempre se lista el período
+(name + modified) y solo se recalculan los comprobantes nuevos o cuyo `modified`
+cambió; se descartan los que ya no están en el período (cancelados o movidos). Los
+cierres de mes bloquean cuentas, no facturas, así que ni un período cerrado se sirve
+sin ese listado.
+
+Limitación: las filas también dependen de datos que no cambian el `modified` del
+comprobante (provincia y condición de IVA de la parte, tasas de los templates de
+impuestos). Para eso cada snapshot guarda un `context` (huella de lo que el reporte
+puede obtener barato, p. ej. las tasas) que invalida el snapshot entero si cambia, y
+vence a las REPORT_SNAPSHOT_MAX_AGE_HOURS: un cambio en los datos de una parte se
+refleja como mucho con ese atraso (o al instante con el endpoint de rebuild).
+
+Los snapshots se guardan como un JSON por clave en REPORT_SNAPSHOT_DIR, escritos con
+archivo temporal + rename para que un proceso nunca lea un archivo a medio escribir.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from config import REPORT_SNAPSHOT_DIR, REPORT_SNAPSHOT_MAX_AGE_HOURS
+
+SNAPSHOT_VERSION = 2
+
+_key_locks: Dict[str, threading.Lock] = {}
+_key_locks_guard = threading.Lock()
+
+
+def _snapshot_key(company: str, report_type: str, period: str) -> str:
+    return f"{company}::{report_type}::{period}"
+
+
+def _snapshot_path(company: str, report_type: str, period: str) -> str:
+    digest = hashlib.sha1(_snapshot_key(company, report_type, period).encode("utf-8")).hexdigest()[:16]
+    safe_type = "".join(ch for ch in report_type if ch.isalnum() or ch in "-_")
+    return os.path.join(REPORT_SNAPSHOT_DIR, f"{safe_type}_{period}_{digest}.json")
+
+
+def snapshot_lock(company: str, report_type: str, period: str) -> threading.Lock:
+    """Lock por clave para que dos requests simultáneos no refresquen el mismo snapshot"""
+    key = _snapshot_key(company, report_type, period)
+    with _key_locks_guard:
+        lock = _key_locks.get(key)
+        if lock is None:
+            lock = threading.Lock()
+            _key_locks[key] = lock
+        return lock
+
+
+def snapshot_context(*parts: Any) -> str:
+    """Huella de los datos externos con los que se calcularon las filas"""
+    encoded = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+def _is_expired(snapshot: Dict[str, Any], max_age_hours: float) -> bool:
+    if not max_age_hours or max_age_hours <= 0:
+        return False
+    try:
+        built_at = datetime.fromisoformat(snapshot.get("built_at"))
+    except (TypeError, ValueError):
+        return True
+    age = datetime.now(timezone.utc) - built_at
+    return age.total_seconds() > max_age_hours * 3600
+
+
+def load_snapshot(company: str, report_type: str, period: str, context: Optional[str] = None,
+                  max_age_hours: float = REPORT_SNAPSHOT_MAX_AGE_HOURS) -> Optional[Dict[str, Any]]:
+    """Snapshot guardado, o None si no existe, es de otra versión/contexto o ya venció"""
+    path = _snapshot_path(company, report_type, period)
+    try:
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as handler:
+            data = json.load(handler)
+    except Exception as exc:
+        print(f"[ReportSnapshots] Failed to read snapshot {path}: {exc}")
+        return None
+
+    if data.get("version") != SNAPSHOT_VERSION or data.get("key") != _snapshot_key(company, report_type, period):
+        return None
+    if data.get("context") != context or _is_expired(data, max_age_hours):
+        return None
+    return data
+
+
+def save_snapshot(company: str, report_type: str, period: str, documents: Dict[str, Any],
+                  extra: Optional[Dict[str, Any]] = None, context: Optional[str] = None,
+                  built_at: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Persistir el snapshot (documents: name -> {modified, rows, ...}).
+
+    built_at es el momento en que se calculó desde cero (el del snapshot anterior en
+    un refresco incremental): el vencimiento cuenta desde ahí, no desde el último
+    refresco, porque los comprobantes sin cambios no se recalculan.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "key": _snapshot_key(company, report_type, period),
+        "company": company,
+        "report_type": report_type,
+        "period": period,
+        "context": context,
+        "built_at": built_at or now,
+        "updated_at": now,
+        "documents": documents,
+    }
+    if extra:
+        snapshot.update(extra)
+
+    path = _snapshot_path(company, report_type, period)
+    try:
+        os.makedirs(REPORT_SNAPSHOT_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=REPORT_SNAPSHOT_DIR, prefix=".snapshot-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as handler:
+                json.dump(snapshot, handler, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    except Exception as exc:
+        print(f"[ReportSnapshots] Failed to persist snapshot {path}: {exc}")
+    return snapshot
+
+
+def delete_snapshot(company: str, report_type: str, period: str) -> bool:
+    path = _snapshot_path(company, report_type, period)
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+    except Exception as exc:
+        print(f"[ReportSnapshots] Failed to delete snapshot {path}: {exc}")
+    return False
+
+
+def diff_documents(snapshot: Optional[Dict[str, Any]], current: Dict[str, str]):
+    """
+    Comparar el snapshot con el listado actual del período (name -> modified).
+
+    Returns:
+        tuple: (nombres a recalcular, documentos del snapshot que siguen vigentes)
+    """
+    previous = (snapshot or {}).get("documents") or {}
+    stale = []
+    kept = {}
+    for name, modified in current.items():
+        entry = previous.get(name)
+        if entry is not None and entry.get("modified") == modified:
+            kept[name] = entry
+        else:
+            stale.append(name)
+    return stale, kept
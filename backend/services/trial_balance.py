@@ -0,0 +1,375 @@
+"""
+Balance de sumas y saldos (trial balance) por compañía agregado en ERPNext.
+
+En lugar de bajar los GL Entry y sumar en Python, se pide a frappe.client.get_list la
+suma de debe/haber agrupada por cuenta (is_cancelled = 0: los comprobantes cancelados
+quedan marcados y los borradores no generan asientos).
+
+Las sumas de los meses cerrados de cada cuenta (fin de mes <= custom_lock_posting_before)
+se guardan por (compañía, mes) en TRIAL_BALANCE_CACHE_PATH. El cierre solo bloquea
+Payment Entry, Journal Entry y Bank Transaction: facturas, comprobantes de stock y
+reposteos pueden seguir generando asientos en un mes cerrado. Por eso cada suma
+cacheada guarda también la cantidad de asientos y el max(modified) con que se calculó,
+y antes de usarla se valida con una consulta agrupada por cuenta (count/max(modified))
+por cada tramo de meses cacheados: un asiento nuevo o reposteado sube el max(modified)
+y uno cancelado o borrado baja la cantidad. Las cuentas que no coinciden se vuelven a
+pedir mes a mes.
+
+Un rango de varios meses se arma con:
+
+  - las sumas cacheadas (y validadas) de las cuentas cerradas en cada mes, y
+  - una consulta agrupada por cuenta por cada tramo de meses consecutivos con el mismo
+    conjunto de cuentas cacheadas (excluidas con `not in`); en régimen son uno o dos
+    tramos para todo el rango.
+
+Las cuentas que se cerraron desde la última consulta se piden mes a mes una sola vez
+y se agregan al cache. Al desbloquear una cuenta se descartan sus meses reabiertos
+(invalidate_trial_balance).
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import quote
+
+from config import TRIAL_BALANCE_CACHE_PATH
+from services.account_balances import month_end, month_key
+from utils.frappe_list import fetch_list_paged
+from utils.http_utils import make_erpnext_request
+from utils.json_state_store import JsonStateStore
+
+CACHE_VERSION = 2
+
+_store = JsonStateStore(
+    TRIAL_BALANCE_CACHE_PATH,
+    default_factory=lambda: {"version": CACHE_VERSION, "months": {}},
+    flush_interval=0
+)
+
+
+def _safe_float(value, default=0.0):
+    try:
+        if value in (None, ''):
+            return default
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _entry_key(company: str, month: str) -> str:
+    return f"{company}::{month}"
+
+
+def _parse_date(value) -> date:
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+def _stamp(value) -> Optional[str]:
+    return str(value) if value else None
+
+
+def get_fiscal_year_range(session, fiscal_year: str):
+    """
+    Fechas de inicio y fin de un Fiscal Year.
+
+    Returns:
+        tuple: ((inicio, fin) o None, error)
+    """
+    response, error = make_erpnext_request(
+        session=session,
+        method="GET",
+        endpoint=f"/api/resource/Fiscal Year/{quote(fiscal_year, safe='')}",
+        operation_name="Get fiscal year dates for trial balance"
+    )
+    if error:
+        return None, error
+    data = response.json().get("data", {}) if response.status_code == 200 else {}
+    if not data.get("year_start_date") or not data.get("year_end_date"):
+        return None, None
+    return (_parse_date(data["year_start_date"]), _parse_date(data["year_end_date"])), None
+
+
+def fetch_account_lock_dates(session, company: str):
+    """
+    custom_lock_posting_before de las cuentas cerradas de la compañía.
+
+    Returns:
+        tuple: ({cuenta: date}, error)
+    """
+    rows, error = fetch_list_paged(
+        session,
+        "Account",
+        ["name", "custom_lock_posting_before"],
+        [["company", "=", company], ["custom_lock_posting_before", "is", "set"]],
+        operation_name="Get account lock dates for trial balance"
+    )
+    if error:
+        return {}, error
+    return {
+        row["name"]: _parse_date(row["custom_lock_posting_before"])
+        for row in rows
+        if row.get("name") and row.get("custom_lock_posting_before")
+    }, None
+
+
+def fetch_account_totals(session, company: str, from_date: date, to_date: date,
+                         exclude_accounts: Optional[FrozenSet[str]] = None):
+    """
+    Debe/haber por cuenta entre from_date y to_date inclusive, agrupados en ERPNext,
+    con la cantidad de asientos y su max(modified) para validar el cache.
+
+    Returns:
+        tuple: ({cuenta: {"debit", "credit", "entries", "last_modified"}}, error)
+    """
+    filters = [
+        ["company", "=", company],
+        ["is_cancelled", "=", 0],
+        ["posting_date", ">=", from_date.isoformat()],
+        ["posting_date", "<=", to_date.isoformat()],
+    ]
+    if exclude_accounts:
+        filters.append(["account", "not in", sorted(exclude_accounts)])
+
+    rows, error = fetch_list_paged(
+        session,
+        "GL Entry",
+        ["account", "sum(debit) as debit", "sum(credit) as credit",
+         "count(name) as entries", "max(modified) as last_modified"],
+        filters,
+        group_by="account",
+        order_by="account asc",
+        page_size=5000,
+        operation_name="Aggregate GL Entry totals by account"
+    )
+    if error:
+        return {}, error
+    return {
+        row["account"]: {
+            "debit": _safe_float(row.get("debit")),
+            "credit": _safe_float(row.get("credit")),
+            "entries": int(row.get("entries") or 0),
+            "last_modified": _stamp(row.get("last_modified")),
+        }
+        for row in rows
+        if row.get("account")
+    }, None
+
+
+def fetch_account_stamps(session, company: str, from_date: date, to_date: date, accounts: FrozenSet[str]):
+    """
+    Cantidad de asientos y max(modified) por cuenta (solo las indicadas) en el rango.
+
+    Returns:
+        tuple: ({cuenta: {"entries", "last_modified"}}, error)
+    """
+    rows, error = fetch_list_paged(
+        session,
+        "GL Entry",
+        ["account", "count(name) as entries", "max(modified) as last_modified"],
+        [
+            ["company", "=", company],
+            ["is_cancelled", "=", 0],
+            ["posting_date", ">=", from_date.isoformat()],
+            ["posting_date", "<=", to_date.isoformat()],
+            ["account", "in", sorted(accounts)],
+        ],
+        group_by="account",
+        order_by="account asc",
+        page_size=5000,
+        operation_name="Validate cached GL Entry totals"
+    )
+    if error:
+        return {}, error
+    return {
+        row["account"]: {"entries": int(row.get("entries") or 0), "last_modified": _stamp(row.get("last_modified"))}
+        for row in rows
+        if row.get("account")
+    }, None
+
+
+def _iter_months(from_date: date, to_date: date):
+    """(mes, inicio, fin, mes completo) de cada mes que toca el rango"""
+    current = from_date
+    while current <= to_date:
+        month = month_key(current.isoformat())
+        last_day = month_end(month)
+        end = min(last_day, to_date)
+        yield month, current, end, current.day == 1 and end == last_day
+        current = last_day + timedelta(days=1)
+
+
+def _add_totals(target: Dict[str, Dict[str, float]], totals: Dict[str, Dict[str, float]]) -> None:
+    for account, values in totals.items():
+        current = target.setdefault(account, {"debit": 0.0, "credit": 0.0})
+        current["debit"] += values["debit"]
+        current["credit"] += values["credit"]
+
+
+def _validate_cached(session, company: str, months: List[Dict[str, Any]]):
+    """
+    Quitar de cada mes las cuentas cacheadas cuyos asientos cambiaron desde que se
+    guardaron. Una consulta de count/max(modified) por tramo de meses consecutivos con
+    las mismas cuentas cacheadas; una diferencia descarta la cuenta en todo el tramo.
+
+    Returns:
+        tuple: (cuentas descartadas, consultas hechas, error)
+    """
+    segments: List[List[Dict[str, Any]]] = []
+    for month in months:
+        if not month["usable"]:
+            continue
+        previous = segments[-1][-1] if segments else None
+        if previous and previous["usable"] == month["usable"] and previous["end"] + timedelta(days=1) == month["start"]:
+            segments[-1].append(month)
+        else:
+            segments.append([month])
+
+    discarded = set()
+    for segment in segments:
+        accounts = segment[0]["usable"]
+        stamps, error = fetch_account_stamps(session, company, segment[0]["start"], segment[-1]["end"], accounts)
+        if error:
+            return discarded, len(segments), error
+        changed = set()
+        for account in accounts:
+            stored = [month["cached"][account] for month in segment]
+            entries = sum(int(values.get("entries") or 0) for values in stored)
+            last_modified = max((values.get("last_modified") or "" for values in stored), default="") or None
+            current = stamps.get(account) or {"entries": 0, "last_modified": None}
+            if current["entries"] != entries or current["last_modified"] != last_modified:
+                changed.add(account)
+        if changed:
+            print(f"--- Trial Balance: cache desactualizado en {company} para {sorted(changed)}")
+            for month in segment:
+                month["usable"] = month["usable"] - changed
+            discarded |= changed
+    return discarded, len(segments), None
+
+
+def get_trial_balance(session, company: str, from_date, to_date):
+    """
+    Sumas y saldos por cuenta entre from_date y to_date.
+
+    Returns:
+        tuple: ({cuenta: {"debit", "credit", "balance"}}, info, error)
+    """
+    from_date, to_date = _parse_date(from_date), _parse_date(to_date)
+    lock_dates, error = fetch_account_lock_dates(session, company)
+    if error:
+        return {}, {}, error
+
+    entries = (_store.get("months") or {}) if _store.get("version") == CACHE_VERSION else {}
+    months: List[Dict[str, Any]] = []
+    for month, start, end, full_month in _iter_months(from_date, to_date):
+        locked = frozenset(
+            account for account, lock_date in lock_dates.items() if full_month and lock_date >= end
+        )
+        cached_accounts = (entries.get(_entry_key(company, month)) or {}).get("accounts") or {}
+        months.append({
+            "month": month,
+            "start": start,
+            "end": end,
+            "locked": locked,
+            "cached": cached_accounts,
+            "usable": frozenset(account for account in locked if account in cached_accounts),
+        })
+
+    discarded, validation_queries, error = _validate_cached(session, company, months)
+    if error:
+        return {}, {}, error
+
+    totals: Dict[str, Dict[str, float]] = {}
+    # Tramos de meses consecutivos con las mismas cuentas cacheadas: una consulta cada uno
+    segments: List[Dict[str, Any]] = []
+    # Meses con cuentas cerradas que todavía no están (o ya no son válidas) en el cache
+    to_materialize: List[Tuple[str, date, date, FrozenSet[str], FrozenSet[str]]] = []
+    cached_months = 0
+
+    for entry in months:
+        month, start, end, usable = entry["month"], entry["start"], entry["end"], entry["usable"]
+        if usable:
+            cached_months += 1
+            _add_totals(totals, {account: entry["cached"][account] for account in usable})
+
+        missing = entry["locked"] - usable
+        if missing:
+            to_materialize.append((month, start, end, usable, missing))
+        elif segments and segments[-1]["exclude"] == usable and segments[-1]["end"] + timedelta(days=1) == start:
+            segments[-1]["end"] = end
+        else:
+            segments.append({"start": start, "end": end, "exclude": usable})
+
+    for segment in segments:
+        segment_totals, error = fetch_account_totals(
+            session, company, segment["start"], segment["end"], exclude_accounts=segment["exclude"]
+        )
+        if error:
+            return {}, {}, error
+        _add_totals(totals, segment_totals)
+
+    empty = {"debit": 0.0, "credit": 0.0, "entries": 0, "last_modified": None}
+    materialized: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for month, start, end, usable, missing in to_materialize:
+        month_totals, error = fetch_account_totals(session, company, start, end, exclude_accounts=usable)
+        if error:
+            return {}, {}, error
+        _add_totals(totals, month_totals)
+        # Las cuentas cerradas sin movimientos también se guardan (en cero) para no volver a pedirlas
+        materialized[month] = {account: month_totals.get(account, dict(empty)) for account in missing}
+
+    if materialized:
+        try:
+            with _store.edit() as data:
+                if data.get("version") != CACHE_VERSION:
+                    data.clear()
+                    data.update({"version": CACHE_VERSION, "months": {}})
+                months_data = data.setdefault("months", {})
+                for month, accounts in materialized.items():
+                    entry = months_data.setdefault(_entry_key(company, month), {"accounts": {}})
+                    entry.setdefault("accounts", {}).update(accounts)
+                    entry["updated_at"] = datetime.now(timezone.utc).isoformat()
+        except Exception as exc:
+            print(f"--- Trial Balance: no se pudo guardar el cache de {company}: {exc}")
+
+    balances = {
+        account: {
+            "debit": values["debit"],
+            "credit": values["credit"],
+            "balance": values["debit"] - values["credit"],
+        }
+        for account, values in totals.items()
+    }
+    info = {
+        "cached_months": cached_months,
+        "materialized_months": len(materialized),
+        "discarded_accounts": len(discarded),
+        "queries": validation_queries + len(segments) + len(to_materialize),
+    }
+    return balances, info, None
+
+
+def invalidate_trial_balance(company: str, account: Optional[str] = None, from_date=None) -> int:
+    """
+    Descartar sumas cacheadas de la compañía (de una cuenta o de todas) desde el mes de
+    from_date (todos los meses si es None).
+
+    Returns:
+        int: meses modificados
+    """
+    prefix = f"{company}::"
+    from_month = month_key(from_date) if from_date else None
+    changed = 0
+    with _store.edit() as data:
+        months = data.get("months") or {}
+        for key in list(months):
+            if not key.startswith(prefix):
+                continue
+            if from_month and key[len(prefix):] < from_month:
+                continue
+            accounts = months[key].get("accounts") or {}
+            if account is None:
+                del months[key]
+                changed += 1
+            elif account in accounts:
+                del accounts[account]
+                changed += 1
+    return changed
@@ -0,0 +1,12 @@
+# Los módulos de la app importan config/utils/services/routes como paquetes de nivel
+# superior (igual que al correr backend/app.py). Se agrega backend/ al path una sola
+# vez y los tests importan con esos mismos nombres, así cada módulo se carga una vez.
+# La raíz del repo también se agrega para los tests que importan vía `backend.`
+# (p. ej. test_kits_utils), así corren igual desde la raíz o desde backend/.
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+for path in (str(BACKEND_DIR.parent), str(BACKEND_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from services import account_balances
+from utils.json_state_store import JsonStateStore
+
+DAILY_ROWS = [
+    {"posting_date": "2024-01-05", "debit": 100.0, "credit": 0.0, "entries": 1, "last_modified": "2024-01-05 10:00:00"},
+    {"posting_date": "2024-01-20", "debit": 0.0, "credit": 30.0, "entries": 2, "last_modified": "2024-01-20 10:00:00"},
+    {"posting_date": "2024-02-10", "debit": 50.0, "credit": 5.0, "entries": 1, "last_modified": "2024-02-10 10:00:00"},
+    {"posting_date": "2024-03-01", "debit": 10.0, "credit": 0.0, "entries": 1, "last_modified": "2024-03-01 10:00:00"},
+]
+
+
+class TestAccountBalances(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        store = JsonStateStore(
+            os.path.join(self.directory.name, 'balances.json'),
+            default_factory=lambda: {"version": account_balances.CACHE_VERSION, "entries": {}},
+            flush_interval=0
+        )
+        self.rows = list(DAILY_ROWS)
+        self.calls = []
+        self.validations = 0
+        patches = [
+            mock.patch.object(account_balances, '_store', store),
+            mock.patch.object(account_balances, 'fetch_list_paged', side_effect=self._fake_fetch),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _fake_fetch(self, session, doctype, fields, filters, **kwargs):
+        rows = self.rows
+        for field, operator, value in filters:
+            if field == 'posting_date' and operator == '>=':
+                rows = [row for row in rows if row['posting_date'] >= value]
+            if field == 'posting_date' and operator == '<=':
+                rows = [row for row in rows if row['posting_date'] <= value]
+        if kwargs.get('group_by') == 'account':
+            # Validación del cache: count/max(modified) del tramo cacheado
+            self.validations += 1
+            return [{
+                "account": "Banco - A",
+                "entries": sum(row["entries"] for row in rows),
+                "last_modified": max(row["last_modified"] for row in rows),
+            }], None
+        self.calls.append(filters)
+        self.assertEqual(kwargs.get('group_by'), 'posting_date')
+        return rows, None
+
+    def test_locked_month(self):
+        self.assertEqual(account_balances.locked_month('2024-02-29'), '2024-02')
+        self.assertEqual(account_balances.locked_month('2024-02-28'), '2024-01')
+        self.assertIsNone(account_balances.locked_month(None))
+
+    def test_locked_months_are_served_from_cache(self):
+        months, error = account_balances.get_monthly_totals(None, 'gl', 'ACME', 'Banco - A', lock_date='2024-02-29')
+        self.assertIsNone(error)
+        self.assertEqual(months['2024-01'], {
+            "debit": 100.0, "credit": 30.0, "entries": 3, "last_modified": "2024-01-20 10:00:00"
+        })
+        self.assertAlmostEqual(account_balances.balance_from_totals(months), 125.0)
+        self.assertAlmostEqual(account_balances.balance_from_totals(months, '2024-02-29'), 115.0)
+
+        months_again, _ = account_balances.get_monthly_totals(None, 'gl', 'ACME', 'Banco - A', lock_date='2024-02-29')
+        self.assertEqual(months_again, months)
+        self.assertIn(['posting_date', '>=', '2024-03-01'], self.calls[-1])
+
+        calls_before = len(self.calls)
+        january, _ = account_balances.get_monthly_totals(
+            None, 'gl', 'ACME', 'Banco - A', lock_date='2024-02-29', to_date='2024-01-31'
+        )
+        self.assertEqual(len(self.calls), calls_before)
+        self.assertEqual(list(january), ['2024-01'])
+        self.assertEqual(self.validations, 2)
+
+    def test_entries_posted_in_locked_month_discard_the_cache(self):
+        account_balances.get_monthly_totals(None, 'gl', 'ACME', 'Banco - A', lock_date='2024-02-29')
+
+        # Una factura (no bloqueada por el cierre) asienta en enero
+        self.rows.append(
+            {"posting_date": "2024-01-25", "debit": 7.0, "credit": 0.0, "entries": 1, "last_modified": "2024-04-01 09:00:00"}
+        )
+        months, _ = account_balances.get_monthly_totals(None, 'gl', 'ACME', 'Banco - A', lock_date='2024-02-29')
+        self.assertNotIn(['posting_date', '>=', '2024-03-01'], self.calls[-1])
+        self.assertEqual(months['2024-01']['debit'], 107.0)
+
+        # Recalculado, el cache vuelve a servir los meses cerrados
+        account_balances.get_monthly_totals(None, 'gl', 'ACME', 'Banco - A', lock_date='2024-02-29')
+        self.assertIn(['posting_date', '>=', '2024-03-01'], self.calls[-1])
+
+    def test_invalidate_drops_reopened_months(self):
+        account_balances.get_monthly_totals(None, 'gl', 'ACME', 'Banco - A', lock_date='2024-02-29')
+        self.assertEqual(account_balances.invalidate_balances('gl', 'Banco - A', from_date='2024-02-10'), 1)
+        account_balances.get_monthly_totals(None, 'gl', 'ACME', 'Banco - A', lock_date='2024-02-29')
+        self.assertIn(['posting_date', '>=', '2024-02-01'], self.calls[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
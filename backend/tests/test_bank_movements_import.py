@@ -0,0 +1,78 @@
+import unittest
+from unittest import mock
+
+from routes import bank_movements_import as bank_import
+
+
+def _doc(date, amount, description='Pago', reference='', transaction_id=''):
+    return {
+        "doctype": "Bank Transaction",
+        "date": date,
+        "description": description,
+        "reference_number": reference,
+        "transaction_id": transaction_id,
+        "deposit": max(amount, 0),
+        "withdrawal": max(-amount, 0),
+    }
+
+
+def _existing(name, date, amount, description='Pago', reference='', transaction_id=''):
+    return bank_import._normalize_existing_transaction({
+        "name": name,
+        "date": date,
+        "description": description,
+        "reference_number": reference,
+        "transaction_id": transaction_id,
+        "deposit": max(amount, 0),
+        "withdrawal": max(-amount, 0),
+    })
+
+
+class _Response:
+    def __init__(self, status_code, payload=None, text=''):
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.text = text
+
+    def json(self):
+        return self._payload
+
+
+class TestBankImportDedupe(unittest.TestCase):
+    def test_rows_are_classified_against_the_index(self):
+        index = bank_import._build_existing_index([
+            _existing('BT-1', '2024-05-02', 100.0, reference='REF-1'),
+            _existing('BT-2', '2024-05-03', -50.0, transaction_id='TX-9'),
+            _existing('BT-3', '2024-05-04', 10.0, description='Comision  mantenimiento'),
+            _existing('BT-4', '2024-05-05', 20.0, description='Con ref', reference='OTRA'),
+        ])
+        candidates = [
+            {"row": 1, "doc": _doc('2024-05-10', 999.0, reference='ref-1')},
+            {"row": 2, "doc": _doc('2024-05-03', -50.0, transaction_id='TX-9')},
+            {"row": 3, "doc": _doc('2024-05-04', 10.0, description='COMISION mantenimiento')},
+            {"row": 4, "doc": _doc('2024-05-05', 20.0, description='Con ref')},
+            {"row": 5, "doc": _doc('2024-05-02', 100.0, reference='REF-2')},
+        ]
+        to_import, skipped = bank_import._classify_duplicates(candidates, index)
+        self.assertEqual([entry["row"] for entry in skipped], [1, 2, 3])
+        self.assertEqual([entry["existing"] for entry in skipped], ['BT-1', 'BT-2', 'BT-3'])
+        self.assertEqual([candidate["row"] for candidate in to_import], [4, 5])
+
+    def test_failed_chunk_is_reported_and_the_rest_is_inserted(self):
+        candidates = [{"row": row, "doc": _doc('2024-05-01', row)} for row in range(1, 6)]
+        responses = [
+            (_Response(200, {"message": ["BT-1", "BT-2"]}), None),
+            (_Response(417, text='ValidationError'), None),
+            (_Response(200, {"message": ["BT-5"]}), None),
+        ]
+        with mock.patch.object(bank_import, 'make_erpnext_request', side_effect=responses) as request_mock:
+            imported, chunk_errors = bank_import._insert_transactions_in_chunks(None, candidates, chunk_size=2)
+        self.assertEqual(request_mock.call_count, 3)
+        self.assertEqual([entry["name"] for entry in imported], ['BT-1', 'BT-2', 'BT-5'])
+        self.assertEqual(len(chunk_errors), 1)
+        self.assertEqual(chunk_errors[0]["rows"], [3, 4])
+        self.assertEqual(chunk_errors[0]["error"], 'ValidationError')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+from unittest import mock
+
+from routes import item_resolution
+from utils import frappe_list
+
+
+class _Response:
+    def __init__(self, payload=None, status_code=200):
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.text = ''
+
+    def json(self):
+        return self._payload
+
+
+class TestItemResolution(unittest.TestCase):
+    def setUp(self):
+        self.existing = {'ART-1', 'ART-1 - AC', 'ART-2'}
+        self.item_taxes = {'ART-1 - AC': [{'parent': 'ART-1 - AC', 'item_tax_template': 'IVA 21 Ventas'}]}
+        self.calls = []
+        self.failing_doctypes = set()
+
+    def _fake_request(self, session, method, endpoint, data=None, operation_name=None, **kwargs):
+        self.calls.append((method, endpoint, data))
+        if data and data.get('doctype') in self.failing_doctypes:
+            return None, {'success': False, 'message': 'timeout'}
+        if endpoint == '/api/method/frappe.client.get_list' and data['doctype'] == 'Item':
+            names = data['filters'][0][2]
+            return _Response({'message': [{'name': name} for name in names if name in self.existing]}), None
+        if endpoint == '/api/method/frappe.client.get_list' and data['doctype'] == 'Item Tax':
+            parents = data['filters'][0][2]
+            rows = [row for parent in parents for row in self.item_taxes.get(parent, [])]
+            return _Response({'message': rows}), None
+        if method == 'POST' and endpoint == '/api/resource/Item':
+            self.existing.add(data['data']['item_code'])
+            return _Response(status_code=201), None
+        return _Response(), None
+
+    def _process(self, items, describe=None, tax_map=None):
+        income = mock.Mock(return_value='Ventas - AC')
+        by_description = mock.Mock(side_effect=describe or (lambda item, *args, **kwargs: None))
+        with mock.patch.object(item_resolution, 'get_company_abbr', return_value='AC'), \
+                mock.patch.object(item_resolution, 'make_erpnext_request', side_effect=self._fake_request), \
+                mock.patch.object(frappe_list, 'make_erpnext_request', side_effect=self._fake_request), \
+                mock.patch.object(item_resolution, 'determine_income_account', income), \
+                mock.patch.object(item_resolution, 'find_or_create_item_by_description', by_description):
+            processed = item_resolution.process_invoice_items_batch(
+                items, object(), {}, 'ACME', tax_map=tax_map, customer='Juan'
+            )
+        return processed, income, by_description
+
+    def test_tax_assignment_candidates(self):
+        self.assertEqual(item_resolution._tax_assignment_candidates('ART-1', 'AC'), ['ART-1 - AC', 'ART-1'])
+        self.assertEqual(item_resolution._tax_assignment_candidates('ART-1 - AC', 'AC'), ['ART-1 - AC', 'ART-1'])
+        self.assertEqual(item_resolution._tax_assignment_candidates('ART-1', None), ['ART-1'])
+
+    def test_lines_are_grouped_into_one_lookup_and_one_put_per_item(self):
+        items = [
+            {'item_code': 'ART-1', 'qty': 1, 'rate': 10, 'iva_percent': 21},
+            {'item_code': 'ART-1', 'qty': 2, 'rate': 10, 'iva_percent': 21},
+            {'item_code': 'ART-2', 'qty': 1, 'rate': 5, 'iva_percent': 10.5},
+            {'item_code': 'NUEVO', 'qty': 1, 'rate': 7, 'iva_percent': 21},
+            {'item_code': 'NUEVO', 'qty': 1, 'rate': 7, 'iva_percent': 21},
+        ]
+        tax_map = {'21.0': 'IVA 21 Ventas', '10.5': 'IVA 10.5 Ventas'}
+        processed, income, _ = self._process(items, tax_map=tax_map)
+
+        self.assertEqual([row['item_code'] for row in processed], ['ART-1', 'ART-1', 'ART-2', 'NUEVO', 'NUEVO'])
+        self.assertTrue(all(row['income_account'] == 'Ventas - AC' for row in processed))
+        income.assert_called_once()
+
+        item_lookups = [call for call in self.calls if call[2] and call[2].get('doctype') == 'Item']
+        self.assertEqual(len(item_lookups), 1)
+        created = [call[2]['data']['item_code'] for call in self.calls if call[:2] == ('POST', '/api/resource/Item')]
+        self.assertEqual(created, ['NUEVO'])
+
+        # ART-1 se asigna a ART-1 - AC, que ya tiene la plantilla: solo ART-2 y NUEVO reciben un PUT (uno cada uno)
+        puts = {call[1]: call[2]['data']['taxes'] for call in self.calls if call[0] == 'PUT'}
+        self.assertEqual(set(puts), {'/api/resource/Item/ART-2', '/api/resource/Item/NUEVO'})
+        self.assertEqual(puts['/api/resource/Item/NUEVO'], [{'item_tax_template': 'IVA 21 Ventas'}])
+
+    def test_failed_lookups_do_not_create_items_or_overwrite_taxes(self):
+        items = [
+            {'item_code': 'ART-1', 'qty': 1, 'rate': 10, 'iva_percent': 21},
+            {'item_code': 'NUEVO', 'qty': 1, 'rate': 7, 'iva_percent': 21},
+        ]
+        tax_map = {'21.0': 'IVA 21 Ventas'}
+
+        # Sin saber qué códigos existen no se crea ninguno
+        self.failing_doctypes = {'Item'}
+        processed, _, _ = self._process(items, tax_map=tax_map)
+        self.assertEqual([row['item_code'] for row in processed], ['ART-1', 'NUEVO'])
+        self.assertFalse([call for call in self.calls if call[:2] == ('POST', '/api/resource/Item')])
+
+        # Sin las filas Item Tax actuales el PUT las borraría: no se asigna
+        self.calls.clear()
+        self.failing_doctypes = {'Item Tax'}
+        self._process(items, tax_map=tax_map)
+        self.assertFalse([call for call in self.calls if call[0] == 'PUT'])
+
+    def test_repeated_descriptions_are_resolved_once(self):
+        items = [
+            {'description': 'Flete', 'iva_percent': 21, 'qty': 1, 'rate': 100},
+            {'description': ' Flete ', 'iva_percent': 21, 'qty': 1, 'rate': 50},
+            {'description': 'Flete', 'iva_percent': 10.5, 'qty': 1, 'rate': 20},
+            {'description': 'Sin resolver', 'qty': 1, 'rate': 1},
+        ]
+
+        def describe(item, *args, **kwargs):
+            if item['description'].strip() == 'Sin resolver':
+                return None
+            return f"FLETE-{item['iva_percent']}"
+
+        processed, _, by_description = self._process(items, describe=describe)
+        self.assertEqual(by_description.call_count, 3)
+        self.assertEqual([row and row['item_code'] for row in processed], ['FLETE-21', 'FLETE-21', 'FLETE-10.5', None])
+
+
+if __name__ == '__main__':
+    unittest.main()
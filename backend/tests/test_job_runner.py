@@ -0,0 +1,187 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from collections import deque
+from unittest import mock
+
+from services import job_runner
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+class TestJobRunner(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name, value in (('JOB_STORE_PATH', os.path.join(directory.name, 'jobs.sqlite3')), ('_schema_ready', False)):
+            patcher = mock.patch.object(job_runner, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        job_runner._ensure_schema()
+
+    def _insert(self, job_id, status, owner_pid, company=None):
+        connection = job_runner._connect()
+        try:
+            connection.execute(
+                "INSERT INTO jobs (id, kind, company, user_id, status, owner_pid, created_at, updated_at) "
+                "VALUES (?, 'test', ?, 'ana', ?, ?, 0, 0)",
+                (job_id, company, status, owner_pid)
+            )
+        finally:
+            connection.close()
+
+    def _isolated_queue(self, max_per_company=1):
+        """Cola, pool y timer propios: el pool solo registra los jobs que arrancarían"""
+        started = []
+        timers = []
+
+        class FakeTimer:
+            def __init__(self, delay, function):
+                self.function = function
+                self.daemon = False
+                timers.append(self)
+
+            def start(self):
+                pass
+
+        executor = mock.Mock()
+        executor.submit.side_effect = lambda run, job_id, *args: started.append(job_id)
+        for name, value in (('_queue', deque()), ('_active', 0), ('_retry_timer', None), ('_executor', executor),
+                            ('JOB_MAX_PER_COMPANY', max_per_company)):
+            patcher = mock.patch.object(job_runner, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(job_runner.threading, 'Timer', FakeTimer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return started, timers
+
+    def test_queued_and_running_jobs_of_dead_process_are_marked_as_error(self):
+        dead = _dead_pid()
+        self._insert('cola-huerfana', 'queued', dead)
+        self._insert('corriendo-huerfano', 'running', dead)
+        self._insert('cola-viva', 'queued', os.getpid())
+
+        progress = job_runner.get_job_progress('cola-huerfana')
+        self.assertEqual(progress['status'], 'error')
+        self.assertIn('antes de empezar', progress['message'])
+
+        self.assertEqual(job_runner._recover_orphans(), 1)
+        self.assertEqual(job_runner.get_job('corriendo-huerfano')['status'], 'error')
+        self.assertEqual(job_runner.get_job('cola-viva')['status'], 'queued')
+
+    def test_submit_records_owner_pid(self):
+        with mock.patch.object(job_runner, '_dispatch'):
+            job_id = job_runner.submit_job('test', lambda job: None, user_id='ana')
+        job = job_runner.get_job(job_id)
+        self.assertEqual((job['status'], job['owner_pid'], job['user_id']), ('queued', os.getpid(), 'ana'))
+
+    def test_claim_respects_company_limit(self):
+        with mock.patch.object(job_runner, 'JOB_MAX_PER_COMPANY', 1):
+            self._insert('corriendo', 'running', os.getpid(), company='ACME')
+            self._insert('en-cola', 'queued', os.getpid(), company='ACME')
+            self._insert('otra-compania', 'queued', os.getpid(), company='OTRA')
+            self._insert('cancelado', 'cancelled', os.getpid(), company='OTRA')
+
+            self.assertIs(job_runner._claim('en-cola', 'ACME'), False)
+            self.assertEqual(job_runner.get_job('en-cola')['status'], 'queued')
+            self.assertIs(job_runner._claim('otra-compania', 'OTRA'), True)
+            self.assertEqual(job_runner.get_job('otra-compania')['status'], 'running')
+            self.assertIsNone(job_runner._claim('cancelado', 'OTRA'))
+
+            # El cupo tomado por un proceso muerto se libera al buscar lugar
+            job_runner.update_job('corriendo', status='completed')
+            self._insert('huerfano', 'running', _dead_pid(), company='ACME')
+            self.assertIs(job_runner._claim('en-cola', 'ACME'), True)
+            self.assertEqual(job_runner.get_job('huerfano')['status'], 'error')
+
+    def test_blocked_job_is_requeued_and_started_when_company_frees_up(self):
+        started, timers = self._isolated_queue(max_per_company=1)
+        first = job_runner.submit_job('test', lambda job: None, company='ACME', user_id='ana')
+        second = job_runner.submit_job('test', lambda job: None, company='ACME', user_id='ana')
+
+        self.assertEqual(started, [first])
+        self.assertEqual([entry[0] for entry in job_runner._queue], [second])
+        self.assertEqual(len(timers), 1)
+        self.assertEqual(job_runner.get_job(second)['status'], 'queued')
+
+        # Sin cupo el reintento vuelve a programarse
+        timers[0].function()
+        self.assertEqual(started, [first])
+        self.assertEqual(len(timers), 2)
+
+        job_runner.update_job(first, status='completed')
+        timers[1].function()
+        self.assertEqual(started, [first, second])
+        self.assertEqual(job_runner.get_job(second)['status'], 'running')
+        self.assertFalse(job_runner._queue)
+
+    def test_cancelled_queued_job_never_starts(self):
+        started, timers = self._isolated_queue(max_per_company=1)
+        first = job_runner.submit_job('test', lambda job: None, company='ACME', user_id='ana')
+        second = job_runner.submit_job('test', lambda job: None, company='ACME', user_id='ana')
+
+        cancelled = job_runner.cancel_job(second)
+        self.assertEqual((cancelled['status'], cancelled['cancel_requested']), ('cancelled', True))
+
+        job_runner.update_job(first, status='completed')
+        timers[0].function()
+        self.assertEqual(started, [first])
+        self.assertFalse(job_runner._queue)
+        self.assertEqual(job_runner.get_job(second)['status'], 'cancelled')
+
+    def test_run_records_completion_cancellation_and_errors(self):
+        self._isolated_queue()
+
+        def cancelled_target(job):
+            job_runner.cancel_job(job.id)
+            job.check_cancelled()
+
+        def failing_target(job):
+            raise RuntimeError('sin conexión')
+
+        for job_id, target in (('ok', lambda job: job.update(saved=3)), ('cancelar', cancelled_target),
+                               ('falla', failing_target)):
+            self._insert(job_id, 'running', os.getpid())
+            job_runner._active += 1
+            job_runner._run(job_id, None, target, (), {})
+
+        self.assertEqual((job_runner.get_job('ok')['status'], job_runner.get_job('ok')['saved']), ('completed', 3))
+        self.assertEqual(job_runner.get_job('cancelar')['status'], 'cancelled')
+        failed = job_runner.get_job('falla')
+        self.assertEqual((failed['status'], failed['success']), ('error', False))
+        self.assertIn('sin conexión', failed['message'])
+        self.assertEqual(job_runner._active, 0)
+
+    def test_progress_writes_are_throttled_until_flush(self):
+        self._insert('progreso', 'running', os.getpid())
+        job = job_runner.JobContext('progreso')
+        with mock.patch.object(job_runner.time, 'monotonic', side_effect=[100.0, 100.1, 100.2, 100.7]):
+            job.set_progress(1)
+            job.set_progress(2)
+            self.assertEqual(job_runner.get_job('progreso')['progress'], 1)
+
+            # Con otros campos o force se escribe aunque no haya pasado el intervalo
+            job.set_progress(3, current_item='ART-3')
+            self.assertEqual(job_runner.get_job('progreso')['progress'], 3)
+
+            job.set_progress(4)
+            self.assertEqual(job_runner.get_job('progreso')['progress'], 4)
+
+        with mock.patch.object(job_runner.time, 'monotonic', return_value=100.8):
+            job.set_progress(5)
+        self.assertEqual(job_runner.get_job('progreso')['progress'], 4)
+        job.flush()
+        self.assertEqual(job_runner.get_job('progreso')['progress'], 5)
+        job.flush()
+        self.assertEqual(job_runner.get_job('progreso')['progress'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
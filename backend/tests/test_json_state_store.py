@@ -0,0 +1,84 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.json_state_store import JsonStateStore
+
+
+def _increment_in_child(path, times):
+    store = JsonStateStore(path, flush_interval=0)
+    for _ in range(times):
+        store.increment('company_item_counts', 'ACME', 1, minimum=0)
+
+
+class TestJsonStateStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'active_companies.json')
+        with open(self.path, 'w', encoding='utf-8') as handle:
+            json.dump({'active_companies': {'u1': 'ACME'}, 'formula_history': {'k': ['x']}}, handle)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _read_file(self):
+        with open(self.path, encoding='utf-8') as handle:
+            return json.load(handle)
+
+    def test_reads_are_served_from_memory_until_the_file_changes(self):
+        store = JsonStateStore(self.path)
+        self.assertEqual(store.get('active_companies', 'u1'), 'ACME')
+        with mock.patch('builtins.open', side_effect=AssertionError('re-read')):
+            self.assertEqual(store.get('active_companies', 'u1'), 'ACME')
+
+        other = JsonStateStore(self.path)
+        with other.edit() as data:
+            data['active_companies']['u1'] = 'OTRA'
+        self.assertEqual(store.get('active_companies', 'u1'), 'OTRA')
+
+    def test_edit_preserves_other_sections_and_skips_noop_writes(self):
+        store = JsonStateStore(self.path)
+        with store.edit() as data:
+            data['active_companies']['u2'] = 'BETA'
+        self.assertEqual(self._read_file()['formula_history'], {'k': ['x']})
+        self.assertEqual(self._read_file()['active_companies']['u2'], 'BETA')
+
+        before = os.stat(self.path).st_ino
+        with store.edit() as data:
+            data.get('active_companies', {}).get('u2')
+        self.assertEqual(os.stat(self.path).st_ino, before)
+
+    def test_snapshot_is_a_copy(self):
+        store = JsonStateStore(self.path)
+        snapshot = store.snapshot()
+        snapshot['active_companies']['u1'] = 'MUTADA'
+        self.assertEqual(store.get('active_companies', 'u1'), 'ACME')
+
+    def test_counters_are_coalesced_and_clamped(self):
+        store = JsonStateStore(self.path, flush_interval=60)
+        for _ in range(3):
+            store.increment('company_item_counts', 'ACME', 1, minimum=0)
+        store.increment('company_item_counts', 'NEW', -1, minimum=0)
+        store.increment('company_item_counts', 'NEW', 1, minimum=0)
+        self.assertEqual(store.get_counter('company_item_counts', 'ACME'), 3)
+        self.assertNotIn('company_item_counts', self._read_file())
+
+        store.flush()
+        self.assertEqual(self._read_file()['company_item_counts'], {'ACME': 3, 'NEW': 1})
+
+    def test_concurrent_processes_do_not_lose_updates(self):
+        context = multiprocessing.get_context('fork') if hasattr(os, 'fork') else multiprocessing.get_context()
+        workers = [context.Process(target=_increment_in_child, args=(self.path, 25)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self._read_file()['company_item_counts']['ACME'], 100)
+        self.assertEqual(self._read_file()['active_companies'], {'u1': 'ACME'})
+
+
+if __name__ == '__main__':
+    unittest.main()
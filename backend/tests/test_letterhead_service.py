@@ -0,0 +1,86 @@
+import unittest
+from unittest import mock
+
+from services import letterhead_service
+
+
+class _Response:
+    def __init__(self, status_code, payload=None, content=b'', headers=None):
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.content = content
+        self.headers = headers or {}
+
+    def json(self):
+        return self._payload
+
+
+class _Session:
+    def __init__(self):
+        self.downloads = 0
+
+    def get(self, url, timeout=None):
+        self.downloads += 1
+        return _Response(200, content=b'\x89PNG-logo', headers={'Content-Type': 'image/png'})
+
+
+class TestInlineLetterhead(unittest.TestCase):
+    def setUp(self):
+        letterhead_service._logo_cache.clear()
+        letterhead_service.invalidate_inline_letterhead()
+        self.inline_doc = None
+        self.requests = []
+        self.base_doc = {
+            'name': 'ACME Letterhead',
+            'header': "<div><img src='/files/logo.png'></div>",
+            'footer': '<p>pie</p>',
+            'image': '/files/logo.png',
+        }
+
+    def _fake_request(self, session, method, endpoint, **kwargs):
+        self.requests.append((method, endpoint))
+        if method == 'GET' and endpoint.endswith('%28Inline%29'):
+            if self.inline_doc is None:
+                return None, {'status_code': 404, 'message': 'not found'}
+            return _Response(200, {'data': dict(self.inline_doc)}), None
+        if method in ('POST', 'PUT'):
+            self.inline_doc = kwargs['data']['data']
+            return _Response(200, {'data': self.inline_doc}), None
+        raise AssertionError((method, endpoint))
+
+    def test_inline_letterhead_is_rewritten_only_when_the_hash_changes(self):
+        session = _Session()
+        with mock.patch.object(letterhead_service, 'make_erpnext_request', side_effect=self._fake_request):
+            name, error = letterhead_service.ensure_inline_letterhead_doc(session, 'ACME', self.base_doc)
+            self.assertEqual((name, error), ('ACME Letterhead (Inline)', None))
+            self.assertIn('data:image/png;base64,', self.inline_doc['header'])
+            self.assertEqual([method for method, _ in self.requests], ['GET', 'POST'])
+
+            self.requests.clear()
+            letterhead_service.ensure_inline_letterhead_doc(session, 'ACME', self.base_doc)
+            self.assertEqual([method for method, _ in self.requests], ['GET'])
+            self.assertEqual(session.downloads, 1)
+
+            self.requests.clear()
+            changed = dict(self.base_doc, footer='<p>nuevo pie</p>')
+            letterhead_service.ensure_inline_letterhead_doc(session, 'ACME', changed)
+            self.assertEqual([method for method, _ in self.requests], ['GET', 'PUT'])
+            self.assertEqual(self.inline_doc['footer'], '<p>nuevo pie</p>')
+
+    def test_resolved_name_is_cached_per_company(self):
+        session = _Session()
+        with mock.patch.object(letterhead_service, 'fetch_letterhead', return_value=(self.base_doc, None)) as fetch_base, \
+                mock.patch.object(letterhead_service, 'make_erpnext_request', side_effect=self._fake_request):
+            for _ in range(5):
+                name, _ = letterhead_service.resolve_inline_letterhead(session, 'ACME')
+            self.assertEqual(name, 'ACME Letterhead (Inline)')
+            self.assertEqual(fetch_base.call_count, 1)
+            self.assertEqual(len(self.requests), 2)
+
+            letterhead_service.invalidate_inline_letterhead('ACME')
+            letterhead_service.resolve_inline_letterhead(session, 'ACME')
+            self.assertEqual(fetch_base.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import io
+import json
+import logging
+import unittest
+
+from utils.logging_utils import (
+    _CorrelationFilter,
+    _StructuredFormatter,
+    get_logger,
+    set_correlation_id,
+)
+
+
+class _CountingValue:
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return 'value'
+
+
+class TestStructuredLogger(unittest.TestCase):
+    def setUp(self):
+        self.logger = get_logger('tests.logging_utils')
+        self.stream = io.StringIO()
+        self.handler = logging.StreamHandler(self.stream)
+        self.handler.addFilter(_CorrelationFilter())
+        self.handler.setFormatter(_StructuredFormatter(as_json=False))
+        self.base = logging.getLogger('erp.tests.logging_utils')
+        self.base.addHandler(self.handler)
+        self.base.propagate = False
+        self.base.setLevel(logging.INFO)
+        self.logger.reset_samples()
+
+    def tearDown(self):
+        self.base.removeHandler(self.handler)
+
+    def test_disabled_level_does_not_format_arguments(self):
+        value = _CountingValue()
+        self.logger.debug('fila %s', value)
+        self.assertEqual(value.formatted, 0)
+        self.assertEqual(self.stream.getvalue(), '')
+
+    def test_fields_and_correlation_id_in_text_output(self):
+        set_correlation_id('abc123')
+        self.logger.info('Importando %s precios', 10, price_list='Venta')
+        self.assertEqual(self.stream.getvalue().strip(), '[INFO] [abc123] Importando 10 precios price_list=Venta')
+
+    def test_sampled_emits_first_and_every_nth(self):
+        for index in range(1, 26):
+            self.logger.sampled('row', 'fila %s', index, every=10, level=logging.INFO)
+        lines = self.stream.getvalue().strip().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('fila 1 ', lines[0])
+        self.assertIn('fila 11 ', lines[1])
+        self.assertIn('fila 21 ', lines[2])
+
+    def test_json_format(self):
+        self.handler.setFormatter(_StructuredFormatter(as_json=True))
+        set_correlation_id('req-1')
+        self.logger.warning('falló %s', 'x', status=500)
+        payload = json.loads(self.stream.getvalue())
+        self.assertEqual(payload['msg'], 'falló x')
+        self.assertEqual(payload['cid'], 'req-1')
+        self.assertEqual(payload['status'], 500)
+        self.assertEqual(payload['level'], 'WARNING')
+
+
+if __name__ == '__main__':
+    unittest.main()
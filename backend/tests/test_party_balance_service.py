@@ -0,0 +1,70 @@
+import unittest
+from unittest import mock
+
+from services import party_balance_service
+
+
+class TestPartyBalanceService(unittest.TestCase):
+    def setUp(self):
+        party_balance_service.invalidate_party_balances()
+        self.addCleanup(party_balance_service.invalidate_party_balances)
+
+    def _balances(self, names, ledger=None, aggregated=None, advances=None, fallback=None):
+        fallback_calls = []
+
+        def fake_fallback(session, party_type, company, search_names):
+            fallback_calls.append(list(search_names))
+            return dict((fallback or {}).get(search_names[0], {"outstanding_amount": 0, "invoice_count": 0}))
+
+        with mock.patch.object(party_balance_service, 'fetch_ledger_closing_map', return_value=ledger or {}), \
+                mock.patch.object(party_balance_service, 'fetch_aggregated_outstanding', return_value=aggregated), \
+                mock.patch.object(party_balance_service, 'fetch_aggregated_advances', return_value=advances or {}), \
+                mock.patch.object(party_balance_service, '_fetch_party_outstanding', side_effect=fake_fallback):
+            balances = party_balance_service.get_party_balances(
+                object(), 'Customer', 'ACME', names, resolve_name=lambda name: f"{name} - AC"
+            )
+        return balances, fallback_calls
+
+    def test_ledger_summary_wins_over_outstanding_and_advances(self):
+        balances, _ = self._balances(
+            ['Juan'],
+            ledger={'Juan - AC': '150.5'},
+            aggregated={'Juan - AC': {'outstanding_amount': 900.0, 'invoice_count': 3}},
+            advances={'Juan - AC': 100.0}
+        )
+        self.assertEqual(balances['Juan'], {'outstanding_amount': 150.5, 'invoice_count': 0, 'source': 'ledger'})
+
+    def test_aggregate_sums_both_names_and_subtracts_advances(self):
+        balances, fallback_calls = self._balances(
+            ['Juan', 'Ana'],
+            aggregated={
+                'Juan - AC': {'outstanding_amount': 300.0, 'invoice_count': 2},
+                'Juan': {'outstanding_amount': 50.0, 'invoice_count': 1},
+            },
+            advances={'Juan - AC': 80.0, 'Ana': 20.0}
+        )
+        self.assertEqual(balances['Juan'], {'outstanding_amount': 270.0, 'invoice_count': 3, 'source': 'aggregate'})
+        # Sin facturas, el anticipo deja saldo a favor
+        self.assertEqual(balances['Ana'], {'outstanding_amount': -20.0, 'invoice_count': 0, 'source': 'aggregate'})
+        self.assertEqual(fallback_calls, [])
+
+    def test_failed_aggregate_falls_back_per_party_and_result_is_cached(self):
+        balances, fallback_calls = self._balances(
+            ['Juan'],
+            aggregated=None,
+            advances={'Juan - AC': 10.0},
+            fallback={'Juan - AC': {'outstanding_amount': 40.0, 'invoice_count': 2}}
+        )
+        self.assertEqual(balances['Juan'], {'outstanding_amount': 30.0, 'invoice_count': 2, 'source': 'fallback'})
+        self.assertEqual(fallback_calls, [['Juan - AC', 'Juan']])
+
+        cached, fallback_calls = self._balances(['Juan'], ledger={'Juan - AC': 999})
+        self.assertEqual(cached, balances)
+
+        party_balance_service.invalidate_party_balances('Customer', 'ACME', ['Juan'])
+        refreshed, _ = self._balances(['Juan'], ledger={'Juan - AC': 999})
+        self.assertEqual(refreshed['Juan']['source'], 'ledger')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from services import pdf_cache
+
+
+class TestPdfCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(pdf_cache, 'PDF_CACHE_DIR', self.directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+        pdf_cache._approx_bytes = None
+
+    def _store(self, key, chunks):
+        return b''.join(pdf_cache.stream_and_store(key, iter(chunks)))
+
+    def test_key_changes_with_modified_format_and_letterhead(self):
+        base = pdf_cache.pdf_cache_key('Sales Invoice', 'FC-1', '2026-01-01 10:00:00', 'Standard', '0', 'abc')
+        self.assertEqual(base, pdf_cache.pdf_cache_key('Sales Invoice', 'FC-1', '2026-01-01 10:00:00', 'Standard', '0', 'abc'))
+        self.assertNotEqual(base, pdf_cache.pdf_cache_key('Sales Invoice', 'FC-1', '2026-01-02 10:00:00', 'Standard', '0', 'abc'))
+        self.assertNotEqual(base, pdf_cache.pdf_cache_key('Sales Invoice', 'FC-1', '2026-01-01 10:00:00', 'Otro', '0', 'abc'))
+        self.assertNotEqual(base, pdf_cache.pdf_cache_key('Sales Invoice', 'FC-1', '2026-01-01 10:00:00', 'Standard', '0', 'def'))
+        # Editar el Print Format cambia su `modified` y con eso la clave
+        self.assertNotEqual(
+            pdf_cache.pdf_cache_key('Sales Invoice', 'FC-1', 'm1', 'Factura', '0', 'abc', '2026-01-01 10:00:00'),
+            pdf_cache.pdf_cache_key('Sales Invoice', 'FC-1', 'm1', 'Factura', '0', 'abc', '2026-02-01 10:00:00')
+        )
+
+    def test_streamed_chunks_are_stored_and_served_on_hit(self):
+        key = pdf_cache.pdf_cache_key('Sales Invoice', 'FC-1', 'm1', 'Standard', '0')
+        self.assertIsNone(pdf_cache.open_cached_pdf(key))
+        self.assertEqual(self._store(key, [b'%PDF-', b'contenido']), b'%PDF-contenido')
+
+        handle = pdf_cache.open_cached_pdf(key)
+        self.assertIsNotNone(handle)
+        self.assertEqual(b''.join(pdf_cache.iter_file(handle, chunk_size=4)), b'%PDF-contenido')
+        self.assertTrue(handle.closed)
+
+    def test_interrupted_stream_leaves_no_entry(self):
+        key = pdf_cache.pdf_cache_key('Sales Invoice', 'FC-2', 'm1', 'Standard', '0')
+        stream = pdf_cache.stream_and_store(key, iter([b'%PDF-', b'parte']))
+        next(stream)
+        stream.close()
+        self.assertIsNone(pdf_cache.open_cached_pdf(key))
+        self.assertEqual(list(pdf_cache._iter_entries()), [])
+        leftovers = [name for _, _, files in os.walk(self.directory.name) for name in files]
+        self.assertEqual(leftovers, [])
+
+    def test_eviction_removes_least_recently_used(self):
+        keys = [pdf_cache.pdf_cache_key('Sales Invoice', f'FC-{index}', 'm1', 'Standard', '0') for index in range(3)]
+        with mock.patch.object(pdf_cache, 'PDF_CACHE_MAX_BYTES', 25):
+            for index, key in enumerate(keys[:2]):
+                self._store(key, [b'x' * 10])
+                os.utime(pdf_cache._entry_path(key), (1000 + index, 1000 + index))
+            # Usar el primero lo vuelve el más reciente
+            pdf_cache.open_cached_pdf(keys[0]).close()
+            self._store(keys[2], [b'x' * 10])
+
+        self.assertTrue(os.path.exists(pdf_cache._entry_path(keys[0])))
+        self.assertFalse(os.path.exists(pdf_cache._entry_path(keys[1])))
+        self.assertTrue(os.path.exists(pdf_cache._entry_path(keys[2])))
+        self.assertLessEqual(pdf_cache.pdf_cache_stats()['bytes'], 25)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import threading
+import unittest
+import zipfile
+from unittest import mock
+
+from services import pdf_cache, pdf_export
+
+
+class _StreamResponse:
+    def __init__(self, body):
+        self.body = body
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), 4):
+            yield self.body[start:start + 4]
+
+    def close(self):
+        self.closed = True
+
+
+class _Job:
+    id = 'job-1'
+
+    def __init__(self):
+        self.updates = []
+        self.progress = []
+
+    def update(self, **fields):
+        self.updates.append(fields)
+
+    def set_progress(self, progress, force=False, **fields):
+        self.progress.append(progress)
+
+    def cancel_requested(self):
+        return False
+
+    def check_cancelled(self):
+        pass
+
+
+class TestPdfExport(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.export_dir = os.path.join(directory.name, 'exports')
+        for target, name, value in (
+            (pdf_export, 'PDF_EXPORT_DIR', self.export_dir),
+            (pdf_export, 'PDF_EXPORT_MAX_WORKERS', 2),
+            (pdf_cache, 'PDF_CACHE_DIR', os.path.join(directory.name, 'cache')),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def _fake_stream(self, session, doc_type, doc_name, format_name, no_letterhead, letterhead=None):
+        with self.lock:
+            self.requests.append((doc_name, letterhead))
+        if doc_name == 'FC-ROTA':
+            return None, {'message': 'Error de impresión', 'status_code': 500}
+        return _StreamResponse(f'%PDF {doc_name}'.encode()), None
+
+    def test_builds_zip_with_one_letterhead_and_reports_failures(self):
+        rows = [
+            {'name': 'FC-1', 'modified': 'm1', 'docstatus': 1},
+            {'name': 'FC-2', 'modified': 'm1', 'docstatus': 0},
+            {'name': 'FC-ROTA', 'modified': 'm1', 'docstatus': 1},
+        ]
+        options = {'format': 'Standard', 'format_version': '', 'no_letterhead': '0', 'letterhead': 'ACME (Inline)', 'letterhead_hash': 'abc'}
+        job = _Job()
+        with mock.patch.object(pdf_export, 'request_pdf_stream', side_effect=self._fake_stream):
+            pdf_export.run_pdf_export(job, object(), 'Sales Invoice', rows, ['FC-NO'], options, 'facturas.zip')
+
+        self.assertEqual({letterhead for _, letterhead in self.requests}, {'ACME (Inline)'})
+        with zipfile.ZipFile(pdf_export.export_path(job.id)) as archive:
+            self.assertEqual(archive.read('FC-1.pdf'), b'%PDF FC-1')
+            self.assertEqual(archive.read('FC-2.pdf'), b'%PDF FC-2')
+            errors = archive.read('errores.txt').decode()
+        self.assertIn('FC-ROTA: Error de impresión', errors)
+        self.assertIn('FC-NO: Documento no encontrado', errors)
+
+        final = job.updates[-1]
+        self.assertEqual(final['status'], 'completed')
+        self.assertEqual(final['exported'], 2)
+        self.assertEqual(final['progress'], 4)
+        self.assertEqual(job.progress[-1], 4)
+        self.assertFalse(os.path.exists(f"{pdf_export.export_path(job.id)}.tmp"))
+
+        # El confirmado quedó en el cache de PDFs: la segunda exportación no lo pide
+        self.requests.clear()
+        with mock.patch.object(pdf_export, 'request_pdf_stream', side_effect=self._fake_stream):
+            pdf_export.run_pdf_export(_Job(), object(), 'Sales Invoice', rows[:2], [], options, 'facturas.zip')
+        self.assertEqual([name for name, _ in self.requests], ['FC-2'])
+
+    def test_names_keep_order_and_report_missing(self):
+        rows = [{'name': 'B', 'modified': 'm', 'docstatus': 1}, {'name': 'A', 'modified': 'm', 'docstatus': 1}]
+        with mock.patch.object(pdf_export, 'fetch_list_by_names', return_value=(rows, None)):
+            found, missing, error = pdf_export.list_export_documents(object(), 'Sales Invoice', names=['A', 'X', 'B', 'A'])
+        self.assertIsNone(error)
+        self.assertEqual([row['name'] for row in found], ['A', 'B'])
+        self.assertEqual(missing, ['X'])
+
+
+if __name__ == '__main__':
+    unittest.main()
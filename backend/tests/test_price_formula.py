@@ -0,0 +1,77 @@
+import random
+import unittest
+
+from utils.price_formula import (
+    FormulaBooleanResult,
+    compile_formula,
+    safe_eval_formula,
+)
+
+
+FORMULAS = [
+    'price.compra * 1.35',
+    'IF(price.compra > 100, price.compra * 1.3, price.compra * 1.5)',
+    'IF(price.actual > 0 AND price.compra > price.actual, price.compra * 1.2, price.actual)',
+    'Math.ceil(price.compra * 1.21 / 10) * 10',
+    'round(max(price.compra * 1.4, price.actual, 50), 2)',
+    'IF(10 < price.compra < 500, pow(price.compra, 1.01), abs(price.compra - price.actual))',
+    '150',
+]
+
+
+class TestPriceFormula(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(5)
+        self.compras = [round(rng.uniform(0, 1000), 2) for _ in range(200)]
+        self.actuals = [round(rng.uniform(0, 1000), 2) if index % 3 else 0.0 for index in range(200)]
+
+    def test_batch_matches_scalar_evaluation(self):
+        for formula in FORMULAS:
+            compiled = compile_formula(formula)
+            rates, errors = compiled.evaluate_batch(self.compras, self.actuals)
+            self.assertEqual(errors, {}, formula)
+            for compra, actual, rate in zip(self.compras, self.actuals, rates):
+                expected = float(compiled.evaluate(actual=actual, compra=compra))
+                self.assertAlmostEqual(rate, expected, places=9, msg=formula)
+
+    def test_rounding_with_digits_matches_python_round(self):
+        # np.round(x, 2) difiere de round(x, 2) en valores como 2.675 o 484.5 * 1.21
+        compras = [2.675, 484.5, 1.005, 0.125, 2.5] * 4
+        for formula in ('round(price.compra, 2)', 'round(price.compra * 1.21, 2)', 'round(price.compra, 1)', 'round(price.compra)'):
+            compiled = compile_formula(formula)
+            self.assertIsNotNone(compiled.vector_code)
+            rates, errors = compiled.evaluate_batch(compras)
+            self.assertEqual(errors, {}, formula)
+            self.assertEqual(rates, [compiled.evaluate_rate(compra=compra) for compra in compras], formula)
+        self.assertEqual(compile_formula('round(price.compra, 2)').evaluate_batch(compras)[0][0], 2.67)
+        self.assertEqual(compile_formula('round(price.compra * 1.21, 2)').evaluate_batch(compras)[0][1], 586.25)
+
+    def test_formulas_are_vectorized_and_cached(self):
+        compiled = compile_formula(FORMULAS[1])
+        self.assertIsNotNone(compiled.vector_code)
+        self.assertIs(compile_formula(FORMULAS[1]), compiled)
+
+    def test_division_by_zero_reports_the_row(self):
+        compras = [10.0] * 20
+        actuals = [2.0] * 20
+        actuals[7] = 0.0
+        rates, errors = compile_formula('price.compra / price.actual').evaluate_batch(compras, actuals)
+        self.assertEqual(list(errors), [7])
+        self.assertIsInstance(errors[7], ZeroDivisionError)
+        self.assertIsNone(rates[7])
+        self.assertEqual(rates[0], 5.0)
+
+    def test_boolean_result_is_flagged(self):
+        rates, errors = compile_formula('price.compra > 100').evaluate_batch(self.compras, self.actuals)
+        self.assertTrue(all(isinstance(error, FormulaBooleanResult) for error in errors.values()))
+        self.assertEqual(len(errors), len(self.compras))
+
+    def test_unsafe_names_are_rejected_at_compile_time(self):
+        with self.assertRaises(ValueError):
+            compile_formula('__import__("os").getcwd()')
+        with self.assertRaises(ValueError):
+            safe_eval_formula('open("x")')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from unittest import mock
+
+from services import reconciliation_queries
+from utils.conciliation_utils import CONCILIATION_FIELD
+
+
+class TestReconciliationQueries(unittest.TestCase):
+    def test_filters_and_projection_are_pushed_to_erpnext(self):
+        calls = []
+
+        def fake_fetch(session, doctype, fields, filters, **kwargs):
+            calls.append((doctype, fields, filters))
+            return [], None
+
+        with mock.patch.object(reconciliation_queries, 'fetch_list_paged', side_effect=fake_fetch):
+            groups, error = reconciliation_queries.get_party_reconciliations(None, 'Supplier', 'PROV - A', 'ACME', submitted_only=False)
+
+        self.assertEqual((groups, error), ([], None))
+        self.assertEqual([call[0] for call in calls], ['Purchase Invoice', 'Payment Entry'])
+        for _, fields, filters in calls:
+            self.assertNotIn('*', fields)
+            self.assertIn([CONCILIATION_FIELD, 'is', 'set'], filters)
+            self.assertNotIn(['docstatus', '=', 1], filters)
+        self.assertIn(['supplier', '=', 'PROV - A'], calls[0][2])
+        self.assertIn(['party', '=', 'PROV - A'], calls[1][2])
+
+    def test_groups_are_built_with_related_payments(self):
+        invoices = [
+            {"name": "FC-1", "posting_date": "2024-05-01", "grand_total": 100, "outstanding_amount": 100, CONCILIATION_FIELD: "C1"},
+            {"name": "NC-1", "posting_date": "2024-05-03", "is_return": 1, "grand_total": -40, "outstanding_amount": -40, CONCILIATION_FIELD: "C1"},
+            {"name": "FC-2", "posting_date": "2024-06-01", "grand_total": 10, "outstanding_amount": 10, CONCILIATION_FIELD: "C2"},
+        ]
+        payments = [
+            {"name": "PE-1", "posting_date": "2024-05-04", "paid_amount": 60, "unallocated_amount": 60, CONCILIATION_FIELD: "C1"},
+        ]
+        related = {
+            "PE-2": {"payment": {"name": "PE-2", "posting_date": "2024-06-02", "paid_amount": 5, "unallocated_amount": 5}, "invoices": ["FC-2"]},
+            "PE-1": {"payment": payments[0], "invoices": ["FC-1"]},
+        }
+        groups = reconciliation_queries.build_reconciliation_list(invoices, payments, 'Customer', related_payments=related)
+
+        self.assertEqual([group["reconciliation_id"] for group in groups], ["C2", "C1"])
+        c2, c1 = groups
+        self.assertEqual(c1["total_amount"], 0.0)
+        self.assertEqual([document["voucher_type"] for document in c1["documents"]], ["Factura", "Nota de Crédito", "Pago"])
+        self.assertEqual(c2["total_amount"], 5.0)
+        self.assertIsNone(c2["documents"][-1][CONCILIATION_FIELD])
+
+
+if __name__ == '__main__':
+    unittest.main()
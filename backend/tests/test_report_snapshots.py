@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from routes.reports import percepciones_reports
+from services import report_snapshots
+from utils import frappe_list
+
+
+class TestReportSnapshots(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(report_snapshots, 'REPORT_SNAPSHOT_DIR', directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_diff_documents_keeps_unchanged_and_drops_removed(self):
+        snapshot = {'documents': {
+            'FC-1': {'name': 'FC-1', 'modified': 'm1', 'rows': [1]},
+            'FC-2': {'name': 'FC-2', 'modified': 'm1', 'rows': [2]},
+            'FC-3': {'name': 'FC-3', 'modified': 'm1', 'rows': [3]},
+        }}
+        stale, kept = report_snapshots.diff_documents(snapshot, {'FC-1': 'm1', 'FC-2': 'm2', 'FC-4': 'm1'})
+        self.assertEqual(sorted(stale), ['FC-2', 'FC-4'])
+        self.assertEqual(list(kept), ['FC-1'])
+
+        stale, kept = report_snapshots.diff_documents(None, {'FC-1': 'm1'})
+        self.assertEqual((stale, kept), (['FC-1'], {}))
+
+    def test_save_and_load_round_trip(self):
+        documents = {'FC-1': {'name': 'FC-1', 'modified': 'm1', 'rows': [{'neto': 10.0}]}}
+        saved = report_snapshots.save_snapshot('ACME', 'ventas', '2026-01', documents, context='abc')
+        loaded = report_snapshots.load_snapshot('ACME', 'ventas', '2026-01', context='abc')
+        self.assertEqual(loaded['documents'], documents)
+        self.assertEqual(loaded['built_at'], saved['built_at'])
+
+        # Otro contexto (p. ej. cambiaron las tasas) u otra clave no reutilizan el snapshot
+        self.assertIsNone(report_snapshots.load_snapshot('ACME', 'ventas', '2026-01', context='otro'))
+        self.assertIsNone(report_snapshots.load_snapshot('ACME', 'compras', '2026-01', context='abc'))
+
+        # Un refresco incremental conserva built_at
+        refreshed = report_snapshots.save_snapshot(
+            'ACME', 'ventas', '2026-01', documents, context='abc', built_at=saved['built_at']
+        )
+        self.assertEqual(refreshed['built_at'], saved['built_at'])
+
+    def test_version_mismatch_and_expiry_discard_snapshot(self):
+        report_snapshots.save_snapshot('ACME', 'ventas', '2026-01', {})
+        path = report_snapshots._snapshot_path('ACME', 'ventas', '2026-01')
+        with open(path, encoding='utf-8') as handler:
+            data = json.load(handler)
+
+        data['version'] = report_snapshots.SNAPSHOT_VERSION - 1
+        with open(path, 'w', encoding='utf-8') as handler:
+            json.dump(data, handler)
+        self.assertIsNone(report_snapshots.load_snapshot('ACME', 'ventas', '2026-01'))
+
+        data['version'] = report_snapshots.SNAPSHOT_VERSION
+        data['built_at'] = (datetime.now(timezone.utc) - timedelta(hours=5)).isoformat()
+        with open(path, 'w', encoding='utf-8') as handler:
+            json.dump(data, handler)
+        self.assertIsNone(report_snapshots.load_snapshot('ACME', 'ventas', '2026-01', max_age_hours=4))
+        self.assertIsNotNone(report_snapshots.load_snapshot('ACME', 'ventas', '2026-01', max_age_hours=6))
+
+    def test_failed_chunk_returns_error_and_snapshot_is_not_saved(self):
+        def fake_paged(session, doctype, fields, filters, **kwargs):
+            if doctype == 'Purchase Invoice' and filters[0][1] == 'in' and 'FC-3' in filters[0][2]:
+                return [], {'success': False, 'message': 'timeout'}
+            if filters[0][1] == 'in':
+                return [{'name': name, 'docstatus': 1, 'modified': 'm1'} for name in filters[0][2]], None
+            return [{'name': name, 'modified': 'm1'} for name in ('FC-1', 'FC-2', 'FC-3')], None
+
+        with mock.patch.object(frappe_list, 'fetch_list_paged', side_effect=fake_paged):
+            rows, error = frappe_list.fetch_list_by_names(
+                object(), 'Purchase Invoice', ['FC-1', 'FC-2', 'FC-3'], ['name'], chunk_size=2
+            )
+        self.assertEqual([row['name'] for row in rows], ['FC-1', 'FC-2'])
+        self.assertEqual(error['message'], 'timeout')
+
+        with mock.patch.object(frappe_list, 'fetch_list_paged', side_effect=fake_paged), \
+                mock.patch.object(percepciones_reports, 'fetch_list_paged', side_effect=fake_paged), \
+                mock.patch.object(percepciones_reports, 'save_snapshot') as save:
+            with self.assertRaises(ValueError):
+                percepciones_reports._build_report(object(), {}, 'ACME', 2026, 1, None, None)
+        save.assert_not_called()
+        self.assertFalse(os.listdir(report_snapshots.REPORT_SNAPSHOT_DIR))
+
+
+if __name__ == '__main__':
+    unittest.main()
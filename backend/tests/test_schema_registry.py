@@ -0,0 +1,80 @@
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from routes import item_groups, price_list_automation
+from utils import schema_registry
+
+
+class _Response:
+    status_code = 201
+    text = ''
+
+    def json(self):
+        return {'data': {}}
+
+
+class TestSchemaRegistry(unittest.TestCase):
+    def setUp(self):
+        schema_registry.forget_schema()
+
+    def tearDown(self):
+        schema_registry.forget_schema()
+
+    def test_verify_runs_once_and_failures_are_retried(self):
+        calls = []
+
+        def verify():
+            calls.append(1)
+            return len(calls) > 1
+
+        self.assertFalse(schema_registry.ensure_ready(schema_registry.DOCTYPE, 'Indice', verify))
+        self.assertTrue(schema_registry.ensure_ready(schema_registry.DOCTYPE, 'Indice', verify))
+        self.assertTrue(schema_registry.ensure_ready(schema_registry.DOCTYPE, 'Indice', verify))
+        self.assertEqual(len(calls), 2)
+
+        self.assertEqual(schema_registry.forget_schema(schema_registry.DOCTYPE), 1)
+        schema_registry.ensure_ready(schema_registry.DOCTYPE, 'Indice', verify)
+        self.assertEqual(len(calls), 3)
+
+    def test_price_list_fields_checked_in_one_query_then_skipped(self):
+        created = []
+
+        def fake_request(session, method, endpoint, data=None, **kwargs):
+            created.append(data['fieldname'])
+            return _Response(), None
+
+        with mock.patch.object(price_list_automation, 'fetch_existing_custom_fields',
+                               return_value={'auto_update_enabled'}) as lookup, \
+                mock.patch.object(price_list_automation, 'make_erpnext_request', side_effect=fake_request):
+            price_list_automation.ensure_price_list_custom_fields(object(), {})
+            price_list_automation.ensure_price_list_custom_fields(object(), {})
+
+        lookup.assert_called_once()
+        self.assertEqual(created, ['auto_update_formula'])
+        self.assertEqual(schema_registry.schema_registry_stats()['ready'], {schema_registry.CUSTOM_FIELD: 2})
+
+    def test_single_delete_is_routed_to_delete_and_forgets_the_group(self):
+        app = Flask(__name__)
+        app.register_blueprint(item_groups.item_groups_bp)
+        schema_registry.mark_ready(schema_registry.ITEM_GROUP, 'Bebidas', 'Bebidas')
+        methods = []
+
+        def fake_request(session, method, endpoint, **kwargs):
+            methods.append(method)
+            response = _Response()
+            response.status_code = 200 if method == 'GET' else 202
+            return response, None
+
+        with mock.patch.object(item_groups, 'get_session_with_auth', return_value=(object(), {}, 'ana', None)), \
+                mock.patch.object(item_groups, 'make_erpnext_request', side_effect=fake_request):
+            response = app.test_client().delete('/api/item-groups/Bebidas')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(methods, ['GET', 'DELETE'])
+        self.assertFalse(schema_registry.is_ready(schema_registry.ITEM_GROUP, 'Bebidas'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from utils.search_index import ItemSearchIndex, fold_text
+
+
+def _item(name, item_name='', description='', modified='2025-01-01 00:00:00'):
+    return {
+        'name': name,
+        'item_code': name,
+        'item_name': item_name,
+        'description': description,
+        'modified': modified,
+    }
+
+
+class TestItemSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = ItemSearchIndex()
+        self.index.rebuild([
+            _item('VAL-001 - ABC', 'Válvula esférica', 'Bronce 1/2"', '2025-01-01 10:00:00'),
+            _item('VAL-002 - ABC', 'Valvula de retención', 'PVC', '2025-01-02 10:00:00'),
+            _item('BOM-001 - ABC', 'Bomba centrífuga', 'Con válvula incorporada', '2025-01-03 10:00:00'),
+            _item('VAL - ABC', 'Kit', '', '2024-12-01 10:00:00'),
+        ])
+
+    def test_fold_text_removes_accents_and_case(self):
+        self.assertEqual(fold_text('  Válvula   ESFÉRICA '), 'valvula esferica')
+
+    def test_text_search_is_accent_insensitive_and_ranked(self):
+        names = self.index.search_text('VALVULA')
+        # Nombre que empieza con la consulta antes que una mención en la descripción
+        self.assertEqual(names, ['VAL-002 - ABC', 'VAL-001 - ABC', 'BOM-001 - ABC'])
+
+    def test_text_search_requires_every_word(self):
+        self.assertEqual(self.index.search_text('bronce valvula'), ['VAL-001 - ABC'])
+        self.assertEqual(self.index.search_text('bronce bomba'), [])
+
+    def test_prefix_search_puts_exact_code_first(self):
+        names = self.index.search_prefix('val - abc')
+        self.assertEqual(names, ['VAL - ABC'])
+        names = self.index.search_prefix('VAL')
+        self.assertEqual(names[0], 'VAL-002 - ABC')
+        self.assertEqual(len(names), 3)
+
+    def test_incremental_add_and_remove(self):
+        self.index.add(_item('VAL-001 - ABC', 'Grifo', '', '2025-02-01 00:00:00'))
+        self.assertNotIn('VAL-001 - ABC', self.index.search_text('esferica'))
+        self.assertEqual(self.index.search_text('grifo'), ['VAL-001 - ABC'])
+        self.index.remove('VAL-002 - ABC')
+        self.assertEqual(self.index.search_prefix('VAL-'), ['VAL-001 - ABC'])
+        self.assertEqual(self.index.memory_usage()['documents'], 3)
+
+    def test_accept_filter_and_limit(self):
+        names = self.index.search_prefix('VAL', limit=1, accept=lambda name: name != 'VAL-002 - ABC')
+        self.assertEqual(names, ['VAL-001 - ABC'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+
+from routes import inventory_utils
+
+
+class TestResolveStockMovements(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def _fake_fetch(self, session, doctype, fields, filters, **kwargs):
+        self.calls.append(doctype)
+        if doctype == 'Delivery Note':
+            # DN-2 fue eliminado, DN-3 está en borrador
+            return [{"name": "DN-1", "docstatus": 1}, {"name": "DN-3", "docstatus": 0}], None
+        if doctype == 'Stock Reconciliation':
+            return [{"name": "SR-1", "docstatus": 1}], None
+        if doctype == 'Stock Entry':
+            return [], {"success": False, "message": "timeout"}
+        if doctype == 'Stock Reconciliation Item':
+            self.assertEqual(kwargs.get('parent'), 'Stock Reconciliation')
+            return [
+                {"parent": "SR-1", "item_code": "A - X", "quantity_difference": "-3"},
+                {"parent": "SR-1", "item_code": "A - X", "quantity_difference": "9"},
+            ], None
+        raise AssertionError(doctype)
+
+    def test_vouchers_are_resolved_with_one_query_per_doctype(self):
+        movements = [
+            {"name": f"SLE-{index}", "voucher_type": "Delivery Note", "voucher_no": "DN-1", "actual_qty": -1}
+            for index in range(50)
+        ]
+        movements += [
+            {"name": "SLE-a", "voucher_type": "Delivery Note", "voucher_no": "DN-2", "actual_qty": -1},
+            {"name": "SLE-b", "voucher_type": "Delivery Note", "voucher_no": "DN-3", "actual_qty": -1},
+            {"name": "SLE-c", "voucher_type": "Stock Entry", "voucher_no": "SE-1", "actual_qty": 5},
+            {"name": "SLE-d", "voucher_type": "Stock Reconciliation", "voucher_no": "SR-1", "actual_qty": 0},
+            {"name": "SLE-e", "voucher_type": None, "voucher_no": None, "actual_qty": 1},
+        ]
+        with mock.patch.object(inventory_utils, 'fetch_list_paged', side_effect=self._fake_fetch):
+            resolved = inventory_utils.resolve_stock_movements(None, movements, item_code='A - X')
+
+        self.assertEqual(sorted(self.calls), ['Delivery Note', 'Stock Entry', 'Stock Reconciliation', 'Stock Reconciliation Item'])
+        names = [movement["name"] for movement in resolved]
+        self.assertEqual(len(names), 53)
+        self.assertNotIn('SLE-a', names)
+        self.assertNotIn('SLE-b', names)
+        self.assertIn('SLE-c', names)
+        reco = next(movement for movement in resolved if movement["name"] == 'SLE-d')
+        self.assertEqual(reco["actual_qty"], -3.0)
+        self.assertTrue(reco["_enriched_from_reco"])
+        self.assertEqual(movements[-2]["actual_qty"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+from services import trial_balance
+from utils.json_state_store import JsonStateStore
+
+# Asientos por (cuenta, fecha): debe, haber, modified
+ENTRIES = {
+    ('Banco', '2026-01-10'): (100.0, 0.0, '2026-01-10 10:00:00'),
+    ('Banco', '2026-02-05'): (0.0, 30.0, '2026-02-05 10:00:00'),
+    ('Banco', '2026-03-20'): (50.0, 0.0, '2026-03-20 10:00:00'),
+    ('Ventas', '2026-01-10'): (0.0, 100.0, '2026-01-10 10:00:00'),
+    ('Ventas', '2026-03-20'): (0.0, 50.0, '2026-03-20 10:00:00'),
+    ('Caja', '2026-02-05'): (30.0, 0.0, '2026-02-05 10:00:00'),
+}
+
+
+class TestTrialBalance(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = JsonStateStore(
+            os.path.join(directory.name, 'trial_balance.json'),
+            default_factory=lambda: {"version": trial_balance.CACHE_VERSION, "months": {}},
+            flush_interval=0
+        )
+        patcher = mock.patch.object(trial_balance, '_store', store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.entries = dict(ENTRIES)
+        self.lock_dates = {}
+        self.queries = []
+        self.validations = []
+
+    def _aggregate(self, from_date, to_date, accepts):
+        totals = {}
+        for (account, posted), (debit, credit, modified) in self.entries.items():
+            if not accepts(account) or not (from_date.isoformat() <= posted <= to_date.isoformat()):
+                continue
+            current = totals.setdefault(account, {'debit': 0.0, 'credit': 0.0, 'entries': 0, 'last_modified': None})
+            current['debit'] += debit
+            current['credit'] += credit
+            current['entries'] += 1
+            current['last_modified'] = max(current['last_modified'] or '', modified)
+        return totals
+
+    def _fake_totals(self, session, company, from_date, to_date, exclude_accounts=None):
+        self.queries.append((from_date, to_date, frozenset(exclude_accounts or ())))
+        return self._aggregate(from_date, to_date, lambda account: account not in (exclude_accounts or ())), None
+
+    def _fake_stamps(self, session, company, from_date, to_date, accounts):
+        self.validations.append((from_date, to_date, frozenset(accounts)))
+        totals = self._aggregate(from_date, to_date, lambda account: account in accounts)
+        return {
+            account: {'entries': values['entries'], 'last_modified': values['last_modified']}
+            for account, values in totals.items()
+        }, None
+
+    def _run(self):
+        with mock.patch.object(trial_balance, 'fetch_account_lock_dates', return_value=(self.lock_dates, None)), \
+                mock.patch.object(trial_balance, 'fetch_account_totals', side_effect=self._fake_totals), \
+                mock.patch.object(trial_balance, 'fetch_account_stamps', side_effect=self._fake_stamps):
+            balances, info, error = trial_balance.get_trial_balance(object(), 'ACME', '2026-01-01', '2026-03-31')
+        self.assertIsNone(error)
+        return balances, info
+
+    def test_without_locks_one_grouped_query_for_the_range(self):
+        balances, info = self._run()
+        self.assertEqual(self.queries, [(date(2026, 1, 1), date(2026, 3, 31), frozenset())])
+        self.assertEqual(balances['Banco'], {'debit': 150.0, 'credit': 30.0, 'balance': 120.0})
+        self.assertEqual(balances['Ventas']['balance'], -150.0)
+        self.assertEqual(info['cached_months'], 0)
+
+    def test_locked_months_are_materialized_once_and_merged(self):
+        self.lock_dates = {'Banco': date(2026, 2, 28), 'Caja': date(2026, 2, 28)}
+        first, info = self._run()
+        self.assertEqual(info['materialized_months'], 2)
+
+        self.queries.clear()
+        second, info = self._run()
+        self.assertEqual(second, first)
+        self.assertEqual(info['cached_months'], 2)
+        # Una validación para enero-febrero + enero-febrero sin las cuentas cerradas + marzo completo
+        self.assertEqual(self.validations, [(date(2026, 1, 1), date(2026, 2, 28), frozenset({'Banco', 'Caja'}))])
+        self.assertEqual(self.queries, [
+            (date(2026, 1, 1), date(2026, 2, 28), frozenset({'Banco', 'Caja'})),
+            (date(2026, 3, 1), date(2026, 3, 31), frozenset()),
+        ])
+
+        # Al reabrir febrero para Banco se vuelve a pedir ese mes
+        trial_balance.invalidate_trial_balance('ACME', 'Banco', from_date='2026-02-01')
+        self.lock_dates = {'Banco': date(2026, 1, 31), 'Caja': date(2026, 2, 28)}
+        self.queries.clear()
+        third, _ = self._run()
+        self.assertEqual(third, first)
+        self.assertEqual(self.queries, [
+            (date(2026, 1, 1), date(2026, 1, 31), frozenset({'Banco', 'Caja'})),
+            (date(2026, 2, 1), date(2026, 2, 28), frozenset({'Caja'})),
+            (date(2026, 3, 1), date(2026, 3, 31), frozenset()),
+        ])
+
+    def test_entries_posted_in_locked_month_invalidate_the_cached_account(self):
+        self.lock_dates = {'Banco': date(2026, 2, 28), 'Caja': date(2026, 2, 28)}
+        self._run()
+
+        # Una factura (no bloqueada por el cierre) asienta en Banco en enero
+        self.entries[('Banco', '2026-01-25')] = (20.0, 0.0, '2026-04-02 09:00:00')
+        self.queries.clear()
+        balances, info = self._run()
+        self.assertEqual(balances['Banco'], {'debit': 170.0, 'credit': 30.0, 'balance': 140.0})
+        self.assertEqual(info['discarded_accounts'], 1)
+        self.assertEqual(self.queries, [
+            (date(2026, 3, 1), date(2026, 3, 31), frozenset()),
+            (date(2026, 1, 1), date(2026, 1, 31), frozenset({'Caja'})),
+            (date(2026, 2, 1), date(2026, 2, 28), frozenset({'Caja'})),
+        ])
+
+        # Ya re-materializado, la siguiente consulta vuelve a usar el cache
+        self.queries.clear()
+        again, info = self._run()
+        self.assertEqual(again, balances)
+        self.assertEqual(info['discarded_accounts'], 0)
+        self.assertEqual(info['materialized_months'], 0)
+
+        # Un asiento cancelado baja la cantidad aunque no cambie el max(modified)
+        del self.entries[('Caja', '2026-02-05')]
+        balances, info = self._run()
+        self.assertNotIn('Caja', balances)
+        self.assertEqual(info['discarded_accounts'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import time
+import unittest
+
+from utils.ttl_cache import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_hit_and_miss_counters(self):
+        cache = TTLCache(maxsize=4, ttl=60)
+        self.assertIsNone(cache.get('sid-1'))
+        cache.set('sid-1', 'user@example.com')
+        self.assertEqual(cache.get('sid-1'), 'user@example.com')
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_expired_entries_are_misses(self):
+        cache = TTLCache(maxsize=4, ttl=0.01)
+        cache.set('k', 'v')
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('k'))
+        self.assertNotIn('k', cache)
+
+    def test_lru_eviction_keeps_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_invalidate(self):
+        cache = TTLCache(maxsize=4, ttl=60)
+        cache.set(('Company', 'A'), 1)
+        cache.set(('Company', 'B'), 2)
+        self.assertTrue(cache.invalidate(('Company', 'A')))
+        self.assertFalse(cache.invalidate(('Company', 'A')))
+        self.assertEqual(cache.invalidate_where(lambda key: key[0] == 'Company'), 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_get_or_load_does_not_cache_none(self):
+        cache = TTLCache(maxsize=4, ttl=60)
+        calls = []
+        cache.get_or_load('x', lambda: calls.append(1))
+        cache.get_or_load('x', lambda: calls.append(1))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(cache.get_or_load('y', lambda: 'loaded'), 'loaded')
+        self.assertEqual(cache.get_or_load('y', lambda: 'other'), 'loaded')
+
+
+if __name__ == '__main__':
+    unittest.main()
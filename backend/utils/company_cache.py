@@ -0,0 +1,63 @@
+# company_cache.py - Cache compartido de metadatos de compañía
+#
+# get_company_abbr, get_company_default_currency y get_company_defaults leían
+# /api/resource/Company/<name> en cada llamada (incluso dentro de loops por item o
+# por cliente). Este módulo carga el documento Company una vez y lo sirve desde
+# memoria con TTL; se invalida al modificar/eliminar la compañía.
+
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+from config import COMPANY_CACHE_TTL, COMPANY_CACHE_MAXSIZE
+from utils.ttl_cache import TTLCache
+
+_company_docs = TTLCache(maxsize=COMPANY_CACHE_MAXSIZE, ttl=COMPANY_CACHE_TTL, name="company_docs")
+
+
+def get_company_doc(session, company_name: str, force_refresh: bool = False) -> Optional[Dict[str, Any]]:
+    """Documento Company completo (desde cache si está vigente)"""
+    if not company_name:
+        return None
+
+    if not force_refresh:
+        cached = _company_docs.get(company_name)
+        if cached is not None:
+            return cached
+
+    # Import local para evitar import circular (http_utils invalida este cache)
+    from utils.http_utils import make_erpnext_request
+
+    response, error = make_erpnext_request(
+        session=session,
+        method="GET",
+        endpoint=f"/api/resource/Company/{quote(company_name)}",
+        operation_name="Get Company (cache)"
+    )
+    if error or not response or response.status_code != 200:
+        return None
+
+    company_doc = response.json().get('data') or None
+    if company_doc:
+        _company_docs.set(company_name, company_doc)
+    return company_doc
+
+
+def get_company_field(session, company_name: str, fieldname: str, default: Any = None) -> Any:
+    company_doc = get_company_doc(session, company_name)
+    if not company_doc:
+        return default
+    value = company_doc.get(fieldname)
+    return default if value is None else value
+
+
+def invalidate_company(company_name: Optional[str] = None) -> int:
+    """Invalidar una compañía (o todas si no se indica nombre)"""
+    if company_name:
+        return 1 if _company_docs.invalidate(company_name) else 0
+    count = len(_company_docs)
+    _company_docs.clear()
+    return count
+
+
+def get_company_cache_stats() -> Dict[str, Any]:
+    return _company_docs.stats()
@@ -0,0 +1,190 @@
+# erpnext_transport.py - Transporte HTTP compartido (pool keep-alive) hacia ERPNext
+#
+# Antes cada request del navegador creaba un requests.Session nuevo, lo que abría
+# conexiones TCP/TLS nuevas contra ERPNext en cada llamada. Este módulo mantiene un
+# requests.Session por host con HTTPAdapter compartido (pool de conexiones) para todo
+# el proceso. Las sesiones por usuario (ERPNextSession) solo guardan sus cookies
+# (sid) y las inyectan en cada request sobre el transporte compartido.
+
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.cookies import RequestsCookieJar, merge_cookies
+
+from config import (
+    ERPNEXT_POOL_CONNECTIONS,
+    ERPNEXT_POOL_MAXSIZE,
+    ERPNEXT_POOL_BLOCK,
+    ERPNEXT_KEEP_ALIVE,
+    ERPNEXT_TIMEOUT_GET,
+    ERPNEXT_TIMEOUT_POST,
+    ERPNEXT_TIMEOUT_PUT,
+    ERPNEXT_TIMEOUT_DELETE,
+)
+
+_METHOD_TIMEOUTS = {
+    "GET": ERPNEXT_TIMEOUT_GET,
+    "HEAD": ERPNEXT_TIMEOUT_GET,
+    "POST": ERPNEXT_TIMEOUT_POST,
+    "PUT": ERPNEXT_TIMEOUT_PUT,
+    "DELETE": ERPNEXT_TIMEOUT_DELETE,
+}
+
+_transports: Dict[str, requests.Session] = {}
+_transports_lock = threading.Lock()
+
+
+class _RejectAllCookiesPolicy(DefaultCookiePolicy):
+    """Impide que el transporte compartido guarde cookies (evita mezclar sid entre usuarios)"""
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+def get_request_timeout(method: str) -> float:
+    """Timeout configurado para un método HTTP (segundos)"""
+    return _METHOD_TIMEOUTS.get((method or "GET").upper(), ERPNEXT_TIMEOUT_GET)
+
+
+def _transport_key(url: str) -> str:
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}".lower()
+
+
+def _build_transport() -> requests.Session:
+    transport = requests.Session()
+    transport.cookies.set_policy(_RejectAllCookiesPolicy())
+    adapter = HTTPAdapter(
+        pool_connections=ERPNEXT_POOL_CONNECTIONS,
+        pool_maxsize=ERPNEXT_POOL_MAXSIZE,
+        pool_block=ERPNEXT_POOL_BLOCK,
+    )
+    transport.mount("http://", adapter)
+    transport.mount("https://", adapter)
+    if not ERPNEXT_KEEP_ALIVE:
+        transport.headers["Connection"] = "close"
+    return transport
+
+
+def get_transport(url: str) -> requests.Session:
+    """Obtener (o crear) el transporte compartido para el host de la URL"""
+    key = _transport_key(url)
+    transport = _transports.get(key)
+    if transport is not None:
+        return transport
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = _build_transport()
+            _transports[key] = transport
+        return transport
+
+
+def close_transports():
+    """Cerrar todos los pools (útil en tests y benchmarks)"""
+    with _transports_lock:
+        for transport in _transports.values():
+            try:
+                transport.close()
+            except Exception:
+                pass
+        _transports.clear()
+
+
+def get_transport_stats() -> Dict[str, Any]:
+    """Estado de los pools por host (cantidad de pools urllib3 abiertos)"""
+    stats = {}
+    with _transports_lock:
+        for key, transport in _transports.items():
+            adapter = transport.get_adapter(key + "/")
+            pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+            stats[key] = {
+                "pools": len(pools) if pools is not None else 0,
+                "pool_maxsize": ERPNEXT_POOL_MAXSIZE,
+                "keep_alive": ERPNEXT_KEEP_ALIVE,
+            }
+    return stats
+
+
+class ERPNextSession:
+    """
+    Sesión liviana por usuario.
+
+    Expone la parte de la API de requests.Session que usa el backend (get/post/put/
+    delete/request, cookies, headers) pero no abre conexiones propias: guarda sus
+    cookies y las envía en cada request sobre el transporte compartido del host.
+    """
+
+    def __init__(self, sid: Optional[str] = None, cookie_domain: Optional[str] = None):
+        self.cookies = RequestsCookieJar()
+        self.headers: Dict[str, str] = {}
+        self._sid = sid
+        if sid:
+            if cookie_domain:
+                self.cookies.set("sid", sid, domain=cookie_domain)
+            else:
+                self.cookies.set("sid", sid)
+
+    @property
+    def sid(self) -> Optional[str]:
+        if self._sid:
+            return self._sid
+        for cookie in self.cookies:
+            if cookie.name == "sid":
+                return cookie.value
+        return None
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        cookies = kwargs.pop("cookies", None)
+        request_cookies = merge_cookies(RequestsCookieJar(), self.cookies)
+        if cookies:
+            request_cookies = merge_cookies(request_cookies, cookies)
+
+        headers = dict(self.headers)
+        if kwargs.get("headers"):
+            headers.update(kwargs["headers"])
+        kwargs["headers"] = headers
+
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = get_request_timeout(method)
+
+        response = get_transport(url).request(method, url, cookies=request_cookies, **kwargs)
+
+        # Conservar cookies emitidas por ERPNext (ej: sid en login) solo en esta sesión
+        if response.cookies:
+            self.cookies.update(response.cookies)
+        for previous in response.history:
+            if previous.cookies:
+                self.cookies.update(previous.cookies)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("allow_redirects", True)
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("allow_redirects", False)
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url: str, data=None, json=None, **kwargs) -> requests.Response:
+        return self.request("POST", url, data=data, json=json, **kwargs)
+
+    def put(self, url: str, data=None, **kwargs) -> requests.Response:
+        return self.request("PUT", url, data=data, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        """Las conexiones pertenecen al transporte compartido; no hay nada que cerrar"""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,236 @@
+"""
+Lecturas masivas con frappe.client.get_list (POST, sin límite de largo de URL).
+
+- fetch_list_paged: recorre todas las páginas de un listado con limit_start (también
+  listados agrupados con sumas).
+- fetch_list_by_names: trae filas para muchos nombres con queries `in` por bloques
+  (sirve también para tablas hijas filtrando por `parent`); corta en el primer bloque
+  con error para que el llamador no trabaje con un resultado incompleto.
+- iter_resource_batches: GET /api/resource con lotes `in` dimensionados según el largo
+  máximo de URL y pedidos en paralelo con un pool acotado.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote, quote_plus, urlencode
+
+from config import ERPNEXT_URL, ERPNEXT_MAX_URL_LENGTH
+from utils.http_utils import make_erpnext_request
+
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_IN_CHUNK_SIZE = 200
+
+
+def fetch_list_paged(
+    session,
+    doctype: str,
+    fields: List[str],
+    filters: List[List[Any]],
+    *,
+    order_by: Optional[str] = None,
+    group_by: Optional[str] = None,
+    parent: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    operation_name: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Todas las filas de un listado, página por página.
+
+    Con group_by los fields pueden llevar agregados ("sum(debit) as debit") y cada
+    fila es un grupo; el paginado es sobre los grupos.
+
+    Returns:
+        tuple: (filas, error) con el mismo criterio que make_erpnext_request
+    """
+    rows: List[Dict[str, Any]] = []
+    start = 0
+    while True:
+        payload: Dict[str, Any] = {
+            "doctype": doctype,
+            "fields": fields,
+            "filters": filters,
+            "limit_start": start,
+            "limit_page_length": page_size,
+        }
+        if order_by:
+            payload["order_by"] = order_by
+        if group_by:
+            payload["group_by"] = group_by
+        if parent:
+            payload["parent"] = parent
+
+        response, error = make_erpnext_request(
+            session=session,
+            method="POST",
+            endpoint="/api/method/frappe.client.get_list",
+            data=payload,
+            operation_name=operation_name or f"Paged list {doctype}",
+        )
+        if error:
+            return rows, error
+        if response.status_code != 200:
+            return rows, {"success": False, "status_code": response.status_code, "message": response.text}
+
+        page = response.json().get("message", []) or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows, None
+        start += page_size
+
+
+def fetch_list_by_names(
+    session,
+    doctype: str,
+    names: Iterable[str],
+    fields: List[str],
+    *,
+    filter_field: str = "name",
+    extra_filters: Optional[List[List[Any]]] = None,
+    order_by: Optional[str] = None,
+    parent: Optional[str] = None,
+    chunk_size: int = DEFAULT_IN_CHUNK_SIZE,
+    operation_name: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Filas de un doctype cuyo filter_field está en names.
+
+    Returns:
+        tuple: (filas, error) - con error las filas son las de los bloques previos y
+        no deben tomarse como el resultado completo
+    """
+    unique_names = sorted({name for name in names if name})
+    rows: List[Dict[str, Any]] = []
+    for start in range(0, len(unique_names), chunk_size):
+        chunk = unique_names[start:start + chunk_size]
+        filters = [[filter_field, "in", chunk]] + list(extra_filters or [])
+        chunk_rows, error = fetch_list_paged(
+            session,
+            doctype,
+            fields,
+            filters,
+            order_by=order_by,
+            parent=parent,
+            operation_name=operation_name,
+        )
+        if error:
+            print(f"--- Bulk fetch {doctype}: error ({error})")
+            return rows, error
+        rows.extend(chunk_rows)
+    return rows, None
+
+
+def plan_url_batches(
+    values: List[Any],
+    base_length: int,
+    *,
+    max_url_length: int = ERPNEXT_MAX_URL_LENGTH,
+    max_batch_size: int = DEFAULT_IN_CHUNK_SIZE,
+) -> List[List[Any]]:
+    """
+    Partir values en lotes cuyo filtro `in` entra en la URL.
+
+    base_length es el largo de la URL con la lista `in` vacía; cada valor suma su
+    JSON codificado más el separador ", " (%2C+). Devuelve [] si ni un valor entra.
+    """
+    budget = max_url_length - base_length
+    batches: List[List[Any]] = []
+    current: List[Any] = []
+    used = 0
+    for value in values:
+        cost = len(quote_plus(json.dumps(value))) + 4
+        if cost > budget:
+            return []
+        if current and (used + cost > budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, used = [], 0
+        current.append(value)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _resource_url_length(doctype: str, params: Dict[str, Any]) -> int:
+    return len(f"{(ERPNEXT_URL or '').rstrip('/')}/api/resource/{quote(doctype)}?{urlencode(params)}")
+
+
+def iter_resource_batches(
+    session,
+    doctype: str,
+    fields: List[str],
+    filter_field: str,
+    values: Iterable[Any],
+    *,
+    extra_filters: Optional[List[List[Any]]] = None,
+    max_workers: int = 4,
+    max_batch_size: int = DEFAULT_IN_CHUNK_SIZE,
+    operation_name: Optional[str] = None,
+) -> Iterator[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+    """
+    Filas de doctype con filter_field `in` values, lote por lote a medida que llegan.
+
+    Los lotes se arman para no pasar ERPNEXT_MAX_URL_LENGTH y se piden en paralelo
+    (max_workers). Si los filtros fijos ya no entran en una URL (ej: cientos de
+    almacenes) se usa POST get_list con lotes de max_batch_size.
+
+    Yields:
+        tuple: (filas del lote, error del lote o None)
+    """
+    unique_values = list(dict.fromkeys(value for value in values if value))
+    if not unique_values:
+        return
+
+    base_filters = [[filter_field, "in", []]] + list(extra_filters or [])
+    base_params = {
+        "fields": json.dumps(fields),
+        "filters": json.dumps(base_filters),
+        "limit_page_length": 0,
+    }
+    batches = plan_url_batches(
+        unique_values,
+        _resource_url_length(doctype, base_params),
+        max_batch_size=max_batch_size,
+    )
+    use_post = not batches
+    if use_post:
+        batches = [
+            unique_values[start:start + max_batch_size]
+            for start in range(0, len(unique_values), max_batch_size)
+        ]
+
+    def fetch(batch_number: int, batch: List[Any]):
+        filters = [[filter_field, "in", batch]] + list(extra_filters or [])
+        label = f"{operation_name or doctype} (batch {batch_number}/{len(batches)})"
+        if use_post:
+            return fetch_list_paged(session, doctype, fields, filters, page_size=5000, operation_name=label)
+        response, error = make_erpnext_request(
+            session=session,
+            method="GET",
+            endpoint=f"/api/resource/{doctype}",
+            params={
+                "fields": json.dumps(fields),
+                "filters": json.dumps(filters),
+                "limit_page_length": 0,
+            },
+            operation_name=label,
+        )
+        if error:
+            return [], error
+        if response.status_code != 200:
+            return [], {"success": False, "status_code": response.status_code, "message": response.text}
+        return response.json().get("data", []) or [], None
+
+    workers = max(1, min(max_workers, len(batches)))
+    if workers == 1:
+        for number, batch in enumerate(batches, start=1):
+            yield fetch(number, batch)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fetch, number, batch) for number, batch in enumerate(batches, start=1)]
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as exc:
+                yield [], {"success": False, "message": str(exc)}
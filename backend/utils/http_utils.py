@@ -5,11 +5,18 @@ import json
 import re
 import html
 import os
+import time
 from flask import jsonify
 from typing import Dict, Any, Optional, Tuple
 from config import ERPNEXT_URL, ERPNEXT_HOST
+from utils.erpnext_transport import get_request_timeout
+from utils.session_cache import invalidate_session
+from utils.logging_utils import get_logger
 from urllib.parse import quote, unquote
 
+logger = get_logger(__name__)
+
+
 def is_detailed_logging_enabled(operation_name: str = "") -> bool:
     """Verificar si el logging detallado está habilitado"""
     # No mostrar logs detallados para operaciones de notificaciones y datos recientes
@@ -116,7 +123,8 @@ def make_erpnext_request(
     custom_headers: Optional[Dict[str, str]] = None,
     operation_name: str = "Operación ERPNext",
     _fiscal_retry: bool = False,
-    send_as_form: bool = False
+    send_as_form: bool = False,
+    stream: bool = False
 ) -> Tuple[Optional[requests.Response], Optional[Dict[str, Any]]]:
     """
     Función centralizada para hacer peticiones HTTP a ERPNext
@@ -129,6 +137,8 @@ def make_erpnext_request(
         params: Parámetros de query string
         custom_headers: Headers adicionales
         operation_name: Nombre descriptivo de la operación para logs
+        stream: No leer el cuerpo de respuestas exitosas (response.iter_content);
+            quien llama debe consumirlo o cerrar la respuesta
 
     Returns:
         Tuple de (response, error_response)
@@ -165,10 +175,10 @@ def make_erpnext_request(
 
         suppress_logs = should_suppress_logging(operation_name)
 
-        # Helper de logging seguro (no imprime si suppress_logs=True)
-        def _log(*args, **kwargs):
+        # Helper de logging seguro (no emite si suppress_logs=True)
+        def _log(message, level="info"):
             if not suppress_logs:
-                print(*args, **kwargs)
+                getattr(logger, level)(message, operation=operation_name)
 
         # LOG: Avisamos que estamos por contactar a ERPNext
         
@@ -177,9 +187,9 @@ def make_erpnext_request(
             # Evitar imprimir headers completos (contienen cookies/metadata innecesaria)
             # Mostrar solo payloads y parámetros relevantes
             if data and method in ['POST', 'PUT']:
-                print(f"📤 Datos JSON enviados: {json.dumps(data, indent=2)}")
+                logger.info("📤 Datos JSON enviados: %s", json.dumps(data, indent=2), operation=operation_name)
             if params:
-                print(f"📤 Parámetros de query: {params}")
+                logger.info("📤 Parámetros de query: %s", params, operation=operation_name)
 
         # Construir URL completa
         url = f"{ERPNEXT_URL}{endpoint}"
@@ -198,26 +208,35 @@ def make_erpnext_request(
             else:
                 request_kwargs['json'] = data
 
-        # Hacer la petición según el método
+        # Hacer la petición según el método (timeouts por método configurables, ver config.py)
+        request_kwargs['timeout'] = get_request_timeout(method)
+        if stream:
+            request_kwargs['stream'] = True
+        started = time.perf_counter()
         if method.upper() == 'GET':
-            response = session.get(url, **request_kwargs, timeout=60)  # 60 segundos timeout
+            response = session.get(url, **request_kwargs)
         elif method.upper() == 'POST':
-            response = session.post(url, **request_kwargs, timeout=120)  # 2 minutos para POST (crear email account)
+            response = session.post(url, **request_kwargs)
         elif method.upper() == 'PUT':
-            response = session.put(url, **request_kwargs, timeout=120)  # 2 minutos para PUT
+            response = session.put(url, **request_kwargs)
         elif method.upper() == 'DELETE':
-            response = session.delete(url, **request_kwargs, timeout=60)  # 60 segundos para DELETE
+            response = session.delete(url, **request_kwargs)
         else:
             return None, {
                 "success": False,
                 "message": f"Método HTTP no soportado: {method}",
                 "status_code": 400
             }
-        # LOG: Mostramos el código de estado de la respuesta de ERPNext
-        _log(f"📡 Respuesta de ERPNext: {response.status_code}")
+        # LOG: una línea por petición (DEBUG; con LOG_LEVEL=INFO no se formatea nada)
+        if not suppress_logs:
+            logger.debug(
+                "📡 Respuesta de ERPNext: %s", response.status_code,
+                method=method.upper(), endpoint=endpoint, operation=operation_name,
+                elapsed_ms=round((time.perf_counter() - started) * 1000, 1)
+            )
 
         # LOG detallado: Mostrar contenido de respuesta solo si está habilitado (no imprimir headers)
-        if is_detailed_logging_enabled(operation_name):
+        if is_detailed_logging_enabled(operation_name) and not (stream and response.status_code < 400):
             # Evitar mostrar headers de respuesta por ruido/privacidad
             try:
                 response_text = response.text
@@ -228,6 +247,10 @@ def make_erpnext_request(
             except:
                 _log("📥 No se pudo leer el contenido de la respuesta")
 
+        # Sesión expirada/inválida: descartar el sid del cache de sesiones validadas
+        if response.status_code == 401:
+            invalidate_session(getattr(session, 'sid', None))
+
         # Si la respuesta no es exitosa, devolver error
         if response.status_code >= 400:
             error_msg = f"Error HTTP {response.status_code}"
@@ -429,7 +452,7 @@ def make_erpnext_request(
 
             error_msg = humanize_generic_error_message(error_msg, error_detail)
 
-            _log(f"❌ {operation_name} falló: {error_msg}")
+            _log(f"❌ {operation_name} falló: {error_msg}", level="warning")
 
             # Detectar error de Product Bundle (Kit) vinculado
             try:
@@ -543,7 +566,8 @@ def make_erpnext_request(
                                     params=params,
                                     custom_headers=custom_headers,
                                     operation_name=operation_name,
-                                    _fiscal_retry=True
+                                    _fiscal_retry=True,
+                                    stream=stream
                                 )
                             else:
                                 _log("⚠️ No se pudo crear/obtener Fiscal Year automáticamente")
@@ -560,13 +584,19 @@ def make_erpnext_request(
                 "response_body": response.text
             }
 
+        # Escrituras sobre Company: descartar los metadatos cacheados de esa compañía
+        if method.upper() in ('PUT', 'DELETE') and endpoint.startswith('/api/resource/Company/'):
+            from utils.company_cache import invalidate_company
+            invalidate_company(unquote(endpoint[len('/api/resource/Company/'):].split('?')[0]))
+
         # Respuesta exitosa
-        _log(f"✅ {operation_name} completada exitosamente")
+        if not suppress_logs:
+            logger.debug("✅ %s completada exitosamente", operation_name)
         return response, None
 
     except requests.exceptions.HTTPError as err:
         # LOG: Capturamos y mostramos el error HTTP en detalle
-        _log(f"❌ Error HTTP en {operation_name}: {err.response.status_code}")
+        _log(f"❌ Error HTTP en {operation_name}: {err.response.status_code}", level="warning")
 
         if is_detailed_logging_enabled(operation_name):
             # No imprimir headers de error (ruido). Mostrar contenido y JSON si está disponible.
@@ -599,7 +629,7 @@ def make_erpnext_request(
 
     except requests.exceptions.RequestException as e:
         # LOG: Capturamos y mostramos cualquier otro error de conexión
-        _log(f"❌ Error de conexión en {operation_name}: {e}")
+        _log(f"❌ Error de conexión en {operation_name}: {e}", level="error")
         return None, {
             "success": False,
             "message": f"Error de conexión con ERPNext: {str(e)}",
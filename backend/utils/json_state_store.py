@@ -0,0 +1,214 @@
+"""
+Store para archivos JSON de estado chicos que se leen en casi todos los requests
+(active_companies.json: compañía activa por usuario, conteo de items, preferencias).
+
+- Lecturas desde memoria: el archivo se vuelve a parsear solo si cambió su firma
+  (mtime_ns, tamaño, inode), así un cambio hecho por otro worker de gunicorn se ve
+  en el request siguiente sin releer el archivo en cada llamada.
+- Escrituras con lock entre threads y entre procesos (archivo `<path>.lock`), releyendo
+  el archivo dentro del lock (read-modify-write sin updates perdidos) y reemplazándolo
+  de forma atómica (archivo temporal + os.replace).
+- Contadores (increment) acumulados en memoria y volcados juntos cada
+  STATE_COUNTER_FLUSH_INTERVAL segundos y al salir del proceso.
+"""
+
+import atexit
+import copy
+import json
+import os
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+def _apply_deltas(value: int, deltas: List[int], minimum: Optional[int]) -> int:
+    # Paso a paso para respetar el mínimo igual que antes (decrement nunca baja de 0)
+    for delta in deltas:
+        value += delta
+        if minimum is not None:
+            value = max(minimum, value)
+    return value
+
+
+class JsonStateStore:
+    def __init__(self, path: str, default_factory: Callable[[], Dict[str, Any]] = dict,
+                 flush_interval: float = 2.0):
+        self.path = os.path.abspath(path)
+        self._lock_path = f"{self.path}.lock"
+        self._default_factory = default_factory
+        self._flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._data: Optional[Dict[str, Any]] = None
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._pending: Dict[Tuple[str, str], Tuple[List[int], Optional[int]]] = {}
+        self._flush_timer: Optional[threading.Timer] = None
+        atexit.register(self.flush)
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            info = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (info.st_mtime_ns, info.st_size, info.st_ino)
+
+    def _current(self) -> Dict[str, Any]:
+        """Datos vigentes (sin copiar); se llama con self._lock tomado"""
+        signature = self._file_signature()
+        if self._data is not None and signature == self._signature:
+            return self._data
+        if signature is None:
+            data = self._default_factory()
+        else:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as handle:
+                    data = json.load(handle)
+            except (OSError, ValueError) as exc:
+                print(f"--- State store: no se pudo leer {os.path.basename(self.path)}: {exc}")
+                # Mantener lo último que se leyó bien antes que perder todo el estado
+                return self._data if self._data is not None else self._default_factory()
+        self._data = data
+        self._signature = signature
+        return data
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copia completa y mutable del estado (para código que la modifica)"""
+        with self._lock:
+            return copy.deepcopy(self._current())
+
+    def get(self, section: str, key: Optional[str] = None, default: Any = None) -> Any:
+        """Valor de una sección (o de una clave dentro de ella) sin copiar: no modificarlo"""
+        with self._lock:
+            value = self._current().get(section)
+            if key is None:
+                return default if value is None else value
+            if not isinstance(value, dict):
+                return default
+            return value.get(key, default)
+
+    def get_counter(self, section: str, key: str) -> int:
+        """Contador persistido más los incrementos que todavía no se volcaron"""
+        with self._lock:
+            value = self.get(section, key, 0) or 0
+            pending = self._pending.get((section, key))
+            if pending:
+                value = _apply_deltas(value, *pending)
+            return value
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self._lock_path, 'a+') as handle:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            elif msvcrt is not None:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+                elif msvcrt is not None:
+                    handle.seek(0)
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _write(self, data: Dict[str, Any]) -> None:
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(self.path)}.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as handle:
+                json.dump(data, handle, indent=2, ensure_ascii=False)
+                handle.flush()
+                os.fsync(handle.fileno())
+            try:
+                os.chmod(temp_path, stat.S_IMODE(os.stat(self.path).st_mode))
+            except FileNotFoundError:
+                os.chmod(temp_path, 0o644)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        self._data = data
+        self._signature = self._file_signature()
+
+    @contextmanager
+    def edit(self) -> Iterator[Dict[str, Any]]:
+        """
+        Read-modify-write protegido:
+
+            with store.edit() as data:
+                data.setdefault("active_companies", {})[user_id] = company
+
+        Si el bloque lanza una excepción o no cambia nada, no se escribe.
+        """
+        with self._lock, self._file_lock():
+            original = self._current()
+            data = copy.deepcopy(original)
+            yield data
+            if data != original:
+                self._write(data)
+
+    def replace(self, data: Dict[str, Any]) -> None:
+        """Reemplazar el contenido completo (compatibilidad con save_*)"""
+        with self._lock, self._file_lock():
+            self._write(copy.deepcopy(data))
+
+    def increment(self, section: str, key: str, delta: int = 1, minimum: Optional[int] = None) -> None:
+        """Sumar `delta` a data[section][key]; se escribe en el próximo flush"""
+        with self._lock:
+            deltas, _ = self._pending.setdefault((section, key), ([], minimum))
+            deltas.append(delta)
+            if self._flush_interval <= 0:
+                self.flush()
+            elif self._flush_timer is None:
+                self._flush_timer = threading.Timer(self._flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self) -> None:
+        """Volcar los contadores acumulados en una sola escritura"""
+        with self._lock:
+            self._flush_timer = None
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                with self.edit() as data:
+                    for (section, key), (deltas, minimum) in pending.items():
+                        values = data.get(section)
+                        if not isinstance(values, dict):
+                            values = data[section] = {}
+                        values[key] = _apply_deltas(values.get(key, 0) or 0, deltas, minimum)
+            except Exception as exc:
+                print(f"--- State store: error volcando contadores de {os.path.basename(self.path)}: {exc}")
+                # Devolver lo pendiente para reintentar en el próximo flush
+                for entry, (deltas, minimum) in pending.items():
+                    current, _ = self._pending.setdefault(entry, ([], minimum))
+                    current[:0] = deltas
+                if self._flush_interval > 0 and self._flush_timer is None:
+                    self._flush_timer = threading.Timer(self._flush_interval, self.flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
@@ -1,9 +1,17 @@
 # logging_utils.py - Utilidades de logging y cacheo para optimizar rendimiento
 
+import contextvars
 import functools
+import json
+import logging
+import sys
+import threading
 import time
+import uuid
 from typing import Dict, Any, Optional
 
+from config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_EVERY
+
 # Cache global para evitar múltiples llamadas a las mismas funciones
 _function_cache: Dict[str, Dict[str, Any]] = {}
 _cache_ttl = 30  # TTL de 30 segundos para el cache
@@ -72,4 +80,166 @@ def log_error(error_msg: str, func_name: str = ""):
 def log_success(success_msg: str, func_name: str = ""):
     """Log de éxito - versión condensada"""
     prefix = f"✅ [{func_name}]" if func_name else "✅"
-    conditional_log(f"{prefix} {success_msg}", "info")
\ No newline at end of file
+    conditional_log(f"{prefix} {success_msg}", "info")
+
+
+# ---------------------------------------------------------------------------
+# Logging estructurado
+#
+#   logger = get_logger(__name__)
+#   logger.info("Importando %s precios", total, price_list=name)
+#   logger.sampled("csv_row", "Fila %s: %s", index, row)   # 1 de cada LOG_SAMPLE_EVERY
+#
+# El mensaje se formatea recién cuando el nivel está habilitado (args estilo %), así un
+# logger.debug en un loop por fila cuesta una comparación de nivel. Los kwargs van como
+# campos (key=value en texto, claves en JSON) y cada línea lleva el correlation id del
+# request o job que la originó.
+# ---------------------------------------------------------------------------
+
+_correlation_id: contextvars.ContextVar = contextvars.ContextVar("correlation_id", default=None)
+_configure_lock = threading.Lock()
+_configured = False
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def get_correlation_id() -> Optional[str]:
+    return _correlation_id.get()
+
+
+def set_correlation_id(value: Optional[str] = None) -> str:
+    """Fijar el correlation id del contexto actual (request o job); genera uno si no viene"""
+    value = (value or "").strip()[:64] or new_correlation_id()
+    _correlation_id.set(value)
+    return value
+
+
+class _CorrelationFilter(logging.Filter):
+    def filter(self, record):
+        record.correlation_id = _correlation_id.get()
+        return True
+
+
+class _StructuredFormatter(logging.Formatter):
+    def __init__(self, as_json: bool):
+        super().__init__()
+        self._as_json = as_json
+
+    def format(self, record):
+        message = record.getMessage()
+        fields = getattr(record, "fields", None) or {}
+        correlation_id = getattr(record, "correlation_id", None)
+        if self._as_json:
+            payload = {
+                "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+                "level": record.levelname,
+                "logger": record.name,
+                "cid": correlation_id,
+                "msg": message,
+            }
+            payload.update(fields)
+            if record.exc_info:
+                payload["exc"] = self.formatException(record.exc_info)
+            return json.dumps(payload, default=str, ensure_ascii=False)
+
+        parts = [f"[{record.levelname}]"]
+        if correlation_id:
+            parts.append(f"[{correlation_id}]")
+        parts.append(message)
+        if fields:
+            parts.append(" ".join(f"{key}={value}" for key, value in fields.items()))
+        text = " ".join(parts)
+        if record.exc_info:
+            text = f"{text}\n{self.formatException(record.exc_info)}"
+        return text
+
+
+def configure_logging() -> None:
+    """Handler único a stdout (donde ya van los print) para los loggers 'erp.*'"""
+    global _configured
+    if _configured:
+        return
+    with _configure_lock:
+        if _configured:
+            return
+        root = logging.getLogger("erp")
+        handler = logging.StreamHandler(sys.stdout)
+        handler.addFilter(_CorrelationFilter())
+        handler.setFormatter(_StructuredFormatter(as_json=LOG_FORMAT == "json"))
+        root.addHandler(handler)
+        level = "DEBUG" if is_debug_mode() else LOG_LEVEL
+        root.setLevel(getattr(logging, level, logging.INFO))
+        root.propagate = False
+        _configured = True
+
+
+class StructuredLogger:
+    """Envoltorio liviano sobre logging.Logger con campos y muestreo"""
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(f"erp.{name}")
+        self._sample_counts: Dict[str, int] = {}
+        self._sample_lock = threading.Lock()
+
+    def is_enabled(self, level: int = logging.DEBUG) -> bool:
+        """Para proteger volcados caros (previews de CSV, JSON completos)"""
+        return self._logger.isEnabledFor(level)
+
+    def _emit(self, level: int, msg: str, args, fields, exc_info=False) -> None:
+        if not self._logger.isEnabledFor(level):
+            return
+        self._logger.log(level, msg, *args, exc_info=exc_info, extra={"fields": fields}, stacklevel=3)
+
+    def debug(self, msg: str, *args, **fields) -> None:
+        self._emit(logging.DEBUG, msg, args, fields)
+
+    def info(self, msg: str, *args, **fields) -> None:
+        self._emit(logging.INFO, msg, args, fields)
+
+    def warning(self, msg: str, *args, **fields) -> None:
+        self._emit(logging.WARNING, msg, args, fields)
+
+    def error(self, msg: str, *args, **fields) -> None:
+        self._emit(logging.ERROR, msg, args, fields)
+
+    def exception(self, msg: str, *args, **fields) -> None:
+        self._emit(logging.ERROR, msg, args, fields, exc_info=True)
+
+    def sampled(self, key: str, msg: str, *args, every: Optional[int] = None,
+                level: int = logging.DEBUG, **fields) -> None:
+        """
+        Mensajes por fila: se emite la primera llamada de cada `key` y después 1 de cada
+        `every` (LOG_SAMPLE_EVERY por defecto). Con el nivel deshabilitado no cuenta nada.
+        """
+        if not self._logger.isEnabledFor(level):
+            return
+        every = every or LOG_SAMPLE_EVERY
+        with self._sample_lock:
+            count = self._sample_counts.get(key, 0) + 1
+            self._sample_counts[key] = count
+        if every > 1 and (count - 1) % every:
+            return
+        if every > 1:
+            fields["sampled"] = f"{count} (1/{every})"
+        self._emit(level, msg, args, fields)
+
+    def reset_samples(self, key: Optional[str] = None) -> None:
+        """Reiniciar el contador (p. ej. al empezar otro archivo) para ver de nuevo la primera fila"""
+        with self._sample_lock:
+            if key is None:
+                self._sample_counts.clear()
+            else:
+                self._sample_counts.pop(key, None)
+
+
+_loggers: Dict[str, StructuredLogger] = {}
+
+
+def get_logger(name: str) -> StructuredLogger:
+    configure_logging()
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers.setdefault(name, StructuredLogger(name))
+    return logger
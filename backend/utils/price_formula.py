@@ -0,0 +1,370 @@
+"""
+Motor de fórmulas de automatización de listas de precios.
+
+Las fórmulas del usuario (IF(...), AND/OR, Math.*, price.compra/price.actual) se
+traducen a una expresión Python, se validan contra una whitelist de nodos AST y se
+compilan una sola vez; el resultado queda cacheado por texto de fórmula.
+
+  formula = compile_formula("IF(price.compra > 100, price.compra * 1.3, price.compra * 1.5)")
+  formula.evaluate(compra=120.0, actual=0.0)            # un valor
+  rates, errors = formula.evaluate_batch(compras, actuales)   # una lista de valores
+
+evaluate_batch evalúa con NumPy (IF -> where, and/or elemento a elemento, math.* ->
+ufuncs) cuando la expresión lo permite. Las filas con resultado no finito y las
+fórmulas que no se pueden vectorizar se evalúan fila por fila con la semántica de
+Python, así los errores (división por cero, log de negativos) son los mismos.
+"""
+
+import ast
+import functools
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy llega con pandas (requirements.txt)
+    np = None
+
+
+def _translate_and_sanitize_formula(expr: str) -> str:
+    """Translate IF(...) and logical operators to Python and map Math.* to math.*"""
+    if not expr or not isinstance(expr, str):
+        return ''
+
+    s = expr
+    # Replace Math. -> math.
+    s = s.replace('Math.', 'math.')
+    # Replace AND/OR -> and/or
+    s = s.replace('\bAND\b', ' and ').replace('\bOR\b', ' or ')
+    s = s.replace('AND', ' and ').replace('OR', ' or ')
+
+    # Replace IF(cond, a, b) with (a if cond else b) - handle nested by simple parse
+    def replace_if(original):
+        out = ''
+        i = 0
+        while i < len(original):
+            idx = original.upper().find('IF(', i)
+            if idx == -1:
+                out += original[i:]
+                break
+            out += original[i:idx]
+            pos = idx + 3
+            depth = 1
+            while pos < len(original) and depth > 0:
+                if original[pos] == '(':
+                    depth += 1
+                elif original[pos] == ')':
+                    depth -= 1
+                pos += 1
+            inside = original[idx + 3: pos - 1]
+            # split top-level commas
+            parts = []
+            buf = ''
+            d = 0
+            for ch in inside:
+                if ch == '(':
+                    d += 1
+                    buf += ch
+                elif ch == ')':
+                    d -= 1
+                    buf += ch
+                elif ch == ',' and d == 0:
+                    parts.append(buf.strip())
+                    buf = ''
+                else:
+                    buf += ch
+            if buf.strip():
+                parts.append(buf.strip())
+            if len(parts) == 3:
+                out += f"(({parts[1]}) if ({parts[0]}) else ({parts[2]}))"
+            else:
+                out += f"IF({inside})"
+            i = pos
+        return out
+
+    s = replace_if(s)
+
+    # Replace price variables
+    s = s.replace('price.actual', 'actual')
+    s = s.replace('price.compra', 'compra')
+    s = s.replace('\bprice\b', 'actual')
+
+    return s
+
+
+ALLOWED_NAMES = {'actual', 'compra', 'math', 'round', 'abs', 'max', 'min', 'pow'}
+
+
+class SafeEvaluator(ast.NodeTransformer):
+    """Validate AST nodes to allow only safe expressions."""
+    ALLOWED_NODE_TYPES = (
+        ast.Expression, ast.BinOp, ast.UnaryOp, ast.Num, ast.Call, ast.Name,
+        ast.Load, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow,
+        ast.USub, ast.UAdd, ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE,
+        ast.Gt, ast.GtE, ast.BoolOp, ast.And, ast.Or, ast.IfExp, ast.Attribute,
+        ast.Tuple, ast.List, ast.Constant
+    )
+
+    def generic_visit(self, node):
+        if not isinstance(node, self.ALLOWED_NODE_TYPES):
+            raise ValueError(f'Unsupported expression element: {type(node).__name__}')
+        return super().generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id not in ALLOWED_NAMES:
+            raise ValueError(f'Use of name "{node.id}" not allowed')
+        return node
+
+    def visit_Call(self, node):
+        # Allow calls to whitelisted names or math.<func>
+        if isinstance(node.func, ast.Name):
+            if node.func.id not in ALLOWED_NAMES:
+                raise ValueError(f'Call to function "{node.func.id}" is not allowed')
+        elif isinstance(node.func, ast.Attribute):
+            # e.g., math.floor
+            if not (isinstance(node.func.value, ast.Name) and node.func.value.id == 'math'):
+                raise ValueError('Only math.* calls allowed as attributes')
+        else:
+            raise ValueError('Unsupported call type')
+        return self.generic_visit(node)
+
+
+class FormulaBooleanResult(ValueError):
+    """La fórmula devolvió True/False donde se espera un precio"""
+
+
+_SCALAR_GLOBALS = {'__builtins__': None, 'math': math, 'round': round, 'abs': abs, 'max': max, 'min': min, 'pow': pow}
+
+# Por debajo de este tamaño el costo de armar arrays supera al loop escalar
+_VECTOR_MIN_ROWS = 16
+
+
+class _NotVectorizable(Exception):
+    pass
+
+
+class _VectorRewriter(ast.NodeTransformer):
+    """Reescribe la expresión validada para evaluarla sobre arrays de NumPy"""
+
+    def _call(self, name, args, node):
+        return ast.copy_location(
+            ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=args, keywords=[]), node
+        )
+
+    def visit_IfExp(self, node):
+        self.generic_visit(node)
+        return self._call('_where', [node.test, node.body, node.orelse], node)
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        name = '_and' if isinstance(node.op, ast.And) else '_or'
+        result = node.values[0]
+        for value in node.values[1:]:
+            result = self._call(name, [result, value], node)
+        return result
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        # a < b < c  ->  (a < b) and (b < c)
+        parts = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            parts.append(ast.copy_location(ast.Compare(left=left, ops=[op], comparators=[right]), node))
+            left = right
+        result = parts[0]
+        for part in parts[1:]:
+            result = self._call('_and', [result, part], node)
+        return result
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if node.keywords:
+            raise _NotVectorizable()
+        if isinstance(node.func, ast.Name):
+            name = node.func.id
+            if name == 'pow' and len(node.args) != 2:
+                raise _NotVectorizable()
+            if name in ('max', 'min') and len(node.args) < 2:
+                raise _NotVectorizable()
+            node.func = ast.Name(id=f'_{name}', ctx=ast.Load())
+        return node
+
+    def visit_Tuple(self, node):
+        raise _NotVectorizable()
+
+    def visit_List(self, node):
+        raise _NotVectorizable()
+
+
+def _truthy(value):
+    return value if getattr(value, 'dtype', None) == bool else np.asarray(value) != 0
+
+
+def _ufunc(name):
+    function = getattr(np, name, None)
+    if not isinstance(function, np.ufunc):
+        raise AttributeError(name)
+
+    def call(*args):
+        # En una ufunc los argumentos posicionales extra son `out`: no vectorizar
+        if len(args) != function.nin:
+            raise _NotVectorizable()
+        return function(*args)
+    return call
+
+
+class _VectorMath:
+    """math.* sobre arrays: constantes de math y ufuncs de NumPy con el mismo nombre"""
+
+    _ALIASES = {'pow': 'power'}
+
+    def __getattr__(self, name):
+        value = getattr(math, name, None)
+        if isinstance(value, float):
+            return value
+        return _ufunc(self._ALIASES.get(name, name))
+
+
+def _vector_round(value, digits=None):
+    if digits is None or (isinstance(digits, (int, np.integer)) and digits == 0):
+        # Sin decimales np.round redondea al par igual que round()
+        return np.round(value)
+    if not isinstance(digits, (int, np.integer)) or isinstance(digits, bool):
+        raise _NotVectorizable()
+    # Con decimales np.round escala por 10**n y pierde el redondeo correcto de round()
+    # (2.675 -> 2.68 en vez de 2.67): se redondea cada valor con el round() de Python
+    array = np.asarray(value, dtype=float)
+    digits = int(digits)
+    return np.array([round(item, digits) for item in array.ravel().tolist()], dtype=float).reshape(array.shape)
+
+
+def _build_vector_globals():
+    if np is None:
+        return None
+    return {
+        '__builtins__': None,
+        'math': _VectorMath(),
+        '_where': lambda condition, body, orelse: np.where(_truthy(condition), body, orelse),
+        # `a and b` / `a or b` con la semántica de Python (devuelven uno de los operandos)
+        '_and': lambda left, right: np.where(_truthy(left), right, left),
+        '_or': lambda left, right: np.where(_truthy(left), left, right),
+        '_round': _vector_round,
+        '_abs': np.abs,
+        '_max': lambda *values: functools.reduce(np.maximum, values),
+        '_min': lambda *values: functools.reduce(np.minimum, values),
+        '_pow': np.power,
+    }
+
+
+_VECTOR_GLOBALS = _build_vector_globals()
+
+
+class CompiledFormula:
+    """Fórmula traducida, validada y compilada (escalar y, si se puede, vectorial)"""
+
+    __slots__ = ('expression', 'code', 'vector_code')
+
+    def __init__(self, expression: str):
+        tree = ast.parse(expression, mode='eval')
+        SafeEvaluator().visit(tree)
+        self.expression = expression
+        self.code = compile(tree, filename='<formula>', mode='eval')
+        self.vector_code = None
+        if _VECTOR_GLOBALS is not None:
+            try:
+                vector_tree = ast.fix_missing_locations(_VectorRewriter().visit(ast.parse(expression, mode='eval')))
+                self.vector_code = compile(vector_tree, filename='<formula-vector>', mode='eval')
+            except _NotVectorizable:
+                self.vector_code = None
+
+    def evaluate(self, actual: float = 0.0, compra: float = 0.0):
+        """Resultado tal cual lo devuelve la expresión (número o booleano)"""
+        return eval(self.code, _SCALAR_GLOBALS, {'actual': actual, 'compra': compra})
+
+    def evaluate_rate(self, actual: float = 0.0, compra: float = 0.0) -> float:
+        result = self.evaluate(actual=actual, compra=compra)
+        if isinstance(result, bool):
+            raise FormulaBooleanResult('Formula evaluated to boolean; numeric rate expected')
+        return float(result)
+
+    def evaluate_batch(
+        self,
+        compra: Sequence[float],
+        actual: Optional[Sequence[float]] = None
+    ) -> Tuple[List[Optional[float]], Dict[int, Exception]]:
+        """
+        Evaluar la fórmula para cada par (compra[i], actual[i]).
+
+        Returns:
+            (rates, errors): rates[i] es float o None; errors[i] es la excepción de la
+            fila i (FormulaBooleanResult si la fórmula devolvió un booleano)
+        """
+        size = len(compra)
+        if actual is None:
+            actual = [0.0] * size
+        rates: List[Optional[float]] = [None] * size
+        errors: Dict[int, Exception] = {}
+        pending = range(size)
+
+        if self.vector_code is not None and size >= _VECTOR_MIN_ROWS:
+            try:
+                compra_array = np.asarray(compra, dtype=float)
+                actual_array = np.asarray(actual, dtype=float)
+                with np.errstate(all='ignore'):
+                    result = np.asarray(eval(self.vector_code, _VECTOR_GLOBALS, {'compra': compra_array, 'actual': actual_array}))
+                if result.dtype == bool or result.dtype.kind not in 'iuf':
+                    raise _NotVectorizable()
+                result = np.broadcast_to(result.astype(float), (size,))
+                finite = np.isfinite(result)
+                rates = result.tolist()
+                pending = np.flatnonzero(~finite).tolist()
+                for index in pending:
+                    rates[index] = None
+            except Exception:
+                rates = [None] * size
+                pending = range(size)
+
+        code = self.code
+        for index in pending:
+            try:
+                result = eval(code, _SCALAR_GLOBALS, {'actual': actual[index], 'compra': compra[index]})
+                if isinstance(result, bool):
+                    raise FormulaBooleanResult('Formula evaluated to boolean; numeric rate expected')
+                rates[index] = float(result)
+            except Exception as exc:
+                errors[index] = exc
+        return rates, errors
+
+
+@functools.lru_cache(maxsize=512)
+def compile_expression(py_expr: str) -> CompiledFormula:
+    """Expresión ya traducida -> CompiledFormula (cacheada por texto)"""
+    return CompiledFormula(py_expr)
+
+
+@functools.lru_cache(maxsize=512)
+def compile_formula(formula: str) -> CompiledFormula:
+    """Fórmula del usuario -> CompiledFormula (traducción + validación una sola vez)"""
+    py_expr = _translate_and_sanitize_formula(formula or '')
+    if not py_expr:
+        raise ValueError('Empty formula')
+    return compile_expression(py_expr)
+
+
+def safe_eval_formula(py_expr: str, actual: float = 0.0, compra: float = 0.0):
+    """Evaluate translated python expression safely returning number or boolean."""
+    return compile_expression(py_expr).evaluate(actual=actual, compra=compra)
+
+
+def formula_cache_stats() -> Dict[str, Any]:
+    formula_info = compile_formula.cache_info()
+    expression_info = compile_expression.cache_info()
+    return {
+        'formulas': formula_info.currsize,
+        'expressions': expression_info.currsize,
+        'hits': formula_info.hits + expression_info.hits,
+        'misses': formula_info.misses + expression_info.misses,
+        'vectorized': np is not None,
+    }
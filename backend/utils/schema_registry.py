@@ -0,0 +1,142 @@
+# schema_registry.py - Esquema de ERPNext ya confirmado en este proceso
+#
+# Varios endpoints verificaban (y creaban si faltaban) custom fields, DocTypes y grupos
+# raíz en cada request: una consulta por campo o por grupo antes de hacer el trabajo
+# real. Este registro recuerda, por sitio (ERPNEXT_URL), qué elementos ya se vieron
+# presentes; la verificación se hace una vez por proceso, con una sola consulta por
+# doctype (fetch_existing_*), y después se saltea.
+#
+# Si algo se borra por fuera de la app, POST /api/schema-registry/refresh (o
+# forget_schema) vuelve a forzar la verificación.
+
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from config import ERPNEXT_URL
+from utils.frappe_list import fetch_list_paged
+
+CUSTOM_FIELD = "custom_field"
+DOCTYPE = "doctype"
+ITEM_GROUP = "item_group"
+
+_ready: Dict[Tuple[str, str, str], Any] = {}
+_lock = threading.Lock()
+_key_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+_stats = {"hits": 0, "checks": 0, "failed_checks": 0, "forgotten": 0}
+
+
+def _site() -> str:
+    return (ERPNEXT_URL or "").rstrip("/").lower()
+
+
+def _key(kind: str, name: str) -> Tuple[str, str, str]:
+    return (_site(), kind, name)
+
+
+def custom_field_name(dt: str, fieldname: str) -> str:
+    return f"{dt}.{fieldname}"
+
+
+def get_ready(kind: str, name: str) -> Any:
+    """Valor registrado (p. ej. el docname) si ya se confirmó, o None"""
+    with _lock:
+        value = _ready.get(_key(kind, name))
+        if value is not None:
+            _stats["hits"] += 1
+        return value
+
+
+def is_ready(kind: str, name: str) -> bool:
+    return get_ready(kind, name) is not None
+
+
+def mark_ready(kind: str, name: str, value: Any = True) -> None:
+    if value is None or value is False:
+        return
+    with _lock:
+        _ready[_key(kind, name)] = value
+
+
+def forget_schema(kind: Optional[str] = None, name: Optional[str] = None) -> int:
+    """Olvidar lo confirmado (todo, un tipo o un elemento) para volver a verificarlo"""
+    site = _site()
+    with _lock:
+        keys = [
+            key for key in _ready
+            if key[0] == site and (kind is None or key[1] == kind) and (name is None or key[2] == name)
+        ]
+        for key in keys:
+            del _ready[key]
+        _stats["forgotten"] += len(keys)
+        return len(keys)
+
+
+def ensure_ready(kind: str, name: str, verify: Callable[[], Any]) -> Any:
+    """
+    Devolver el valor registrado o ejecutar verify() (verificar/crear) una sola vez.
+
+    Si verify() devuelve algo falso no se registra y se reintenta en el próximo
+    llamado. Requests simultáneos del mismo elemento esperan a la misma verificación.
+    """
+    value = get_ready(kind, name)
+    if value is not None:
+        return value
+    key = _key(kind, name)
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        value = get_ready(kind, name)
+        if value is not None:
+            return value
+        with _lock:
+            _stats["checks"] += 1
+        value = verify()
+        if value is None or value is False:
+            with _lock:
+                _stats["failed_checks"] += 1
+            return value
+        mark_ready(kind, name, value)
+        return value
+
+
+def fetch_existing_custom_fields(session, dt: str, fieldnames: Iterable[str]) -> Optional[Set[str]]:
+    """Fieldnames de la lista que ya existen como Custom Field de dt (una consulta); None si falló"""
+    wanted = sorted(set(fieldnames))
+    rows, error = fetch_list_paged(
+        session,
+        "Custom Field",
+        ["fieldname"],
+        [["dt", "=", dt], ["fieldname", "in", wanted]],
+        operation_name=f"Check Custom Fields in {dt}",
+    )
+    if error:
+        print(f"--- Schema registry: error verificando custom fields de {dt}: {error}")
+        return None
+    return {row.get("fieldname") for row in rows if row.get("fieldname")}
+
+
+def fetch_existing_records(session, doctype: str, values: Iterable[str], field: str = "name") -> Optional[Dict[str, str]]:
+    """valor de field -> docname de los registros existentes (una consulta); None si falló"""
+    wanted = sorted(set(values))
+    fields = ["name"] if field == "name" else ["name", field]
+    rows, error = fetch_list_paged(
+        session,
+        doctype,
+        fields,
+        [[field, "in", wanted]],
+        operation_name=f"Check {doctype} existence",
+    )
+    if error:
+        print(f"--- Schema registry: error verificando {doctype}: {error}")
+        return None
+    return {row.get(field): row.get("name") for row in rows if row.get(field)}
+
+
+def schema_registry_stats() -> Dict[str, Any]:
+    site = _site()
+    with _lock:
+        by_kind: Dict[str, int] = {}
+        for key_site, kind, _ in _ready:
+            if key_site == site:
+                by_kind[kind] = by_kind.get(kind, 0) + 1
+        return {"site": site, "ready": by_kind, **_stats}
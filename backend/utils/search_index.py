@@ -0,0 +1,263 @@
+"""
+Índice de búsqueda en memoria para el typeahead de items.
+
+- Texto normalizado: minúsculas y sin acentos ("Válvula" == "valvula").
+- Subcadenas: índice de trigramas sobre item_name + description + item_code. Cada
+  trigrama guarda un bitmap (int de Python) de documentos, así la intersección es un
+  `&`; los candidatos se verifican contra el texto (cada palabra tiene que aparecer).
+- Prefijos: listas ordenadas de códigos y de nombres normalizados + búsqueda binaria.
+- Recencia: cada documento tiene una clave (menor = modificado más recientemente) que
+  se usa para desempatar sin comparar timestamps en cada búsqueda.
+
+Se actualiza de a un documento (add/remove) y no es thread-safe: lo protege el lock
+de la réplica del catálogo (services/item_catalog.py).
+"""
+
+import bisect
+import sys
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+_SORT_SENTINEL = "\U0010ffff"
+# Posiciones de los bits encendidos de cada byte (para recorrer bitmaps rápido)
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def fold_text(value: Any) -> str:
+    """Minúsculas, sin acentos y con espacios colapsados"""
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFKD", str(value).lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.split())
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[index:index + 3] for index in range(len(text) - 2)}
+
+
+def _bitmap_ids(bitmap: int) -> List[int]:
+    ids = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for offset, byte in enumerate(data):
+        if byte:
+            base = offset * 8
+            ids.extend(base + bit for bit in _BYTE_BITS[byte])
+    return ids
+
+
+def _prefix_range(entries: List[Tuple[str, int]], prefix: str) -> List[Tuple[str, int]]:
+    start = bisect.bisect_left(entries, (prefix, -1))
+    end = bisect.bisect_left(entries, (prefix + _SORT_SENTINEL, -1))
+    return entries[start:end]
+
+
+class ItemSearchIndex:
+    """Trigramas + prefijos de código/nombre para los items de una compañía"""
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def clear(self) -> None:
+        self._ids: Dict[str, int] = {}
+        # Por id de documento (los ids no se reutilizan hasta el próximo rebuild)
+        self._names: List[Optional[str]] = []
+        self._texts: List[str] = []
+        self._codes: List[str] = []
+        self._keys: List[int] = []
+        self._prefix_entries: List[Tuple[Tuple[List[Tuple[str, int]], str], ...]] = []
+        self._alive = 0
+        self._postings: Dict[str, int] = {}
+        self._code_prefixes: List[Tuple[str, int]] = []
+        self._name_prefixes: List[Tuple[str, int]] = []
+        self._next_key = -1
+
+    def rebuild(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Reconstruir todo (siembra de la réplica); las claves de recencia siguen modified desc"""
+        self.clear()
+        ordered = sorted(
+            (row for row in rows if row.get("name")),
+            key=lambda row: row.get("modified") or "",
+            reverse=True
+        )
+        bitmaps: Dict[str, bytearray] = {}
+        size = (len(ordered) + 7) // 8
+        for key, row in enumerate(ordered):
+            doc_id, text = self._register(row, key)
+            for gram in _trigrams(text):
+                bitmap = bitmaps.get(gram)
+                if bitmap is None:
+                    bitmap = bitmaps[gram] = bytearray(size)
+                bitmap[doc_id >> 3] |= 1 << (doc_id & 7)
+        self._postings = {gram: int.from_bytes(bitmap, "little") for gram, bitmap in bitmaps.items()}
+        self._alive = (1 << len(ordered)) - 1
+        self._code_prefixes.sort()
+        self._name_prefixes.sort()
+
+    def add(self, row: Dict[str, Any]) -> None:
+        """Alta o modificación; el documento pasa a ser el más reciente"""
+        name = row.get("name")
+        if not name:
+            return
+        self.remove(name)
+        doc_id, text = self._register(row, self._next_key, keep_sorted=True)
+        self._next_key -= 1
+        bit = 1 << doc_id
+        for gram in _trigrams(text):
+            self._postings[gram] = self._postings.get(gram, 0) | bit
+        self._alive |= bit
+
+    def remove(self, name: str) -> None:
+        doc_id = self._ids.pop(name, None)
+        if doc_id is None:
+            return
+        mask = ~(1 << doc_id)
+        for gram in _trigrams(self._texts[doc_id]):
+            bitmap = self._postings.get(gram, 0) & mask
+            if bitmap:
+                self._postings[gram] = bitmap
+            else:
+                self._postings.pop(gram, None)
+        self._alive &= mask
+        for target, value in self._prefix_entries[doc_id]:
+            position = bisect.bisect_left(target, (value, doc_id))
+            if position < len(target) and target[position] == (value, doc_id):
+                del target[position]
+        self._names[doc_id] = None
+        self._texts[doc_id] = ""
+        self._prefix_entries[doc_id] = ()
+
+    def _register(self, row: Dict[str, Any], key: int, keep_sorted: bool = False) -> Tuple[int, str]:
+        name = row["name"]
+        code = fold_text(row.get("item_code") or name)
+        item_name = fold_text(row.get("item_name"))
+        text = " ".join(part for part in (item_name, fold_text(row.get("description")), code) if part)
+
+        doc_id = len(self._names)
+        self._ids[name] = doc_id
+        self._names.append(name)
+        self._texts.append(text)
+        self._codes.append(code)
+        self._keys.append(key)
+
+        # Un documento puede tener dos códigos (item_code y name distintos)
+        entries = [(self._code_prefixes, value) for value in {code, fold_text(name)}]
+        if item_name:
+            entries.append((self._name_prefixes, item_name))
+        self._prefix_entries.append(tuple(entries))
+        for target, value in entries:
+            if keep_sorted:
+                bisect.insort(target, (value, doc_id))
+            else:
+                target.append((value, doc_id))
+        return doc_id, text
+
+    def search_prefix(
+        self,
+        query: str,
+        limit: int = 20,
+        accept: Optional[Callable[[str], bool]] = None
+    ) -> List[str]:
+        """Nombres cuyo item_code/name empieza con query; exacto primero, luego más recientes"""
+        prefix = fold_text(query)
+        if not prefix:
+            return []
+        ids = {doc_id for _, doc_id in _prefix_range(self._code_prefixes, prefix)}
+        ordered = sorted(ids, key=lambda doc_id: (self._codes[doc_id] != prefix, self._keys[doc_id]))
+        return self._take(ordered, limit, accept)
+
+    def search_text(
+        self,
+        query: str,
+        limit: int = 20,
+        accept: Optional[Callable[[str], bool]] = None
+    ) -> List[str]:
+        """
+        Nombres cuyo texto contiene cada palabra de query.
+
+        Ranking: código exacto, código que empieza con la consulta, nombre que empieza
+        con la consulta y después el resto; dentro de cada grupo, los más recientes.
+        """
+        needle = fold_text(query)
+        if not needle:
+            return []
+        tokens = needle.split(" ")
+
+        candidates = self._alive
+        grams = sorted(
+            (self._postings.get(gram, 0) for token in tokens for gram in _trigrams(token)),
+            key=int.bit_count
+        )
+        for bitmap in grams:
+            candidates &= bitmap
+            if not candidates:
+                return []
+
+        # Un prefijo de código o de nombre ya contiene todas las palabras de la consulta
+        ranked: List[int] = []
+        seen: Set[int] = set()
+        for entries in (
+            [(value, doc_id) for value, doc_id in _prefix_range(self._code_prefixes, needle) if value == needle],
+            _prefix_range(self._code_prefixes, needle),
+            _prefix_range(self._name_prefixes, needle),
+        ):
+            group = sorted(
+                {doc_id for _, doc_id in entries if doc_id not in seen},
+                key=self._keys.__getitem__
+            )
+            seen.update(group)
+            ranked.extend(group)
+        results = self._take(ranked, limit, accept)
+        if len(results) >= limit:
+            return results
+
+        rest = sorted(
+            (doc_id for doc_id in _bitmap_ids(candidates) if doc_id not in seen),
+            key=self._keys.__getitem__
+        )
+        texts = self._texts
+        for doc_id in rest:
+            text = texts[doc_id]
+            if all(token in text for token in tokens):
+                name = self._names[doc_id]
+                if accept is None or accept(name):
+                    results.append(name)
+                    if len(results) >= limit:
+                        break
+        return results
+
+    def _take(self, ids: Iterable[int], limit: int, accept) -> List[str]:
+        results = []
+        for doc_id in ids:
+            name = self._names[doc_id]
+            if name is None or (accept is not None and not accept(name)):
+                continue
+            results.append(name)
+            if len(results) >= limit:
+                break
+        return results
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Estimación en bytes (sys.getsizeof de las estructuras y sus strings)"""
+        postings_bytes = sys.getsizeof(self._postings) + sum(
+            sys.getsizeof(gram) + sys.getsizeof(bitmap) for gram, bitmap in self._postings.items()
+        )
+        documents_bytes = sys.getsizeof(self._ids) + sum(
+            sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+            for values in (self._names, self._texts, self._codes, self._keys)
+        )
+        prefix_bytes = sum(
+            sys.getsizeof(entries) + sum(sys.getsizeof(entry) + sys.getsizeof(entry[0]) for entry in entries)
+            for entries in (self._code_prefixes, self._name_prefixes)
+        )
+        return {
+            "documents": len(self._ids),
+            "trigrams": len(self._postings),
+            "postings_bytes": postings_bytes,
+            "documents_bytes": documents_bytes,
+            "prefix_bytes": prefix_bytes,
+            "total_bytes": postings_bytes + documents_bytes + prefix_bytes,
+        }
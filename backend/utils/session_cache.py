@@ -0,0 +1,58 @@
+# session_cache.py - Cache de sesiones ERPNext validadas (sid -> user_id)
+#
+# get_session_with_auth consultaba frappe.auth.get_logged_user en cada request.
+# Este cache acotado con TTL guarda el usuario resuelto por sid; se invalida en
+# logout o cuando ERPNext responde 401 para ese sid.
+
+import threading
+from typing import Any, Dict, Optional
+
+from config import SESSION_CACHE_TTL, SESSION_CACHE_MAXSIZE
+from utils.ttl_cache import TTLCache
+
+_session_users = TTLCache(maxsize=SESSION_CACHE_MAXSIZE, ttl=SESSION_CACHE_TTL, name="session_users")
+
+_latency_lock = threading.Lock()
+_validation_count = 0
+_validation_total_seconds = 0.0
+
+
+def get_cached_user(sid_token: str) -> Optional[str]:
+    """Usuario cacheado para el sid, o None si no hay entrada vigente"""
+    if not sid_token:
+        return None
+    return _session_users.get(sid_token)
+
+
+def cache_user(sid_token: str, user_id: str, validation_seconds: Optional[float] = None):
+    """Registrar el usuario resuelto para un sid (y la latencia de la validación)"""
+    global _validation_count, _validation_total_seconds
+    if not sid_token or not user_id:
+        return
+    _session_users.set(sid_token, user_id)
+    if validation_seconds is not None:
+        with _latency_lock:
+            _validation_count += 1
+            _validation_total_seconds += validation_seconds
+
+
+def invalidate_session(sid_token: Optional[str]) -> bool:
+    """Eliminar un sid del cache (logout o 401 de ERPNext)"""
+    if not sid_token:
+        return False
+    return _session_users.invalidate(sid_token)
+
+
+def clear_session_cache():
+    _session_users.clear()
+
+
+def get_session_cache_stats() -> Dict[str, Any]:
+    """Hit rate del cache y latencia ahorrada estimada (hits * latencia media de validación)"""
+    stats = _session_users.stats()
+    with _latency_lock:
+        avg_ms = (_validation_total_seconds / _validation_count * 1000) if _validation_count else 0.0
+    stats["validations"] = _validation_count
+    stats["avg_validation_ms"] = round(avg_ms, 2)
+    stats["saved_latency_ms"] = round(stats["hits"] * avg_ms, 2)
+    return stats
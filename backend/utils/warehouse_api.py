@@ -2,7 +2,14 @@ import json
 from typing import Any, Dict, List, Optional, Tuple
 import requests
 
+from config import WAREHOUSE_INDEX_TTL
 from utils.http_utils import make_erpnext_request
+from utils.ttl_cache import TTLCache
+
+WAREHOUSE_INDEX_FIELDS = ["name", "warehouse_name", "is_group", "parent_warehouse", "warehouse_type"]
+
+# Índice de almacenes por compañía (company -> {"warehouses": [...], "leaf": [...]})
+_warehouse_index_cache = TTLCache(maxsize=256, ttl=WAREHOUSE_INDEX_TTL, name="company_warehouses")
 
 
 def build_company_warehouse_filters(
@@ -53,3 +60,59 @@ def fetch_company_warehouses(
         operation_name=operation_name,
     )
 
+
+
+def _load_company_warehouse_index(session: requests.Session, company: str) -> Optional[Dict[str, Any]]:
+    response, error = fetch_company_warehouses(
+        session=session,
+        company=company,
+        fields=WAREHOUSE_INDEX_FIELDS,
+        operation_name="Get company warehouse index",
+        limit_page_length=0,
+    )
+    if error or not response or response.status_code != 200:
+        print(f"--- Warehouse index: error obteniendo almacenes de {company}: {error}")
+        return None
+
+    warehouses = [row for row in response.json().get("data", []) or [] if row.get("name")]
+    return {
+        "warehouses": warehouses,
+        "leaf": [row["name"] for row in warehouses if not row.get("is_group")],
+    }
+
+
+def get_company_warehouse_index(
+    session: requests.Session,
+    company: str,
+    *,
+    force_refresh: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """
+    Almacenes habilitados de la compañía, cacheados por proceso.
+
+    Returns:
+        dict: {"warehouses": [filas con WAREHOUSE_INDEX_FIELDS], "leaf": [nombres no-grupo]}
+        None si no se pudo obtener (los errores no se cachean)
+    """
+    if not company:
+        return None
+    if force_refresh:
+        _warehouse_index_cache.invalidate(company)
+    return _warehouse_index_cache.get_or_load(
+        company,
+        lambda: _load_company_warehouse_index(session, company),
+    )
+
+
+def get_company_leaf_warehouses(session: requests.Session, company: str) -> List[str]:
+    """Nombres de los almacenes hoja (no grupo, habilitados) de la compañía"""
+    index = get_company_warehouse_index(session, company)
+    return list(index["leaf"]) if index else []
+
+
+def invalidate_company_warehouses(company: Optional[str] = None) -> None:
+    """Descartar el índice de una compañía (o de todas si company es None)"""
+    if company:
+        _warehouse_index_cache.invalidate(company)
+    else:
+        _warehouse_index_cache.clear()
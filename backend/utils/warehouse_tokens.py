@@ -21,6 +21,7 @@ Functions:
 import re
 from urllib.parse import quote
 from utils.http_utils import make_erpnext_request
+from utils.warehouse_api import invalidate_company_warehouses
 from routes.general import get_company_abbr
 
 __all__ = [
@@ -196,13 +197,16 @@ def ensure_warehouse(session, headers, company, base_code, role, supplier_code=N
         if parent:
             create_data["parent_warehouse"] = parent
 
-        return make_erpnext_request(
+        create_response, create_error = make_erpnext_request(
             session=session,
             method="POST",
             endpoint="/api/resource/Warehouse",
             data=create_data,
             operation_name="Create warehouse"
         )
+        if not create_error:
+            invalidate_company_warehouses(company)
+        return create_response, create_error
 
     if role in ['CON', 'VCON']:
         # The base_code should be the actual warehouse selected by the user (e.g., "Finished Goods")
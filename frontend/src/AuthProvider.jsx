@@ -245,6 +245,14 @@ export default function AuthProvider({ children }) {
   };
 
   const logout = () => {
+    const currentToken = localStorage.getItem('erp_token');
+    if (currentToken) {
+      // Avisar al backend para invalidar la sesión cacheada (no bloquea el logout local)
+      fetch(`${API_URL}/api/logout`, {
+        method: 'POST',
+        headers: { 'X-Session-Token': currentToken }
+      }).catch(() => {});
+    }
     setToken(null);
     setUser(null);
     setIsAuthenticated(false);
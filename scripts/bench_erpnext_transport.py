@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: reuse of connections to ERPNext with the shared pooled transport.
+
+Starts a local stub ERPNext server (HTTP/1.1 keep-alive) and issues the same
+number of `make_erpnext_request` calls twice:
+  - legacy:  a brand-new requests.Session per call (what get_session_with_auth did)
+  - pooled:  a per-user ERPNextSession over the process-wide transport
+
+Usage:
+  python scripts/bench_erpnext_transport.py --requests 500 --threads 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+class StubERPNextHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers + body in a single write; avoids Nagle/delayed-ACK stalls on keep-alive
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.stats_lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.stats_lock:
+            self.server.requests_served += 1
+        body = json.dumps({"message": "bench@example.com", "data": []}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubERPNextHandler)
+    server.daemon_threads = True
+    server.stats_lock = threading.Lock()
+    server.connections = 0
+    server.requests_served = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def reset_stats(server):
+    with server.stats_lock:
+        server.connections = 0
+        server.requests_served = 0
+
+
+def run_mode(label, session_factory, total, threads, server, make_erpnext_request):
+    reset_stats(server)
+
+    def call(_):
+        session = session_factory()
+        response, error = make_erpnext_request(
+            session=session,
+            method="GET",
+            endpoint="/api/method/frappe.auth.get_logged_user",
+            operation_name="Check if notification bench",
+        )
+        if error:
+            raise RuntimeError(error)
+        return response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(call, range(total)))
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{label:<8} requests={server.requests_served:<6} connections={server.connections:<6} "
+        f"elapsed={elapsed:.3f}s  avg={elapsed / total * 1000:.2f}ms/req"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    host, port = server.server_address
+    os.environ["ERPNEXT_URL"] = f"http://{host}:{port}"
+    os.environ["ERPNEXT_HOST"] = host
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+    import requests
+    from utils.http_utils import make_erpnext_request
+    from utils.erpnext_transport import ERPNextSession, close_transports
+
+    legacy = run_mode("legacy", requests.Session, args.requests, args.threads, server, make_erpnext_request)
+    pooled = run_mode(
+        "pooled",
+        lambda: ERPNextSession("bench-sid", cookie_domain=host),
+        args.requests,
+        args.threads,
+        server,
+        make_erpnext_request,
+    )
+    close_transports()
+    server.shutdown()
+
+    if pooled > 0:
+        print(f"speedup  x{legacy / pooled:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Benchmark: local item-catalog replica vs. pulling the whole company Item list.
+
+Starts a local stub ERPNext serving a fake catalog (50k items by default) and runs
+the same lookups twice:
+  - legacy:   one GET of every company item per call, filtered in Python
+              (what recognize-skus, bulk fetch > 100 codes and search-items did)
+  - replica:  services.item_catalog, seeded once, then incremental `modified`
+              polling (forced on every call to measure the worst case)
+
+Usage:
+  python scripts/bench_item_catalog.py --items 50000 --calls 20 --skus 500
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+COMPANY = "Bench SA"
+ABBR = "BSA"
+
+
+def build_catalog(total):
+    rng = random.Random(7)
+    words = ["tornillo", "tuerca", "arandela", "cable", "caño", "llave", "filtro", "bomba", "válvula", "codo"]
+    rows = []
+    for index in range(total):
+        code = f"SKU-{index:06d} - {ABBR}"
+        rows.append({
+            "name": code,
+            "item_code": code,
+            "item_name": f"{rng.choice(words).title()} {rng.choice(words)} {index}",
+            "description": f"{rng.choice(words)} de {rng.randint(1, 100)} mm",
+            "stock_uom": "Unidad",
+            "is_stock_item": 1,
+            "standard_rate": rng.randint(100, 10000),
+            "valuation_rate": rng.randint(50, 5000),
+            "item_group": f"Grupo {index % 40} - {ABBR}",
+            "docstatus": 0,
+            "disabled": 1 if index % 97 == 0 else 0,
+            "brand": None,
+            "item_defaults": [],
+            "custom_company": COMPANY,
+            "modified": f"2025-01-01 00:00:{index % 60:02d}.{index:06d}",
+        })
+    return rows
+
+
+class StubERPNextHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        with self.server.stats_lock:
+            self.server.requests_served += 1
+
+        rows = []
+        if parsed.path.endswith("/Item"):
+            filters = json.loads(params.get("filters", "[]"))
+            rows = self.server.catalog
+            for field, operator, value in filters:
+                if field == "modified" and operator == ">=":
+                    rows = [row for row in rows if row["modified"] >= value]
+                elif field == "disabled":
+                    rows = [row for row in rows if row["disabled"] == value]
+            start = int(params.get("limit_start", 0))
+            limit = int(params.get("limit_page_length", 20)) or len(rows)
+            rows = rows[start:start + limit]
+
+        body = json.dumps({"data": rows}).encode("utf-8")
+        with self.server.stats_lock:
+            self.server.bytes_sent += len(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(catalog):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubERPNextHandler)
+    server.daemon_threads = True
+    server.stats_lock = threading.Lock()
+    server.catalog = catalog
+    server.requests_served = 0
+    server.bytes_sent = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def reset_stats(server):
+    with server.stats_lock:
+        server.requests_served = 0
+        server.bytes_sent = 0
+
+
+def report(label, server, elapsed, calls):
+    print(
+        f"{label:<14} requests={server.requests_served:<5} mb={server.bytes_sent / 1e6:<8.1f} "
+        f"elapsed={elapsed:.3f}s  avg={elapsed / calls * 1000:.1f}ms/call"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--skus", type=int, default=500)
+    args = parser.parse_args()
+
+    catalog = build_catalog(args.items)
+    server = start_stub_server(catalog)
+    host, port = server.server_address
+    os.environ["ERPNEXT_URL"] = f"http://{host}:{port}"
+    os.environ["ERPNEXT_HOST"] = host
+    os.environ["ITEM_CATALOG_POLL_INTERVAL"] = "0"
+    os.environ["ITEM_CATALOG_SQLITE_PATH"] = ""
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+    from utils.http_utils import make_erpnext_request
+    from utils.erpnext_transport import ERPNextSession, close_transports
+    from services import item_catalog
+
+    session = ERPNextSession("bench-sid", cookie_domain=host)
+    rng = random.Random(11)
+    lookups = [
+        [f"SKU-{rng.randrange(args.items):06d} - {ABBR}" for _ in range(args.skus)]
+        for _ in range(args.calls)
+    ]
+
+    # legacy: inventario completo por llamada
+    reset_stats(server)
+    started = time.perf_counter()
+    legacy_hits = 0
+    for codes in lookups:
+        response, error = make_erpnext_request(
+            session=session,
+            method="GET",
+            endpoint="/api/resource/Item",
+            params={
+                "fields": json.dumps(item_catalog.CATALOG_FIELDS),
+                "filters": json.dumps([["disabled", "=", 0], ["custom_company", "=", COMPANY]]),
+                "limit_page_length": args.items + 1000,
+            },
+            operation_name="Bench legacy catalog",
+        )
+        if error:
+            raise RuntimeError(error)
+        inventory_map = {row["item_code"]: row for row in response.json()["data"]}
+        legacy_hits += sum(1 for code in set(codes) if code in inventory_map)
+    report("legacy", server, time.perf_counter() - started, args.calls)
+
+    # replica: siembra única
+    reset_stats(server)
+    started = time.perf_counter()
+    item_catalog.ensure_item_catalog(session, COMPANY)
+    report("replica seed", server, time.perf_counter() - started, 1)
+
+    # replica: poll incremental + lookup por llamada
+    reset_stats(server)
+    started = time.perf_counter()
+    replica_hits = 0
+    for codes in lookups:
+        found, error = item_catalog.get_catalog_items_by_code(session, COMPANY, codes)
+        if error:
+            raise RuntimeError(error)
+        replica_hits += len(found)
+    replica = time.perf_counter() - started
+    report("replica", server, replica, args.calls)
+
+    # búsqueda (20 resultados) sobre la réplica
+    reset_stats(server)
+    started = time.perf_counter()
+    for _ in range(args.calls):
+        item_catalog.search_catalog_items(session, COMPANY, "válvula", field="description", limit=20)
+    report("replica search", server, time.perf_counter() - started, args.calls)
+
+    close_transports()
+    server.shutdown()
+    print(f"hits legacy={legacy_hits} replica={replica_hits}")
+
+
+if __name__ == "__main__":
+    main()
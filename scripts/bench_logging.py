@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark: costo del logging en el procesamiento de CSV de listas de precios.
+
+Corre routes.sales_price_lists._process_csv_data sobre un CSV sintético (20k filas
+por defecto) con la salida estándar redirigida a un archivo (como el log del
+contenedor) y compara:
+  - legacy:        los print por fila que tenía la función antes (copia del loop)
+  - info:          LOG_LEVEL=INFO (default): solo resumen
+  - debug-sampled: LOG_LEVEL=DEBUG con muestreo (1 de cada LOG_SAMPLE_EVERY filas)
+  - debug-all:     LOG_LEVEL=DEBUG sin muestreo (una línea por fila)
+
+Usage:
+  python scripts/bench_logging.py --rows 20000 --repeat 3
+"""
+
+import argparse
+import csv
+import io
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ABBR = "BSA"
+
+
+def build_csv(rows):
+    rng = random.Random(3)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["Item Code", "Rate"])
+    for index in range(rows):
+        rate = "0" if index % 250 == 0 else f"{rng.randint(100, 99999)},{rng.randint(0, 99):02d}"
+        writer.writerow([f"SKU-{index:06d}", rate])
+    return output.getvalue()
+
+
+def legacy_process_csv_data(csv_data, price_list_name, currency, company_abbr):
+    """Loop de _process_csv_data con los print por fila que tenía antes"""
+    print(f"BACKEND: Iniciando _process_csv_data con csv_data length: {len(csv_data)}")
+    print(csv_data[:300])
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=["Item Code", "Price List", "Currency", "Rate", "Buying", "Selling"])
+    writer.writeheader()
+    processed_count = 0
+    for row in csv.DictReader(io.StringIO(csv_data)):
+        print(f"BACKEND: Procesando fila cruda: {row}")
+        processed_row = {
+            "Item Code": row.get("Item Code", "").strip('"'),
+            "Price List": price_list_name,
+            "Currency": currency,
+            "Rate": row.get("Rate", "0").strip('"').replace(',', '.'),
+            "Buying": "0",
+            "Selling": "1"
+        }
+        print(f"BACKEND: Fila procesada: Item Code='{processed_row['Item Code']}', Rate='{processed_row['Rate']}'")
+        try:
+            rate = float(processed_row["Rate"])
+            print(f"BACKEND: Rate convertido a float: {rate}")
+            if rate <= 0:
+                print(f"⚠️ BACKEND: Skipping row with invalid Rate: {rate}")
+                continue
+        except (ValueError, TypeError):
+            print(f"⚠️ BACKEND: Skipping row with non-numeric Rate: {processed_row['Rate']}")
+            continue
+        item_code = processed_row["Item Code"]
+        if company_abbr and f" - {company_abbr}" not in item_code:
+            processed_row["Item Code"] = f"{item_code} - {company_abbr}"
+            print(f"BACKEND: Item code adjusted: '{item_code}' -> '{processed_row['Item Code']}'")
+        writer.writerow(processed_row)
+        processed_count += 1
+        if processed_count <= 5:
+            print(f"BACKEND: Fila escrita {processed_count}: {processed_row}")
+    processed_csv = output.getvalue()
+    print(f"BACKEND: Procesamiento completado - Procesadas: {processed_count}")
+    print(processed_csv[:300])
+    return processed_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    csv_data = build_csv(args.rows)
+    report = sys.stderr
+    log_file = tempfile.NamedTemporaryFile("w", suffix=".log", delete=False, encoding="utf-8")
+    # El handler de logging toma sys.stdout al configurarse: redirigir antes de importar
+    sys.stdout = log_file
+
+    os.environ.setdefault("ERPNEXT_URL", "http://127.0.0.1:1")
+    os.environ["LOG_LEVEL"] = "INFO"
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+    from utils import logging_utils
+    from routes.sales_price_lists import _process_csv_data
+
+    root = logging.getLogger("erp")
+
+    def run(label, func, level=None, sample_every=None):
+        if level is not None:
+            root.setLevel(level)
+        if sample_every is not None:
+            logging_utils.LOG_SAMPLE_EVERY = sample_every
+        best = None
+        written = 0
+        for _ in range(args.repeat):
+            log_file.flush()
+            start_size = os.path.getsize(log_file.name)
+            started = time.perf_counter()
+            result = func(csv_data, "Lista Bench", "ARS", ABBR)
+            sys.stdout.flush()
+            elapsed = time.perf_counter() - started
+            written = os.path.getsize(log_file.name) - start_size
+            best = elapsed if best is None else min(best, elapsed)
+        print(
+            f"{label:<14} best={best * 1000:8.1f}ms  rows/s={args.rows / best:>10,.0f}  "
+            f"log={written / 1e6:6.2f}MB  out_rows={result.count(chr(10)) - 1}",
+            file=report
+        )
+
+    run("legacy", legacy_process_csv_data)
+    run("info", _process_csv_data, level=logging.INFO)
+    run("debug-sampled", _process_csv_data, level=logging.DEBUG, sample_every=1000)
+    run("debug-all", _process_csv_data, level=logging.DEBUG, sample_every=1)
+
+    sys.stdout = sys.__stdout__
+    log_file.close()
+    os.unlink(log_file.name)
+
+
+if __name__ == "__main__":
+    main()
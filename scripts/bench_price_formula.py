@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark: recálculo de listas de precios automatizadas (items x listas).
+
+  - legacy:   traducir + ast.parse + validar + compile en cada par (item, lista),
+              como hacía safe_eval_formula
+  - compiled: fórmula compilada una vez por lista, evaluación escalar por item
+  - batch:    CompiledFormula.evaluate_batch (NumPy cuando la fórmula lo permite)
+
+Usage:
+  python scripts/bench_price_formula.py --items 30000 --lists 5
+"""
+
+import argparse
+import ast
+import random
+import sys
+import time
+from pathlib import Path
+
+FORMULAS = [
+    "price.compra * 1.35",
+    "IF(price.compra > 100, price.compra * 1.3, price.compra * 1.5)",
+    "IF(price.actual > 0 AND price.compra > price.actual, price.compra * 1.2, price.actual)",
+    "Math.ceil(price.compra * 1.21 / 10) * 10",
+    "round(max(price.compra * 1.4, price.actual, 50), 2)",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=30000)
+    parser.add_argument("--lists", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+    from utils.price_formula import (
+        SafeEvaluator, _SCALAR_GLOBALS, _translate_and_sanitize_formula, compile_formula
+    )
+
+    rng = random.Random(1)
+    compras = [round(rng.uniform(1, 5000), 2) for _ in range(args.items)]
+    actuals = [round(rng.uniform(0, 6000), 2) if index % 4 else 0.0 for index in range(args.items)]
+    formulas = [FORMULAS[index % len(FORMULAS)] for index in range(args.lists)]
+    pairs = args.items * args.lists
+
+    def legacy():
+        out = []
+        for compra, actual in zip(compras, actuals):
+            for formula in formulas:
+                tree = ast.parse(_translate_and_sanitize_formula(formula), mode="eval")
+                SafeEvaluator().visit(tree)
+                code = compile(tree, filename="<ast>", mode="eval")
+                out.append(float(eval(code, _SCALAR_GLOBALS, {"actual": actual, "compra": compra})))
+        return out
+
+    def compiled():
+        out = []
+        for formula in formulas:
+            formula = compile_formula(formula)
+            out.extend(formula.evaluate_rate(actual=actual, compra=compra) for compra, actual in zip(compras, actuals))
+        return out
+
+    def batch():
+        out = []
+        for formula in formulas:
+            rates, errors = compile_formula(formula).evaluate_batch(compras, actuals)
+            if errors:
+                raise RuntimeError(errors)
+            out.extend(rates)
+        return out
+
+    results = {}
+    for label, func in (("legacy", legacy), ("compiled", compiled), ("batch", batch)):
+        started = time.perf_counter()
+        results[label] = func()
+        elapsed = time.perf_counter() - started
+        print(f"{label:<9} {elapsed * 1000:9.1f}ms  {pairs / elapsed:>12,.0f} pares/s")
+
+    # Mismos valores (el orden de legacy es item-major)
+    legacy_sorted = sorted(results["legacy"])
+    for label in ("compiled", "batch"):
+        other = sorted(results[label])
+        mismatch = max(abs(a - b) for a, b in zip(legacy_sorted, other))
+        print(f"max |legacy - {label}| = {mismatch:.3g}")
+
+
+if __name__ == "__main__":
+    main()